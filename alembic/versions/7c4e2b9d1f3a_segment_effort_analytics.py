@@ -0,0 +1,49 @@
+"""Segment effort analytics indexes and sync tracking
+
+Revision ID: 7c4e2b9d1f3a
+Revises: 0230a741c9b0
+Create Date: 2026-10-18 10:12:41.207815
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4e2b9d1f3a'
+down_revision: Union[str, Sequence[str], None] = '0230a741c9b0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('segment_efforts', sa.Column('athlete_id', sa.BigInteger(), nullable=True))
+    # Efforts saved before this revision don't record their athlete, and nothing else
+    # in the schema does either. With a single user they are all theirs. Otherwise each
+    # segment's next full sync claims its rows by effort id (segment_effort_syncs
+    # starts empty, so every segment is synced again before answering from the DB).
+    bind = op.get_bind()
+    athletes = bind.execute(sa.text('SELECT strava_athlete_id FROM users')).fetchall()
+    if len(athletes) == 1:
+        bind.execute(
+            sa.text('UPDATE segment_efforts SET athlete_id = :athlete_id WHERE athlete_id IS NULL'),
+            {'athlete_id': athletes[0][0]}
+        )
+    op.create_index('ix_segment_efforts_segment_elapsed', 'segment_efforts', ['segment_id', 'elapsed_time'], unique=False)
+    op.create_index('ix_segment_efforts_segment_start', 'segment_efforts', ['segment_id', 'start_date'], unique=False)
+    op.create_table('segment_effort_syncs',
+    sa.Column('athlete_id', sa.BigInteger(), nullable=False),
+    sa.Column('segment_id', sa.BigInteger(), nullable=False),
+    sa.Column('complete', sa.Boolean(), nullable=False),
+    sa.Column('synced_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('athlete_id', 'segment_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('segment_effort_syncs')
+    op.drop_index('ix_segment_efforts_segment_start', table_name='segment_efforts')
+    op.drop_index('ix_segment_efforts_segment_elapsed', table_name='segment_efforts')
+    op.drop_column('segment_efforts', 'athlete_id')
@@ -1,4 +1,6 @@
 
+from typing import Optional
+
 import httpx
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from fastapi.responses import RedirectResponse
@@ -124,18 +126,18 @@ async def strava_callback(code: str, background_tasks: BackgroundTasks, db: Sess
     )
 
     # Trigger background data fetch to warm up cache on the MCP server
-    background_tasks.add_task(trigger_mcp_refresh, access_token)
+    background_tasks.add_task(trigger_mcp_refresh, access_token, user.strava_athlete_id)
 
     return response
 
-async def trigger_mcp_refresh(access_token: str):
+async def trigger_mcp_refresh(access_token: str, athlete_id: Optional[int] = None):
     """Fire-and-forget request to the MCP server to start caching activities."""
     async with httpx.AsyncClient() as client:
         try:
             # Use a short timeout as we don't need to wait for the full response
             await client.post(
                 f"{MCP_SERVER_URL}/activities/refresh",
-                headers={"X-Strava-Token": access_token},
+                headers=mcp_headers(access_token, athlete_id),
                 timeout=2.0
             )
         except httpx.ReadTimeout:
@@ -146,7 +148,7 @@ async def trigger_mcp_refresh(access_token: str):
             import logging
             logging.getLogger(__name__).error(f"Failed to trigger MCP refresh: {e}")
 
-from .deps import get_current_user  # noqa: E402
+from .deps import get_current_user, mcp_headers  # noqa: E402
 
 
 @router.get("/me")
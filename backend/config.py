@@ -12,6 +12,8 @@ class Settings(BaseSettings):
     # URLs
     FRONTEND_URL: str = "http://localhost:5173"
     MCP_SERVER_URL: str = "http://localhost:8001"
+    # Shared with the MCP server; without it the MCP server looks athlete ids up itself
+    MCP_INTERNAL_KEY: str = ""
     
     # Security
     SECRET_KEY: str = "change_this_to_a_secure_random_key_in_production"
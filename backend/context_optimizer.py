@@ -10,6 +10,16 @@ from typing import Any, Dict, List, Optional, Tuple
 import dateparser
 from dateparser.search import search_dates
 
+from .relevance import RelevanceRanker
+
+# Sentinel: the caller has not parsed the date range (None means "all time")
+UNPARSED = object()
+
+
+def is_numeric_keyword(kw: str) -> bool:
+    """True for keywords like "5" or "13.1" that should match distances."""
+    return kw.isdigit() or (kw.replace('.', '', 1).isdigit() and kw.count('.') <= 1)
+
 
 class ContextOptimizer:
     """
@@ -29,10 +39,16 @@ class ContextOptimizer:
     TOKENS_PER_SUMMARY_ENTRY = 20
     TOKENS_PER_STATS_ENTRY = 30
     
-    def __init__(self, question: str, activity_summary: Dict[str, Any], stats: Dict[str, Any]):
+    def __init__(self, question: str, activity_summary: Dict[str, Any], stats: Dict[str, Any],
+                 keyword_matches: Optional[Dict[str, List[int]]] = None,
+                 date_range: Any = UNPARSED):
         self.question = question.lower()
         self.activity_summary = activity_summary
         self.stats = stats
+        # Optional precomputed {keyword: [activity ids]} from the MCP text index
+        self.keyword_matches = {kw.lower(): set(ids) for kw, ids in (keyword_matches or {}).items()}
+        # Date range already parsed by the caller (used to pre-filter the summary on the MCP server)
+        self.date_range = date_range
         self.by_year = activity_summary.get("by_year", {})
         self.activities_by_date = activity_summary.get("activities_by_date", {})
         
@@ -295,62 +311,10 @@ class ContextOptimizer:
         print(f"ContextOptimizer: Filtered {len(filtered)} activities from {len(self.activities_by_date)} days.")
         return filtered
     
-    def calculate_relevance(self, activity: Dict[str, Any]) -> Tuple[int, str]:
-        """
-        Calculate relevance score for an activity against the query.
-        Returns tuple (score, start_time) for sorting.
-        """
-        score = 0
-        name = str(activity.get('name', '')).lower()
-        note = str(activity.get('private_note', '')).lower()
-        desc = str(activity.get('description', '')).lower()
-        full_text = f"{name} {note} {desc}"
-        
-        # Keywords from query (excluding stop words)
-        stop_words = {'what', 'was', 'the', 'list', 'all', 'segments', 'from', 'at', 'in', 'on', 'my', 'run', 'ride', 'how', 'many', 'activities', 'have', 'been', 'of', 'exactly', 'did', 'do'}
-        question_words = [w.lower() for w in re.findall(r'\w+', self.question)]
-        query_words = [w for w in question_words if w not in stop_words]
-        
-        for w in query_words:
-            if w in full_text:
-                score += 10
-        
-        # Distance matching score
-        dist = activity.get('distance_miles', 0)
-        for w in query_words:
-            if w.replace('.', '', 1).isdigit():
-                try:
-                    target_dist = float(w)
-                    diff = abs(dist - target_dist)
-                    if diff < 0.01:
-                        score += 200 # Exact match priority
-                    elif diff < 0.1:
-                        score += 100 # Near match
-                    elif diff < 0.3:
-                        score += 50
-                except ValueError:
-                    pass
-                    
-        # Recency Match (Critical for "my run today")
-        try:
-            start_str = activity.get('start_date', '') or activity.get('start_time', '')
-            if start_str:
-                act_dt = datetime.fromisoformat(start_str.replace("Z", "+00:00"))
-                now = datetime.now(act_dt.tzinfo)
-                delta = now - act_dt
-                if delta.total_seconds() < 86400: # Last 24 hours
-                    score += 1000 # Absolute Priority
-                elif delta.days < 7:
-                    score += 100 # This week
-        except Exception: pass
-                    
-        return (score, activity.get('start_time', ''))
-
-    def filter_by_keyword(self, activities: List[Dict[str, Any]], date_range_applied: bool = False) -> List[Dict[str, Any]]:
-        """Filter activities by keywords found in quotes or after 'with'/'contains'.
+    def extract_keywords(self, date_range_applied: bool = False) -> List[str]:
+        """Extract keywords found in quotes or after 'with'/'contains'.
         
         Args:
-            activities: List of activities to filter
             date_range_applied: If True, skip aggressive keyword extraction to avoid filtering by date components
         """
         question_lower = self.question.lower()
@@ -381,12 +345,39 @@ class ContextOptimizer:
                 if w not in blacklist and len(w) >= 1:
                     keywords.append(w.lower())
         
+        return keywords
+
+    def filter_by_keyword(self, activities: List[Dict[str, Any]], date_range_applied: bool = False) -> List[Dict[str, Any]]:
+        """Filter activities by keywords found in quotes or after 'with'/'contains'.
+        
+        Text keywords are resolved through the MCP text index when its matches were
+        provided; otherwise (and for numeric keywords) fall back to a substring scan.
+        
+        Args:
+            activities: List of activities to filter
+            date_range_applied: If True, skip aggressive keyword extraction to avoid filtering by date components
+        """
+        keywords = self.extract_keywords(date_range_applied)
         if not keywords:
             return activities
             
         print(f"ContextOptimizer: Filtering by keywords: {keywords}")
+        indexed_ids = set()
+        scan_keywords = []
+        for kw in keywords:
+            if kw in self.keyword_matches and not is_numeric_keyword(kw):
+                indexed_ids |= self.keyword_matches[kw]
+            else:
+                scan_keywords.append(kw)
+        
         filtered = []
         for activity in activities:
+            if activity.get('id') in indexed_ids:
+                filtered.append(activity)
+                continue
+            if not scan_keywords:
+                continue
+            
             # Include distance and other numeric fields in searchable text
             dist = activity.get('distance_miles', 0)
             elev = activity.get('elevation_feet', 0)
@@ -399,9 +390,9 @@ class ContextOptimizer:
             ).lower()
             
             is_match = False
-            for kw in keywords:
+            for kw in scan_keywords:
                 # Handle numeric matches (e.g. "5" matches "5.02")
-                if kw.isdigit() or (kw.replace('.', '', 1).isdigit() and kw.count('.') <= 1):
+                if is_numeric_keyword(kw):
                     try:
                         f_kw = float(kw)
                         if abs(dist - f_kw) < 0.2: # 0.2 mile tolerance
@@ -452,7 +443,7 @@ class ContextOptimizer:
 
         
         # Determine what level of detail is needed
-        date_range = self.parse_date_range()
+        date_range = self.parse_date_range() if self.date_range is UNPARSED else self.date_range
         
         # Get filtered activities (Date Range)
         if date_range:
@@ -538,19 +529,17 @@ class ContextOptimizer:
             
             # Sort by date (most recent first) and limit
             # Note: filter_by_keyword might have already reduced the list significantly!
-            # Sort by Relevance Score + Date
-            # This ensures "Angeles Crest" (matches query) floats to top even if old!
-            relevant_activities.sort(key=self.calculate_relevance, reverse=True)
-            
             # Recalculate available tokens
             available_tokens = self.MAX_CONTEXT_TOKENS - base_tokens - self.TOKEN_OVERHEAD
             max_activities = available_tokens // self.TOKENS_PER_ACTIVITY
             
             # Only use this strategy if we can fit a meaningful amount (e.g. at least 50)
             # Otherwise we risk showing a confusingly small slice of history
-            # Limit to what we can fit, prioritized by relevance score
+            # Limit to what we can fit, prioritized by Relevance Score + Date.
+            # This ensures "Angeles Crest" (matches query) floats to top even if old!
             if max_activities > 0:
-                optimized["relevant_activities"] = [scrub_activity(act) for act in relevant_activities[:max_activities]]
+                top_activities = RelevanceRanker(self.question).top_k(relevant_activities, max_activities)
+                optimized["relevant_activities"] = [scrub_activity(act) for act in top_activities]
                 optimized["strategy"] = "limited_recent"
                 optimized["note"] = f"Showing {len(optimized['relevant_activities'])} most relevant activities"
                 return optimized
@@ -574,3 +563,17 @@ class ContextOptimizer:
         
         return optimized
 
+
+
+def optimize_context(question: str, activity_summary: Dict[str, Any], stats: Dict[str, Any],
+                     keyword_matches: Optional[Dict[str, List[int]]] = None,
+                     date_range: Any = UNPARSED) -> Dict[str, Any]:
+    """ContextOptimizer(...).optimize_context() as a module-level function, so a process pool can run it."""
+    return ContextOptimizer(
+        question, activity_summary, stats, keyword_matches=keyword_matches, date_range=date_range
+    ).optimize_context()
+
+
+def activity_count(activity_summary: Dict[str, Any]) -> int:
+    """Activities in an /activities/query response (the optimizer's input size)."""
+    return sum(len(activities) for activities in activity_summary.get("activities_by_date", {}).values())
@@ -1,6 +1,9 @@
+from typing import Dict, Optional
+
 from fastapi import Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 
+from .config import settings
 from .database import get_db
 from .models import User
 from .security import decode_access_token
@@ -44,3 +47,16 @@ def get_current_user(request: Request, db: Session = Depends(get_db)):
             detail="User not found",
         )
     return user
+
+
+def mcp_headers(access_token: str, athlete_id: Optional[int] = None) -> Dict[str, str]:
+    """
+    Headers for calls to the MCP server. Passing the athlete id we already know
+    spares the MCP server an /athlete lookup whenever Strava rotates the token.
+    The MCP server only trusts the id together with the shared MCP_INTERNAL_KEY.
+    """
+    headers = {"X-Strava-Token": access_token}
+    if athlete_id is not None and settings.MCP_INTERNAL_KEY:
+        headers["X-Strava-Athlete-Id"] = str(athlete_id)
+        headers["X-MCP-Internal-Key"] = settings.MCP_INTERNAL_KEY
+    return headers
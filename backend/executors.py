@@ -0,0 +1,143 @@
+"""
+Worker pools for CPU-bound work, and an event-loop lag monitor, so one large
+history doesn't stall every other request on the worker. Both services use
+this module (mcp-server/src/executors.py re-exports it).
+
+- run_in_thread: NumPy, zlib, template rendering and other work that releases
+  the GIL (or is short enough that thread switching keeps the loop responsive).
+- run_cpu_bound: pure-Python aggregation. Inputs of at least
+  PROCESS_POOL_MIN_ITEMS go to a process pool so they don't hold the GIL;
+  smaller ones aren't worth the pickling and run in the thread pool. The
+  function and its arguments must be picklable (module-level functions; each
+  pool process imports the function's module once).
+
+Pool sizes come from CPU_THREAD_WORKERS and CPU_PROCESS_WORKERS
+(0 process workers disables the process pool).
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+THREAD_WORKERS = int(os.getenv("CPU_THREAD_WORKERS", str(min(8, (os.cpu_count() or 1) + 4))))
+PROCESS_WORKERS = int(os.getenv("CPU_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+PROCESS_POOL_MIN_ITEMS = int(os.getenv("PROCESS_POOL_MIN_ITEMS", "5000"))
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_stats = {"thread_tasks": 0, "process_tasks": 0, "process_failures": 0}
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix="cpu")
+    return _thread_pool
+
+
+def _get_process_pool() -> Optional[ProcessPoolExecutor]:
+    global _process_pool
+    if _process_pool is None and PROCESS_WORKERS > 0:
+        _process_pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS)
+    return _process_pool
+
+
+async def run_in_thread(fn: Callable, *args, **kwargs) -> Any:
+    """Run fn in the shared thread pool."""
+    _stats["thread_tasks"] += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_thread_pool(), functools.partial(fn, *args, **kwargs))
+
+
+async def run_cpu_bound(fn: Callable, *args, size: int = 0) -> Any:
+    """
+    Run pure-Python fn off the event loop: in the process pool when size (e.g. the
+    number of activities) is at least PROCESS_POOL_MIN_ITEMS, else in the thread pool.
+    Falls back to the thread pool if the process pool is disabled or broken.
+    """
+    pool = _get_process_pool() if size >= PROCESS_POOL_MIN_ITEMS else None
+    if pool is not None:
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+            _stats["process_tasks"] += 1
+            return result
+        except Exception as e:
+            # BrokenProcessPool, pickling errors... the work itself is still valid
+            _stats["process_failures"] += 1
+            logger.warning(f"Process pool failed for {getattr(fn, '__name__', fn)}: {e}. Using a thread.")
+    return await run_in_thread(fn, *args)
+
+
+def shutdown() -> None:
+    global _thread_pool, _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+
+
+class EventLoopLagMonitor:
+    """
+    Measures how late the event loop wakes up from a fixed sleep. Anything that
+    blocks the loop (CPU work in a handler, sync I/O) shows up as lag for every
+    request on the worker.
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 600):
+        self.interval = interval
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - started - self.interval, 0.0)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def get_stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(int(len(ordered) * p), len(ordered) - 1)] * 1000, 2)
+
+        return {
+            "samples": len(ordered),
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
+
+
+def get_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "thread_workers": THREAD_WORKERS,
+        "process_workers": PROCESS_WORKERS,
+        "process_pool_min_items": PROCESS_POOL_MIN_ITEMS,
+    }
+
+
+# Global Instance
+loop_lag_monitor = EventLoopLagMonitor()
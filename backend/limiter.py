@@ -1,4 +1,7 @@
+import os
+
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
-limiter = Limiter(key_func=get_remote_address)
+# RATE_LIMIT_ENABLED=false turns the per-IP limits off (benchmarks send many questions)
+limiter = Limiter(key_func=get_remote_address, enabled=os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false")
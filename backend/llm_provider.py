@@ -12,10 +12,25 @@ from dotenv import load_dotenv
 from google import genai
 from openai import AsyncOpenAI
 
+from . import metrics
+
 # Load .env explicitly (same pattern as database.py)
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
+LLM_TOKENS = metrics.Histogram(
+    "copilot_llm_tokens", "Tokens per LLM call, as reported by the provider.", ["provider", "kind"],
+    buckets=(100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+)
+
+
+def record_usage(provider: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    """Record the provider's token counts (they're missing from some responses)."""
+    if prompt_tokens is not None:
+        LLM_TOKENS.observe(prompt_tokens, provider=provider, kind="prompt")
+    if completion_tokens is not None:
+        LLM_TOKENS.observe(completion_tokens, provider=provider, kind="completion")
+
 
 class LLMProvider:
     """
@@ -50,7 +65,7 @@ class LLMProvider:
             self.api_key = os.getenv("DEEPSEEK_API_KEY")
             if not self.api_key:
                 raise ValueError("DEEPSEEK_API_KEY not set")
-            self.base_url = "https://api.deepseek.com/v1"
+            self.base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
         elif self.provider == "gemini":
             self.api_key = os.getenv("GEMINI_API_KEY")
             if not self.api_key:
@@ -137,6 +152,8 @@ class LLMProvider:
                      logger.error(f"OpenRouter API returned error in JSON: {data}")
                      raise ValueError(f"OpenRouter API Error: {data['error']}")
                      
+                usage = data.get("usage") or {}
+                record_usage("openrouter", usage.get("prompt_tokens"), usage.get("completion_tokens"))
                 return data["choices"][0]["message"]["content"]
             except httpx.HTTPStatusError as e:
                 logger.error(f"OpenRouter HTTP Error: {e.response.status_code} - {e.response.text}")
@@ -173,7 +190,10 @@ class LLMProvider:
                 timeout=60.0
             )
             response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
+            data = response.json()
+            usage = data.get("usage") or {}
+            record_usage("deepseek", usage.get("prompt_tokens"), usage.get("completion_tokens"))
+            return data["choices"][0]["message"]["content"]
     
     async def _generate_gemini(
         self,
@@ -199,6 +219,9 @@ class LLMProvider:
                 max_output_tokens=max_tokens
             )
         )
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            record_usage("gemini", usage.prompt_token_count, usage.candidates_token_count)
         return response.text
 
 
@@ -1,10 +1,13 @@
 import os
+import time
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
+from . import executors, metrics
 from .auth import router as auth_router
 from .database import Base, engine
 from .limiter import limiter
@@ -13,7 +16,14 @@ from .routes import router as api_router
 # Create tables on startup
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="ActivityCopilot")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    executors.loop_lag_monitor.start()
+    yield
+    executors.loop_lag_monitor.stop()
+    executors.shutdown()
+
+app = FastAPI(title="ActivityCopilot", lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -31,6 +41,22 @@ app.add_middleware(
     allow_headers=["Content-Type", "Authorization", "X-Strava-Token"],
 )
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Latency per route, and a stage trace that routes can add to (see metrics.py)."""
+    started = time.perf_counter()
+    status = 500
+    with metrics.trace(f"{request.method} {request.url.path}"):
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            metrics.http_request_seconds.observe(
+                time.perf_counter() - started,
+                method=request.method, route=metrics.route_label(request), status=status
+            )
+
 # Include routers
 app.include_router(auth_router, prefix="/api/auth", tags=["auth"])
 app.include_router(api_router, prefix="/api", tags=["api"])
@@ -52,3 +78,22 @@ async def global_exception_handler(request, exc):
 @app.get("/")
 def read_root():
     return {"message": "Strava Activity Copilot API is running"}
+
+@app.get("/runtime/stats")
+def runtime_stats():
+    """Event-loop lag and worker pool usage."""
+    return {"event_loop_lag": executors.loop_lag_monitor.get_stats(), "executors": executors.get_stats()}
+
+EVENT_LOOP_LAG = metrics.Gauge("copilot_event_loop_lag_seconds", "Event-loop wake-up lag.", ["stat"])
+
+@metrics.registry.on_collect
+def collect_runtime_metrics():
+    lag = executors.loop_lag_monitor.get_stats()
+    EVENT_LOOP_LAG.set(lag["max_ms"] / 1000, stat="max")
+    if lag["p99_ms"] is not None:
+        EVENT_LOOP_LAG.set(lag["p99_ms"] / 1000, stat="p99")
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint (not under /api, so the public proxy doesn't expose it)."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
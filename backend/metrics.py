@@ -0,0 +1,288 @@
+"""
+Request metrics and per-stage tracing.
+
+- Counter, Gauge and Histogram keep labelled values in process and render()
+  writes them in the Prometheus text format (served at /metrics).
+- span(name) times a block into the stage histogram. Trace.stage(name) does the
+  same for consecutive stages of one long handler: each call ends the previous
+  stage. Both also record into the request's Trace, and a request slower than
+  SLOW_REQUEST_SECONDS logs where its time went.
+- If the opentelemetry API is installed, spans are OpenTelemetry spans too. They
+  are no-ops until an SDK and exporter are configured (e.g. by running under
+  opentelemetry-instrument).
+
+Metrics are per process: scrape each worker, or run one. The MCP server uses
+this module too (mcp-server/src/metrics.py re-exports it).
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # Optional: only needed to export spans
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the built-in metrics; the MCP server sets its own (see set_namespace)
+NAMESPACE = "copilot"
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "10"))
+
+# Seconds, from a cache hit to a full history fetch or an LLM answer on a long history
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_tracer = otel_trace.get_tracer(__name__) if otel_trace is not None else None
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Registry:
+    """The metrics /metrics renders, plus callbacks that refresh mirrored values first."""
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics.append(metric)
+
+    def on_collect(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run callback before every render (for values kept elsewhere, e.g. cache stats)."""
+        self._collectors.append(callback)
+        return callback
+
+    def render(self) -> str:
+        for callback in self._collectors:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), registry: Optional[Registry] = registry):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        # Handlers run on the event loop, but pool threads (run_in_thread) record too
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels) -> None:
+        """Mirror a total that is counted elsewhere (set from a collector)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional[Registry] = registry):
+        super().__init__(name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def get_count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+stage_seconds = Histogram(
+    f"{NAMESPACE}_stage_seconds", "Time spent in each traced stage of a request.", ["stage"]
+)
+http_request_seconds = Histogram(
+    f"{NAMESPACE}_http_request_seconds", "HTTP request latency by route.", ["method", "route", "status"]
+)
+
+
+def set_namespace(namespace: str) -> None:
+    """Rename the built-in metrics for a service (call at import time, before the first scrape)."""
+    global NAMESPACE
+    NAMESPACE = namespace
+    stage_seconds.name = f"{namespace}_stage_seconds"
+    http_request_seconds.name = f"{namespace}_http_request_seconds"
+
+
+class Trace:
+    """Stage timings of one request. Nested spans overlap the stage they run in."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lap: Optional[Tuple[str, float, Any]] = None
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def stage(self, name: str) -> None:
+        """End the current stage (if any) and start the next one."""
+        self._end_lap()
+        otel_span = _tracer.start_span(name) if _tracer is not None else None
+        self._lap = (name, time.perf_counter(), otel_span)
+
+    def _end_lap(self) -> None:
+        if self._lap is None:
+            return
+        name, started, otel_span = self._lap
+        self._lap = None
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=name)
+        self.record(name, elapsed)
+        if otel_span is not None:
+            otel_span.end()
+
+    def finish(self) -> float:
+        self._end_lap()
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        return " ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.stages.items())
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def current_trace() -> Trace:
+    """The request's trace (a throwaway one outside of a request)."""
+    return _current_trace.get() or Trace("untraced")
+
+
+@contextmanager
+def trace(name: str) -> Iterator[Trace]:
+    """Trace a whole request; logs the stage breakdown if it was slow."""
+    request_trace = Trace(name)
+    token = _current_trace.set(request_trace)
+    otel_span = _tracer.start_as_current_span(name) if _tracer is not None else nullcontext()
+    with otel_span:
+        try:
+            yield request_trace
+        finally:
+            _current_trace.reset(token)
+            total = request_trace.finish()
+            if total >= SLOW_REQUEST_SECONDS:
+                logger.warning(f"Slow request {name}: {total * 1000:.0f}ms | {request_trace.summary()}")
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[None]:
+    """Time a block as stage `name` (and an OpenTelemetry span, if available)."""
+    started = time.perf_counter()
+    otel_span = _tracer.start_as_current_span(name, attributes=attributes) if _tracer is not None else nullcontext()
+    try:
+        with otel_span:
+            yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=name)
+        request_trace = _current_trace.get()
+        if request_trace is not None:
+            request_trace.record(name, elapsed)
+
+
+def route_label(request: Any) -> str:
+    """The matched route template (e.g. /api/activities/{activity_id}/map), to keep labels bounded."""
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def render() -> str:
+    return registry.render()
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -7,10 +7,12 @@ from datetime import datetime
 from cryptography.fernet import Fernet
 from sqlalchemy import (
     BigInteger,
+    Boolean,
     Column,
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
@@ -79,10 +81,16 @@ class Segment(Base):
 
 class SegmentEffort(Base):
     __tablename__ = "segment_efforts"
+    __table_args__ = (
+        # Leaderboard / nth-best / percentile and chronological (first, last, PR progression) scans
+        Index("ix_segment_efforts_segment_elapsed", "segment_id", "elapsed_time"),
+        Index("ix_segment_efforts_segment_start", "segment_id", "start_date"),
+    )
 
     id = Column(BigInteger, primary_key=True, index=True)  # Strava Effort ID
     segment_id = Column(BigInteger, ForeignKey("segments.id"), nullable=False)
     activity_id = Column(BigInteger, index=True, nullable=False) # Strava Activity ID
+    athlete_id = Column(BigInteger, nullable=True)  # Strava Athlete ID (NULL for rows saved before it was tracked)
     
     elapsed_time = Column(Integer)
     moving_time = Column(Integer)
@@ -93,6 +101,15 @@ class SegmentEffort(Base):
 
     segment = relationship("Segment", back_populates="efforts")
 
+class SegmentEffortSync(Base):
+    """Tracks whether an athlete's full effort history for a segment is stored locally."""
+    __tablename__ = "segment_effort_syncs"
+
+    athlete_id = Column(BigInteger, primary_key=True)
+    segment_id = Column(BigInteger, primary_key=True)
+    complete = Column(Boolean, default=False, nullable=False)
+    synced_at = Column(DateTime, nullable=True)
+
 class LLMCache(Base):
     __tablename__ = "llm_cache"
 
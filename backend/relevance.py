@@ -0,0 +1,163 @@
+"""
+Relevance ranking for activity lists.
+Scores a whole candidate set against a question at once (numeric features are
+vectorized, text is matched with plain substring checks) and returns the top-k
+without fully sorting large histories.
+"""
+import heapq
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Scoring profiles. Tiers are (threshold, points) pairs checked in ascending
+# order; the first threshold the value falls under wins.
+OPTIMIZER_PROFILE: Dict[str, Any] = {
+    "stop_words": frozenset({
+        'what', 'was', 'the', 'list', 'all', 'segments', 'from', 'at', 'in', 'on', 'my', 'run',
+        'ride', 'how', 'many', 'activities', 'have', 'been', 'of', 'exactly', 'did', 'do'
+    }),
+    "word_points": 10,
+    "name_points": 200,
+    "distance_tiers": ((0.01, 200), (0.1, 100), (0.3, 50)),  # Miles
+    "recency_tiers": ((86400, 1000), (7 * 86400, 100)),  # Seconds since start
+}
+
+ENRICHMENT_PROFILE: Dict[str, Any] = {
+    "stop_words": frozenset({
+        'what', 'was', 'the', 'list', 'all', 'segments', 'from', 'at', 'in', 'on', 'my', 'run',
+        'ride', 'did', 'last', 'show', 'me', 'how', 'about'
+    }),
+    "word_points": 10,
+    "name_points": 200,
+    "distance_tiers": ((0.1, 100), (0.3, 50)),
+    "recency_tiers": ((2 * 86400, 500), (7 * 86400, 150), (30 * 86400, 50)),
+}
+
+
+def parse_epochs(start_strs: Sequence[str]) -> np.ndarray:
+    """
+    Parse ISO start times ("2024-01-23T08:00:00Z") into epoch seconds.
+    Missing or unparseable values become NaN.
+    """
+    if not start_strs:
+        return np.empty(0, dtype=float)
+    trimmed = [s[:19] if s else "NaT" for s in start_strs]
+    try:
+        stamps = np.array(trimmed, dtype="datetime64[s]")
+    except ValueError:
+        # Fall back to per-item parsing when a malformed value is present
+        stamps = np.array([_parse_one(s) for s in trimmed], dtype="datetime64[s]")
+    epochs = stamps.astype("int64").astype(float)
+    epochs[np.isnat(stamps)] = np.nan
+    return epochs
+
+
+def _parse_one(value: str) -> np.datetime64:
+    try:
+        return np.datetime64(value, "s")
+    except ValueError:
+        return np.datetime64("NaT")
+
+
+class ActivityFeatures:
+    """Per-activity values needed for scoring, computed once per candidate set."""
+
+    def __init__(self, activities: Sequence[Dict[str, Any]]):
+        self.activities = list(activities)
+        # Plain lists: a fixed-width numpy string array pads every row to the
+        # longest description, which is huge for a long history
+        self.names = [str(a.get('name', '')).lower() for a in self.activities]
+        self.texts = [
+            f"{str(a.get('name', ''))} {str(a.get('private_note', ''))} {str(a.get('description', ''))}".lower()
+            for a in self.activities
+        ]
+        self.distances = np.array(
+            [float(a.get('distance_miles') or 0) for a in self.activities], dtype=float
+        )
+        self.start_times = [a.get('start_time', '') or '' for a in self.activities]
+        self.epochs = parse_epochs(
+            [a.get('start_date', '') or a.get('start_time', '') for a in self.activities]
+        )
+
+    def __len__(self) -> int:
+        return len(self.activities)
+
+
+class RelevanceRanker:
+    """
+    Ranks activities against a question.
+    The question is tokenized once; scoring is done over the whole candidate set at once.
+    """
+
+    def __init__(self, question: str, profile: Optional[Dict[str, Any]] = None,
+                 names: Optional[Sequence[str]] = None):
+        self.profile = profile or OPTIMIZER_PROFILE
+        stop_words = self.profile["stop_words"]
+        self.query_words = [w for w in re.findall(r'\w+', question.lower()) if w not in stop_words]
+        self.target_distances = [
+            float(w) for w in self.query_words if w.replace('.', '', 1).isdigit()
+        ]
+        self.names = [n.lower() for n in (names or []) if n]
+
+    def score(self, features: ActivityFeatures, now: Optional[float] = None) -> np.ndarray:
+        """Score every activity in the candidate set."""
+        n = len(features)
+        scores = np.zeros(n, dtype=float)
+        if n == 0:
+            return scores
+
+        # 1. Content match
+        for w in self.query_words:
+            scores += self.profile["word_points"] * _contains(features.texts, w)
+
+        # 2. Name match
+        for name in self.names:
+            scores += self.profile["name_points"] * _contains(features.names, name)
+
+        # 3. Distance match
+        for target in self.target_distances:
+            scores += _tier_points(np.abs(features.distances - target), self.profile["distance_tiers"])
+
+        # 4. Recency match
+        if now is None:
+            now = datetime.now(timezone.utc).timestamp()
+        age = now - features.epochs
+        scores += _tier_points(age, self.profile["recency_tiers"])
+
+        return scores
+
+    def top_k(self, activities: Sequence[Dict[str, Any]], k: Optional[int] = None,
+              features: Optional[ActivityFeatures] = None) -> List[Dict[str, Any]]:
+        """
+        Return the k most relevant activities, best first.
+        Ties are broken by start time (most recent first). k=None ranks everything.
+        """
+        if features is None:
+            features = ActivityFeatures(activities)
+        scores = self.score(features)
+        n = len(features)
+        key = _rank_key(scores, features.start_times)
+        if k is None or k >= n:
+            order = sorted(range(n), key=key, reverse=True)
+        else:
+            order = heapq.nlargest(max(k, 0), range(n), key=key)
+        return [features.activities[i] for i in order]
+
+
+def _contains(texts: List[str], word: str) -> np.ndarray:
+    """Boolean mask of the texts containing word."""
+    return np.fromiter((word in text for text in texts), dtype=bool, count=len(texts))
+
+
+def _tier_points(values: np.ndarray, tiers: Tuple[Tuple[float, int], ...]) -> np.ndarray:
+    """Map values to points using ascending thresholds. NaN scores zero."""
+    conditions = [values < threshold for threshold, _ in tiers]
+    points = [p for _, p in tiers]
+    return np.select(conditions, points, default=0)
+
+
+def _rank_key(scores: np.ndarray, start_times: List[str]):
+    score_list = scores.tolist()
+    return lambda i: (score_list[i], start_times[i])
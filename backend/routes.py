@@ -9,17 +9,32 @@ from typing import Dict
 
 import httpx
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field, validator
 from sqlalchemy.orm import Session
 
+from . import metrics
 from .config import settings
-from .context_optimizer import ContextOptimizer
+from .context_optimizer import (
+    ContextOptimizer,
+    activity_count,
+    is_numeric_keyword,
+    optimize_context,
+)
 from .database import get_db
-from .deps import get_current_user
+from .deps import get_current_user, mcp_headers
+from .executors import run_cpu_bound, run_in_thread
 from .limiter import limiter
 from .llm_provider import get_llm_provider
 from .models import Segment, Token, User
+from .relevance import ENRICHMENT_PROFILE, RelevanceRanker
+from .services.segment_analytics import effort_history as effort_history_rows
+from .services.segment_analytics import (
+    is_history_complete,
+    nth_best,
+    save_effort_history,
+    segment_summary,
+)
 from .services.segment_service import get_best_efforts_for_segment, save_segments_from_activity
 
 router = APIRouter()
@@ -43,6 +58,35 @@ SYNC_THRESHOLD = 7200 # 2 hours in seconds
 
 MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:8001")
 
+# Detail enrichment: how many activities, and how long /query waits for details
+ENRICHMENT_LIMIT = 5
+ENRICHMENT_DEADLINE_SECONDS = 8.0
+
+# Questions about today wait (briefly) for the MCP activity list to catch up
+RECENCY_TRIGGERS = ['today', 'yesterday', 'this morning', 'tonight', 'just now', 'last night']
+RECENCY_MAX_CACHE_AGE_SECONDS = 300
+RECENCY_REFRESH_WAIT_SECONDS = 10.0
+
+# /query metrics (stage latencies go to metrics.stage_seconds via the request trace)
+QUERY_OUTCOMES = metrics.Counter("copilot_queries_total", "Answered questions by outcome.", ["outcome"])
+LLM_CACHE_LOOKUPS = metrics.Counter("copilot_llm_cache_lookups_total", "LLM response cache lookups.", ["result"])
+PROMPT_CHARS = metrics.Histogram(
+    "copilot_llm_prompt_chars", "Characters sent to the LLM (system instruction + prompt).",
+    buckets=(1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+)
+
+def needs_fresh_activities(question: str, date_range, cache_headers) -> bool:
+    """True if the question is about recent days and the MCP activity list may be missing them."""
+    about_today = any(t in question.lower() for t in RECENCY_TRIGGERS) or (
+        date_range is not None and date_range[1].date() >= datetime.now().date()
+    )
+    if not about_today:
+        return False
+    if cache_headers.get("X-Cache-Refreshing") == "true":
+        return True
+    age = cache_headers.get("X-Cache-Age")
+    return age is not None and int(age) > RECENCY_MAX_CACHE_AGE_SECONDS
+
 class QueryRequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=1000)
     
@@ -109,6 +153,44 @@ def determine_query_type(question: str, optimized_context: dict) -> str:
     else:
         return "general"
 
+async def fetch_keyword_matches(client: httpx.AsyncClient, headers: dict, keywords: list) -> Dict[str, list]:
+    """Look up activity ids matching each keyword via the MCP text index."""
+    if not keywords:
+        return {}
+    try:
+        resp = await client.get(
+            f"{MCP_SERVER_URL}/activities/text_search",
+            headers=headers,
+            params={"q": keywords},
+            timeout=180.0
+        )
+        if resp.status_code == 200:
+            return resp.json().get("matches", {})
+        logger.warning(f"Text search failed ({resp.status_code}); falling back to keyword scan")
+    except httpx.RequestError as e:
+        logger.warning(f"Text search unavailable ({e}); falling back to keyword scan")
+    return {}
+
+async def stream_activity_details(client: httpx.AsyncClient, headers: dict, ids: list, deadline: float):
+    """
+    Yield NDJSON lines from the MCP batch details endpoint as they arrive.
+    Cached activities come first; the last line is the {"done": true, ...} summary.
+    """
+    if not ids:
+        return
+    async with client.stream(
+        "POST",
+        f"{MCP_SERVER_URL}/activities/details",
+        headers=headers,
+        json={"ids": ids, "deadline_seconds": deadline}
+    ) as resp:
+        if resp.status_code != 200:
+            logger.warning(f"Details batch failed ({resp.status_code})")
+            return
+        async for raw_line in resp.aiter_lines():
+            if raw_line.strip():
+                yield json.loads(raw_line)
+
 @router.get("/status")
 @limiter.limit("20/minute")
 async def get_system_status(
@@ -122,7 +204,7 @@ async def get_system_status(
         async with httpx.AsyncClient(timeout=10.0) as client:
             resp = await client.get(
                 f"{MCP_SERVER_URL}/athlete/stats",
-                headers={"X-Strava-Token": token}
+                headers=mcp_headers(token, user.strava_athlete_id)
             )
             if resp.status_code == 200:
                 stats = resp.json()
@@ -145,11 +227,14 @@ async def query_strava_data(
     db: Session = Depends(get_db)
 ):
 
+    trace = metrics.current_trace()
     try:
         # 1. Get Valid Token
+        trace.stage("token_refresh")
         access_token = await get_valid_token(user, db)
 
         # 1. Start background sync of starred segments to enable name matching
+        trace.stage("segment_sync")
         try:
             from .services.segment_service import sync_starred_segments
             
@@ -161,12 +246,12 @@ async def query_strava_data(
             
             if not has_segments:
                 logger.info("First run: Awaiting starred segment sync...")
-                await sync_starred_segments(access_token, db)
+                await sync_starred_segments(access_token, db, user.strava_athlete_id)
                 LAST_SEGMENT_SYNC = now
             elif (now - LAST_SEGMENT_SYNC) > SYNC_THRESHOLD:
                 # Throttled background sync
                 logger.info("Triggering throttled background segment sync...")
-                asyncio.create_task(sync_starred_segments(access_token, db))
+                asyncio.create_task(sync_starred_segments(access_token, db, user.strava_athlete_id))
                 LAST_SEGMENT_SYNC = now
             else:
                 logger.debug("Skipping segment sync (throttled)")
@@ -179,24 +264,58 @@ async def query_strava_data(
         # A more advanced implementation would let Gemini decide what to fetch via tool calls,
         # but per requirements, we'll fetch structured data and pass to Gemini.
         
+        # Parse the date range up front so the MCP server only returns matching rows.
+        # Text keywords (quoted terms, "with X") are resolved by the MCP text index
+        # instead of scanning every activity's notes in the optimizer.
+        # (dateparser is slow and synchronous: keep it off the event loop)
+        trace.stage("date_parse")
+        query_probe = ContextOptimizer(query.question, {}, {})
+        date_range = await run_in_thread(query_probe.parse_date_range)
+        text_keywords = [
+            kw for kw in await run_in_thread(query_probe.extract_keywords)
+            if kw.strip() and not is_numeric_keyword(kw)
+        ]
+        activity_query = {}
+        if date_range:
+            activity_query["after_date"] = date_range[0].strftime("%Y-%m-%d")
+            activity_query["before_date"] = date_range[1].strftime("%Y-%m-%d")
+        
+        trace.stage("mcp_fetch")
         async with httpx.AsyncClient(timeout=30.0) as client:
-            headers = {"X-Strava-Token": access_token}
+            headers = mcp_headers(access_token, user.strava_athlete_id)
             
             # Parallel fetch for better performance
             try:
-                stats_resp, activities_resp = await asyncio.gather(
+                stats_resp, activities_resp, keyword_matches = await asyncio.gather(
                     client.get(f"{MCP_SERVER_URL}/athlete/stats", headers=headers, timeout=60.0),
-                    client.get(f"{MCP_SERVER_URL}/activities/summary", headers=headers, timeout=180.0)
+                    client.post(f"{MCP_SERVER_URL}/activities/query", headers=headers, json=activity_query, timeout=180.0),
+                    fetch_keyword_matches(client, headers, text_keywords)
                 )
                 
                 # Check directly for Rate Limits before processing
                 if stats_resp.status_code == 429 or activities_resp.status_code == 429:
+                    QUERY_OUTCOMES.inc(outcome="rate_limited")
                     return JSONResponse(content={
                         "answer": "**Strava API Rate Limit Reached** 🚦\n\nStrava is currently limiting requests due to high traffic (likely during testing or full history sync). Please try again in approximately 15 minutes.\n\n*System Note: The backend is preventing further requests to avoid API bans.*",
                         "context": {},
                         "model": "system-alert"
                     })
 
+                # The MCP server serves a stale list instantly and refreshes it in the background
+                # (freshness in X-Cache-* headers); questions about today wait for the refresh.
+                if activities_resp.status_code == 200 and needs_fresh_activities(query.question, date_range, activities_resp.headers):
+                    logger.info(f"Activity list is {activities_resp.headers.get('X-Cache-Age')}s old. Waiting for refresh...")
+                    trace.stage("activity_refresh_wait")
+                    try:
+                        await client.post(
+                            f"{MCP_SERVER_URL}/activities/refresh", headers=headers,
+                            params={"wait_seconds": RECENCY_REFRESH_WAIT_SECONDS},
+                            timeout=RECENCY_REFRESH_WAIT_SECONDS + 5.0
+                        )
+                        activities_resp = await client.post(f"{MCP_SERVER_URL}/activities/query", headers=headers, json=activity_query, timeout=180.0)
+                    except httpx.HTTPError as e:
+                        logger.warning(f"Waiting for activity refresh failed (using cached list): {e}")
+
             except httpx.RequestError as e:
                  raise HTTPException(status_code=500, detail=f"Failed to connect to MCP server: {str(e)}")
 
@@ -214,25 +333,15 @@ async def query_strava_data(
         
         # 3. Optimize Context - Smart filtering to prevent context limits and minimize costs
         # 3. Optimize Context - Smart filtering to prevent context limits and minimize costs
+        trace.stage("optimizer")
         try:
             # OPTIMIZE CONTEXT for the LLM
             # This reduces token usage and focuses the AI on relevant data.
-            from .context_optimizer import ContextOptimizer
-            
-            # On-demand refresh DISABLED - it re-fetches the entire activity list (25+ API calls)
-            # which is too expensive. The activity list is cached and sufficient.
-            # recency_triggers = ['today', 'yesterday', 'this morning', 'just now', 'last night']
-            # if any(t in query.question.lower() for t in recency_triggers):
-            #     logger.info("Recency query detected. Triggering on-demand activity refresh...")
-            #     try:
-            #         async with httpx.AsyncClient(timeout=2.0) as ref_client:
-            #             await ref_client.post(f"{MCP_SERVER_URL}/activities/refresh", headers=headers)
-            #             await asyncio.sleep(0.5)
-            #     except Exception as e:
-            #         logger.warning(f"On-demand refresh failed (ignoring): {e}")
-
-            optimizer = ContextOptimizer(query.question, activity_summary_data, stats_data)
-            optimized_context = optimizer.optimize_context()
+            # Pure-Python filtering and scoring: a long history goes to the process pool
+            optimized_context = await run_cpu_bound(
+                optimize_context, query.question, activity_summary_data, stats_data,
+                keyword_matches, date_range, size=activity_count(activity_summary_data)
+            )
 
             
             # --- HYDRATION STRATEGY ---
@@ -248,6 +357,7 @@ async def query_strava_data(
             
             # SEGMENT CONTEXT INJECTION
             # Check if any persisted segments are mentioned in the query
+            trace.stage("segment_context")
             try:
                 # 2. Check for explicit Segment ID or URL in query
                 # Match https://www.strava.com/segments/12345 or just 12345 (if it looks like an ID context)
@@ -301,42 +411,75 @@ async def query_strava_data(
                 logger.info(f"Segment matching: found {len(matched_segments)} segments: {matched_segments}")
                 found_segments_data = []
                 
+                athlete_id = user.strava_athlete_id
+                wants_leaderboard = re.search(r'\b(leaderboard|kom|qom|cr|rank|ranking)\b', query.question.lower()) is not None
                 async with httpx.AsyncClient(timeout=15.0) as seg_client:
                     for seg_id, seg_name in matched_segments:
-                        logger.info(f"Proactively fetching details for segment: {seg_name} ({seg_id})")
+                        # Complete, recent local history: answer from the DB without any Strava calls
+                        local_history = is_history_complete(db, athlete_id, seg_id)
+                        logger.info(f"Preparing segment: {seg_name} ({seg_id}) | local history: {local_history}")
                         
-                        # Fetch in parallel: Details and Leaderboard
-                        detail_task = seg_client.get(f"{MCP_SERVER_URL}/segments/{seg_id}", headers=headers)
-                        lb_task = seg_client.get(f"{MCP_SERVER_URL}/segments/{seg_id}/leaderboard", headers=headers)
+                        # Leaderboard (other athletes) only when the question is about ranking
+                        lb_task = seg_client.get(f"{MCP_SERVER_URL}/segments/{seg_id}/leaderboard", headers=headers) if wants_leaderboard else None
                         
-                        # Fetch ALL effort pages (Strava API paginates at 200 per page)
-                        all_efforts = []
-                        page = 1
-                        while True:
-                            efforts_resp = await seg_client.get(
-                                f"{MCP_SERVER_URL}/segments/{seg_id}/efforts",
-                                headers=headers,
-                                params={"page": page, "per_page": 200}
-                            )
-                            if efforts_resp.status_code == 200:
-                                page_efforts = efforts_resp.json()
-                                if not page_efforts or not isinstance(page_efforts, list):
-                                    break
-                                all_efforts.extend(page_efforts)
-                                logger.info(f"Segment {seg_name}: fetched page {page} with {len(page_efforts)} efforts (total: {len(all_efforts)})")
-                                if len(page_efforts) < 200:  # Last page
+                        if local_history:
+                            segment_row = db.query(Segment).filter(Segment.id == seg_id).first()
+                            pr_effort = nth_best(db, athlete_id, seg_id, 1)
+                            segment_details = {
+                                "name": segment_row.name if segment_row else seg_name,
+                                "distance": segment_row.distance if segment_row else None,
+                                "average_grade": segment_row.average_grade if segment_row else None,
+                                "athlete_pr_effort": {
+                                    "elapsed_time": pr_effort.elapsed_time,
+                                    "activity_id": pr_effort.activity_id
+                                } if pr_effort else None
+                            }
+                            effort_history = [
+                                {
+                                    "activity": {"id": e.activity_id},
+                                    "start_date_local": e.start_date.isoformat() if e.start_date else None,
+                                    "elapsed_time": e.elapsed_time,
+                                    "pr_rank": e.pr_rank
+                                }
+                                for e in effort_history_rows(db, athlete_id, seg_id)
+                            ]
+                        else:
+                            detail_task = seg_client.get(f"{MCP_SERVER_URL}/segments/{seg_id}", headers=headers)
+                            
+                            # Fetch ALL effort pages (the MCP server syncs with Strava on page 1 only)
+                            all_efforts = []
+                            page = 1
+                            while True:
+                                efforts_resp = await seg_client.get(
+                                    f"{MCP_SERVER_URL}/segments/{seg_id}/efforts",
+                                    headers=headers,
+                                    params={"page": page, "per_page": 200}
+                                )
+                                if efforts_resp.status_code == 200:
+                                    page_efforts = efforts_resp.json()
+                                    if not page_efforts or not isinstance(page_efforts, list):
+                                        break
+                                    all_efforts.extend(page_efforts)
+                                    logger.info(f"Segment {seg_name}: fetched page {page} with {len(page_efforts)} efforts (total: {len(all_efforts)})")
+                                    if len(page_efforts) < 200:  # Last page
+                                        break
+                                    page += 1  # Pages are served from the MCP effort store
+                                else:
+                                    logger.warning(f"Failed to fetch efforts page {page} for segment {seg_id}: {efforts_resp.status_code}")
+                                    all_efforts = None
                                     break
-                                page += 1
-                                await asyncio.sleep(0.5)  # Rate limit protection
-                            else:
-                                logger.warning(f"Failed to fetch efforts page {page} for segment {seg_id}: {efforts_resp.status_code}")
-                                break
-                        
-                        resps = await asyncio.gather(detail_task, lb_task, return_exceptions=True)
+                            
+                            detail_resp = (await asyncio.gather(detail_task, return_exceptions=True))[0]
+                            segment_details = detail_resp.json() if isinstance(detail_resp, httpx.Response) and detail_resp.status_code == 200 else {}
+                            effort_history = all_efforts or []
+                            if all_efforts is not None:
+                                save_effort_history(db, athlete_id, seg_id, all_efforts)
                         
-                        segment_details = resps[0].json() if isinstance(resps[0], httpx.Response) and resps[0].status_code == 200 else {}
-                        leaderboard_data = resps[1].json() if isinstance(resps[1], httpx.Response) and resps[1].status_code == 200 else {}
-                        effort_history = all_efforts
+                        leaderboard_data = {}
+                        if lb_task is not None:
+                            lb_resp = (await asyncio.gather(lb_task, return_exceptions=True))[0]
+                            if isinstance(lb_resp, httpx.Response) and lb_resp.status_code == 200:
+                                leaderboard_data = lb_resp.json()
 
                         # Extract activity IDs from effort history and fetch activity summaries
                         # This allows AI to show which activities contain this segment
@@ -346,13 +489,19 @@ async def query_strava_data(
                             if act_id:
                                 activity_ids.append(act_id)
                         
-                        # Fetch activity summaries for these IDs from the activity summary data
+                        # Fetch activity summaries for these IDs (the main summary is date-filtered)
                         segment_activities = []
                         if activity_ids:
-                            # Look up activities from the already-fetched activity_summary data
-                            for date_str, activities in activity_summary_data.get("activities_by_date", {}).items():
+                            ids_resp = await seg_client.post(
+                                f"{MCP_SERVER_URL}/activities/query",
+                                headers=headers,
+                                json={"ids": activity_ids, "include_summary": False}
+                            )
+                            ids_summary = ids_resp.json() if ids_resp.status_code == 200 else activity_summary_data
+                            wanted_ids = set(activity_ids)
+                            for date_str, activities in ids_summary.get("activities_by_date", {}).items():
                                 for act in activities:
-                                    if act.get("id") in activity_ids:
+                                    if act.get("id") in wanted_ids:
                                         segment_activities.append({
                                             **act,
                                             "date": date_str
@@ -370,6 +519,7 @@ async def query_strava_data(
                                 "top_entries": leaderboard_data.get("entries", [])[:3],
                                 "entry_count": leaderboard_data.get("entry_count")
                             },
+                            "analytics": segment_summary(db, athlete_id, seg_id, format_seconds_to_str),
                             "effort_history": [
                                 {
                                     "activity_id": e.get("activity", {}).get("id") if isinstance(e.get("activity"), dict) else e.get("activity"),
@@ -388,6 +538,7 @@ async def query_strava_data(
                 logger.error(f"Segment logic failed: {e}")
 
             # --- DETAIL ENRICHMENT & ACTIVITY MATCHING ---
+            trace.stage("enrichment")
             # Match activities by name if the user mentions a specific run/route name like "Downskis"
             # Extract possible names from quotes or capitalized words
             potential_names = re.findall(r'["\'](.+?)["\']', query.question)
@@ -401,96 +552,51 @@ async def query_strava_data(
             
             if relevant_list and (named_matches or needs_enrichment or len(relevant_list) <= 5):
                 # Prioritize activities that match query terms using smart scoring
+                # Cap enrichment; the MCP scheduler paces whatever is not cached yet
                 try:
-                    query_lower = query.question.lower()
-                    def relevance_score(act):
-                        score = 0
-                        full_text = f"{str(act.get('name', ''))} {str(act.get('private_note', ''))} {str(act.get('description', ''))}".lower()
-                        # Use a broader set of stop words to focus on meaningful content
-                        stop_words = {'what', 'was', 'the', 'list', 'all', 'segments', 'from', 'at', 'in', 'on', 'my', 'run', 'ride', 'did', 'last', 'show', 'me', 'how', 'about'}
-                        query_words = [w for w in re.findall(r'\w+', query.question.lower()) if w not in stop_words]
-                        
-                        # 1. Content match
-                        for w in query_words:
-                            if w in full_text: score += 10
-                            
-                        # 2. Name Match (High Priority)
-                        if potential_names:
-                            for name_part in potential_names:
-                                if name_part.lower() in str(act.get('name', '')).lower():
-                                    score += 200
-                        
-                        # 3. Recency Match (Critical for "my run today")
-                        try:
-                            # Parse ISO date "2024-01-23T..."
-                            start_str = act.get('start_date', '') or act.get('start_time', '')
-                            if start_str:
-                                # Simple string prefix match for Current Year/Month often enough, but let's be robust
-                                # We'll just give a blanket boost to the most recent items by using the timestamp effectively
-                                # But to keep "score" comparable, we add step functions.
-                                from datetime import datetime, timedelta
-                                act_dt = datetime.fromisoformat(start_str.replace("Z", "+00:00"))
-                                now = datetime.now(act_dt.tzinfo)
-                                delta = now - act_dt
-                                
-                                if delta.days < 2:
-                                    score += 500  # "Today/Yesterday" - Absolute Priority
-                                elif delta.days < 7:
-                                    score += 150  # "This week"
-                                elif delta.days < 30:
-                                    score += 50   # "This month"
-                        except Exception:
-                            pass
-
-                        # 4. Distance match (very high priority for enrichment)
-                        dist = act.get('distance_miles', 0)
-                        for w in query_words:
-                            if w.replace('.', '', 1).isdigit():
-                                try:
-                                    target_dist = float(w)
-                                    if abs(dist - target_dist) < 0.1:
-                                        score += 100 # Ensure distance matches are enriched
-                                    elif abs(dist - target_dist) < 0.3:
-                                        score += 50
-                                except: pass
-                        return (score, act.get('start_time', ''))
-
-                    relevant_list.sort(key=relevance_score, reverse=True)
+                    ranker = RelevanceRanker(query.question, ENRICHMENT_PROFILE, names=potential_names)
+                    activities_to_enrich = ranker.top_k(relevant_list, ENRICHMENT_LIMIT)
+                    # Float the enriched activities to the top of the context list
+                    top_ids = {id(act) for act in activities_to_enrich}
+                    relevant_list[:] = activities_to_enrich + [act for act in relevant_list if id(act) not in top_ids]
                 except Exception as e:
                     logger.error(f"Relevance sorting failed: {e}")
+                    activities_to_enrich = relevant_list[:ENRICHMENT_LIMIT]
 
-                # CAP ENRICHMENT TO TOP 3 to prevent rate limits
-                activities_to_enrich = relevant_list[:3]
                 logger.info(f"Enriching top {len(activities_to_enrich)} activities (capped)...")
                 
                 try:
+                    enrich_by_id = {act['id']: act for act in activities_to_enrich}
                     async with httpx.AsyncClient(timeout=30.0) as detail_client:
-                        tasks = [detail_client.get(f"{MCP_SERVER_URL}/activities/{act['id']}", headers=headers) for act in activities_to_enrich]
-                        responses = await asyncio.gather(*tasks, return_exceptions=True)
-                        logger.info(f"Enrichment: Found {len(responses)} detail responses.")
-                        for i, res in enumerate(responses):
-                            if isinstance(res, httpx.Response) and res.status_code == 200:
-                                detailed_data = res.json()
-                                logger.info(f"Enriched activity {relevant_list[i].get('id')} with {len(detailed_data.get('segment_efforts', []))} segments.")
-                                relevant_list[i].update({
-                                    'private_note': detailed_data.get('private_note'),
-                                    'description': detailed_data.get('description'),
-                                    'name': detailed_data.get('name'),
-                                    'segments': [
-                                        {
-                                            'name': s.get('name'), 
-                                            # Format segment time: Use h:mm:ss if >= 1 hour, else m:ss
-                                            'elapsed_time': (lambda t: f"{int(t)//3600}:{int(t)%3600//60:02d}:{int(t)%60:02d}" if int(t) >= 3600 else f"{int(t)//60}:{int(t)%60:02d}")(int(s.get('elapsed_time', 0))),
-                                            'id': s.get('segment', {}).get('id')
-                                        } 
-                                        for s in detailed_data.get('segment_efforts', [])[:15]
-                                    ]
-                                })
-                                # Persist segments found here
-                                try: save_segments_from_activity(detailed_data, db)
-                                except Exception: pass
-                            else:
-                                logger.error(f"Failed to enrich activity {relevant_list[i].get('id')}: {res}")
+                        async for line in stream_activity_details(detail_client, headers, list(enrich_by_id), ENRICHMENT_DEADLINE_SECONDS):
+                            if line.get('done'):
+                                logger.info(f"Enrichment: {line['cached']} cached, {line['fetched']} fetched, {len(line['pending'])} still pending at deadline.")
+                                continue
+                            act = enrich_by_id.get(line.get('id'))
+                            if act is None:
+                                continue
+                            if 'activity' not in line:
+                                logger.error(f"Failed to enrich activity {line['id']}: {line.get('error')}")
+                                continue
+                            detailed_data = line['activity']
+                            logger.info(f"Enriched activity {act.get('id')} ({line['source']}) with {len(detailed_data.get('segment_efforts', []))} segments.")
+                            act.update({
+                                'private_note': detailed_data.get('private_note'),
+                                'description': detailed_data.get('description'),
+                                'name': detailed_data.get('name'),
+                                'segments': [
+                                    {
+                                        'name': s.get('name'), 
+                                        # Format segment time: Use h:mm:ss if >= 1 hour, else m:ss
+                                        'elapsed_time': (lambda t: f"{int(t)//3600}:{int(t)%3600//60:02d}:{int(t)%60:02d}" if int(t) >= 3600 else f"{int(t)//60}:{int(t)%60:02d}")(int(s.get('elapsed_time', 0))),
+                                        'id': s.get('segment', {}).get('id')
+                                    } 
+                                    for s in detailed_data.get('segment_efforts', [])[:15]
+                                ]
+                            })
+                            # Persist segments found here
+                            try: save_segments_from_activity(detailed_data, db)
+                            except Exception: pass
                 except Exception as e:
                     logger.error(f"Enrichment failed: {e}")
 
@@ -512,6 +618,7 @@ async def query_strava_data(
 
             # GEAR & ZONES ENRICHMENT
             # If the user asks about heart rate zones, intensity, or gear (shoes/bikes).
+            trace.stage("zones")
             try:
                 question_lower = query.question.lower()
                 
@@ -532,7 +639,25 @@ async def query_strava_data(
                                 if isinstance(res, httpx.Response) and res.status_code == 200:
                                     # Inject zones into the activity object
                                     acts_to_zone[i]['zones'] = res.json()
-                
+
+                # STREAM ANALYTICS (best efforts, power curve, drift) computed by the MCP server
+                if any(w in question_lower for w in ['best', 'fastest', 'power', 'watts', 'pace', 'mile', '5k', '10k', 'marathon', 'drift', 'decoupling', 'elevation', 'climb', 'zone', 'heart rate']):
+                    acts_to_analyze = relevant_list[:3] if relevant_list else []
+                    if acts_to_analyze:
+                        logger.info(f"Fetching stream analytics for {len(acts_to_analyze)} activities...")
+                        async with httpx.AsyncClient(timeout=30.0) as analytics_client:
+                            tasks = [
+                                analytics_client.get(f"{MCP_SERVER_URL}/activities/{act['id']}/analytics", headers=headers)
+                                for act in acts_to_analyze
+                            ]
+                            responses = await asyncio.gather(*tasks, return_exceptions=True)
+
+                            for i, res in enumerate(responses):
+                                if isinstance(res, httpx.Response) and res.status_code == 200:
+                                    analytics = res.json()
+                                    analytics.pop('activity_id', None)
+                                    acts_to_analyze[i]['analytics'] = analytics
+
                 # GEAR
                 if any(w in question_lower for w in ['shoe', 'bike', 'gear', 'equipment', 'mileage']):
                     # Check if activities have gear_id
@@ -557,6 +682,7 @@ async def query_strava_data(
             }
         
         # System instructions (reduces token cost, can be cached)
+        trace.stage("prompt_build")
         from datetime import datetime
         current_date_str = datetime.now().strftime("%B %d, %Y")
         
@@ -589,6 +715,12 @@ IMPORTANT INSTRUCTIONS:
   - `date`: Date of the activity (YYYY-MM-DD).
   - `segments`: List of segments.
      - **DURATION FORMATTING**: For segment times, if the duration is >= 60 minutes, format as `h:mm:ss` (e.g., "3:05:12" for 3h 5m 12s) or `h m s` (e.g. "3h 5m"). DO NOT use "185:12" (minutes:seconds) format for durations over an hour.
+  - `analytics`: Numbers computed from the activity's recorded streams (present only when relevant).
+     - `best_efforts`: Fastest time for standard distances within the activity (e.g. "1 mile": "6:42").
+     - `power_curve_w` / `pace_curve`: Best average power (watts) / pace (per mile) held for each duration (e.g. "20m").
+     - `hr_zone_seconds` / `power_zone_seconds`: Seconds spent in each zone, zone 1 first.
+     - `decoupling_pct`: Heart-rate drift between the first and second half; under 5% means the effort was aerobically steady.
+     - `elevation_gain_m`: Recomputed elevation gain in meters.
 
 - **LINKING & FORMATTING**:
   - **ACTIVITY STRUCTURE**: 
@@ -609,6 +741,7 @@ IMPORTANT INSTRUCTIONS:
   - Each effort includes `activity_id` - use this to create activity links: `https://www.strava.com/activities/{{activity_id}}`
   - For "how many times" queries: Count the entries in effort_history.
   - **CRITICAL**: Do NOT show a random activity - use the specific date from effort_history.
+  - `analytics` (per mentioned segment) is precomputed from the full history: `attempts`, `attempts_per_year`, `best_efforts` (fastest first), `first_effort`, `last_effort` (with `percentile`: share of attempts it beat or tied), and `pr_progression` (each new personal best in date order). Prefer these over counting or sorting effort_history yourself.
 - **DATA ANALYSIS**: 
   - **DISTANCES**: If you are searching for an "exactly X miles" run, and the data shows X.008 or X.992, you MUST report it as exactly "X.0 miles". Strava UI rounds to 1 decimal place, so match that look.
   - **DATES**: Every activity summary MUST start with the full date (e.g. August 2, 2025).
@@ -647,6 +780,7 @@ Answer the user's question following the MANDATORY RULES above.
         # 4. Generate Answer using LLM provider (OpenRouter, DeepSeek, or Gemini)
         
         # Check Cache
+        trace.stage("llm_cache_lookup")
         import hashlib
 
         from .models import LLMCache
@@ -666,8 +800,14 @@ Answer the user's question following the MANDATORY RULES above.
         
         if cached_entry:
             logger.info("Returning cached LLM response")
+            LLM_CACHE_LOOKUPS.inc(result="hit")
+            QUERY_OUTCOMES.inc(outcome="cached")
             return QueryResponse(answer=cached_entry.response, data_used=context_data)
 
+        LLM_CACHE_LOOKUPS.inc(result="miss")
+        PROMPT_CHARS.observe(len(system_instruction) + len(user_prompt))
+
+        trace.stage("llm_generation")
         try:
             llm = get_llm_provider()
             
@@ -718,41 +858,88 @@ Answer the user's question following the MANDATORY RULES above.
             else:
                 answer_text = f"Error generating answer: {error_str}"
         
+        QUERY_OUTCOMES.inc(outcome="answered")
         return QueryResponse(answer=answer_text, data_used=context_data)
         
     except HTTPException as he:
+        QUERY_OUTCOMES.inc(outcome="error")
         raise he
     except Exception as e:
+        QUERY_OUTCOMES.inc(outcome="error")
         import traceback
         error_trace = traceback.format_exc()
         logger.error(f"Query handler CRASH: {error_trace}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
+STREAM_PASSTHROUGH_HEADERS = ("Content-Type", "Content-Disposition", "ETag", "Cache-Control")
+
+async def open_mcp_stream(url: str, headers: dict, timeout: float = 30.0):
+    """
+    Start a GET against the MCP server without reading the body.
+    Returns (client, response); close both with close_mcp_stream, or hand them to
+    stream_mcp_response which closes them once the body has been relayed.
+    """
+    client = httpx.AsyncClient(timeout=timeout)
+    try:
+        response = await client.send(client.build_request("GET", url, headers=headers), stream=True)
+    except BaseException:
+        await client.aclose()
+        raise
+    return client, response
+
+async def close_mcp_stream(client: httpx.AsyncClient, response: httpx.Response):
+    await response.aclose()
+    await client.aclose()
+
+def stream_mcp_response(client: httpx.AsyncClient, response: httpx.Response, default_media_type: str,
+                        default_headers: dict = None) -> StreamingResponse:
+    """Relay an MCP body chunk by chunk, so large exports are never held in memory here."""
+    async def body():
+        try:
+            async for chunk in response.aiter_bytes():
+                yield chunk
+        finally:
+            await close_mcp_stream(client, response)
+
+    headers = dict(default_headers or {})
+    headers.update({k: response.headers[k] for k in STREAM_PASSTHROUGH_HEADERS if k in response.headers and k != "Content-Type"})
+    return StreamingResponse(
+        body(),
+        media_type=response.headers.get("content-type") or default_media_type,
+        headers=headers
+    )
+
 @router.get("/activities/{activity_id}/map")
 async def get_activity_map(
     activity_id: int,
+    request: Request,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Proxy map request to MCP server."""
+    """Proxy map request to MCP server (passes ETags through so unchanged maps are 304s)."""
     logger.info(f"Map request received for {activity_id} from user {user.id}")
     token = await get_valid_token(user, db)
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            logger.info(f"Fetching map from MCP: {MCP_SERVER_URL}/activities/{activity_id}/map")
-            response = await client.get(
-                f"{MCP_SERVER_URL}/activities/{activity_id}/map",
-                headers={"X-Strava-Token": token}
-            )
-            if response.status_code != 200:
-                logger.error(f"MCP Map error: {response.status_code} - {response.text[:100]}")
-                raise HTTPException(status_code=response.status_code, detail="Failed to fetch map from MCP")
-            
-            logger.info(f"Map delivered for {activity_id}")
-            return HTMLResponse(content=response.text)
-        except Exception as e:
-            logger.error(f"Map proxy failed: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+    headers = mcp_headers(token, user.strava_athlete_id)
+    if request.headers.get("If-None-Match"):
+        headers["If-None-Match"] = request.headers["If-None-Match"]
+    try:
+        logger.info(f"Fetching map from MCP: {MCP_SERVER_URL}/activities/{activity_id}/map")
+        client, response = await open_mcp_stream(f"{MCP_SERVER_URL}/activities/{activity_id}/map", headers)
+    except Exception as e:
+        logger.error(f"Map proxy failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if response.status_code != 200:
+        cache_headers = {k: response.headers[k] for k in ("ETag", "Cache-Control") if k in response.headers}
+        error_body = (await response.aread())[:100] if response.status_code != 304 else b""
+        await close_mcp_stream(client, response)
+        if response.status_code == 304:
+            return Response(status_code=304, headers=cache_headers)
+        logger.error(f"MCP Map error: {response.status_code} - {error_body!r}")
+        raise HTTPException(status_code=response.status_code, detail="Failed to fetch map from MCP")
+
+    logger.info(f"Map delivered for {activity_id}")
+    return stream_mcp_response(client, response, "text/html")
 
 @router.get("/routes/{route_id}/gpx")
 async def download_route_gpx(
@@ -760,30 +947,31 @@ async def download_route_gpx(
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Proxy route GPX download to MCP server."""
+    """Proxy route GPX download to MCP server (streamed through)."""
     try:
         token = await get_valid_token(user, db)
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.get(f"{MCP_SERVER_URL}/routes/{route_id}/export_gpx", headers={"X-Strava-Token": token})
-            # Safe handling of headers
-            content_disp = resp.headers.get("content-disposition") or f"attachment; filename=route_{route_id}.gpx"
-            content_type = resp.headers.get("content-type") or "application/gpx+xml"
-            
-            return Response(
-                content=resp.content,
-                media_type=content_type,
-                headers={"Content-Disposition": content_disp}
-            )
+        client, resp = await open_mcp_stream(f"{MCP_SERVER_URL}/routes/{route_id}/export_gpx", mcp_headers(token, user.strava_athlete_id))
     except Exception as e:
         logger.error(f"GPX proxy failed: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+    if resp.status_code != 200:
+        detail = (await resp.aread()).decode(errors="replace")[:200]
+        await close_mcp_stream(client, resp)
+        logger.error(f"MCP GPX error: {resp.status_code} - {detail}")
+        return JSONResponse(status_code=resp.status_code, content={"error": detail})
+
+    return stream_mcp_response(
+        client, resp, "application/gpx+xml",
+        default_headers={"Content-Disposition": f"attachment; filename=route_{route_id}.gpx"}
+    )
+
 @router.get("/test-data")
 async def get_test_data(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Utility to see what data the backend fetches for debugging."""
     access_token = await get_valid_token(user, db)
     async with httpx.AsyncClient() as client:
-        headers = {"X-Strava-Token": access_token}
+        headers = mcp_headers(access_token, user.strava_athlete_id)
         stats_resp = await client.get(f"{MCP_SERVER_URL}/athlete/stats", headers=headers)
         activities_resp = await client.get(f"{MCP_SERVER_URL}/activities/recent?limit=10", headers=headers)
         
@@ -0,0 +1,174 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import extract, func
+from sqlalchemy.orm import Session
+
+from ..models import Segment, SegmentEffort, SegmentEffortSync
+
+logger = logging.getLogger(__name__)
+
+# How long a complete local history is trusted before asking the MCP server again
+HISTORY_MAX_AGE = timedelta(hours=1)
+
+
+def _efforts(db: Session, athlete_id: int, segment_id: int):
+    return db.query(SegmentEffort).filter(
+        SegmentEffort.segment_id == segment_id,
+        SegmentEffort.athlete_id == athlete_id
+    )
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def is_history_complete(db: Session, athlete_id: int, segment_id: int,
+                        max_age: timedelta = HISTORY_MAX_AGE) -> bool:
+    """True if the athlete's full effort history for the segment is stored and recent enough."""
+    sync = db.query(SegmentEffortSync).filter(
+        SegmentEffortSync.athlete_id == athlete_id,
+        SegmentEffortSync.segment_id == segment_id
+    ).first()
+    return bool(
+        sync and sync.complete and sync.synced_at
+        and datetime.utcnow() - sync.synced_at < max_age
+    )
+
+
+def save_effort_history(db: Session, athlete_id: int, segment_id: int, efforts: List[dict]):
+    """
+    Store a full effort listing (e.g. from the MCP /segments/{id}/efforts endpoint)
+    and mark the history complete.
+    """
+    if efforts and db.query(Segment).filter(Segment.id == segment_id).first() is None:
+        # Efforts reference the segment; create it from the embedded summary
+        segment_data = efforts[0].get("segment") or {}
+        db.add(Segment(
+            id=segment_id,
+            name=segment_data.get("name"),
+            distance=segment_data.get("distance"),
+            average_grade=segment_data.get("average_grade"),
+            city=segment_data.get("city")
+        ))
+        db.flush()
+
+    existing = {
+        e.id: e for e in db.query(SegmentEffort).filter(
+            SegmentEffort.id.in_([e.get("id") for e in efforts if e.get("id")])
+        )
+    }
+    for effort in efforts:
+        effort_id = effort.get("id")
+        if not effort_id:
+            continue
+        activity = effort.get("activity")
+        activity_id = activity.get("id") if isinstance(activity, dict) else activity
+        row = existing.get(effort_id)
+        if row is None:
+            row = SegmentEffort(id=effort_id, segment_id=segment_id, activity_id=activity_id)
+            db.add(row)
+        row.athlete_id = athlete_id
+        row.elapsed_time = effort.get("elapsed_time")
+        row.moving_time = effort.get("moving_time")
+        row.start_date = _parse_date(effort.get("start_date"))
+        row.kom_rank = effort.get("kom_rank")
+        row.pr_rank = effort.get("pr_rank")
+
+    sync = db.query(SegmentEffortSync).filter(
+        SegmentEffortSync.athlete_id == athlete_id,
+        SegmentEffortSync.segment_id == segment_id
+    ).first()
+    if sync is None:
+        sync = SegmentEffortSync(athlete_id=athlete_id, segment_id=segment_id)
+        db.add(sync)
+    sync.complete = True
+    sync.synced_at = datetime.utcnow()
+
+    try:
+        db.commit()
+    except Exception as e:
+        logger.error(f"Error saving effort history for segment {segment_id}: {e}")
+        db.rollback()
+
+
+def effort_history(db: Session, athlete_id: int, segment_id: int) -> List[SegmentEffort]:
+    """All efforts, oldest first."""
+    return _efforts(db, athlete_id, segment_id).order_by(SegmentEffort.start_date.asc()).all()
+
+
+def nth_best(db: Session, athlete_id: int, segment_id: int, n: int = 1) -> Optional[SegmentEffort]:
+    """The nth fastest effort (1 = PR)."""
+    return _efforts(db, athlete_id, segment_id)\
+        .order_by(SegmentEffort.elapsed_time.asc(), SegmentEffort.start_date.asc())\
+        .offset(max(n - 1, 0))\
+        .first()
+
+
+def first_and_last_effort(db: Session, athlete_id: int, segment_id: int):
+    """(first, last) efforts by date, or (None, None)."""
+    query = _efforts(db, athlete_id, segment_id)
+    first = query.order_by(SegmentEffort.start_date.asc()).first()
+    last = query.order_by(SegmentEffort.start_date.desc()).first()
+    return first, last
+
+
+def attempts_per_year(db: Session, athlete_id: int, segment_id: int) -> Dict[str, int]:
+    year = extract("year", SegmentEffort.start_date)
+    rows = _efforts(db, athlete_id, segment_id)\
+        .with_entities(year, func.count(SegmentEffort.id))\
+        .group_by(year)\
+        .order_by(year)\
+        .all()
+    return {str(int(y)): count for y, count in rows if y is not None}
+
+
+def pr_progression(db: Session, athlete_id: int, segment_id: int) -> List[SegmentEffort]:
+    """Efforts that were a new personal best at the time, oldest first."""
+    progression = []
+    best = None
+    for effort in effort_history(db, athlete_id, segment_id):
+        if effort.elapsed_time is not None and (best is None or effort.elapsed_time < best):
+            best = effort.elapsed_time
+            progression.append(effort)
+    return progression
+
+
+def percentile_rank(db: Session, athlete_id: int, segment_id: int, elapsed_time: int) -> Optional[float]:
+    """Share of the athlete's efforts (0-100) that this time beats or ties. 100 = PR."""
+    query = _efforts(db, athlete_id, segment_id)
+    total = query.count()
+    if not total:
+        return None
+    slower = query.filter(SegmentEffort.elapsed_time >= elapsed_time).count()
+    return round(slower / total * 100, 1)
+
+
+def segment_summary(db: Session, athlete_id: int, segment_id: int, format_time) -> Dict:
+    """Compact PR analytics for the LLM context. format_time renders seconds as a string."""
+    def row(effort: Optional[SegmentEffort]) -> Optional[Dict]:
+        if effort is None:
+            return None
+        return {
+            "activity_id": effort.activity_id,
+            "date": effort.start_date.strftime("%Y-%m-%d") if effort.start_date else None,
+            "time_str": format_time(effort.elapsed_time),
+            "elapsed_time": effort.elapsed_time,
+        }
+
+    first, last = first_and_last_effort(db, athlete_id, segment_id)
+    summary = {
+        "attempts": _efforts(db, athlete_id, segment_id).count(),
+        "attempts_per_year": attempts_per_year(db, athlete_id, segment_id),
+        "best_efforts": [row(nth_best(db, athlete_id, segment_id, n)) for n in (1, 2, 3)],
+        "first_effort": row(first),
+        "last_effort": row(last),
+        "pr_progression": [row(e) for e in pr_progression(db, athlete_id, segment_id)],
+    }
+    summary["best_efforts"] = [e for e in summary["best_efforts"] if e]
+    if last is not None and last.elapsed_time is not None:
+        summary["last_effort"]["percentile"] = percentile_rank(db, athlete_id, segment_id, last.elapsed_time)
+    return summary
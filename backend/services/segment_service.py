@@ -1,13 +1,14 @@
 import logging
 import httpx
 import os
-from typing import List
+from typing import List, Optional
 from sqlalchemy.orm import Session
+from ..deps import mcp_headers
 from ..models import Segment, SegmentEffort
 
 logger = logging.getLogger(__name__)
 
-async def sync_starred_segments(token: str, db: Session):
+async def sync_starred_segments(token: str, db: Session, athlete_id: Optional[int] = None):
     """
     Fetch starred segments from Strava (via MCP) and save to local DB.
     This enables fuzzy-matching of segment names for users.
@@ -19,7 +20,7 @@ async def sync_starred_segments(token: str, db: Session):
         try:
             resp = await client.get(
                 f"{mcp_url}/segments/starred",
-                headers={"X-Strava-Token": token}
+                headers=mcp_headers(token, athlete_id)
             )
             if resp.status_code != 200:
                 logger.error(f"Failed to fetch starred segments: {resp.text}")
@@ -111,6 +112,7 @@ def save_segments_from_activity(activity_data: dict, db: Session):
                 id=effort_id,
                 segment_id=segment_id,
                 activity_id=activity_id,
+                athlete_id=(effort.get("athlete") or {}).get("id"),
                 elapsed_time=effort.get("elapsed_time"),
                 moving_time=effort.get("moving_time"),
                 start_date=start_date,
@@ -123,6 +125,7 @@ def save_segments_from_activity(activity_data: dict, db: Session):
             segment_effort.moving_time = effort.get("moving_time")
             segment_effort.kom_rank = effort.get("kom_rank")
             segment_effort.pr_rank = effort.get("pr_rank")
+            segment_effort.athlete_id = (effort.get("athlete") or {}).get("id") or segment_effort.athlete_id
     
     try:
         db.commit()
@@ -0,0 +1,5 @@
+import os
+
+# Tests never touch Postgres: database.py builds its engine at import time, and
+# the Postgres driver may not be installed
+os.environ.setdefault("DATABASE_URL", "sqlite://")
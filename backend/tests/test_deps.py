@@ -0,0 +1,22 @@
+import os
+import sys
+
+# Ensure backend module is available
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.config import settings
+from backend.deps import mcp_headers
+
+
+def test_mcp_headers_send_athlete_id_only_with_internal_key(monkeypatch):
+    monkeypatch.setattr(settings, "MCP_INTERNAL_KEY", "")
+    # Without the shared key the MCP server would ignore the id, so it is not sent
+    assert mcp_headers("tok", 42) == {"X-Strava-Token": "tok"}
+
+    monkeypatch.setattr(settings, "MCP_INTERNAL_KEY", "secret")
+    assert mcp_headers("tok", 42) == {
+        "X-Strava-Token": "tok",
+        "X-Strava-Athlete-Id": "42",
+        "X-MCP-Internal-Key": "secret",
+    }
+    assert mcp_headers("tok") == {"X-Strava-Token": "tok"}
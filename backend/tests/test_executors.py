@@ -0,0 +1,34 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+# Ensure backend module is available
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend import executors
+from backend.context_optimizer import activity_count, optimize_context
+
+SUMMARY = {
+    "activities_by_date": {
+        "2024-05-01": [{"id": 1, "name": "Hill repeats", "distance_miles": 6.2, "map": {"polyline": "abc"}}],
+        "2024-05-03": [{"id": 2, "name": "Recovery", "distance_miles": 3.1}],
+    },
+}
+STATS = {"all_run_totals": {"count": 2}}
+
+
+@pytest.mark.asyncio
+async def test_optimizer_runs_in_the_process_pool(monkeypatch):
+    args = ("list my hill runs", SUMMARY, STATS, {}, (datetime(2024, 5, 1), datetime(2024, 5, 31)))
+    expected = optimize_context(*args)
+    assert activity_count(SUMMARY) == 2
+
+    monkeypatch.setattr(executors, "PROCESS_POOL_MIN_ITEMS", 1)
+    before = executors.get_stats()
+    try:
+        assert await executors.run_cpu_bound(optimize_context, *args, size=activity_count(SUMMARY)) == expected
+        assert executors.get_stats()["process_tasks"] == before["process_tasks"] + 1
+    finally:
+        executors.shutdown()
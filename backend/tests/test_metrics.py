@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+# Ensure backend module is available
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.metrics import (
+    Counter,
+    Histogram,
+    Registry,
+    http_request_seconds,
+    render,
+    set_namespace,
+    span,
+    stage_seconds,
+    trace,
+)
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    lookups = Counter("test_lookups_total", "Lookups.", ["result"], registry=registry)
+    latency = Histogram("test_latency_seconds", "Latency.", ["route"], buckets=(0.1, 1.0), registry=registry)
+    lookups.inc(result="hit")
+    lookups.inc(2, result="miss")
+    latency.observe(0.05, route="/a")
+    latency.observe(0.5, route="/a")
+    latency.observe(5, route="/a")
+
+    text = registry.render()
+    assert "# TYPE test_lookups_total counter" in text
+    assert 'test_lookups_total{result="miss"} 2' in text
+    # Buckets are cumulative, with a +Inf bucket equal to the count
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_sum{route="/a"} 5.55' in text
+    assert 'test_latency_seconds_count{route="/a"} 3' in text
+
+
+def test_label_names_are_checked():
+    counter = Counter("test_checked_total", "Checked.", ["result"], registry=None)
+    with pytest.raises(ValueError):
+        counter.inc(outcome="hit")
+
+
+def test_trace_records_stages_and_spans():
+    before = stage_seconds.get_count(stage="test_fetch")
+    with trace("GET /test") as request_trace:
+        request_trace.stage("test_fetch")
+        with span("test_nested"):
+            pass
+        request_trace.stage("test_answer")
+    assert list(request_trace.stages) == ["test_nested", "test_fetch", "test_answer"]
+    assert stage_seconds.get_count(stage="test_fetch") == before + 1
+
+
+def test_set_namespace_renames_builtin_metrics():
+    try:
+        set_namespace("test_service")
+        assert "# TYPE test_service_stage_seconds histogram" in render()
+        assert "test_service_http_request_seconds" in http_request_seconds.name
+    finally:
+        set_namespace("copilot")
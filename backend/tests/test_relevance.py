@@ -0,0 +1,69 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Ensure backend module is available
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.relevance import ENRICHMENT_PROFILE, ActivityFeatures, RelevanceRanker, parse_epochs
+
+
+def _iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _activity(aid, name, days_ago, miles=3.0, note=""):
+    start = _iso(datetime.now(timezone.utc) - timedelta(days=days_ago))
+    return {"id": aid, "name": name, "distance_miles": miles, "start_time": start, "private_note": note}
+
+
+def test_parse_epochs_handles_missing_and_malformed():
+    epochs = parse_epochs(["2024-01-23T08:00:00Z", "", "not-a-date"])
+    assert epochs[0] == datetime(2024, 1, 23, 8, tzinfo=timezone.utc).timestamp()
+    assert all(e != e for e in epochs[1:])  # NaN
+
+
+def test_keyword_match_floats_old_activity_to_top():
+    activities = [
+        _activity(1, "Morning Run", 10),
+        _activity(2, "Angeles Crest 100", 400),
+        _activity(3, "Evening Run", 20),
+    ]
+    top = RelevanceRanker("angeles crest race").top_k(activities, 1)
+    assert [a["id"] for a in top] == [2]
+
+
+def test_today_gets_absolute_priority():
+    activities = [_activity(1, "Angeles Crest", 400), _activity(2, "Lunch Run", 0)]
+    top = RelevanceRanker("what did I do angeles").top_k(activities, 2)
+    assert [a["id"] for a in top] == [2, 1]
+
+
+def test_distance_tiers_and_tie_break_by_start_time():
+    activities = [
+        _activity(1, "A", 50, miles=5.002),
+        _activity(2, "B", 60, miles=5.2),
+        _activity(3, "C", 40, miles=8.0),
+        _activity(4, "D", 45, miles=8.0),
+    ]
+    ranked = RelevanceRanker("exactly 5 miles").top_k(activities)
+    assert [a["id"] for a in ranked] == [1, 2, 3, 4]
+
+
+def test_enrichment_profile_name_match_and_reusable_features():
+    activities = [_activity(1, "Downskis loop", 90), _activity(2, "Recovery", 1)]
+    features = ActivityFeatures(activities)
+    ranker = RelevanceRanker("my Downskis run", ENRICHMENT_PROFILE, names=["Downskis"])
+    scores = ranker.score(features)
+    assert scores[0] == 10 + 200
+    assert scores[1] == 500
+    assert ranker.top_k(activities, 0, features=features) == []
+
+
+def test_text_features_are_not_padded_to_the_longest_text():
+    activities = [_activity(1, "Long day", 5, note="x" * 5000), _activity(2, "Tempo", 3)]
+    features = ActivityFeatures(activities)
+    # Each text keeps its own length (a numpy "<U" array pads all rows to the longest)
+    assert len(features.texts[1]) < 50
+    scores = RelevanceRanker("tempo").score(features)
+    assert scores[1] - scores[0] == 10
@@ -0,0 +1,76 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+# Ensure backend module is available
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest  # noqa: E402
+from backend.database import Base  # noqa: E402
+from backend.models import SegmentEffortSync  # noqa: E402
+from backend.services.segment_analytics import (  # noqa: E402
+    attempts_per_year,
+    is_history_complete,
+    nth_best,
+    percentile_rank,
+    pr_progression,
+    save_effort_history,
+    segment_summary,
+)
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+ATHLETE = 42
+SEGMENT = 7
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _effort(effort_id, date, elapsed):
+    return {
+        "id": effort_id,
+        "segment": {"id": SEGMENT, "name": "Commute Hill", "distance": 800.0},
+        "activity": {"id": 1000 + effort_id},
+        "start_date": f"{date}T08:00:00Z",
+        "elapsed_time": elapsed,
+    }
+
+
+def test_history_analytics(db):
+    save_effort_history(db, ATHLETE, SEGMENT, [
+        _effort(1, "2023-05-01", 300),
+        _effort(2, "2023-06-01", 280),
+        _effort(3, "2024-01-10", 290),
+        _effort(4, "2024-03-02", 270),
+    ])
+    # Another athlete's effort on the same segment is ignored
+    save_effort_history(db, 99, SEGMENT, [_effort(5, "2024-04-01", 100)])
+
+    assert is_history_complete(db, ATHLETE, SEGMENT)
+    assert nth_best(db, ATHLETE, SEGMENT, 1).id == 4
+    assert nth_best(db, ATHLETE, SEGMENT, 2).id == 2
+    assert [e.id for e in pr_progression(db, ATHLETE, SEGMENT)] == [1, 2, 4]
+    assert attempts_per_year(db, ATHLETE, SEGMENT) == {"2023": 2, "2024": 2}
+    assert percentile_rank(db, ATHLETE, SEGMENT, 290) == 50.0
+
+    summary = segment_summary(db, ATHLETE, SEGMENT, lambda t: f"{t}s")
+    assert summary["attempts"] == 4
+    assert summary["first_effort"]["date"] == "2023-05-01"
+    assert summary["last_effort"]["percentile"] == 100.0
+
+
+def test_history_goes_stale(db):
+    assert not is_history_complete(db, ATHLETE, SEGMENT)
+    save_effort_history(db, ATHLETE, SEGMENT, [_effort(1, "2023-05-01", 300)])
+    sync = db.query(SegmentEffortSync).first()
+    sync.synced_at = datetime.utcnow() - timedelta(days=1)
+    db.commit()
+    assert not is_history_complete(db, ATHLETE, SEGMENT)
@@ -0,0 +1,61 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions API (the backend's
+"deepseek" provider), so /api/query can be measured without a real model.
+
+    python benchmarks/fake_llm.py --port 9200
+    LLM_PROVIDER=deepseek DEEPSEEK_API_KEY=bench DEEPSEEK_BASE_URL=http://127.0.0.1:9200/v1 uvicorn backend.main:app
+
+The answer names the context optimizer strategy found in the prompt, so the
+benchmark can group questions by strategy. GET /_bench/calls lists every call.
+"""
+import argparse
+import asyncio
+import re
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import Body, FastAPI
+
+app = FastAPI(title="Fake LLM")
+CALLS: List[Dict[str, Any]] = []
+LATENCY_SECONDS = 0.0
+STRATEGY = re.compile(r'"strategy": "(\w+)"')
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+    messages = payload.get("messages", [])
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    match = STRATEGY.search(prompt)
+    strategy = match.group(1) if match else "none"
+    CALLS.append({"strategy": strategy, "prompt_chars": len(prompt)})
+    if LATENCY_SECONDS:
+        await asyncio.sleep(LATENCY_SECONDS)
+    answer = f"strategy={strategy}"
+    return {
+        "id": f"bench-{len(CALLS)}",
+        "object": "chat.completion",
+        "model": payload.get("model", "bench"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        # Roughly four characters per token, like the context optimizer's estimate
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(answer) // 4},
+    }
+
+
+@app.get("/_bench/calls")
+async def bench_calls() -> List[Dict[str, Any]]:
+    return CALLS
+
+
+def main() -> None:
+    global LATENCY_SECONDS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added to every completion")
+    args = parser.parse_args()
+    LATENCY_SECONDS = args.latency_ms / 1000
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
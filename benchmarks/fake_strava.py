@@ -0,0 +1,394 @@
+"""
+Local stand-in for the Strava API, serving synthetic athletes.
+
+The access token picks the athlete: "bench-<n>" is an athlete (id n) with n
+activities, spread over up to 15 years and ending today. Everything is derived
+deterministically from (athlete, activity index), so histories of 50k
+activities cost nothing to hold and are identical between runs.
+
+    python benchmarks/fake_strava.py --port 9100 --latency-ms 25
+    STRAVA_API_BASE_URL=http://127.0.0.1:9100/api/v3 python mcp-server/src/strava_http_server.py
+
+Calls are counted per route template: GET /_bench/calls, POST /_bench/reset.
+"""
+import argparse
+import asyncio
+import math
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+MAX_HISTORY_DAYS = 365 * 15
+SPORTS = (("Run", 0.55), ("Ride", 0.30), ("TrailRun", 0.08), ("Walk", 0.04), ("Swim", 0.03))
+NAMES = {
+    "Run": ("Morning Run", "Easy Run", "Tempo Run", "Long Run", "Lunch Run", "Downskis"),
+    "Ride": ("Morning Ride", "Gravel Loop", "Coffee Ride", "Hill Repeats"),
+    "TrailRun": ("Trail Run", "Ridge Traverse", "Canyon Loop"),
+    "Walk": ("Evening Walk", "Dog Walk"),
+    "Swim": ("Pool Swim", "Lake Swim"),
+}
+NOTES = ("", "", "", "Felt strong.", "Knee pain after mile 4.", "Ran with Sam.", "Windy, legs heavy.", "New shoes!")
+SEGMENT_BASE_ID = 7_000_000
+SEGMENTS = (
+    "Hill Climb", "River Loop", "Bridge Sprint", "Park Straight", "Summit Push",
+    "Harbor Dash", "Forest Descent", "Track Lap", "Canal Path", "Old Mill Road",
+)
+STARRED_SEGMENTS = 5
+# Meters per second by sport
+SPEEDS = {"Run": 3.0, "TrailRun": 2.5, "Ride": 7.5, "Walk": 1.4, "Swim": 0.9}
+
+app = FastAPI(title="Fake Strava API")
+CALLS: Counter = Counter()
+LATENCY_SECONDS = 0.0
+# "Now" for every synthetic history (fixed at startup so pages stay consistent)
+ANCHOR = datetime.now(timezone.utc).replace(hour=23, minute=0, second=0, microsecond=0)
+
+
+class Athlete:
+    def __init__(self, athlete_id: int):
+        self.id = athlete_id
+        self.count = athlete_id
+        span_days = min(max(self.count, 30), MAX_HISTORY_DAYS)
+        self.interval = span_days * 86400 / self.count
+        self._segment_efforts: Dict[int, List[int]] = {}
+
+    def start(self, index: int) -> datetime:
+        """Activity 0 is the newest."""
+        return ANCHOR - timedelta(seconds=(index + 0.5) * self.interval)
+
+    def index_of(self, activity_id: int) -> int:
+        index = activity_id - self.id * 10_000_000
+        if not 0 <= index < self.count:
+            raise HTTPException(status_code=404, detail="Record Not Found")
+        return index
+
+    def rng(self, index: int) -> random.Random:
+        return random.Random(self.id * 1_000_003 + index)
+
+    def summary(self, index: int) -> Dict[str, Any]:
+        rng = self.rng(index)
+        sport = rng.choices([s for s, _ in SPORTS], [w for _, w in SPORTS])[0]
+        speed = SPEEDS[sport] * rng.uniform(0.8, 1.2)
+        moving_time = int(rng.uniform(1200, 7200) * (1.5 if sport == "Ride" else 1))
+        start = self.start(index)
+        return {
+            "id": self.id * 10_000_000 + index,
+            "resource_state": 2,
+            "athlete": {"id": self.id},
+            "name": rng.choice(NAMES[sport]),
+            "type": sport,
+            "sport_type": sport,
+            "start_date": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "start_date_local": (start - timedelta(hours=7)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "timezone": "(GMT-08:00) America/Los_Angeles",
+            "distance": round(moving_time * speed, 1),
+            "moving_time": moving_time,
+            "elapsed_time": moving_time + rng.randint(0, 900),
+            "total_elevation_gain": round(rng.uniform(0, 600), 1),
+            "average_speed": round(speed, 3),
+            "max_speed": round(speed * 1.6, 3),
+            "average_heartrate": round(rng.uniform(120, 165), 1),
+            "max_heartrate": rng.randint(165, 195),
+            "kudos_count": rng.randint(0, 30),
+            "achievement_count": rng.randint(0, 5),
+            "athlete_count": rng.choice((1, 1, 1, 2, 4)),
+            "gear_id": "g1" if sport in ("Run", "TrailRun", "Walk") else "b1",
+            "map": {"id": f"a{index}", "summary_polyline": "", "resource_state": 2},
+        }
+
+    def segments_of(self, index: int) -> List[Tuple[int, int]]:
+        """(segment index, effort seconds) for the segments an activity crossed."""
+        rng = self.rng(index)
+        rng.random()
+        picks = rng.sample(range(len(SEGMENTS)), rng.randint(0, 3))
+        return [(k, rng.randint(90, 900)) for k in picks]
+
+    def segment_effort(self, index: int, segment: int, seconds: int) -> Dict[str, Any]:
+        start = self.start(index)
+        return {
+            "id": (self.id * 10_000_000 + index) * 10 + segment,
+            "name": SEGMENTS[segment],
+            "elapsed_time": seconds,
+            "moving_time": seconds,
+            "start_date": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "start_date_local": (start - timedelta(hours=7)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "activity": {"id": self.id * 10_000_000 + index},
+            "athlete": {"id": self.id},
+            "segment": segment_summary(segment),
+            "pr_rank": None,
+        }
+
+    def detail(self, index: int) -> Dict[str, Any]:
+        activity = self.summary(index)
+        rng = self.rng(index)
+        activity.update({
+            "resource_state": 3,
+            "description": rng.choice(NOTES),
+            "private_note": rng.choice(NOTES),
+            "calories": rng.randint(200, 1500),
+            "segment_efforts": [self.segment_effort(index, k, s) for k, s in self.segments_of(index)],
+        })
+        return activity
+
+    def efforts_for(self, segment: int) -> List[int]:
+        """Activity indexes (newest first) that crossed a segment."""
+        if segment not in self._segment_efforts:
+            self._segment_efforts[segment] = [
+                i for i in range(self.count) if any(k == segment for k, _ in self.segments_of(i))
+            ]
+        return self._segment_efforts[segment]
+
+
+ATHLETES: Dict[int, Athlete] = {}
+
+
+def athlete_for(request: Request) -> Athlete:
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not token.startswith("bench-") or not token[6:].isdigit() or int(token[6:]) <= 0:
+        raise HTTPException(status_code=401, detail="Authorization Error")
+    athlete_id = int(token[6:])
+    if athlete_id not in ATHLETES:
+        ATHLETES[athlete_id] = Athlete(athlete_id)
+    return ATHLETES[athlete_id]
+
+
+def segment_summary(segment: int) -> Dict[str, Any]:
+    return {
+        "id": SEGMENT_BASE_ID + segment,
+        "name": SEGMENTS[segment],
+        "distance": 400.0 + 350 * segment,
+        "average_grade": round(1.5 * (segment % 5), 1),
+        "city": "Bench City",
+    }
+
+
+def segment_index(segment_id: int) -> int:
+    segment = segment_id - SEGMENT_BASE_ID
+    if not 0 <= segment < len(SEGMENTS):
+        raise HTTPException(status_code=404, detail="Record Not Found")
+    return segment
+
+
+def page_bounds(page: int, per_page: int, total: int) -> range:
+    start = (max(page, 1) - 1) * per_page
+    return range(min(start, total), min(start + per_page, total))
+
+
+@app.middleware("http")
+async def count_calls(request: Request, call_next):
+    response = await call_next(request)
+    if request.url.path.startswith("/api/v3"):
+        route = request.scope.get("route")
+        CALLS[getattr(route, "path", request.url.path)] += 1
+        if LATENCY_SECONDS:
+            await asyncio.sleep(LATENCY_SECONDS)
+        total = sum(CALLS.values())
+        response.headers["X-RateLimit-Limit"] = "1000000,10000000"
+        response.headers["X-RateLimit-Usage"] = f"{total},{total}"
+    return response
+
+
+@app.get("/_bench/calls")
+async def bench_calls() -> Dict[str, Any]:
+    return {"total": sum(CALLS.values()), "by_route": dict(CALLS)}
+
+
+@app.post("/_bench/reset")
+async def bench_reset() -> Dict[str, str]:
+    CALLS.clear()
+    return {"status": "reset"}
+
+
+@app.get("/api/v3/athlete")
+async def get_athlete(request: Request) -> Dict[str, Any]:
+    athlete = athlete_for(request)
+    return {"id": athlete.id, "firstname": "Bench", "lastname": f"Athlete {athlete.count}",
+            "shoes": [{"id": "g1", "name": "Trainers", "distance": 1_234_000.0}],
+            "bikes": [{"id": "b1", "name": "Road Bike", "distance": 9_876_000.0}]}
+
+
+@app.get("/api/v3/athletes/{athlete_id}/stats")
+async def get_stats(athlete_id: int, request: Request) -> Dict[str, Any]:
+    athlete = athlete_for(request)
+    runs = int(athlete.count * 0.63)
+    rides = int(athlete.count * 0.30)
+
+    def totals(count: int, speed: float) -> Dict[str, Any]:
+        return {"count": count, "distance": count * 3600 * speed, "moving_time": count * 3600,
+                "elapsed_time": count * 3900, "elevation_gain": count * 150.0}
+
+    return {
+        "all_run_totals": totals(runs, SPEEDS["Run"]),
+        "all_ride_totals": totals(rides, SPEEDS["Ride"]),
+        "ytd_run_totals": totals(min(runs, 200), SPEEDS["Run"]),
+        "ytd_ride_totals": totals(min(rides, 90), SPEEDS["Ride"]),
+        "recent_run_totals": totals(min(runs, 12), SPEEDS["Run"]),
+        "recent_ride_totals": totals(min(rides, 5), SPEEDS["Ride"]),
+        "biggest_ride_distance": 160934.0,
+        "biggest_climb_elevation_gain": 1800.0,
+    }
+
+
+@app.get("/api/v3/athlete/activities")
+async def list_activities(request: Request, page: int = 1, per_page: int = 30,
+                          before: Optional[int] = None, after: Optional[int] = None) -> List[Dict[str, Any]]:
+    athlete = athlete_for(request)
+    newest, oldest = 0, athlete.count  # index range [newest, oldest)
+    if before is not None:
+        newest = max(newest, math.ceil((ANCHOR.timestamp() - before) / athlete.interval - 0.5))
+    if after is not None:
+        oldest = min(oldest, max(0, math.ceil((ANCHOR.timestamp() - after) / athlete.interval - 0.5)))
+    indexes = list(range(newest, oldest))
+    if after is not None:
+        indexes.reverse()  # Strava returns oldest first when `after` is given
+    return [athlete.summary(indexes[i]) for i in page_bounds(page, per_page, len(indexes))]
+
+
+@app.get("/api/v3/activities/{activity_id}")
+async def get_activity(activity_id: int, request: Request) -> Dict[str, Any]:
+    athlete = athlete_for(request)
+    return athlete.detail(athlete.index_of(activity_id))
+
+
+@app.get("/api/v3/activities/{activity_id}/streams")
+async def get_activity_streams(activity_id: int, request: Request, keys: str = "",
+                               key_by_type: bool = False) -> Any:
+    athlete = athlete_for(request)
+    activity = athlete.summary(athlete.index_of(activity_id))
+    rng = athlete.rng(activity["id"])
+    n = min(activity["moving_time"] // 2, 5000)
+    speed = activity["average_speed"]
+    heading = rng.uniform(0, 2 * math.pi)
+    streams = {
+        "time": [2 * i for i in range(n)],
+        "distance": [round(2 * i * speed, 1) for i in range(n)],
+        "latlng": [[round(37.77 + 0.0001 * i * math.sin(heading + i / 400), 6),
+                    round(-122.42 + 0.0001 * i * math.cos(heading + i / 400), 6)] for i in range(n)],
+        "altitude": [round(50 + 30 * math.sin(i / 150), 1) for i in range(n)],
+        "heartrate": [int(activity["average_heartrate"] + 10 * math.sin(i / 90)) for i in range(n)],
+        "velocity_smooth": [round(speed * (1 + 0.1 * math.sin(i / 60)), 2) for i in range(n)],
+        "cadence": [int(85 + 5 * math.sin(i / 45)) for i in range(n)],
+        "moving": [True] * n,
+    }
+    if activity["type"] == "Ride":
+        streams["watts"] = [int(200 + 60 * math.sin(i / 75)) for i in range(n)]
+    wanted = [k for k in keys.split(",") if k] or ["time", "distance"]
+    selected = {k: streams[k] for k in wanted if k in streams}
+    selected.setdefault("distance", streams["distance"])
+    if key_by_type:
+        return {k: {"type": k, "data": v, "series_type": "distance", "original_size": n, "resolution": "high"}
+                for k, v in selected.items()}
+    return [{"type": k, "data": v, "series_type": "distance", "original_size": n, "resolution": "high"}
+            for k, v in selected.items()]
+
+
+@app.get("/api/v3/activities/{activity_id}/zones")
+async def get_activity_zones(activity_id: int, request: Request) -> List[Dict[str, Any]]:
+    athlete = athlete_for(request)
+    activity = athlete.summary(athlete.index_of(activity_id))
+    share = (0.1, 0.35, 0.3, 0.2, 0.05)
+    bounds = ((0, 120), (120, 140), (140, 155), (155, 170), (170, -1))
+    return [{"type": "heartrate", "sensor_based": True, "distribution_buckets": [
+        {"min": lo, "max": hi, "time": int(activity["moving_time"] * s)} for (lo, hi), s in zip(bounds, share)
+    ]}]
+
+
+@app.get("/api/v3/activities/{activity_id}/laps")
+async def get_activity_laps(activity_id: int, request: Request) -> List[Dict[str, Any]]:
+    athlete = athlete_for(request)
+    activity = athlete.summary(athlete.index_of(activity_id))
+    laps = max(1, int(activity["distance"] // 1609))
+    return [{"id": activity["id"] * 100 + i, "lap_index": i + 1, "distance": 1609.0,
+             "elapsed_time": int(1609 / activity["average_speed"])} for i in range(min(laps, 50))]
+
+
+@app.get("/api/v3/athlete/zones")
+async def get_athlete_zones(request: Request) -> Dict[str, Any]:
+    athlete_for(request)
+    return {"heart_rate": {"custom_zones": False, "zones": [
+        {"min": 0, "max": 120}, {"min": 120, "max": 140}, {"min": 140, "max": 155},
+        {"min": 155, "max": 170}, {"min": 170, "max": -1},
+    ]}}
+
+
+@app.get("/api/v3/segments/starred")
+async def get_starred_segments(request: Request, page: int = 1, per_page: int = 30) -> List[Dict[str, Any]]:
+    athlete_for(request)
+    return [segment_summary(k) for k in page_bounds(page, per_page, STARRED_SEGMENTS)]
+
+
+@app.get("/api/v3/segments/{segment_id}")
+async def get_segment(segment_id: int, request: Request) -> Dict[str, Any]:
+    athlete = athlete_for(request)
+    segment = segment_index(segment_id)
+    efforts = athlete.efforts_for(segment)
+    detail = segment_summary(segment)
+    detail["athlete_segment_stats"] = {"effort_count": len(efforts)}
+    if efforts:
+        best = min(efforts, key=lambda i: dict(athlete.segments_of(i))[segment])
+        detail["athlete_pr_effort"] = {
+            "elapsed_time": dict(athlete.segments_of(best))[segment],
+            "activity_id": athlete.id * 10_000_000 + best,
+        }
+    return detail
+
+
+@app.get("/api/v3/segments/{segment_id}/leaderboard")
+async def get_segment_leaderboard(segment_id: int, request: Request, per_page: int = 10) -> Dict[str, Any]:
+    athlete_for(request)
+    segment_index(segment_id)
+    return {"entry_count": 4321, "entries": [
+        {"athlete_name": f"Rider {i + 1}", "elapsed_time": 80 + 3 * i, "rank": i + 1} for i in range(per_page)
+    ]}
+
+
+@app.get("/api/v3/segment_efforts")
+async def list_segment_efforts(request: Request, segment_id: int, page: int = 1, per_page: int = 30,
+                               start_date_local: Optional[str] = None) -> List[Dict[str, Any]]:
+    athlete = athlete_for(request)
+    segment = segment_index(segment_id)
+    efforts = [
+        athlete.segment_effort(i, segment, dict(athlete.segments_of(i))[segment])
+        for i in reversed(athlete.efforts_for(segment))  # Oldest first, like Strava
+    ]
+    if start_date_local:
+        efforts = [e for e in efforts if e["start_date_local"] >= start_date_local]
+    return [efforts[i] for i in page_bounds(page, per_page, len(efforts))]
+
+
+@app.get("/api/v3/gear/{gear_id}")
+async def get_gear(gear_id: str, request: Request) -> Dict[str, Any]:
+    athlete_for(request)
+    return {"id": gear_id, "name": "Trainers" if gear_id == "g1" else "Road Bike", "distance": 1_234_000.0}
+
+
+@app.get("/api/v3/athlete/routes")
+@app.get("/api/v3/athlete/clubs")
+async def get_empty_list(request: Request) -> List[Any]:
+    athlete_for(request)
+    return []
+
+
+@app.exception_handler(HTTPException)
+async def strava_error(request: Request, exc: HTTPException) -> JSONResponse:
+    return JSONResponse(status_code=exc.status_code, content={"message": exc.detail, "errors": []})
+
+
+def main() -> None:
+    global LATENCY_SECONDS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added to every API call (Strava's round trip)")
+    args = parser.parse_args()
+    LATENCY_SECONDS = args.latency_ms / 1000
+    print(f"Fake Strava on :{args.port} (histories end {ANCHOR.date()})")
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""
+End-to-end benchmarks for the MCP server and the backend, run against local
+stand-ins for Strava (fake_strava.py) and the LLM (fake_llm.py).
+
+    python benchmarks/run_benchmarks.py                    # athletes with 100 / 5k / 50k activities
+    python benchmarks/run_benchmarks.py --sizes 100 5000 --strava-latency-ms 50
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier>.json
+
+For each synthetic athlete it measures:
+- /activities/summary, cold (full history fetch) and warm, plus the Strava calls
+  of the cold load
+- how much the MCP server's RSS grows while it loads the athlete
+- /api/query end to end for every question in QUESTIONS (the activity list is
+  already cached by then), grouped by context optimizer strategy, with the
+  Strava calls and prompt size of each question
+
+Results are written to benchmarks/results/<timestamp>.json and compared with
+the previous run (or --compare). Anything more than --threshold slower is
+flagged. All services run in a temporary directory, so no real cache, quota
+state or database is touched.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = ROOT / "benchmarks"
+RESULTS_DIR = BENCH_DIR / "results"
+MCP_SRC = ROOT / "mcp-server" / "src"
+
+DEFAULT_SIZES = (100, 5_000, 50_000)
+# Chosen to exercise the optimizer strategies, keyword search, segments and enrichment
+QUESTIONS = (
+    "What did I do yesterday?",
+    "How far did I run last week?",
+    "What was my longest run in 2023?",
+    "How has my running mileage changed over the years?",
+    "What is my total distance this year?",
+    "List all my runs",
+    "Which of my runs mention \"knee pain\"?",
+    "What is my fastest time on the \"Hill Climb\" segment?",
+    "Show my heart rate zones for my rides this month",
+)
+# Differences below this are noise, whatever the percentage
+MIN_REGRESSION_MS = 5.0
+SESSION_SECRET = "bench-secret"
+INTERNAL_KEY = "bench-internal"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Service:
+    """One server subprocess, logging to <workdir>/<name>.log."""
+
+    def __init__(self, name: str, args: List[str], cwd: Path, workdir: Path, env: Optional[Dict[str, str]] = None,
+                 ready_path: str = "/docs"):
+        self.name = name
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.args = [a.format(port=self.port) for a in args]
+        self.cwd = cwd
+        self.env = {**os.environ, **(env or {})}
+        self.ready_path = ready_path
+        self.log_path = workdir / f"{name}.log"
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float = 60.0) -> "Service":
+        log = open(self.log_path, "w")
+        self.process = subprocess.Popen(self.args, cwd=self.cwd, env=self.env, stdout=log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.name} exited during startup:\n{self.log_tail()}")
+            try:
+                httpx.get(self.url + self.ready_path, timeout=1.0)
+                return self
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise RuntimeError(f"{self.name} did not start within {timeout:.0f}s:\n{self.log_tail()}")
+
+    def stop(self) -> None:
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+    def log_tail(self, lines: int = 20) -> str:
+        try:
+            return "\n".join(self.log_path.read_text().splitlines()[-lines:])
+        except OSError:
+            return ""
+
+    def rss_mb(self) -> Optional[float]:
+        """Resident set size (Linux only; None elsewhere)."""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return round(int(line.split()[1]) / 1024, 1)
+        except OSError:
+            pass
+        return None
+
+
+def start_services(workdir: Path, args) -> Dict[str, Service]:
+    python = sys.executable
+    strava = Service("fake_strava", [python, str(BENCH_DIR / "fake_strava.py"), "--port", "{port}",
+                                     "--latency-ms", str(args.strava_latency_ms)], BENCH_DIR, workdir).start()
+    llm = Service("fake_llm", [python, str(BENCH_DIR / "fake_llm.py"), "--port", "{port}",
+                               "--latency-ms", str(args.llm_latency_ms)], BENCH_DIR, workdir).start()
+    mcp = Service("mcp", [python, "-m", "uvicorn", "strava_http_server:app", "--app-dir", str(MCP_SRC),
+                          "--port", "{port}", "--log-level", "warning"], workdir / "mcp", workdir, env={
+        "STRAVA_API_BASE_URL": f"{strava.url}/api/v3",
+        "STRAVA_LIMIT_15_MIN": "1000000",
+        "STRAVA_LIMIT_DAILY": "10000000",
+        "ACTIVITY_PAGE_PAUSE_SECONDS": "0",
+        "AUTO_HYDRATION": "false",
+        "LOG_LEVEL": "WARNING",
+    }).start()
+    backend = Service("backend", [python, "-m", "uvicorn", "backend.main:app", "--port", "{port}",
+                                  "--log-level", "warning"], ROOT, workdir, env={
+        "DATABASE_URL": os.environ["DATABASE_URL"],
+        "SECRET_KEY": SESSION_SECRET,
+        "MCP_SERVER_URL": mcp.url,
+        "LLM_PROVIDER": "deepseek",
+        "LLM_MODEL": "deepseek/deepseek-chat",
+        "DEEPSEEK_API_KEY": "bench",
+        "DEEPSEEK_BASE_URL": f"{llm.url}/v1",
+        "RATE_LIMIT_ENABLED": "false",
+    }).start()
+    return {"strava": strava, "llm": llm, "mcp": mcp, "backend": backend}
+
+
+def create_user(athlete_id: int) -> str:
+    """Backend user with a long-lived token for the fake athlete; returns a session cookie."""
+    from backend.database import SessionLocal
+    from backend.models import Token, User
+    from backend.security import create_access_token
+
+    db = SessionLocal()
+    try:
+        user = User(strava_athlete_id=athlete_id, name=f"Bench Athlete {athlete_id}")
+        db.add(user)
+        db.flush()
+        db.add(Token(user_id=user.id, access_token=f"bench-{athlete_id}", refresh_token="bench",
+                     expires_at=int(time.time()) + 3600 * 24 * 365))
+        db.commit()
+        return create_access_token({"sub": str(user.id)}, expires_delta=timedelta(days=1))
+    finally:
+        db.close()
+
+
+def strava_calls(strava: Service) -> Dict[str, int]:
+    return httpx.get(f"{strava.url}/_bench/calls").json()["by_route"]
+
+
+def calls_since(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    return {route: n - before.get(route, 0) for route, n in after.items() if n - before.get(route, 0)}
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round((time.perf_counter() - started) * 1000, 1)
+
+
+def bench_summary(services: Dict[str, Service], athlete_id: int, repeats: int) -> Dict[str, Any]:
+    mcp, strava = services["mcp"], services["strava"]
+    headers = {"X-Strava-Token": f"bench-{athlete_id}", "X-Strava-Athlete-Id": str(athlete_id),
+               "X-MCP-Internal-Key": INTERNAL_KEY}
+    url = f"{mcp.url}/activities/summary"
+
+    rss_before = mcp.rss_mb()
+    calls_before = strava_calls(strava)
+    resp, cold_ms = timed(httpx.get, url, headers=headers, timeout=600.0)
+    resp.raise_for_status()
+    cold_calls = calls_since(calls_before, strava_calls(strava))
+    rss_after = mcp.rss_mb()
+
+    warm = []
+    for _ in range(repeats):
+        resp, elapsed = timed(httpx.get, url, headers=headers, timeout=120.0)
+        resp.raise_for_status()
+        warm.append(elapsed)
+
+    return {
+        "summary": {
+            "activities": resp.json()["total_activities"],
+            "cold_ms": cold_ms,
+            "cold_strava_calls": sum(cold_calls.values()),
+            "warm_median_ms": round(statistics.median(warm), 1),
+            "warm_min_ms": min(warm),
+            "warm_max_ms": max(warm),
+        },
+        "memory": {
+            "rss_before_mb": rss_before,
+            "rss_after_mb": rss_after,
+            "delta_mb": round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None,
+        },
+    }
+
+
+def bench_queries(services: Dict[str, Service], session: str) -> List[Dict[str, Any]]:
+    backend, strava, llm = services["backend"], services["strava"], services["llm"]
+    results = []
+    with httpx.Client(base_url=backend.url, cookies={"session_token": session}, timeout=600.0) as client:
+        for question in QUESTIONS:
+            calls_before = strava_calls(strava)
+            llm_calls = len(httpx.get(f"{llm.url}/_bench/calls").json())
+            resp, elapsed = timed(client.post, "/api/query", json={"question": question})
+            calls = calls_since(calls_before, strava_calls(strava))
+            completions = httpx.get(f"{llm.url}/_bench/calls").json()[llm_calls:]
+            answer = resp.json().get("answer", "") if resp.status_code == 200 else ""
+            results.append({
+                "question": question,
+                "status": resp.status_code,
+                "strategy": answer.split("=", 1)[1] if answer.startswith("strategy=") else "none",
+                "latency_ms": elapsed,
+                "strava_calls": sum(calls.values()),
+                "strava_calls_by_route": calls,
+                "prompt_chars": completions[-1]["prompt_chars"] if completions else None,
+            })
+            print(f"    {elapsed:>9.1f} ms  {results[-1]['strategy']:<22} {sum(calls.values()):>4} Strava calls  {question}")
+    return results
+
+
+def by_strategy(queries: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for q in queries:
+        grouped.setdefault(q["strategy"], []).append(q)
+    return {
+        strategy: {
+            "questions": len(rows),
+            "median_ms": round(statistics.median(r["latency_ms"] for r in rows), 1),
+            "max_ms": max(r["latency_ms"] for r in rows),
+            "strava_calls_per_question": round(sum(r["strava_calls"] for r in rows) / len(rows), 1),
+        }
+        for strategy, rows in sorted(grouped.items())
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: Dict[str, Any]) -> Dict[str, float]:
+    """Comparable numbers of a run, keyed like "5000.query.summary_only.median_ms"."""
+    flat = {}
+    for size, athlete in results["athletes"].items():
+        for key in ("cold_ms", "warm_median_ms", "cold_strava_calls"):
+            flat[f"{size}.summary.{key}"] = athlete["summary"][key]
+        if athlete["memory"]["delta_mb"] is not None:
+            flat[f"{size}.memory.delta_mb"] = athlete["memory"]["delta_mb"]
+        for strategy, stats in athlete["by_strategy"].items():
+            flat[f"{size}.query.{strategy}.median_ms"] = stats["median_ms"]
+            flat[f"{size}.query.{strategy}.strava_calls_per_question"] = stats["strava_calls_per_question"]
+    return flat
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Print both runs side by side; returns the metrics that regressed."""
+    old, new = flatten(previous), flatten(current)
+    regressions = []
+    print(f"\nCompared with {previous.get('git_revision') or '?'} ({previous['started_at']}):")
+    for key in sorted(set(old) & set(new)):
+        before, after = old[key], new[key]
+        change = (after - before) / before if before else 0.0
+        regressed = change > threshold and (not key.endswith("_ms") or after - before >= MIN_REGRESSION_MS)
+        if regressed:
+            regressions.append(key)
+        print(f"  {key:<58} {before:>10} -> {after:>10}  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def latest_result() -> Optional[Path]:
+    runs = sorted(RESULTS_DIR.glob("*.json"))
+    return runs[-1] if runs else None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Activities per athlete")
+    parser.add_argument("--repeats", type=int, default=5, help="Warm /activities/summary calls per athlete")
+    parser.add_argument("--strava-latency-ms", type=float, default=25.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--compare", type=Path, help="Earlier results file (default: the latest in benchmarks/results)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown flagged as a regression (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the service logs and caches")
+    args = parser.parse_args()
+
+    previous_path = args.compare or latest_result()
+    workdir = Path(tempfile.mkdtemp(prefix="strava-bench-"))
+    (workdir / "mcp").mkdir()
+    # Shared with the backend process, which must decrypt the tokens stored here
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'backend.db'}"
+    os.environ["SECRET_KEY"] = SESSION_SECRET
+    os.environ["MCP_INTERNAL_KEY"] = INTERNAL_KEY
+    sys.path.insert(0, str(ROOT))
+
+    results: Dict[str, Any] = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "sizes": args.sizes, "repeats": args.repeats,
+            "strava_latency_ms": args.strava_latency_ms, "llm_latency_ms": args.llm_latency_ms,
+        },
+        "athletes": {},
+    }
+    services: Dict[str, Service] = {}
+    try:
+        services = start_services(workdir, args)
+        for size in sorted(args.sizes):
+            print(f"Athlete with {size} activities")
+            athlete = bench_summary(services, size, args.repeats)
+            summary = athlete["summary"]
+            print(f"    summary cold {summary['cold_ms']} ms ({summary['cold_strava_calls']} Strava calls), "
+                  f"warm {summary['warm_median_ms']} ms, RSS +{athlete['memory']['delta_mb']} MB")
+            athlete["queries"] = bench_queries(services, create_user(size))
+            athlete["by_strategy"] = by_strategy(athlete["queries"])
+            results["athletes"][str(size)] = athlete
+    except RuntimeError as e:
+        print(f"Benchmark failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        for service in reversed(list(services.values())):
+            service.stop()
+        if args.keep_workdir:
+            print(f"Service logs and caches kept in {workdir}")
+        else:
+            subprocess.run(["rm", "-rf", str(workdir)], check=False)
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    out_path = RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out_path.write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {out_path.relative_to(ROOT)}")
+
+    if previous_path is not None and previous_path.exists():
+        regressions = compare(json.loads(previous_path.read_text()), results, args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+GPX and TCX files for activities, generated from locally cached streams.
+
+The writers are generators that yield the document a batch of trackpoints at a
+time, so an export can be streamed to the client or into a zip entry without
+ever holding the whole file in memory. Strava only offers exports for routes;
+activity files are rebuilt from the time, latlng, altitude, distance,
+heartrate, cadence, watts and temp streams plus the activity summary.
+"""
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+EXPORT_STREAM_KEYS = "time,latlng,altitude,distance,heartrate,cadence,watts,temp"
+EXPORT_FORMATS = {
+    "gpx": "application/gpx+xml",
+    "tcx": "application/vnd.garmin.tcx+xml",
+}
+# Trackpoints per yielded chunk
+POINTS_PER_CHUNK = 500
+
+TCX_SPORTS = {
+    "Run": "Running", "TrailRun": "Running", "VirtualRun": "Running",
+    "Ride": "Biking", "VirtualRide": "Biking", "EBikeRide": "Biking",
+    "GravelRide": "Biking", "MountainBikeRide": "Biking", "EMountainBikeRide": "Biking",
+}
+
+CREATOR = "ActivityCopilot"
+
+
+def _value(arrays: Dict[str, np.ndarray], key: str, i: int) -> Optional[float]:
+    """arrays[key][i], or None if the stream is missing, short, or null at i."""
+    values = arrays.get(key)
+    if values is None or i >= len(values):
+        return None
+    v = values[i]
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return None
+    return v
+
+
+def _start_epoch(activity: Dict[str, Any]) -> float:
+    start = activity.get("start_date")
+    if not start:
+        return 0.0
+    return datetime.fromisoformat(start.replace("Z", "+00:00")).timestamp()
+
+
+def _timestamp(epoch: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+
+def _point_count(arrays: Dict[str, np.ndarray]) -> int:
+    for key in ("time", "latlng", "distance"):
+        if key in arrays:
+            return len(arrays[key])
+    return 0
+
+
+def has_gps(arrays: Dict[str, np.ndarray]) -> bool:
+    latlng = arrays.get("latlng")
+    return latlng is not None and len(latlng) > 0
+
+
+def export_filename(activity: Dict[str, Any], ext: str) -> str:
+    """e.g. 2024-05-04_123456.gpx (date first so a year's zip lists in order)."""
+    day = (activity.get("start_date_local") or activity.get("start_date") or "")[:10] or "undated"
+    return f"{day}_{activity.get('id', 'activity')}.{ext}"
+
+
+def iter_gpx(activity: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> Iterator[str]:
+    """GPX 1.1 with Garmin TrackPointExtension hr/cad/atemp and <power>. Points without a position are skipped."""
+    name = escape(activity.get("name") or "")
+    start = _start_epoch(activity)
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<gpx creator="{CREATOR}" version="1.1" xmlns="http://www.topografix.com/GPX/1/1"'
+        ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+        ' xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd"'
+        ' xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">\n'
+        f' <metadata>\n  <name>{name}</name>\n  <time>{_timestamp(start)}</time>\n </metadata>\n'
+        f' <trk>\n  <name>{name}</name>\n  <type>{escape(activity.get("sport_type") or activity.get("type") or "")}</type>\n'
+        '  <trkseg>\n'
+    )
+
+    n = _point_count(arrays)
+    for chunk_start in range(0, n, POINTS_PER_CHUNK):
+        parts = []
+        for i in range(chunk_start, min(chunk_start + POINTS_PER_CHUNK, n)):
+            latlng = _value(arrays, "latlng", i)
+            if latlng is None:
+                continue
+            parts.append(f'   <trkpt lat="{float(latlng[0]):.7f}" lon="{float(latlng[1]):.7f}">\n')
+            ele = _value(arrays, "altitude", i)
+            if ele is not None:
+                parts.append(f"    <ele>{float(ele):.1f}</ele>\n")
+            t = _value(arrays, "time", i)
+            if t is not None:
+                parts.append(f"    <time>{_timestamp(start + float(t))}</time>\n")
+
+            watts = _value(arrays, "watts", i)
+            tpx = [
+                f"<gpxtpx:{tag}>{int(v)}</gpxtpx:{tag}>"
+                for tag, v in (("atemp", _value(arrays, "temp", i)),
+                               ("hr", _value(arrays, "heartrate", i)),
+                               ("cad", _value(arrays, "cadence", i)))
+                if v is not None
+            ]
+            if watts is not None or tpx:
+                parts.append("    <extensions>")
+                if watts is not None:
+                    parts.append(f"<power>{int(watts)}</power>")
+                if tpx:
+                    parts.append(f"<gpxtpx:TrackPointExtension>{''.join(tpx)}</gpxtpx:TrackPointExtension>")
+                parts.append("</extensions>\n")
+            parts.append("   </trkpt>\n")
+        if parts:
+            yield "".join(parts)
+
+    yield "  </trkseg>\n </trk>\n</gpx>\n"
+
+
+def iter_tcx(activity: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> Iterator[str]:
+    """TCX with one lap spanning the activity. Works without GPS (treadmill, trainer)."""
+    start = _start_epoch(activity)
+    n = _point_count(arrays)
+    sport = TCX_SPORTS.get(activity.get("sport_type") or activity.get("type") or "", "Other")
+    last_time = _value(arrays, "time", n - 1) if n else None
+    last_distance = _value(arrays, "distance", n - 1) if n else None
+    total_time = activity.get("elapsed_time") or last_time or 0
+    total_distance = activity.get("distance") or last_distance or 0
+
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2"'
+        ' xmlns:ns3="http://www.garmin.com/xmlschemas/ActivityExtension/v2">\n'
+        f' <Activities>\n  <Activity Sport={quoteattr(sport)}>\n'
+        f"   <Id>{_timestamp(start)}</Id>\n"
+        f'   <Lap StartTime="{_timestamp(start)}">\n'
+        f"    <TotalTimeSeconds>{float(total_time):.1f}</TotalTimeSeconds>\n"
+        f"    <DistanceMeters>{float(total_distance):.1f}</DistanceMeters>\n"
+        f"    <Calories>{int(activity.get('calories') or 0)}</Calories>\n"
+        "    <Intensity>Active</Intensity>\n"
+        "    <TriggerMethod>Manual</TriggerMethod>\n"
+        "    <Track>\n"
+    )
+
+    for chunk_start in range(0, n, POINTS_PER_CHUNK):
+        parts = []
+        for i in range(chunk_start, min(chunk_start + POINTS_PER_CHUNK, n)):
+            t = _value(arrays, "time", i)
+            parts.append(f"     <Trackpoint>\n      <Time>{_timestamp(start + float(t or 0))}</Time>\n")
+            latlng = _value(arrays, "latlng", i)
+            if latlng is not None:
+                parts.append(
+                    f"      <Position><LatitudeDegrees>{float(latlng[0]):.7f}</LatitudeDegrees>"
+                    f"<LongitudeDegrees>{float(latlng[1]):.7f}</LongitudeDegrees></Position>\n"
+                )
+            ele = _value(arrays, "altitude", i)
+            if ele is not None:
+                parts.append(f"      <AltitudeMeters>{float(ele):.1f}</AltitudeMeters>\n")
+            dist = _value(arrays, "distance", i)
+            if dist is not None:
+                parts.append(f"      <DistanceMeters>{float(dist):.1f}</DistanceMeters>\n")
+            hr = _value(arrays, "heartrate", i)
+            if hr is not None:
+                parts.append(f"      <HeartRateBpm><Value>{int(hr)}</Value></HeartRateBpm>\n")
+            cad = _value(arrays, "cadence", i)
+            if cad is not None:
+                parts.append(f"      <Cadence>{int(cad)}</Cadence>\n")
+            watts = _value(arrays, "watts", i)
+            if watts is not None:
+                parts.append(f"      <Extensions><ns3:TPX><ns3:Watts>{int(watts)}</ns3:Watts></ns3:TPX></Extensions>\n")
+            parts.append("     </Trackpoint>\n")
+        yield "".join(parts)
+
+    yield "    </Track>\n   </Lap>\n  </Activity>\n </Activities>\n</TrainingCenterDatabase>\n"
+
+
+WRITERS = {"gpx": iter_gpx, "tcx": iter_tcx}
+
+
+def iter_export(activity: Dict[str, Any], arrays: Dict[str, np.ndarray], ext: str) -> Iterator[str]:
+    return WRITERS[ext](activity, arrays)
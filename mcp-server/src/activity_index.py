@@ -0,0 +1,125 @@
+"""
+Inverted full-text index over activity names, descriptions and private notes.
+One index is kept per athlete so keyword questions don't scan the whole history.
+"""
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Set
+
+TOKEN_RE = re.compile(r"\w+")
+INDEXED_FIELDS = ("name", "description", "private_note")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of a string."""
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def trigrams(token: str) -> Set[str]:
+    """Character trigrams of a token (tokens shorter than 3 chars have none)."""
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class ActivityTextIndex:
+    """
+    Token -> activity ids, plus trigram -> tokens for partial matches.
+
+    A query token matches any indexed token that contains it, so "downski" finds
+    "Downskis" and "skis" finds "Downskis" too. Multi-word queries require every
+    word to match (AND).
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Set[int]] = defaultdict(set)
+        self.trigram_tokens: Dict[str, Set[str]] = defaultdict(set)
+        self.doc_tokens: Dict[int, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_tokens)
+
+    def build(self, activities: Iterable[Dict[str, Any]]) -> "ActivityTextIndex":
+        """(Re)build the index from a full activity list."""
+        self.postings.clear()
+        self.trigram_tokens.clear()
+        self.doc_tokens.clear()
+        for activity in activities:
+            self.add(activity)
+        return self
+
+    def add(self, activity: Dict[str, Any]) -> None:
+        """Index an activity, replacing any previous entry for the same id."""
+        activity_id = activity.get("id")
+        if activity_id is None:
+            return
+        if activity_id in self.doc_tokens:
+            self.remove(activity_id)
+
+        tokens: Set[str] = set()
+        for field in INDEXED_FIELDS:
+            value = activity.get(field)
+            if value:
+                tokens.update(tokenize(str(value)))
+
+        self.doc_tokens[activity_id] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                for gram in trigrams(token):
+                    self.trigram_tokens[gram].add(token)
+            self.postings[token].add(activity_id)
+
+    def remove(self, activity_id: int) -> None:
+        """Drop an activity from the index."""
+        tokens = self.doc_tokens.pop(activity_id, set())
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(activity_id)
+            if not ids:
+                del self.postings[token]
+                for gram in trigrams(token):
+                    grams = self.trigram_tokens.get(gram)
+                    if grams is not None:
+                        grams.discard(token)
+                        if not grams:
+                            del self.trigram_tokens[gram]
+
+    def matching_tokens(self, query_token: str) -> Set[str]:
+        """Indexed tokens containing query_token as a substring."""
+        if len(query_token) < 3:
+            return {t for t in self.postings if query_token in t}
+
+        candidates = None
+        for gram in trigrams(query_token):
+            tokens = self.trigram_tokens.get(gram)
+            if not tokens:
+                return set()
+            candidates = set(tokens) if candidates is None else candidates & tokens
+            if not candidates:
+                return set()
+        return {t for t in candidates if query_token in t}
+
+    def ids_for(self, query_token: str) -> Set[int]:
+        """Ids of activities with a token containing query_token."""
+        ids: Set[int] = set()
+        for token in self.matching_tokens(query_token):
+            ids |= self.postings[token]
+        return ids
+
+    def search(self, query: str) -> Set[int]:
+        """Ids of activities whose text matches every word in query."""
+        result = None
+        for query_token in set(tokenize(query)):
+            ids = self.ids_for(query_token)
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result or set()
+
+    def score(self, query: str) -> Dict[int, int]:
+        """Number of distinct query words each activity matches (for ranking)."""
+        scores: Dict[int, int] = defaultdict(int)
+        for query_token in set(tokenize(query)):
+            for activity_id in self.ids_for(query_token):
+                scores[activity_id] += 1
+        return scores
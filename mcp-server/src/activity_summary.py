@@ -0,0 +1,154 @@
+"""
+Pure-Python aggregation over an athlete's activity list (condensed rows, yearly
+and monthly totals). Kept free of server state so it can run in a worker
+process (see executors.run_cpu_bound).
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# (start_date, activity_type, distance_m, elevation_gain_m, moving_time_s)
+SummaryRow = Tuple[str, str, float, float, int]
+
+
+def format_seconds_to_str(seconds: int) -> str:
+    """Format seconds into Xh Ym string."""
+    if not seconds:
+        return "0s"
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    return f"{hours}h {minutes}m"
+
+
+def condense_activity(activity: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Condensed per-activity row used by the summary endpoints (None if undated)."""
+    start_date = activity.get("start_date_local", activity.get("start_date", ""))
+    if not start_date:
+        return None
+    
+    return {
+        "id": activity.get("id"),
+        "name": activity.get("name", ""),
+        "type": activity.get("sport_type", activity.get("type", "Unknown")),
+        "distance_miles": round(activity.get("distance", 0) / 1609.344, 3), # Official meters per mile for precision
+        "elevation_feet": round(activity.get("total_elevation_gain", 0) * 3.28084, 0),
+        "moving_time_seconds": activity.get("moving_time", 0),
+        "elapsed_time_seconds": activity.get("elapsed_time", 0),
+        "elapsed_time_str": format_seconds_to_str(activity.get("elapsed_time", 0)),
+        "start_time": start_date,
+        "private_note": activity.get("private_note", ""),
+        "description": activity.get("description", ""),
+        "athlete_count": activity.get("athlete_count", 1),
+        "route_match_count": activity.get("similar_activities", {}).get("effort_count", 0) if activity.get("similar_activities") else 0,
+        "hydrated": activity.get("hydrated_at") is not None
+    }
+
+
+def group_by_date(activities: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Condensed activity rows grouped by local date (YYYY-MM-DD)."""
+    activities_by_date: Dict[str, List[Dict[str, Any]]] = {}
+    for activity in activities:
+        row = condense_activity(activity)
+        if row is None:
+            continue
+        activities_by_date.setdefault(row["start_time"][:10], []).append(row)
+    return activities_by_date
+
+
+def summary_rows(activities: List[Dict[str, Any]]) -> List[SummaryRow]:
+    """
+    The fields summarize_rows needs, as plain tuples: cheap to pickle for a worker
+    process, and a stable snapshot while the cached records keep being hydrated.
+    """
+    rows = []
+    for activity in activities:
+        start_date = activity.get("start_date_local", activity.get("start_date", ""))
+        if not start_date:
+            continue
+        rows.append((
+            start_date,
+            activity.get("sport_type", activity.get("type", "Unknown")),
+            activity.get("distance", 0),
+            activity.get("total_elevation_gain", 0),
+            activity.get("moving_time", 0),
+        ))
+    return rows
+
+
+def summarize_by_year(activities: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Aggregate activities into yearly/monthly totals with per-type breakdowns."""
+    return summarize_rows(summary_rows(activities))
+
+
+def summarize_rows(rows: List[SummaryRow]) -> Dict[str, Dict[str, Any]]:
+    """summarize_by_year over pre-extracted summary_rows."""
+    by_year: Dict[str, Dict[str, Any]] = {}
+    
+    for start_date, activity_type, distance, elevation_gain, moving_time in rows:
+        # Parse date
+        date_obj = datetime.fromisoformat(start_date.replace("Z", "+00:00"))
+        year = str(date_obj.year)
+        month = f"{year}-{date_obj.month:02d}"
+        
+        # Initialize year if needed
+        if year not in by_year:
+            by_year[year] = {
+                "total_activities": 0,
+                "total_distance_miles": 0,
+                "total_elevation_feet": 0,
+                "total_moving_time_seconds": 0,
+                "by_type": {},
+                "by_month": {}
+            }
+        
+        # Initialize month if needed
+        if month not in by_year[year]["by_month"]:
+            by_year[year]["by_month"][month] = {
+                "activities": 0,
+                "distance_miles": 0,
+                "elevation_feet": 0,
+                "moving_time_seconds": 0,
+                "by_type": {}
+            }
+        
+        distance_miles = distance / 1609.344 # Official meters per mile for precision
+        elevation_feet = elevation_gain * 3.28084
+        
+        # Update year totals
+        by_year[year]["total_activities"] += 1
+        by_year[year]["total_distance_miles"] += distance_miles
+        by_year[year]["total_elevation_feet"] += elevation_feet
+        by_year[year]["total_moving_time_seconds"] += moving_time
+        
+        # Update type counts (Yearly)
+        if activity_type not in by_year[year]["by_type"]:
+            by_year[year]["by_type"][activity_type] = {"count": 0, "distance_miles": 0}
+        by_year[year]["by_type"][activity_type]["count"] += 1
+        by_year[year]["by_type"][activity_type]["distance_miles"] += distance_miles
+        
+        # Update month totals
+        by_year[year]["by_month"][month]["activities"] += 1
+        by_year[year]["by_month"][month]["distance_miles"] += distance_miles
+        by_year[year]["by_month"][month]["elevation_feet"] += elevation_feet
+        by_year[year]["by_month"][month]["moving_time_seconds"] += moving_time
+        
+        # Update type counts (Monthly)
+        if activity_type not in by_year[year]["by_month"][month]["by_type"]:
+            by_year[year]["by_month"][month]["by_type"][activity_type] = {"count": 0, "distance_miles": 0}
+        by_year[year]["by_month"][month]["by_type"][activity_type]["count"] += 1
+        by_year[year]["by_month"][month]["by_type"][activity_type]["distance_miles"] += distance_miles
+    
+    # Round the totals
+    for year_data in by_year.values():
+        year_data["total_distance_miles"] = round(year_data["total_distance_miles"], 2)
+        year_data["total_elevation_feet"] = round(year_data["total_elevation_feet"], 0)
+        for type_data in year_data["by_type"].values():
+            type_data["distance_miles"] = round(type_data["distance_miles"], 2)
+        
+        for month_data in year_data["by_month"].values():
+            month_data["distance_miles"] = round(month_data["distance_miles"], 2)
+            month_data["elevation_feet"] = round(month_data["elevation_feet"], 0)
+            # Round monthly type totals
+            for m_type_data in month_data["by_type"].values():
+                m_type_data["distance_miles"] = round(m_type_data["distance_miles"], 2)
+    
+    return by_year
@@ -0,0 +1,281 @@
+"""
+Cache and lock backends for state that several MCP server workers must share.
+
+- MemoryBackend: process-local (the default; one worker, as before).
+- SQLiteBackend: a WAL-mode SQLite file, shared by workers on one host.
+- RedisBackend: any Redis-compatible server, shared across hosts (needs the
+  optional `redis` package).
+
+Pick one with CACHE_BACKEND_URL: "memory://", "sqlite:///path/to/cache.db" or
+"redis://host:6379/0". Values must be JSON-serializable.
+
+Locks are leases: a worker that dies while holding one blocks the others for at
+most lock_lease seconds.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import executors
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Optional: only needed for redis:// backends
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 120.0
+LOCK_LEASE = 300.0
+LOCK_POLL_INTERVAL = 0.05
+
+
+class LockTimeout(Exception):
+    """Raised when a lock could not be acquired within its timeout."""
+
+
+class CacheBackend(ABC):
+    """get/set/delete keyed by (namespace, key), plus named locks."""
+
+    # True if other processes see the same data (so local copies can go stale)
+    shared = False
+
+    def __init__(self):
+        self.stats = {"gets": 0, "sets": 0, "lock_waits": 0, "lock_timeouts": 0}
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def _try_acquire(self, name: str, owner: str, lease: float) -> bool:
+        """Take the lock for owner unless someone else holds an unexpired lease."""
+
+    @abstractmethod
+    async def _release(self, name: str, owner: str) -> None:
+        """Drop the lock if owner still holds it."""
+
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: float = LOCK_TIMEOUT, lease: float = LOCK_LEASE) -> AsyncIterator[None]:
+        """Hold the named lock for the body of the block. Raises LockTimeout."""
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        waited = False
+        while not await self._try_acquire(name, owner, lease):
+            if not waited:
+                self.stats["lock_waits"] += 1
+                waited = True
+            if time.monotonic() >= deadline:
+                self.stats["lock_timeouts"] += 1
+                raise LockTimeout(f"Timed out waiting for lock {name}")
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            await self._release(name, owner)
+
+    async def close(self) -> None:
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__, "shared": self.shared, **self.stats}
+
+
+class MemoryBackend(CacheBackend):
+    """Process-local dict and leases."""
+
+    def __init__(self):
+        super().__init__()
+        self._data: Dict[str, Any] = {}
+        # name -> (owner, lease expiry)
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        self.stats["gets"] += 1
+        item = self._data.get(f"{namespace}:{key}")
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[f"{namespace}:{key}"]
+            return None
+        return value
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.stats["sets"] += 1
+        self._data[f"{namespace}:{key}"] = (value, time.time() + ttl if ttl else None)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        self._data.pop(f"{namespace}:{key}", None)
+
+    async def _try_acquire(self, name: str, owner: str, lease: float) -> bool:
+        now = time.monotonic()
+        held = self._leases.get(name)
+        if held is not None and held[1] > now:
+            return False
+        self._leases[name] = (owner, now + lease)
+        return True
+
+    async def _release(self, name: str, owner: str) -> None:
+        held = self._leases.get(name)
+        if held is not None and held[0] == owner:
+            del self._leases[name]
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    One SQLite file in WAL mode (readers don't block the writer). Calls run in the
+    shared thread pool, since activity lists can be megabytes of JSON.
+    """
+
+    shared = True
+
+    def __init__(self, db_path: str):
+        super().__init__()
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        # The connection is used from the event loop and from pool threads
+        self._conn_lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE TABLE IF NOT EXISTS cache_locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        """)
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        """Run a write; returns the number of rows changed."""
+        with self._conn_lock:
+            return self.conn.execute(sql, params).rowcount
+
+    def _fetchone(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        with self._conn_lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def _get(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._fetchone(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        )
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def _set(self, namespace: str, key: str, value: Any, ttl: Optional[float]) -> None:
+        value = json.dumps(value)
+        self._execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, value, time.time() + ttl if ttl else None)
+        )
+
+    def _acquire(self, name: str, owner: str, lease: float) -> bool:
+        now = time.time()
+        # Take the lock if it is free or its lease ran out (the holder died)
+        changed = self._execute("""
+            INSERT INTO cache_locks (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE cache_locks.expires_at <= ?
+        """, (name, owner, now + lease, now))
+        return changed == 1
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        self.stats["gets"] += 1
+        return await executors.run_in_thread(self._get, namespace, key)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.stats["sets"] += 1
+        await executors.run_in_thread(self._set, namespace, key, value, ttl)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        self._execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    async def _try_acquire(self, name: str, owner: str, lease: float) -> bool:
+        return self._acquire(name, owner, lease)
+
+    async def _release(self, name: str, owner: str) -> None:
+        self._execute("DELETE FROM cache_locks WHERE name = ? AND owner = ?", (name, owner))
+
+    async def close(self) -> None:
+        self.conn.close()
+
+
+# Delete the lock only if we still own it (the lease may have passed to someone else)
+_REDIS_RELEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBackend(CacheBackend):
+    """Redis (or any server speaking its protocol) via redis.asyncio."""
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "strava-mcp"):
+        super().__init__()
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for a redis:// cache backend (pip install redis)")
+        self.client = aioredis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        self.stats["gets"] += 1
+        raw = await self.client.get(self._key(namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.stats["sets"] += 1
+        await self.client.set(self._key(namespace, key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        await self.client.delete(self._key(namespace, key))
+
+    async def _try_acquire(self, name: str, owner: str, lease: float) -> bool:
+        return bool(await self.client.set(self._key("lock", name), owner, nx=True, px=int(lease * 1000)))
+
+    async def _release(self, name: str, owner: str) -> None:
+        await self.client.eval(_REDIS_RELEASE, 1, self._key("lock", name), owner)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_backend(url: Optional[str]) -> CacheBackend:
+    """Backend for a CACHE_BACKEND_URL (empty means memory://)."""
+    if not url or url == "memory://":
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported CACHE_BACKEND_URL: {url}")
@@ -0,0 +1,81 @@
+"""
+Merging activity cache entries written by different workers.
+
+With a shared cache backend every worker holds its own copy of an athlete's
+entry and publishes it after changing it. Publishing the whole entry blindly
+would let the last writer win: a webhook patch in one worker and a hydration
+merge in another would overwrite each other. So each worker records which
+records it changed since its copy was last in step with the shared one
+(ActivityChanges), and when the shared copy has moved on meanwhile those
+changes are replayed onto it instead.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Set
+
+# Entry fields that only move forward
+TIMESTAMP_FIELDS = ("fetched_at", "full_fetched_at")
+
+
+@dataclass
+class ActivityChanges:
+    """Local changes to one athlete's entry that the shared copy may not have yet."""
+    updated: Set[int] = field(default_factory=set)
+    removed: Set[int] = field(default_factory=set)
+    # A full listing replaced the list: it decides which activities exist
+    replaced: bool = False
+
+    def update(self, activity_id: int) -> None:
+        self.updated.add(activity_id)
+        self.removed.discard(activity_id)
+
+    def remove(self, activity_id: int) -> None:
+        self.removed.add(activity_id)
+        self.updated.discard(activity_id)
+
+    def __bool__(self) -> bool:
+        return bool(self.updated or self.removed or self.replaced)
+
+
+def _newest_first(activities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(activities, key=lambda a: a.get("start_date") or "", reverse=True)
+
+
+def merge_activities(theirs: List[Dict[str, Any]], ours: List[Dict[str, Any]],
+                     changes: ActivityChanges) -> List[Dict[str, Any]]:
+    """
+    Replay our changes onto their list. A record changed on both sides keeps their
+    fields and takes ours on top, so details one worker fetched survive a patch in
+    the other.
+    """
+    their_map = {a["id"]: a for a in theirs if "id" in a}
+    if changes.replaced:
+        return [{**their_map.get(a.get("id"), {}), **a} for a in ours]
+
+    our_map = {a["id"]: a for a in ours if "id" in a}
+    merged = dict(their_map)
+    for activity_id in changes.updated:
+        if activity_id in our_map:
+            merged[activity_id] = {**their_map.get(activity_id, {}), **our_map[activity_id]}
+    for activity_id in changes.removed:
+        merged.pop(activity_id, None)
+    return _newest_first(list(merged.values()))
+
+
+def merge_entries(theirs: Dict[str, Any], ours: Dict[str, Any], changes: ActivityChanges) -> Dict[str, Any]:
+    """Our entry replayed onto theirs (the newer shared copy)."""
+    merged = {**theirs, **{k: v for k, v in ours.items() if k != "activities"}}
+    for key in TIMESTAMP_FIELDS:
+        stamps = [e[key] for e in (theirs, ours) if e.get(key) is not None]
+        if stamps:
+            merged[key] = max(stamps)
+    if theirs.get("stats_fetched_at", 0) > ours.get("stats_fetched_at", 0):
+        merged["stats"] = theirs["stats"]
+        merged["stats_fetched_at"] = theirs["stats_fetched_at"]
+    if not changes.replaced:
+        merged["complete"] = bool(theirs.get("complete") or ours.get("complete"))
+
+    if "activities" in theirs and "activities" in ours:
+        merged["activities"] = merge_activities(theirs["activities"], ours["activities"], changes)
+    elif "activities" in ours:
+        merged["activities"] = ours["activities"]
+    return merged
@@ -0,0 +1,103 @@
+"""
+Declarative response caching for read-only Strava pass-through endpoints.
+
+    @app.get("/activities/{activity_id}/laps")
+    @endpoint_cache.cached("laps", ttl=3600 * 24 * 7)
+    async def get_activity_laps(activity_id: int, x_strava_token: str = Header(...)): ...
+
+The cache key is the namespace, the caller's scope (athlete id, unless the
+data is the same for everyone) and the handler's other arguments in signature
+order, so path parameters come first and can be invalidated as a prefix.
+
+With stale_ttl, an entry older than ttl is still served for up to stale_ttl
+more seconds while one background call refreshes it (stale-while-revalidate).
+"""
+import asyncio
+import functools
+import inspect
+import logging
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TOKEN_ARG = "x_strava_token"
+SHARED_SCOPE = "*"
+
+
+class EndpointCache:
+    """
+    scope_for(token) maps a Strava token to the athlete id used to scope
+    per-athlete entries.
+    """
+
+    def __init__(self, cache: TTLCache, scope_for: Callable[[str], str]):
+        self.cache = cache
+        self.scope_for = scope_for
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.stats = {"stale_served": 0, "revalidations": 0, "revalidation_errors": 0}
+
+    @staticmethod
+    def make_key(scope: str, *parts: Hashable) -> str:
+        return ":".join([scope, *(str(p) for p in parts)])
+
+    def cached(self, namespace: str, ttl: float, stale_ttl: float = 0, per_athlete: bool = True):
+        """Cache a handler's result under namespace for ttl seconds (+ stale_ttl served stale)."""
+        def decorator(handler):
+            signature = inspect.signature(handler)
+
+            @functools.wraps(handler)
+            async def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                token = bound.arguments[TOKEN_ARG]
+                scope = self.scope_for(token) if per_athlete else SHARED_SCOPE
+                key = self.make_key(scope, *(v for name, v in bound.arguments.items() if name != TOKEN_ARG))
+
+                # 1. CHECK CACHE
+                entry = self.cache.get_entry(namespace, key)
+                if entry is not None:
+                    if entry.age >= ttl:
+                        self.stats["stale_served"] += 1
+                        self._revalidate(namespace, key, ttl + stale_ttl, handler, bound)
+                    return entry.value
+
+                # 2. FETCH AND STORE
+                value = await handler(*bound.args, **bound.kwargs)
+                self.cache.set(namespace, key, value, ttl + stale_ttl)
+                return value
+
+            return wrapper
+        return decorator
+
+    def _revalidate(self, namespace: str, key: str, lifetime: float, handler, bound) -> None:
+        """Refresh a stale entry in the background, at most one refresh per key at a time."""
+        task_key = f"{namespace}|{key}"
+        if task_key in self._refreshing:
+            return
+
+        async def _refresh():
+            try:
+                value = await handler(*bound.args, **bound.kwargs)
+                self.cache.set(namespace, key, value, lifetime)
+                self.stats["revalidations"] += 1
+            except Exception as e:
+                # Keep serving the stale copy until it runs out
+                self.stats["revalidation_errors"] += 1
+                logger.warning(f"Revalidating {namespace} {key} failed: {e}")
+            finally:
+                self._refreshing.pop(task_key, None)
+
+        self._refreshing[task_key] = asyncio.create_task(_refresh())
+
+    def invalidate(self, namespace: str, token: Optional[str] = None, *parts: Hashable) -> int:
+        """
+        Drop entries in namespace for the token's athlete (or shared entries if token
+        is None) whose leading arguments match parts. Returns how many were dropped.
+        """
+        scope = self.scope_for(token) if token is not None else SHARED_SCOPE
+        return self.cache.invalidate_prefix(namespace, self.make_key(scope, *parts))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "revalidating": len(self._refreshing)}
@@ -0,0 +1,24 @@
+"""
+Worker pools for CPU-bound work and the event-loop lag monitor, shared with
+the backend.
+
+The implementation is backend/executors.py; this module re-exports it so the
+flat modules here can keep using `import executors`. Settings such as
+PROCESS_POOL_MIN_ITEMS live on backend.executors.
+"""
+import os
+import sys
+
+# The repository root, so the backend package is importable however the server is started
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.executors import (
+    EventLoopLagMonitor,
+    get_stats,
+    loop_lag_monitor,
+    run_cpu_bound,
+    run_in_thread,
+    shutdown,
+)
+
+__all__ = ["EventLoopLagMonitor", "get_stats", "loop_lag_monitor", "run_cpu_bound", "run_in_thread", "shutdown"]
@@ -0,0 +1,110 @@
+"""
+On-disk cache for file exports (route GPX/TCX).
+
+Files are keyed on (kind, id, version), where version is the object's
+`updated_at`, so an edited route is fetched again and the old file is removed.
+Writes go to a temp file that is renamed into place only when the download
+completed, so an interrupted stream never leaves a truncated export behind.
+"""
+import logging
+import os
+import re
+import tempfile
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _safe(value: Any) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "", str(value))
+
+
+class ExportWriter:
+    """Accumulates one download; commit() publishes it, discard() drops it."""
+
+    def __init__(self, cache: "ExportCache", final_path: str, prefix: str):
+        self.cache = cache
+        self.final_path = final_path
+        self.prefix = prefix
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.root, suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self) -> None:
+        self.file.close()
+        os.replace(self.tmp_path, self.final_path)
+        self.cache.remove_other_versions(self.prefix, keep=self.final_path)
+
+    def discard(self) -> None:
+        if not self.file.closed:
+            self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class ExportCache:
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _prefix(self, kind: str, obj_id: Any) -> str:
+        return f"{_safe(kind)}_{_safe(obj_id)}_"
+
+    def path_for(self, kind: str, obj_id: Any, version: Any, ext: str) -> str:
+        return os.path.join(self.root, f"{self._prefix(kind, obj_id)}{_safe(version)}.{_safe(ext)}")
+
+    def get(self, kind: str, obj_id: Any, version: Any, ext: str) -> Optional[str]:
+        """Path of the cached export, or None."""
+        path = self.path_for(kind, obj_id, version, ext)
+        if os.path.exists(path):
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def writer(self, kind: str, obj_id: Any, version: Any, ext: str) -> ExportWriter:
+        return ExportWriter(self, self.path_for(kind, obj_id, version, ext), self._prefix(kind, obj_id))
+
+    def remove_other_versions(self, prefix: str, keep: str) -> None:
+        ext = os.path.splitext(keep)[1]
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(prefix) and name.endswith(ext) and path != keep:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove old export {name}: {e}")
+
+    def remove_object(self, obj_id: Any, kind_pattern: str) -> int:
+        """
+        Delete every export of obj_id whose kind matches the regex kind_pattern (e.g.
+        all year zips of an athlete). Returns how many files were removed.
+        """
+        pattern = re.compile(f"(?:{kind_pattern})_{re.escape(_safe(obj_id))}_")
+        removed = 0
+        for name in os.listdir(self.root):
+            if not pattern.match(name):
+                continue
+            try:
+                os.remove(os.path.join(self.root, name))
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Could not remove export {name}: {e}")
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        files = [f for f in os.listdir(self.root) if not f.endswith(".part")]
+        return {
+            "files": len(files),
+            "bytes": sum(os.path.getsize(os.path.join(self.root, f)) for f in files),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
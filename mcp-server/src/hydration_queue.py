@@ -0,0 +1,365 @@
+"""
+Persistent background hydration.
+
+Activities that still need their detail call are queued as jobs in SQLite so
+progress survives restarts. A single worker drains the queue, rotating between
+athletes and pacing itself from the rate limiter's live headroom.
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from fastapi import HTTPException
+from rate_limiter import StravaRateLimiter
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_SPORTS = ('Run', 'Ride', 'Swim', 'VirtualRun', 'VirtualRide')
+# Only the last 12 months are hydrated in the background
+HYDRATION_WINDOW_DAYS = 365
+
+
+def hydration_priority(act: Dict[str, Any], now: Optional[datetime] = None) -> Optional[int]:
+    """
+    Background hydration priority of an activity (higher first), or None to skip it.
+    Skipped: low-value activity types (walks, yoga...) and anything older than 12 months.
+    """
+    atype = act.get('type', 'Run')  # Default to Run if missing
+    kudos = act.get('kudos_count', 0) or 0
+    comments = act.get('comment_count', 0) or 0
+    name = act.get('name', '').lower()
+
+    # High value = primary sport, social engagement or a race/test
+    high_value = (
+        atype in PRIMARY_SPORTS
+        or kudos > 5 or comments > 0
+        or any(w in name for w in ['race', 'marathon', 'ftp', 'test'])
+    )
+    if not high_value:
+        return None
+
+    start_date_str = act.get('start_date', '')
+    if not start_date_str:
+        return 0
+    try:
+        act_date = datetime.fromisoformat(start_date_str.replace("Z", "+00:00"))
+    except ValueError:
+        return 0
+    now = now or datetime.now(act_date.tzinfo)
+    if (now - act_date).days > HYDRATION_WINDOW_DAYS:
+        return None
+
+    score = 0
+    # Tier 1: Recent
+    if act_date.year == now.year:
+        score += 1000
+    elif act_date.year == now.year - 1:
+        score += 500
+    # Tier 2: Social
+    if kudos > 10:
+        score += 50
+    if comments > 0:
+        score += 100
+    # Tier 3: Important keywords
+    if any(w in name for w in ['race', 'marathon', '5k', '10k', 'pr', 'pb']):
+        score += 200
+    if 'angeles' in name:
+        score += 100
+    # Tier 4: Type Preference
+    if atype == 'Run':
+        score += 20
+    return score
+
+
+def hydration_jobs(activities: Iterable[Dict[str, Any]]) -> List[Tuple[int, int, str]]:
+    """(activity_id, priority, start_date) jobs for the activities worth hydrating."""
+    now = datetime.now(timezone.utc)
+    jobs = []
+    for act in activities:
+        priority = hydration_priority(act, now)
+        if priority is not None and "id" in act:
+            jobs.append((act["id"], priority, act.get("start_date", "")))
+    return jobs
+
+
+class HydrationQueue:
+    """
+    SQLite job table: one row per (athlete, activity).
+    status: pending -> done, or failed after MAX_ATTEMPTS errors. A done job goes
+    back to pending if its activity is queued again without details.
+    """
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS hydration_jobs (
+                athlete_id TEXT NOT NULL,
+                activity_id INTEGER NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                start_date TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL,
+                PRIMARY KEY (athlete_id, activity_id)
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_hydration_jobs_next "
+            "ON hydration_jobs (athlete_id, status, priority DESC, start_date DESC)"
+        )
+        self.conn.commit()
+
+    def enqueue(self, athlete_id: str, jobs: Iterable[Tuple[int, int, str]]) -> int:
+        """
+        Add (activity_id, priority, start_date) jobs for activities that still lack
+        details. Existing pending jobs get the new priority. A done job is reopened:
+        its activity has lost its details since (e.g. a full re-pagination replaced
+        the record with a summary). Failed jobs are left alone. Returns the number
+        of rows touched.
+        """
+        now = time.time()
+        rows = [(athlete_id, activity_id, priority, start_date, now) for activity_id, priority, start_date in jobs]
+        with self.conn:
+            cursor = self.conn.executemany("""
+                INSERT INTO hydration_jobs (athlete_id, activity_id, priority, start_date, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (athlete_id, activity_id) DO UPDATE SET
+                    priority = excluded.priority,
+                    attempts = CASE WHEN hydration_jobs.status = 'done' THEN 0 ELSE attempts END,
+                    status = 'pending',
+                    updated_at = excluded.updated_at
+                WHERE hydration_jobs.status IN ('pending', 'done')
+            """, rows)
+        return cursor.rowcount
+
+    def next_job(self, athlete_id: str) -> Optional[int]:
+        row = self.conn.execute("""
+            SELECT activity_id FROM hydration_jobs
+            WHERE athlete_id = ? AND status = 'pending'
+            ORDER BY priority DESC, start_date DESC
+            LIMIT 1
+        """, (athlete_id,)).fetchone()
+        return row[0] if row else None
+
+    def athletes_with_work(self) -> List[str]:
+        rows = self.conn.execute(
+            "SELECT DISTINCT athlete_id FROM hydration_jobs WHERE status = 'pending'"
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def mark_done(self, athlete_id: str, activity_id: int) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE hydration_jobs SET status = 'done', last_error = NULL, updated_at = ? "
+                "WHERE athlete_id = ? AND activity_id = ?",
+                (time.time(), athlete_id, activity_id)
+            )
+
+    def mark_failed(self, athlete_id: str, activity_id: int, error: str, permanent: bool = False) -> None:
+        """Record an error; the job is retried until MAX_ATTEMPTS unless permanent."""
+        with self.conn:
+            self.conn.execute("""
+                UPDATE hydration_jobs
+                SET attempts = attempts + 1,
+                    last_error = ?,
+                    updated_at = ?,
+                    status = CASE WHEN ? OR attempts + 1 >= ? THEN 'failed' ELSE 'pending' END
+                WHERE athlete_id = ? AND activity_id = ?
+            """, (error[:500], time.time(), permanent, self.MAX_ATTEMPTS, athlete_id, activity_id))
+
+    def forget_athlete(self, athlete_id: str) -> int:
+        """Drop all of an athlete's jobs. Returns how many were removed."""
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM hydration_jobs WHERE athlete_id = ?", (athlete_id,))
+        return cursor.rowcount
+
+    def counts(self, athlete_id: str) -> Dict[str, int]:
+        rows = self.conn.execute(
+            "SELECT status, COUNT(*) FROM hydration_jobs WHERE athlete_id = ? GROUP BY status",
+            (athlete_id,)
+        ).fetchall()
+        counts = {"pending": 0, "done": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+
+class HydrationWorker:
+    """
+    Drains the HydrationQueue in the background.
+
+    - Fairness: athletes with pending jobs are served one job at a time, round-robin.
+    - Pacing: when the background share of the 15-minute/daily quota runs low, the
+      remaining slots are spread over the rest of the window instead of being burnt
+      at once (the scheduler still has the final say on every request).
+    - Athletes whose token is unknown (e.g. after a restart) are skipped until they
+      are seen again; their jobs stay queued.
+    """
+
+    # Below this share of the background budget used, run flat out
+    PACING_THRESHOLD = 0.5
+    IDLE_SLEEP = 5.0
+    RATE_WINDOW = 50  # Completed jobs used for the throughput estimate
+
+    def __init__(self, queue: HydrationQueue, limiter: StravaRateLimiter,
+                 reserve_15m: int, reserve_daily: int):
+        self.queue = queue
+        self.limiter = limiter
+        self.reserve_15m = reserve_15m
+        self.reserve_daily = reserve_daily
+        self.tokens: Dict[str, str] = {}  # athlete_id -> latest access token (memory only)
+        self.fetch: Optional[Callable[[str, int], Awaitable[Any]]] = None
+        self.on_progress: Optional[Callable[[], None]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._rotation: Deque[str] = deque()
+        self._completed: Dict[str, Deque[float]] = {}
+        self._last_error: Dict[str, str] = {}
+        self.current_delay = 0.0
+
+    def configure(self, fetch: Callable[[str, int], Awaitable[Any]], on_progress: Callable[[], None]) -> None:
+        """fetch(token, activity_id) hydrates one activity; on_progress() is called after each job."""
+        self.fetch = fetch
+        self.on_progress = on_progress
+
+    def remember_token(self, athlete_id: str, token: str) -> None:
+        """Keep the athlete's freshest token (un-parks an athlete paused on a 401)."""
+        self.tokens[athlete_id] = token
+
+    def forget_athlete(self, athlete_id: str) -> None:
+        """Drop an athlete's jobs, token and progress (access revoked)."""
+        self.queue.forget_athlete(athlete_id)
+        self.tokens.pop(athlete_id, None)
+        self._completed.pop(athlete_id, None)
+        self._last_error.pop(athlete_id, None)
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def submit(self, athlete_id: str, token: str, jobs: Iterable[Tuple[int, int, str]]) -> int:
+        """Queue jobs for an athlete and make sure the worker is running."""
+        self.remember_token(athlete_id, token)
+        queued = self.queue.enqueue(athlete_id, jobs)
+        if not self.is_running():
+            self._task = asyncio.create_task(self.run())
+        self._wake.set()
+        return queued
+
+    def pacing_delay(self) -> float:
+        """Seconds to wait before the next background request, from live limiter headroom."""
+        if not self.limiter.has_headroom(self.reserve_15m, self.reserve_daily):
+            return self.limiter.seconds_until_available(self.reserve_15m, self.reserve_daily)
+
+        stats = self.limiter.get_stats()
+        budget_15m = stats["15m_limit"] - self.reserve_15m
+        budget_daily = stats["daily_limit"] - self.reserve_daily
+        left_15m = budget_15m - stats["15m_used"]
+        left_daily = budget_daily - stats["daily_used"]
+
+        delay = 0.0
+        if left_15m < budget_15m * self.PACING_THRESHOLD:
+            delay = max(delay, 900 / max(left_15m, 1))
+        if left_daily < budget_daily * self.PACING_THRESHOLD:
+            now = datetime.now(timezone.utc)
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+            delay = max(delay, (midnight - now).total_seconds() / max(left_daily, 1))
+        return delay
+
+    def _next_athlete(self) -> Optional[str]:
+        """Next athlete in the rotation that has pending work and a usable token."""
+        with_work = set(self.queue.athletes_with_work()) & set(self.tokens)
+        for athlete_id in with_work - set(self._rotation):
+            self._rotation.append(athlete_id)
+        for _ in range(len(self._rotation)):
+            athlete_id = self._rotation.popleft()
+            if athlete_id in with_work:
+                self._rotation.append(athlete_id)
+                return athlete_id
+        return None
+
+    async def run(self) -> None:
+        logger.info("Hydration worker started.")
+        while True:
+            athlete_id = self._next_athlete()
+            if athlete_id is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.IDLE_SLEEP)
+                except asyncio.TimeoutError:
+                    pass
+                if not set(self.queue.athletes_with_work()) & set(self.tokens):
+                    # Drained, or only athletes without a usable token are left
+                    logger.info("No hydration work available. Worker stopping.")
+                    return
+                continue
+
+            self.current_delay = self.pacing_delay()
+            if self.current_delay > 0:
+                await asyncio.sleep(self.current_delay)
+
+            activity_id = self.queue.next_job(athlete_id)
+            if activity_id is None:
+                continue
+            await self._run_job(athlete_id, activity_id)
+
+    async def _run_job(self, athlete_id: str, activity_id: int) -> None:
+        token = self.tokens.get(athlete_id)
+        try:
+            await self.fetch(token, activity_id)
+        except HTTPException as e:
+            self._last_error[athlete_id] = f"{e.status_code}: {e.detail}"
+            if e.status_code == 401:
+                # Token expired: park the athlete until a fresh token arrives
+                logger.warning(f"Hydration paused for athlete {athlete_id}: token rejected")
+                self.tokens.pop(athlete_id, None)
+            elif e.status_code == 429:
+                logger.error("Rate limit 429 hit (server side). Backing off hydration.")
+                await asyncio.sleep(60)
+            else:
+                self.queue.mark_failed(athlete_id, activity_id, str(e.detail), permanent=e.status_code == 404)
+            return
+        except Exception as e:
+            logger.error(f"Failed to hydrate {activity_id}: {e}")
+            self._last_error[athlete_id] = str(e)
+            self.queue.mark_failed(athlete_id, activity_id, str(e))
+            return
+
+        self.queue.mark_done(athlete_id, activity_id)
+        self._completed.setdefault(athlete_id, deque(maxlen=self.RATE_WINDOW)).append(time.time())
+        if self.on_progress:
+            self.on_progress()
+
+    def get_stats(self, athlete_id: str) -> Dict[str, Any]:
+        counts = self.queue.counts(athlete_id)
+        completed = self._completed.get(athlete_id)
+        per_minute = None
+        if completed and len(completed) > 1 and completed[-1] > completed[0]:
+            per_minute = round((len(completed) - 1) / (completed[-1] - completed[0]) * 60, 1)
+        eta_minutes = round(counts["pending"] / per_minute, 1) if per_minute else None
+        return {
+            **counts,
+            "running": self.is_running(),
+            "paused": athlete_id not in self.tokens and counts["pending"] > 0,
+            "per_minute": per_minute,
+            "eta_minutes": eta_minutes,
+            "pacing_delay_s": round(self.current_delay, 1),
+            "last_error": self._last_error.get(athlete_id),
+        }
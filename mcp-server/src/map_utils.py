@@ -1,12 +1,17 @@
-import polyline
-from typing import List, Tuple, Dict, Any
-from math import floor
-import json
 import logging
-from templates import MAP_TEMPLATE
+from math import cos, radians
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import polyline
+from templates import MAP_TEMPLATE_HEAD, MAP_TEMPLATE_TAIL
 
 logger = logging.getLogger(__name__)
 
+# Simplification tolerance as a fraction of the route's bounding-box diagonal.
+# A map fitted to the route is ~1000px across, so this keeps errors well under a pixel.
+SIMPLIFY_TOLERANCE_FRACTION = 1 / 4000
+
 def decode_polyline(encoded_polyline: str) -> List[Tuple[float, float]]:
     """Decode a polyline string into a list of coordinates."""
     try:
@@ -15,6 +20,53 @@ def decode_polyline(encoded_polyline: str) -> List[Tuple[float, float]]:
         logger.error(f"Failed to decode polyline: {str(e)}")
         raise ValueError(f"Invalid polyline data: {str(e)}")
 
+def simplify_route(coordinates: List[Tuple[float, float]], tolerance: Optional[float] = None) -> List[Tuple[float, float]]:
+    """
+    Douglas-Peucker line simplification.
+    tolerance is in degrees of latitude; by default it scales with the size of the route
+    (SIMPLIFY_TOLERANCE_FRACTION of its extent), i.e. with the zoom level the map opens at.
+    """
+    if len(coordinates) <= 2:
+        return list(coordinates)
+    points = np.asarray(coordinates, dtype=float)
+    # Equirectangular projection so distances are comparable in both axes
+    xy = np.column_stack((points[:, 1] * cos(radians(float(points[:, 0].mean()))), points[:, 0]))
+    if tolerance is None:
+        extent = float(np.hypot(*(xy.max(axis=0) - xy.min(axis=0))))
+        tolerance = extent * SIMPLIFY_TOLERANCE_FRACTION
+    if tolerance <= 0:
+        return list(coordinates)
+
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(xy) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = xy[start], xy[end]
+        inner = xy[start + 1:end]
+        ab = b - a
+        length_sq = float(ab @ ab)
+        if length_sq == 0:
+            # Closed loop: distance to the shared start/end point
+            dist = np.hypot(*(inner - a).T)
+        else:
+            # Distance to the segment (not the infinite line)
+            t = np.clip((inner - a) @ ab / length_sq, 0, 1)
+            dist = np.hypot(*(inner - (a + t[:, None] * ab)).T)
+        index = int(dist.argmax())
+        if dist[index] > tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return [tuple(p) for p in points[keep]]
+
+def coordinates_to_js(coordinates: List[Tuple[float, float]]) -> str:
+    """JS array literal of [lat, lng] pairs at polyline precision (5 decimals)."""
+    return "[" + ",".join(f"[{lat:.5f},{lng:.5f}]" for lat, lng in coordinates) + "]"
+
 def format_duration(seconds: int) -> str:
     """Format duration in seconds to HH:MM:SS format."""
     try:
@@ -42,9 +94,10 @@ def create_html_map(activity: Dict[str, Any]) -> str:
             logger.warning("No map data available in activity")
             return "<p>No map data available</p>"
 
-        # Decode polyline
-        coordinates = decode_polyline(activity['map']['polyline'])
-        logger.debug(f"Decoded {len(coordinates)} coordinates from polyline")
+        # Decode and simplify polyline
+        decoded = decode_polyline(activity['map']['polyline'])
+        coordinates = simplify_route(decoded)
+        logger.debug(f"Decoded {len(decoded)} coordinates from polyline, {len(coordinates)} after simplification")
         
         # Format duration
         duration = format_duration(activity.get('moving_time', 0))
@@ -56,11 +109,10 @@ def create_html_map(activity: Dict[str, Any]) -> str:
             'duration': duration,
             'avg_speed': activity.get('average_speed', 0) * 3.6,  # Convert to km/h
             'elevation_gain': activity.get('total_elevation_gain', 0),
-            'coordinates': json.dumps(coordinates)  # Convert coordinates to JSON for JavaScript
         }
         
-        # Return formatted HTML
-        return MAP_TEMPLATE.format(**template_data)
+        # Return formatted HTML (coordinates are spliced in, not formatted)
+        return MAP_TEMPLATE_HEAD.format(**template_data) + coordinates_to_js(coordinates) + MAP_TEMPLATE_TAIL
     except Exception as e:
         logger.error(f"Failed to create HTML map: {str(e)}", exc_info=True)
         raise ValueError(f"Failed to create map visualization: {str(e)}")
@@ -104,58 +156,60 @@ def format_activity_with_map(activity: Dict[str, Any], format: str = 'html') ->
         logger.error(f"Failed to format activity: {str(e)}", exc_info=True)
         raise ValueError(f"Failed to format activity data: {str(e)}")
 
-# Keep the create_ascii_map function for backward compatibility
-def create_ascii_map(coordinates: List[Tuple[float, float]], width: int = 60, height: int = 20) -> str:
-    """Create an ASCII map representation of the route."""
+# Density shading, sparsest to densest (plain maps use the middle one for every point)
+ASCII_ROUTE_CHAR = '•'
+ASCII_DENSITY_CHARS = '·•●█'
+
+def _grid_index(values: np.ndarray, low: float, high: float, cells: int) -> np.ndarray:
+    """Bin values into 0..cells-1; a zero-width range (single point, due N-S/E-W route) maps to the middle."""
+    if high <= low:
+        return np.full(len(values), (cells - 1) // 2, dtype=np.intp)
+    return np.clip(np.floor((values - low) / (high - low) * (cells - 1)).astype(np.intp), 0, cells - 1)
+
+def create_ascii_map(coordinates: List[Tuple[float, float]], width: int = 60, height: int = 20,
+                     shading: bool = False) -> str:
+    """
+    Create an ASCII map representation of the route.
+    All points are binned in one NumPy pass; with shading, cells are drawn by how many
+    points fall in them (log scale), so repeated laps and stops stand out.
+    """
     try:
-        if not coordinates:
+        if len(coordinates) == 0:
             return "No coordinates available"
 
-        # Find bounds
-        lats = [lat for lat, _ in coordinates]
-        lngs = [lng for _, lng in coordinates]
-        min_lat, max_lat = min(lats), max(lats)
-        min_lng, max_lng = min(lngs), max(lngs)
-
-        # Create empty map
-        map_array = [[' ' for _ in range(width)] for _ in range(height)]
+        points = np.asarray(coordinates, dtype=float)
+        lats, lngs = points[:, 0], points[:, 1]
+        x = _grid_index(lngs, lngs.min(), lngs.max(), width)
+        # Row 0 is the northern edge
+        y = _grid_index(-lats, -lats.max(), -lats.min(), height)
 
-        # Plot points
-        for lat, lng in coordinates:
-            # Convert to map coordinates
-            x = floor((lng - min_lng) / (max_lng - min_lng) * (width - 1))
-            y = floor((max_lat - lat) / (max_lat - min_lat) * (height - 1))
-            
-            # Ensure within bounds
-            x = min(max(x, 0), width - 1)
-            y = min(max(y, 0), height - 1)
-            
-            map_array[y][x] = '•'
+        counts = np.bincount(y * width + x, minlength=width * height).reshape(height, width)
+        grid = np.full((height, width), ' ', dtype='<U1')
+        if shading:
+            levels = np.log1p(counts) / np.log1p(counts.max()) * (len(ASCII_DENSITY_CHARS) - 1)
+            chars = np.array(list(ASCII_DENSITY_CHARS))
+            grid[counts > 0] = chars[np.round(levels[counts > 0]).astype(np.intp)]
+        else:
+            grid[counts > 0] = ASCII_ROUTE_CHAR
 
         # Mark start and end
-        start_x = floor((coordinates[0][1] - min_lng) / (max_lng - min_lng) * (width - 1))
-        start_y = floor((max_lat - coordinates[0][0]) / (max_lat - min_lat) * (height - 1))
-        end_x = floor((coordinates[-1][1] - min_lng) / (max_lng - min_lng) * (width - 1))
-        end_y = floor((max_lat - coordinates[-1][0]) / (max_lat - min_lat) * (height - 1))
-        
-        map_array[start_y][start_x] = 'S'
-        map_array[end_y][end_x] = 'E'
-
-        # Convert to string
-        map_str = '```\n'  # Start code block
-        map_str += '┌' + '─' * width + '┐\n'
-        for row in map_array:
-            map_str += '│' + ''.join(row) + '│\n'
-        map_str += '└' + '─' * width + '┘\n'
-        map_str += '```\n'  # End code block
-        
-        # Add legend
-        map_str += 'Legend:\n'
-        map_str += 'S: Start point\n'
-        map_str += 'E: End point\n'
-        map_str += '•: Route point\n'
-        
-        return map_str
+        grid[y[0], x[0]] = 'S'
+        grid[y[-1], x[-1]] = 'E'
+
+        rows = ['│' + ''.join(row) + '│' for row in grid.tolist()]
+        legend = ['Legend:', 'S: Start point', 'E: End point']
+        if shading:
+            legend.append(f"{ASCII_DENSITY_CHARS}: Route points, sparse to dense")
+        else:
+            legend.append(f"{ASCII_ROUTE_CHAR}: Route point")
+        return '\n'.join([
+            '```',  # Start code block
+            '┌' + '─' * width + '┐',
+            *rows,
+            '└' + '─' * width + '┘',
+            '```',  # End code block
+            *legend,
+        ]) + '\n'
     except Exception as e:
         logger.error(f"Failed to create ASCII map: {str(e)}", exc_info=True)
-        raise ValueError(f"Failed to create ASCII map: {str(e)}") 
\ No newline at end of file
+        raise ValueError(f"Failed to create ASCII map: {str(e)}")
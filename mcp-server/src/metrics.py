@@ -0,0 +1,35 @@
+"""
+Request metrics and per-stage tracing, shared with the backend.
+
+The implementation is backend/metrics.py; this module re-exports it so the
+flat modules here can keep using `import metrics`. The server renames the
+built-in metrics to its own namespace (metrics.set_namespace).
+"""
+import os
+import sys
+
+# The repository root, so the backend package is importable however the server is started
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.metrics import (
+    CONTENT_TYPE,
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    Trace,
+    current_trace,
+    http_request_seconds,
+    registry,
+    render,
+    route_label,
+    set_namespace,
+    span,
+    stage_seconds,
+    trace,
+)
+
+__all__ = [
+    "CONTENT_TYPE", "Counter", "Gauge", "Histogram", "Registry", "Trace", "current_trace",
+    "http_request_seconds", "registry", "render", "route_label", "set_namespace", "span", "stage_seconds", "trace",
+]
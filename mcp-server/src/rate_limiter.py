@@ -1,9 +1,15 @@
-import time
 import json
-import os
 import logging
-from datetime import datetime, timezone
-from typing import List, Dict
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; a single worker doesn't need the file lock
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
@@ -24,9 +30,10 @@ class StravaRateLimiter:
     STATE_FILE = "rate_limit_state.json"
     
     # Safety Limits (Strava official: 100/15m, 1000/day)
-    # Using full 100/15m since we now use on-demand enrichment only
-    LIMIT_15_MIN = 100
-    LIMIT_DAILY = 800
+    # Using full 100/15m since we now use on-demand enrichment only.
+    # Apps with a raised Strava limit (or a local stand-in) can override both.
+    LIMIT_15_MIN = int(os.getenv("STRAVA_LIMIT_15_MIN", "100"))
+    LIMIT_DAILY = int(os.getenv("STRAVA_LIMIT_DAILY", "800"))
     
     def __init__(self):
         self.requests_15m: List[float] = []
@@ -47,16 +54,34 @@ class StravaRateLimiter:
                 logger.error(f"Failed to load rate limit state: {e}")
                 
     def _save_state(self):
-        """Save request timestamps to disk."""
+        """Save request timestamps to disk (atomically, so other workers never read a partial file)."""
+        tmp_path = f"{self.STATE_FILE}.{os.getpid()}.tmp"
         try:
-            with open(self.STATE_FILE, 'w') as f:
+            with open(tmp_path, 'w') as f:
                 json.dump({
                     '15m': self.requests_15m,
                     'daily': self.requests_daily
                 }, f)
+            os.replace(tmp_path, self.STATE_FILE)
         except Exception as e:
             logger.error(f"Failed to save rate limit state: {e}")
 
+    @contextmanager
+    def _state_lock(self):
+        """
+        Exclusive lock around read-modify-write of the state file, so workers sharing
+        it don't overwrite each other's attempts.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.STATE_FILE}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
     def _cleanup(self):
         """Remove timestamps older than the windows."""
         now = time.time()
@@ -83,13 +108,43 @@ class StravaRateLimiter:
             return False
         return True
 
-    def record_attempt(self):
-        """Record a request ATTEMPT (call this BEFORE the HTTP request)."""
+    def has_headroom(self, reserve_15m: int = 0, reserve_daily: int = 0) -> bool:
+        """Check if a request fits while keeping `reserve_*` slots free. Reloads state from disk first."""
+        self._load_state()
+        return (
+            len(self.requests_15m) < self.LIMIT_15_MIN - reserve_15m
+            and len(self.requests_daily) < self.LIMIT_DAILY - reserve_daily
+        )
+
+    def seconds_until_available(self, reserve_15m: int = 0, reserve_daily: int = 0) -> float:
+        """Seconds until has_headroom() would pass with the same reserve (0 if it already does)."""
         self._load_state()
         now = time.time()
-        self.requests_15m.append(now)
-        self.requests_daily.append(now)
-        self._save_state()
+        wait = 0.0
+
+        # 15m window: wait for enough of the oldest timestamps to slide out
+        excess = len(self.requests_15m) - (self.LIMIT_15_MIN - reserve_15m)
+        if excess >= 0:
+            oldest = sorted(self.requests_15m)
+            idx = min(excess, len(oldest) - 1)
+            wait = max(wait, oldest[idx] + 900 - now) if oldest else wait
+
+        # Daily window: resets at midnight UTC
+        if len(self.requests_daily) >= self.LIMIT_DAILY - reserve_daily:
+            tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+            midnight = datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=timezone.utc)
+            wait = max(wait, midnight.timestamp() - now)
+
+        return max(wait, 0.0)
+
+    def record_attempt(self):
+        """Record a request ATTEMPT (call this BEFORE the HTTP request)."""
+        with self._state_lock():
+            self._load_state()
+            now = time.time()
+            self.requests_15m.append(now)
+            self.requests_daily.append(now)
+            self._save_state()
         
     def get_stats(self) -> Dict[str, int]:
         self._cleanup()
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+from typing import Deque, Dict, Optional
+
+from rate_limiter import StravaRateLimiter, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Request classes sharing the Strava quota (lower value = served first)."""
+    INTERACTIVE = 0  # A user is waiting (e.g. /query enrichment)
+    HYDRATION = 1    # Background detail hydration
+    BULK = 2         # Full-history refreshes and other batch work
+
+
+class QuotaWaitTimeout(Exception):
+    """Raised when a request could not get a quota slot within its max wait."""
+
+
+class StravaRequestScheduler:
+    """
+    Central async gate in front of the Strava quota.
+
+    - Requests queue by priority instead of failing when the limiter is exhausted,
+      and are released as soon as the window frees up.
+    - Within a priority, athletes are served round-robin so one large history
+      cannot starve everybody else.
+    - Background classes may not use the last INTERACTIVE_RESERVE_* slots of a
+      window; that headroom is kept for users who are waiting on an answer.
+    """
+
+    INTERACTIVE_RESERVE_15M = 20
+    INTERACTIVE_RESERVE_DAILY = 100
+    # Interactive callers give up after this long rather than hang a request
+    INTERACTIVE_MAX_WAIT = 30.0
+
+    def __init__(self, limiter: StravaRateLimiter):
+        self.limiter = limiter
+        # {priority: {athlete_key: deque[future]}}
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            p: OrderedDict() for p in Priority
+        }
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self.granted: Dict[Priority, int] = {p: 0 for p in Priority}
+        self.waited_seconds: Dict[Priority, float] = {p: 0.0 for p in Priority}
+
+    def _reserve(self, priority: Priority):
+        if priority == Priority.INTERACTIVE:
+            return 0, 0
+        return self.INTERACTIVE_RESERVE_15M, self.INTERACTIVE_RESERVE_DAILY
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE, athlete_key: str = "",
+                      max_wait: Optional[float] = None) -> None:
+        """
+        Wait for a quota slot. The attempt is recorded in the limiter when granted.
+        max_wait defaults to INTERACTIVE_MAX_WAIT for interactive requests and to
+        no limit for background classes.
+        """
+        if max_wait is None and priority == Priority.INTERACTIVE:
+            max_wait = self.INTERACTIVE_MAX_WAIT
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(athlete_key, deque()).append(future)
+        started = time.monotonic()
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=max_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Granted right at the deadline - keep the slot
+                return
+            future.cancel()
+            raise QuotaWaitTimeout(f"No Strava quota available within {max_wait:.0f}s")
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        finally:
+            self.waited_seconds[priority] += time.monotonic() - started
+
+    def _next_waiter(self, priority: Priority) -> Optional[asyncio.Future]:
+        """Pop the next live waiter of a priority, rotating between athletes."""
+        queue = self._queues[priority]
+        while queue:
+            athlete_key, waiters = next(iter(queue.items()))
+            while waiters and waiters[0].done():
+                waiters.popleft()  # Timed out or cancelled
+            if not waiters:
+                del queue[athlete_key]
+                continue
+            future = waiters.popleft()
+            # Move this athlete to the back of the rotation
+            queue.move_to_end(athlete_key)
+            if not waiters:
+                del queue[athlete_key]
+            return future
+        return None
+
+    def _has_waiters(self, priority: Priority) -> bool:
+        return any(not f.done() for waiters in self._queues[priority].values() for f in waiters)
+
+    def _dispatch(self) -> None:
+        """Grant slots in priority order while the limiter has room."""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        for priority in Priority:
+            reserve_15m, reserve_daily = self._reserve(priority)
+            while self._has_waiters(priority) and self.limiter.has_headroom(reserve_15m, reserve_daily):
+                future = self._next_waiter(priority)
+                if future is None:
+                    break
+                self.limiter.record_attempt()
+                self.granted[priority] += 1
+                future.set_result(None)
+
+        # Sleep until the earliest moment a waiting class could be served
+        delays = [
+            self.limiter.seconds_until_available(*self._reserve(p))
+            for p in Priority if self._has_waiters(p)
+        ]
+        if delays:
+            delay = max(min(delays), 0.05)
+            logger.info(f"Strava quota exhausted for queued requests. Next dispatch in {delay:.1f}s")
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            p.name.lower(): {
+                "queued": sum(1 for waiters in self._queues[p].values() for f in waiters if not f.done()),
+                "granted": self.granted[p],
+                "waited_seconds": round(self.waited_seconds[p], 1),
+            }
+            for p in Priority
+        }
+
+
+# Global Instance
+scheduler = StravaRequestScheduler(rate_limiter)
@@ -0,0 +1,163 @@
+"""
+Local segment effort history per (athlete, segment).
+
+Efforts arrive from two places: activity details (hydration and on-demand
+lookups carry `segment_efforts`) and Strava's /segment_efforts listing. After
+one full listing a segment is marked complete, and from then on only efforts
+from the newest one a listing returned onwards are requested from Strava.
+(Efforts from hydrated activities do not move that watermark: older efforts
+may still be missing between the last listing and them.)
+"""
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _activity_id(effort: Dict[str, Any]) -> Optional[int]:
+    activity = effort.get("activity")
+    return activity.get("id") if isinstance(activity, dict) else activity
+
+
+class SegmentEffortStore:
+    """
+    SQLite-backed effort history.
+
+    sync state per (athlete, segment):
+      complete   - a full /segment_efforts listing has been stored
+      synced_at  - last time Strava was asked (full listing or top-up)
+      listed_until - newest start_date_local any listing has returned; top-ups start here
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS segment_efforts (
+                effort_id INTEGER PRIMARY KEY,
+                athlete_id TEXT NOT NULL,
+                segment_id INTEGER NOT NULL,
+                activity_id INTEGER,
+                start_date_local TEXT,
+                elapsed_time INTEGER,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_segment_efforts_history
+                ON segment_efforts (athlete_id, segment_id, start_date_local);
+            CREATE TABLE IF NOT EXISTS segment_effort_sync (
+                athlete_id TEXT NOT NULL,
+                segment_id INTEGER NOT NULL,
+                complete INTEGER NOT NULL DEFAULT 0,
+                synced_at REAL,
+                listed_until TEXT,
+                PRIMARY KEY (athlete_id, segment_id)
+            );
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(segment_effort_sync)")}
+        if "listed_until" not in columns:
+            # Databases from before the watermark: those segments get one full listing again
+            self.conn.execute("ALTER TABLE segment_effort_sync ADD COLUMN listed_until TEXT")
+        self.conn.commit()
+
+    def ingest(self, athlete_id: str, efforts: Iterable[Dict[str, Any]]) -> int:
+        """Store efforts (from activity details or a listing). Returns the number of rows written."""
+        rows = []
+        for effort in efforts:
+            segment = effort.get("segment") or {}
+            if effort.get("id") is None or segment.get("id") is None:
+                continue
+            rows.append((
+                effort["id"], athlete_id, segment["id"], _activity_id(effort),
+                effort.get("start_date_local") or effort.get("start_date"),
+                effort.get("elapsed_time"), json.dumps(effort)
+            ))
+        if not rows:
+            return 0
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO segment_efforts
+                    (effort_id, athlete_id, segment_id, activity_id, start_date_local, elapsed_time, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (effort_id) DO UPDATE SET
+                    start_date_local = excluded.start_date_local,
+                    elapsed_time = excluded.elapsed_time,
+                    data = excluded.data
+            """, rows)
+        return len(rows)
+
+    def remove_activity(self, athlete_id: str, activity_id: int) -> int:
+        """Drop the efforts of a deleted activity. Returns the number of rows removed."""
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM segment_efforts WHERE athlete_id = ? AND activity_id = ?",
+                (athlete_id, activity_id)
+            )
+        return cursor.rowcount
+
+    def forget_athlete(self, athlete_id: str) -> int:
+        """Drop an athlete's whole effort history and sync state. Returns the number of efforts removed."""
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM segment_efforts WHERE athlete_id = ?", (athlete_id,))
+            self.conn.execute("DELETE FROM segment_effort_sync WHERE athlete_id = ?", (athlete_id,))
+        return cursor.rowcount
+
+    def sync_state(self, athlete_id: str, segment_id: int) -> Dict[str, Any]:
+        row = self.conn.execute(
+            "SELECT complete, synced_at FROM segment_effort_sync WHERE athlete_id = ? AND segment_id = ?",
+            (athlete_id, segment_id)
+        ).fetchone()
+        if row is None:
+            return {"complete": False, "synced_at": None}
+        return {"complete": bool(row[0]), "synced_at": row[1]}
+
+    def mark_synced(self, athlete_id: str, segment_id: int, complete: bool,
+                    listed_until: Optional[str] = None) -> None:
+        """Record a listing; listed_until is the newest start it returned (the watermark only moves forward)."""
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO segment_effort_sync (athlete_id, segment_id, complete, synced_at, listed_until)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (athlete_id, segment_id) DO UPDATE SET
+                    complete = MAX(complete, excluded.complete),
+                    synced_at = excluded.synced_at,
+                    listed_until = COALESCE(MAX(listed_until, excluded.listed_until),
+                                            listed_until, excluded.listed_until)
+            """, (athlete_id, segment_id, int(complete), time.time(), listed_until))
+
+    def listed_until(self, athlete_id: str, segment_id: int) -> Optional[str]:
+        """Where the next /segment_efforts top-up starts, or None if no listing has run."""
+        row = self.conn.execute(
+            "SELECT listed_until FROM segment_effort_sync WHERE athlete_id = ? AND segment_id = ?",
+            (athlete_id, segment_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def latest_start(self, athlete_id: str, segment_id: int) -> Optional[str]:
+        """Newest effort stored from any source (not a sync watermark, see listed_until)."""
+        row = self.conn.execute(
+            "SELECT MAX(start_date_local) FROM segment_efforts WHERE athlete_id = ? AND segment_id = ?",
+            (athlete_id, segment_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def count(self, athlete_id: str, segment_id: int) -> int:
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM segment_efforts WHERE athlete_id = ? AND segment_id = ?",
+            (athlete_id, segment_id)
+        ).fetchone()
+        return row[0]
+
+    def page(self, athlete_id: str, segment_id: int, page: int = 1, per_page: int = 50) -> List[Dict[str, Any]]:
+        """Efforts oldest first (Strava's order), paginated like /segment_efforts."""
+        offset = max(page - 1, 0) * per_page
+        rows = self.conn.execute("""
+            SELECT data FROM segment_efforts
+            WHERE athlete_id = ? AND segment_id = ?
+            ORDER BY start_date_local, effort_id
+            LIMIT ? OFFSET ?
+        """, (athlete_id, segment_id, per_page, offset)).fetchall()
+        return [json.loads(r[0]) for r in rows]
@@ -8,18 +8,42 @@ import os
 import sys
 import time
 import asyncio
-from typing import Any, Dict, List, Optional
+import hashlib
+import heapq
+import hmac
+import uuid
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional
 from collections import defaultdict
+from contextlib import asynccontextmanager
 from datetime import datetime
 import json
 import logging
-from fastapi import FastAPI, HTTPException, Response, Header, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, Response, Header, BackgroundTasks, Query, Body
 from pydantic import BaseModel
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import uvicorn
 import httpx
 from map_utils import format_activity_with_map
 from rate_limiter import rate_limiter
+from request_scheduler import Priority, QuotaWaitTimeout, scheduler
+from activity_index import ActivityTextIndex
+from streams_store import streams_store
+from hydration_queue import HydrationQueue, HydrationWorker, hydration_jobs
+from segment_effort_store import SegmentEffortStore
+from stream_analytics import ANALYTICS_KEYS, analyze_streams
+from activity_summary import group_by_date, summarize_by_year, summarize_rows, summary_rows
+import executors
+import metrics
+from executors import loop_lag_monitor
+from ttl_cache import TTLCache
+from endpoint_cache import EndpointCache
+from export_cache import ExportCache, ExportWriter
+from activity_export import EXPORT_FORMATS, EXPORT_STREAM_KEYS, export_filename, has_gps, iter_export
+from cache_backend import LockTimeout, create_backend
+from cache_merge import ActivityChanges, merge_entries
+from token_map import TokenAthleteMap, token_fingerprint
+from webhooks import WebhookEvent, insert_activity, patch_activity, remove_activity
 
 # Configure logging
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -30,45 +54,164 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Strava API configuration
-STRAVA_API_BASE_URL = "https://www.strava.com/api/v3"
+# Strava API configuration (overridable to point at a stand-in, e.g. benchmarks/fake_strava.py)
+STRAVA_API_BASE_URL = os.getenv("STRAVA_API_BASE_URL", "https://www.strava.com/api/v3")
+
+# Shared secret the backend sends as X-MCP-Internal-Key (both read backend/.env).
+# Headers that vouch for an identity, like X-Strava-Athlete-Id, count only with it.
+MCP_INTERNAL_KEY = os.getenv("MCP_INTERNAL_KEY", "")
+# Only the backend (and nginx, for /webhook) should reach this server
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+MCP_PORT = int(os.getenv("MCP_PORT", "8001"))
 
 # In-memory cache for activities
 # Cache structure: {athlete_id: {"activities": [...], "fetched_at": timestamp}}
 ACTIVITY_CACHE: Dict[str, Dict[str, Any]] = {}
 
 # Cache structure: {token: athlete_id}
+# Raw tokens, in memory only: the latest one per athlete is what background work
+# (webhooks, hydration) calls Strava with
 TOKEN_TO_ID_CACHE: Dict[str, str] = {}
+# sha256(token) -> athlete_id, persisted and bounded, so a restart or token rotation
+# doesn't cost an /athlete call before cached data can be served
+token_athletes = TokenAthleteMap(
+    max_entries=int(os.getenv("TOKEN_MAP_MAX_ENTRIES", "10000")),
+    persist_path=os.getenv("TOKEN_MAP_FILE", "token_athletes.json")
+)
 LAST_HYDRATION_TRIGGER = 0  # Timestamp of last background hydration start
-ATHLETE_LOCKS = defaultdict(asyncio.Lock)
-
-# --- SEGMENT CACHE ---
-# Cache for segment details, efforts, and leaderboards
-# {segment_id: {"details": {...}, "leaderboard": {...}, "efforts": [...], "fetched_at": timestamp}}
-SEGMENT_CACHE: Dict[int, Dict[str, Any]] = {}
+# /athlete/stats starts background hydration of unhydrated activities (off for benchmarks)
+AUTO_HYDRATION = os.getenv("AUTO_HYDRATION", "true").lower() != "false"
+# Activity lists, token -> athlete ids and per-athlete locks shared between workers
+# (CACHE_BACKEND_URL; process-local by default)
+cache_backend = create_backend(os.getenv("CACHE_BACKEND_URL"))
+# Digest of each athlete's entry as last loaded from / published to a shared backend
+ACTIVITY_CACHE_DIGESTS: Dict[str, str] = {}
+# Records changed locally since then, replayed onto the shared copy if it moved on (cache_merge.py)
+ACTIVITY_CHANGES: Dict[str, ActivityChanges] = {}
+CACHE_PUBLISH_LOCK = asyncio.Lock()
+CACHE_PUBLISH_PENDING = False
+# Strava access tokens live six hours
+TOKEN_ATHLETE_TTL = 3600 * 6
+# In-flight background activity list refreshes: {athlete_id: task}
+ACTIVITY_REFRESH_TASKS: Dict[str, asyncio.Task] = {}
+
+# Full-text index per athlete over name/description/private_note
+# Built lazily from ACTIVITY_CACHE, kept in sync on fetch and hydration
+ACTIVITY_TEXT_INDEXES: Dict[str, ActivityTextIndex] = {}
+
+# id -> activity record per athlete (same dict objects as ACTIVITY_CACHE)
+# {athlete_id: (activities list it was built from, {activity_id: activity})}
+ACTIVITY_ID_MAPS: Dict[str, Any] = {}
+
+# --- RESPONSE CACHE ---
+# Bounded TTL + LRU cache for the read-only pass-through endpoints (segments, gear,
+# routes, zones, clubs, laps, comments, kudos), declared per handler with
+# @endpoint_cache.cached. Namespaced so /cache/stats can report hit rates per endpoint.
+response_cache = TTLCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    persist_path=os.getenv("RESPONSE_CACHE_FILE", "response_cache.json")
+)
 SEGMENT_TTL = 3600 * 24 # 24 hours for segment details (they don't change often)
 SEGMENT_EFFORTS_TTL = 3600 * 1 # 1 hour for efforts/leaderboard
+GEAR_TTL = 3600 * 24
+ROUTES_TTL = 3600 * 1 # Routes can be created/edited at any time
+CLUBS_TTL = 3600 * 24
+CLUB_ACTIVITIES_TTL = 60 * 15
+# Activity zones and laps are fixed once the activity is processed
+ACTIVITY_ZONES_TTL = 3600 * 24 * 7
+LAPS_TTL = 3600 * 24 * 7
+SOCIAL_TTL = 60 * 10 # Comments and kudos keep arriving
+# Rendered activity maps (dropped when the activity is edited)
+MAP_CACHE_TTL = 3600 * 24 * 7
+# How long past its TTL an entry may still be served while it is refreshed in the background
+STALE_TTL = 3600 * 24
+SOCIAL_STALE_TTL = 3600 * 1
+
+# Route GPX/TCX files and year export zips on disk (routes keyed on route id + updated_at)
+export_cache = ExportCache(os.getenv("EXPORT_CACHE_DIR", "export_cache"))
+# Year export jobs: {job_id: status dict}
+EXPORT_JOBS: Dict[str, Dict[str, Any]] = {}
+
+def token_scope(fingerprint: str) -> str:
+    """Cache scope of a token whose athlete is not known yet (see token_fingerprint)."""
+    return "token:" + fingerprint[:16]
+
+def known_athlete_id(access_token: str) -> Optional[str]:
+    """The token's athlete id if this process (or its persistent map) already knows it."""
+    return TOKEN_TO_ID_CACHE.get(access_token) or token_athletes.get(access_token)
+
+def cache_scope(access_token: str) -> str:
+    """Athlete id for per-athlete cache keys (a token scope until the id is known)."""
+    athlete_id = known_athlete_id(access_token)
+    if athlete_id:
+        return athlete_id
+    return token_scope(token_fingerprint(access_token))
+
+endpoint_cache = EndpointCache(response_cache, cache_scope)
+
+# Effort history per (athlete, segment); topped up at most every SEGMENT_EFFORTS_TTL
+segment_effort_store = SegmentEffortStore(os.getenv("SEGMENT_EFFORTS_DB", "segment_efforts.db"))
+EFFORTS_PAGE_SIZE = 200  # Strava's max per_page
 
 
 # Cache configuration
 CACHE_FILE = "strava_cache.json"
+CACHE_SAVE_DEBOUNCE_SECONDS = 30
+PENDING_CACHE_SAVE: Optional[asyncio.Task] = None
 
 class HydrationRequest(BaseModel):
     ids: List[int]
+
+class DetailsRequest(BaseModel):
+    ids: List[int]
+    deadline_seconds: Optional[float] = None  # Stop waiting (fetches keep going and get cached)
+
+class ActivityQuery(BaseModel):
+    after_date: Optional[str] = None
+    before_date: Optional[str] = None
+    activity_type: Optional[str] = None
+    min_distance_meters: Optional[float] = None
+    max_distance_meters: Optional[float] = None
+    keyword: Optional[List[str]] = None
+    ids: Optional[List[int]] = None
+    q: Optional[str] = None
+    top_k: Optional[int] = None
+    include_summary: bool = True
 CACHE_TTL_SECONDS = 3600  # 1 hour
+# Strava push subscription (see /webhook). With webhooks patching the cache, the
+# list TTL is only a safety net for missed events and can be much longer.
+WEBHOOK_VERIFY_TOKEN = os.getenv("STRAVA_WEBHOOK_VERIFY_TOKEN")
+WEBHOOK_SUBSCRIPTION_ID = os.getenv("STRAVA_WEBHOOK_SUBSCRIPTION_ID")
+if WEBHOOK_VERIFY_TOKEN:
+    CACHE_TTL_SECONDS = int(os.getenv("WEBHOOK_CACHE_TTL_SECONDS", str(3600 * 24)))
+WEBHOOK_STATS: Dict[str, int] = defaultdict(int)
+# A delta refresh re-reads activities that started this long before the newest cached one
+DELTA_OVERLAP_SECONDS = 3600 * 24 * 3
+# Refreshes requested within this long of the last one are answered from the cache
+MIN_REFRESH_INTERVAL_SECONDS = 30
+# Deltas never see deletions or edits to older activities: a refresh re-paginates the
+# whole list once the last full listing is older than this (or on POST /activities/refresh?full=true)
+FULL_RECONCILE_SECONDS = int(os.getenv("FULL_RECONCILE_SECONDS", str(3600 * 24 * 7)))
+# Pause between activity list pages of a full fetch
+ACTIVITY_PAGE_PAUSE_SECONDS = float(os.getenv("ACTIVITY_PAGE_PAUSE_SECONDS", "1"))
 STARRED_SEGMENTS_TTL = 3600 * 24 # 24 hours for starred segments list
+# Concurrent detail fetches per batch (the scheduler still enforces the quota)
+DETAIL_FETCH_CONCURRENCY = 5
+# Activity, segment and effort streams never change once uploaded; routes can be edited
+ROUTE_STREAMS_MAX_AGE = 3600 * 24 * 7
 
-def format_seconds_to_str(seconds: int) -> str:
-    """Format seconds into Xh Ym string."""
-    if not seconds:
-        return "0s"
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    return f"{hours}h {minutes}m"
+# Stream analytics per activity: {activity_id: {"zones": athlete zones used, "analytics": {...}}}
+ANALYTICS_CACHE: Dict[int, Dict[str, Any]] = {}
+ATHLETE_ZONES_TTL = 3600 * 24
 
 def load_cache_from_disk():
-    """Load activity cache from disk."""
+    """Load activity cache from disk (a shared backend is read per athlete instead)."""
     global ACTIVITY_CACHE
+    token_athletes.load()
+    if cache_backend.shared:
+        response_cache.load()
+        return
     try:
         if os.path.exists(CACHE_FILE):
             with open(CACHE_FILE, 'r') as f:
@@ -76,29 +219,310 @@ def load_cache_from_disk():
             logger.info(f"Loaded {len(ACTIVITY_CACHE)} athletes from disk cache.")
     except Exception as e:
         logger.error(f"Failed to load disk cache: {e}")
+    response_cache.load()
+
+def request_cache_save():
+    """Debounced save_cache_to_disk for frequent small updates (e.g. hydration progress)."""
+    global PENDING_CACHE_SAVE
+    if PENDING_CACHE_SAVE is not None and not PENDING_CACHE_SAVE.done():
+        return
+
+    async def _save_later():
+        await asyncio.sleep(CACHE_SAVE_DEBOUNCE_SECONDS)
+        save_cache_to_disk()
+
+    PENDING_CACHE_SAVE = asyncio.create_task(_save_later())
 
 def save_cache_to_disk():
-    """Save activity cache to disk."""
+    """Save activity cache to disk (or publish changed athletes to a shared backend)."""
+    token_athletes.save()
+    if cache_backend.shared:
+        schedule_cache_publish()
+        response_cache.save()
+        return
     try:
         with open(CACHE_FILE, 'w') as f:
             json.dump(ACTIVITY_CACHE, f)
         logger.info("Saved cache to disk.")
     except Exception as e:
         logger.error(f"Failed to save disk cache: {e}")
+    response_cache.save()
+
+def pending_changes(athlete_id: str) -> ActivityChanges:
+    changes = ACTIVITY_CHANGES.get(athlete_id)
+    if changes is None:
+        changes = ACTIVITY_CHANGES[athlete_id] = ActivityChanges()
+    return changes
+
+def drop_local_activity_cache(athlete_id: str) -> None:
+    """Forget the local copy of an entry another worker deleted (e.g. the athlete deauthorized)."""
+    for cache in (ACTIVITY_CACHE, ACTIVITY_TEXT_INDEXES, ACTIVITY_CACHE_DIGESTS, ACTIVITY_CHANGES):
+        cache.pop(athlete_id, None)
+
+def adopt_shared_entry(athlete_id: str, entry: Dict[str, Any], digest: str) -> None:
+    """
+    Take the shared copy, with local changes not yet published replayed onto it
+    (they stay pending, so the next publish pushes the merged entry).
+    """
+    local = ACTIVITY_CACHE.get(athlete_id)
+    changes = ACTIVITY_CHANGES.get(athlete_id)
+    if local is not None and changes:
+        entry = merge_entries(entry, local, changes)
+    ACTIVITY_CACHE[athlete_id] = entry
+    ACTIVITY_CACHE_DIGESTS[athlete_id] = digest
+    # Rebuilt from the new list on next use
+    ACTIVITY_TEXT_INDEXES.pop(athlete_id, None)
+    SUMMARY_CACHE.pop(athlete_id, None)
+
+async def sync_activity_cache(athlete_id: str) -> None:
+    """With a shared backend, adopt the athlete's entry if another worker published a newer one."""
+    if not cache_backend.shared:
+        return
+    meta = await cache_backend.get("activities_meta", athlete_id)
+    if meta is None:
+        if athlete_id in ACTIVITY_CACHE_DIGESTS:
+            drop_local_activity_cache(athlete_id)
+        return
+    if meta["digest"] == ACTIVITY_CACHE_DIGESTS.get(athlete_id):
+        return
+    entry = await cache_backend.get("activities", athlete_id)
+    if entry is None:
+        return
+    adopt_shared_entry(athlete_id, entry, meta["digest"])
+    logger.info(f"Loaded {len(entry.get('activities', []))} activities for athlete {athlete_id} from the shared cache")
+
+def activity_cache_digest(entry: Dict[str, Any]) -> str:
+    """Digest published alongside an activity cache entry."""
+    # Inline on purpose: the C JSON encoder holds the GIL throughout, so a pool
+    # thread would not free the loop, and the entry must not change mid-encode
+    return hashlib.sha1(json.dumps(entry).encode()).hexdigest()
+
+async def publish_activity_cache(athlete_id: str) -> None:
+    """
+    Push the athlete's entry to a shared backend if it changed since the last sync.
+    Compare-and-set: if another worker published since, its copy is re-read and our
+    changes are replayed onto it before publishing.
+    """
+    if not cache_backend.shared or athlete_id not in ACTIVITY_CACHE:
+        return
+    if activity_cache_digest(ACTIVITY_CACHE[athlete_id]) == ACTIVITY_CACHE_DIGESTS.get(athlete_id):
+        return
+    try:
+        async with cache_backend.lock(f"publish:{athlete_id}"):
+            await _publish_locked(athlete_id)
+    except LockTimeout:
+        # Changes stay pending; the next save publishes them
+        logger.warning(f"Publishing the activity cache of athlete {athlete_id} timed out waiting for the lock")
+
+async def _publish_locked(athlete_id: str) -> None:
+    meta = await cache_backend.get("activities_meta", athlete_id)
+    if meta is None and athlete_id in ACTIVITY_CACHE_DIGESTS:
+        drop_local_activity_cache(athlete_id)
+        return
+    if meta is not None and meta["digest"] != ACTIVITY_CACHE_DIGESTS.get(athlete_id):
+        theirs = await cache_backend.get("activities", athlete_id)
+        if theirs is not None:
+            adopt_shared_entry(athlete_id, theirs, meta["digest"])
+            logger.info(f"Activity cache for athlete {athlete_id} changed in another worker: merged")
+    entry = ACTIVITY_CACHE.get(athlete_id)
+    if entry is None:
+        return
+    digest = activity_cache_digest(entry)
+    await cache_backend.set("activities", athlete_id, entry)
+    await cache_backend.set("activities_meta", athlete_id, {"digest": digest, "published_at": time.time()})
+    ACTIVITY_CACHE_DIGESTS[athlete_id] = digest
+    ACTIVITY_CHANGES.pop(athlete_id, None)
+
+def schedule_cache_publish() -> None:
+    """Publish every changed athlete in the background (one pass queued at a time)."""
+    global CACHE_PUBLISH_PENDING
+    if CACHE_PUBLISH_PENDING:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    CACHE_PUBLISH_PENDING = True
+
+    async def _publish():
+        global CACHE_PUBLISH_PENDING
+        async with CACHE_PUBLISH_LOCK:
+            CACHE_PUBLISH_PENDING = False
+            for athlete_id in list(ACTIVITY_CACHE):
+                try:
+                    await publish_activity_cache(athlete_id)
+                except Exception as e:
+                    logger.error(f"Failed to publish activity cache for athlete {athlete_id}: {e}")
+
+    loop.create_task(_publish())
+
+@asynccontextmanager
+async def athlete_lock(athlete_id: str):
+    """Per-athlete lock across workers, so only one of them fetches the activity list."""
+    try:
+        async with cache_backend.lock(f"activities:{athlete_id}"):
+            yield
+    except LockTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+def get_text_index(athlete_id: str) -> ActivityTextIndex:
+    """Get the athlete's text index, building it from the cache on first use."""
+    index = ACTIVITY_TEXT_INDEXES.get(athlete_id)
+    if index is None:
+        activities = ACTIVITY_CACHE.get(athlete_id, {}).get("activities", [])
+        index = ActivityTextIndex().build(activities)
+        ACTIVITY_TEXT_INDEXES[athlete_id] = index
+        logger.info(f"Built text index for athlete {athlete_id}: {len(index)} activities")
+    return index
+
+def get_activity_map(athlete_id: str) -> Dict[int, Dict[str, Any]]:
+    """
+    The athlete's activity_id -> cached record map.
+    Rebuilt only when the cached activity list itself is replaced (full fetch, disk load);
+    hydration updates records in place so the map stays in sync.
+    """
+    activities = ACTIVITY_CACHE.get(athlete_id, {}).get("activities")
+    if activities is None:
+        return {}
+    entry = ACTIVITY_ID_MAPS.get(athlete_id)
+    if entry is None or entry[0] is not activities:
+        entry = (activities, {a["id"]: a for a in activities if "id" in a})
+        ACTIVITY_ID_MAPS[athlete_id] = entry
+    return entry[1]
+
+def is_hydrated(activity: Dict[str, Any]) -> bool:
+    """True if the record already holds the detailed activity (description, segment efforts...)."""
+    return activity.get("hydrated_at") is not None or activity.get("description") is not None
+
+def activity_changed(athlete_id: str, activity: Dict[str, Any]):
+    """
+    Note an added or updated record: refresh it in the athlete's text index (if the
+    index exists yet) and, with a shared backend, queue it for the next publish.
+    """
+    index = ACTIVITY_TEXT_INDEXES.get(athlete_id)
+    if index is not None:
+        index.add(activity)
+    if cache_backend.shared and "id" in activity:
+        pending_changes(athlete_id).update(activity["id"])
+
+def activity_removed(athlete_id: str, activity_id: int) -> None:
+    """Note a record dropped from the athlete's list (see activity_changed)."""
+    if cache_backend.shared:
+        pending_changes(athlete_id).remove(activity_id)
 
 # Load cache on startup
 load_cache_from_disk()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_lag_monitor.start()
+    yield
+    loop_lag_monitor.stop()
+    await cache_backend.close()
+    executors.shutdown()
+
 # Create FastAPI app
 app = FastAPI(
     title="Strava API Server",
     description="HTTP server for Strava API integration",
+    lifespan=lifespan,
 )
 
-async def make_strava_request(url: str, method: str = "GET", params: Dict[str, Any] = None, access_token: str = None, response_type: str = "json") -> Any:
+def is_internal_request(request: Request) -> bool:
+    """True if the request carries the backend's MCP_INTERNAL_KEY."""
+    key = request.headers.get("X-MCP-Internal-Key")
+    if not MCP_INTERNAL_KEY or not key:
+        return False
+    return hmac.compare_digest(key.encode(), MCP_INTERNAL_KEY.encode())
+
+@app.middleware("http")
+async def remember_athlete_id(request: Request, call_next):
+    """
+    The backend sends the athlete id it already knows alongside the token, so a new
+    token never needs an /athlete call. The id is taken on trust, so it is ignored
+    unless the request also carries the internal key; otherwise the id comes from
+    Strava as before.
+    """
+    token = request.headers.get("X-Strava-Token")
+    athlete_id = request.headers.get("X-Strava-Athlete-Id")
+    if token and athlete_id and athlete_id.isdigit() and is_internal_request(request):
+        remember_token(token, athlete_id)
+    return await call_next(request)
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Latency per route, and a stage trace that handlers can add to (see metrics.py)."""
+    started = time.perf_counter()
+    status = 500
+    with metrics.trace(f"{request.method} {request.url.path}"):
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            metrics.http_request_seconds.observe(
+                time.perf_counter() - started,
+                method=request.method, route=metrics.route_label(request), status=status
+            )
+
+metrics.set_namespace("strava_mcp")
+STRAVA_RESPONSES = metrics.Counter("strava_mcp_strava_responses_total", "Strava API responses by status.", ["status"])
+# source="strava" is Strava's own count (X-RateLimit-* headers, shared by everything using
+# our client id); source="local" is what this host's rate limiter has recorded
+STRAVA_QUOTA_USED = metrics.Gauge("strava_mcp_quota_used", "Strava requests used in the window.", ["window", "source"])
+STRAVA_QUOTA_LIMIT = metrics.Gauge("strava_mcp_quota_limit", "Strava request limit of the window.", ["window", "source"])
+
+def record_strava_quota(response: httpx.Response) -> None:
+    """Track Strava's usage headers ("<15 min>,<daily>")."""
+    for header, gauge in (("X-RateLimit-Usage", STRAVA_QUOTA_USED), ("X-RateLimit-Limit", STRAVA_QUOTA_LIMIT)):
+        values = response.headers.get(header, "").split(",")
+        if len(values) != 2:
+            continue
+        try:
+            gauge.set(int(values[0]), window="15m", source="strava")
+            gauge.set(int(values[1]), window="daily", source="strava")
+        except ValueError:
+            pass
+
+async def acquire_strava_slot(access_token: str, priority: Priority) -> None:
+    """Wait for a quota slot; the scheduler records the attempt when it grants it."""
+    try:
+        athlete_key = TOKEN_TO_ID_CACHE.get(access_token) or str(hash(access_token))
+        with metrics.span("strava_quota_wait"):
+            await scheduler.acquire(priority, athlete_key=athlete_key)
+    except QuotaWaitTimeout:
+        stats = rate_limiter.get_stats()
+        msg = f"Rate Limit Reached (Internal Safety). Used: 15m={stats['15m_used']}, Daily={stats['daily_used']}"
+        logger.error(msg)
+        raise HTTPException(status_code=429, detail=msg)
+
+def check_strava_response(response: httpx.Response) -> None:
+    """Map Strava error statuses to HTTPExceptions (429 also locks out every other caller)."""
+    STRAVA_RESPONSES.inc(status=response.status_code)
+    record_strava_quota(response)
+
+    # Check for 429 Rate Limit from Strava
+    if response.status_code == 429:
+        # Strava is telling us we overshot. 
+        # We need to aggressively stop everything.
+        logger.error("!!! STRAVA 429 RECEIVED. Aggressively halting all further requests. !!!")
+        
+        # Force the rate limiter to reflect the overload so can_request() fails for everyone
+        for _ in range(rate_limiter.LIMIT_15_MIN):
+            rate_limiter.record_attempt()
+
+        raise HTTPException(status_code=429, detail="Strava API Rate Limit Exceeded (Global Lockout)")
+
+    if response.status_code == 401:
+         raise HTTPException(status_code=401, detail="Invalid or expired Strava token")
+    
+    response.raise_for_status()
+
+async def make_strava_request(url: str, method: str = "GET", params: Dict[str, Any] = None, access_token: str = None, response_type: str = "json", priority: Priority = Priority.INTERACTIVE) -> Any:
     """
     Make a request to the Strava API with STRICT Rate Limiting.
     response_type: "json" (default), "text", or "content" (binary)
+    priority: quota class; background work queues behind interactive requests
     """
     if not access_token:
         raise HTTPException(status_code=401, detail="Missing X-Strava-Token header")
@@ -111,40 +535,19 @@ async def make_strava_request(url: str, method: str = "GET", params: Dict[str, A
     
     async with httpx.AsyncClient(timeout=30.0) as client:
         while True:
-            # 1. CHECK RATE LIMITS BEFORE EVERY ATTEMPT
-            if not rate_limiter.can_request():
-                stats = rate_limiter.get_stats()
-                msg = f"Rate Limit Reached (Internal Safety). Used: 15m={stats['15m_used']}, Daily={stats['daily_used']}"
-                logger.error(msg)
-                raise HTTPException(status_code=429, detail=msg)
-
-            # 2. RECORD THE ATTEMPT IMMEDIATELY
-            rate_limiter.record_attempt()
+            # 1. WAIT FOR A QUOTA SLOT BEFORE EVERY ATTEMPT
+            await acquire_strava_slot(access_token, priority)
 
             try:
-                response = await client.request(
-                    method=method,
-                    url=url,
-                    headers=headers,
-                    params=params
-                )
-                
-                # Check for 429 Rate Limit from Strava
-                if response.status_code == 429:
-                    # Strava is telling us we overshot. 
-                    # We need to aggressively stop everything.
-                    logger.error("!!! STRAVA 429 RECEIVED. Aggressively halting all further requests. !!!")
-                    
-                    # Force the rate limiter to reflect the overload so can_request() fails for everyone
-                    for _ in range(rate_limiter.LIMIT_15_MIN):
-                        rate_limiter.record_attempt()
-
-                    raise HTTPException(status_code=429, detail="Strava API Rate Limit Exceeded (Global Lockout)")
-
-                if response.status_code == 401:
-                     raise HTTPException(status_code=401, detail="Invalid or expired Strava token")
+                with metrics.span("strava_api"):
+                    response = await client.request(
+                        method=method,
+                        url=url,
+                        headers=headers,
+                        params=params
+                    )
                 
-                response.raise_for_status()
+                check_strava_response(response)
                 
                 if response_type == "text":
                     return response.text
@@ -164,6 +567,61 @@ async def make_strava_request(url: str, method: str = "GET", params: Dict[str, A
                 logger.error(f"Unexpected error during Strava request: {str(e)}")
                 raise HTTPException(status_code=500, detail=str(e))
 
+async def stream_strava_download(url: str, access_token: str, media_type: str, headers: Dict[str, str],
+                                 writer: Optional[ExportWriter] = None,
+                                 priority: Priority = Priority.INTERACTIVE) -> StreamingResponse:
+    """
+    Pass a Strava file download through chunk by chunk instead of buffering it.
+    The status is checked before the response starts, so errors still surface as
+    HTTPExceptions. If writer is given, the chunks are also written to the export
+    cache and published only when the whole body has arrived.
+    """
+    if not access_token:
+        raise HTTPException(status_code=401, detail="Missing X-Strava-Token header")
+
+    client = httpx.AsyncClient(timeout=30.0)
+    try:
+        await acquire_strava_slot(access_token, priority)
+        request = client.build_request("GET", url, headers={"Authorization": f"Bearer {access_token}"})
+        with metrics.span("strava_api"):
+            upstream = await client.send(request, stream=True)
+        try:
+            check_strava_response(upstream)
+        except BaseException:
+            await upstream.aclose()
+            raise
+    except BaseException as e:
+        await client.aclose()
+        if writer is not None:
+            writer.discard()
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"Strava API request failed: {str(e)}")
+            raise HTTPException(status_code=e.response.status_code, detail=str(e))
+        if isinstance(e, httpx.RequestError):
+            logger.error(f"Strava API connection error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Connection error: {str(e)}")
+        raise
+
+    async def body():
+        completed = False
+        try:
+            async for chunk in upstream.aiter_bytes():
+                if writer is not None:
+                    writer.write(chunk)
+                yield chunk
+            completed = True
+        finally:
+            await upstream.aclose()
+            await client.aclose()
+            if writer is not None:
+                # A client that disconnects mid-download must not leave a truncated export
+                if completed:
+                    writer.commit()
+                else:
+                    writer.discard()
+
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
 @app.get("/auth/status")
 async def check_auth_status(x_strava_token: Optional[str] = Header(None, alias="X-Strava-Token")) -> Dict[str, Any]:
     """Check if we're authenticated with Strava."""
@@ -197,6 +655,16 @@ async def get_recent_activities(limit: int = 200, page: int = 1, x_strava_token:
         access_token=x_strava_token
     )
 
+def _activity_epoch(activity: Dict[str, Any]) -> Optional[float]:
+    """UTC epoch seconds of an activity's start_date (None if missing/invalid)."""
+    start_date = activity.get("start_date")
+    if not start_date:
+        return None
+    try:
+        return datetime.fromisoformat(start_date.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
 @app.get("/activities/search")
 async def search_activities_optimized(
     x_strava_token: str = Header(..., alias="X-Strava-Token"),
@@ -212,156 +680,361 @@ async def search_activities_optimized(
     """
     Search activities with optimized fetching strategy.
     
+    Answers from the cached history when it covers the requested window and only
+    pages Strava for the part newer than the cache (or everything, if uncached).
+    
     - oldest_first: If True, fetches oldest activities first using 'after' param.
                     Use this for 'first time I did X' queries to enable early stopping.
-    - max_pages: Maximum pages to fetch (default 25 = ~5000 activities)
+    - max_pages: Maximum pages to fetch from Strava (default 25 = ~5000 activities)
     - search_name: Filter by activity name (case-insensitive substring match)
     - min_distance_meters/max_distance_meters: Filter by distance range
     - activity_type: Filter by type (Run, Ride, Swim, etc.)
     - after_date/before_date: Date range filter (YYYY-MM-DD format)
     
-    Returns: {activities: [...], pages_fetched: int, early_stopped: bool, total_found: int}
+    Returns: {activities: [...], pages_fetched: int, early_stopped: bool, total_found: int,
+              source: {cache: int, api: int, cache_covered_until: str | None}}
     """
     import datetime
     
-    all_matches = []
-    page = 1
-    early_stopped = False
-    
     # For oldest-first, use 'after' param with timestamp from year 2000
     # This reverses the sort order to chronological (oldest first)
-    base_params = {"per_page": 200}
+    after_ts: Optional[int] = None
+    before_ts: Optional[int] = None
     
     if oldest_first:
         # Unix timestamp for Jan 1, 2000 = 946684800
-        base_params["after"] = 946684800
+        after_ts = 946684800
     
     # Add date filters if provided
     if after_date:
         try:
             dt = datetime.datetime.strptime(after_date, "%Y-%m-%d")
-            base_params["after"] = int(dt.timestamp())
+            after_ts = int(dt.timestamp())
         except ValueError:
             pass
     
     if before_date:
         try:
             dt = datetime.datetime.strptime(before_date, "%Y-%m-%d")
-            base_params["before"] = int(dt.timestamp())
+            before_ts = int(dt.timestamp())
         except ValueError:
             pass
     
-    while page <= max_pages:
-        params = {**base_params, "page": page}
-        logger.info(f"Search: Fetching page {page}, oldest_first={oldest_first}")
-        
-        try:
-            activities = await make_strava_request(
-                f"{STRAVA_API_BASE_URL}/athlete/activities",
-                params=params,
-                access_token=x_strava_token
-            )
-        except Exception as e:
-            logger.warning(f"Search stopped at page {page}: {e}")
-            break
-        
-        if not activities:
-            break
+    def matches(act: Dict[str, Any]) -> bool:
+        if search_name and search_name.lower() not in act.get("name", "").lower():
+            return False
+        if activity_type and act.get("type", "").lower() != activity_type.lower():
+            return False
+        dist = act.get("distance", 0)
+        if min_distance_meters and dist < min_distance_meters:
+            return False
+        if max_distance_meters and dist > max_distance_meters:
+            return False
+        return True
+    
+    # 1. Cached history: covers everything that started before the cache was fetched
+    cache_matches: List[Dict[str, Any]] = []
+    covered_until: Optional[float] = None
+    athlete_id = known_athlete_id(x_strava_token)
+    if athlete_id:
+        # Another worker may hold the only copy (or this one just restarted)
+        await sync_activity_cache(athlete_id)
+    cache_entry = ACTIVITY_CACHE.get(athlete_id) if athlete_id else None
+    # A list without the flag is a partial one from before it existed
+    if cache_entry and "activities" in cache_entry and cache_entry.get("complete"):
+        covered_until = cache_entry["fetched_at"]
+        for act in cache_entry["activities"]:
+            epoch = _activity_epoch(act)
+            if epoch is None:
+                continue
+            if after_ts is not None and epoch <= after_ts:
+                continue
+            if before_ts is not None and epoch >= before_ts:
+                continue
+            if matches(act):
+                cache_matches.append(act)
+        cache_matches.sort(key=lambda a: a.get("start_date", ""), reverse=not oldest_first)
+        logger.info(f"Search: {len(cache_matches)} matches from cache (covered until {int(covered_until)})")
+    
+    all_matches = list(cache_matches)
+    early_stopped = False
+    page = 0
+    api_matches: List[Dict[str, Any]] = []
+    
+    # For oldest-first "first occurrence" queries, a cached match is the answer:
+    # anything newer than the cache cannot be older than it.
+    if oldest_first and cache_matches:
+        all_matches = cache_matches[:1]
+        early_stopped = True
+    elif covered_until is None or before_ts is None or before_ts > covered_until:
+        # 2. Page Strava for the uncovered part of the window only
+        base_params: Dict[str, Any] = {"per_page": 200}
+        if covered_until is not None:
+            base_params["after"] = int(max(after_ts or 0, covered_until))
+        elif after_ts is not None:
+            base_params["after"] = after_ts
+        if before_ts is not None:
+            base_params["before"] = before_ts
         
-        # Filter activities
-        for act in activities:
-            match = True
-            
-            if search_name and search_name.lower() not in act.get("name", "").lower():
-                match = False
+        known_ids = {a.get("id") for a in cache_matches}
+        page = 1
+        while page <= max_pages:
+            params = {**base_params, "page": page}
+            logger.info(f"Search: Fetching page {page}, oldest_first={oldest_first}")
             
-            if activity_type and act.get("type", "").lower() != activity_type.lower():
-                match = False
+            try:
+                activities = await make_strava_request(
+                    f"{STRAVA_API_BASE_URL}/athlete/activities",
+                    params=params,
+                    access_token=x_strava_token
+                )
+            except Exception as e:
+                logger.warning(f"Search stopped at page {page}: {e}")
+                break
             
-            dist = act.get("distance", 0)
-            if min_distance_meters and dist < min_distance_meters:
-                match = False
-            if max_distance_meters and dist > max_distance_meters:
-                match = False
+            if not activities:
+                break
             
-            if match:
-                all_matches.append(act)
+            # Filter activities
+            for act in activities:
+                if act.get("id") in known_ids or not matches(act):
+                    continue
+                api_matches.append(act)
                 
                 # For oldest-first "first occurrence" queries, we can stop early
                 # after finding the first match (user can specify via max results)
-                if oldest_first and len(all_matches) >= 1:
+                if oldest_first:
                     early_stopped = True
                     break
-        
-        if early_stopped:
-            break
             
-        if len(activities) < 200:
-            # Last page reached
-            break
-            
-        page += 1
+            if early_stopped:
+                break
+                
+            if len(activities) < 200:
+                # Last page reached
+                break
+                
+            page += 1
+        
+        # Strava returns newest-first without 'after' and oldest-first with it
+        api_matches.sort(key=lambda a: a.get("start_date", ""), reverse=not oldest_first)
+        all_matches = api_matches + cache_matches if not oldest_first else cache_matches + api_matches
     
     return {
         "activities": all_matches,
         "pages_fetched": page,
         "early_stopped": early_stopped,
         "total_found": len(all_matches),
-        "strategy": "oldest_first" if oldest_first else "newest_first"
+        "strategy": "oldest_first" if oldest_first else "newest_first",
+        "source": {
+            "cache": len(all_matches) - len(api_matches),
+            "api": len(api_matches),
+            "cache_covered_until": datetime.datetime.fromtimestamp(covered_until).isoformat() if covered_until else None
+        }
     }
 
-async def _fetch_all_activities_logic(x_strava_token: str, refresh: bool) -> List[Dict[str, Any]]:
-    """Core logic to fetch all activities, separated for background reuse."""
-    global ACTIVITY_CACHE, TOKEN_TO_ID_CACHE
-    
-    # Get athlete ID (check token cache first)
+def remember_token(access_token: str, athlete_id: str) -> None:
+    """Record a token's athlete; older tokens of the athlete are dropped from memory."""
+    if TOKEN_TO_ID_CACHE.get(access_token) == athlete_id:
+        return
+    for stale in [t for t, known_id in TOKEN_TO_ID_CACHE.items() if known_id == athlete_id]:
+        del TOKEN_TO_ID_CACHE[stale]
+    TOKEN_TO_ID_CACHE[access_token] = athlete_id
+    token_athletes.set(access_token, athlete_id)
+
+async def get_athlete_id(x_strava_token: str) -> str:
+    """
+    Athlete id for a token: sent by the backend (X-Strava-Athlete-Id, with the
+    internal key), remembered from an earlier request, or one /athlete call the
+    first time.
+    """
     athlete_id = TOKEN_TO_ID_CACHE.get(x_strava_token)
+    if athlete_id:
+        return athlete_id
+    athlete_id = token_athletes.get(x_strava_token)
+    if athlete_id:
+        remember_token(x_strava_token, athlete_id)
+        return athlete_id
+    if cache_backend.shared:
+        # Another worker may already have asked Strava
+        athlete_id = await cache_backend.get("token_athlete", token_fingerprint(x_strava_token))
+        if athlete_id:
+            remember_token(x_strava_token, athlete_id)
+            return athlete_id
+    try:
+        athlete = await make_strava_request(f"{STRAVA_API_BASE_URL}/athlete", access_token=x_strava_token)
+    except HTTPException as e:
+        if e.status_code == 429:
+            logger.error("Rate limited getting athlete ID. Cannot check cache.")
+        raise e
+    athlete_id = str(athlete["id"])
+    remember_token(x_strava_token, athlete_id)
+    if cache_backend.shared:
+        await cache_backend.set("token_athlete", token_fingerprint(x_strava_token), athlete_id, TOKEN_ATHLETE_TTL)
+    return athlete_id
+
+def schedule_activity_refresh(x_strava_token: str, athlete_id: str, full: bool = False) -> asyncio.Task:
+    """
+    Start a background refresh of the athlete's activity list (delta, or a full
+    re-pagination with full=True), unless one of the same kind is already running.
+    """
+    key = f"{athlete_id}:full" if full else athlete_id
+    task = ACTIVITY_REFRESH_TASKS.get(key)
+    if task is None or task.done():
+        async def _refresh():
+            try:
+                await _fetch_all_activities_logic(x_strava_token, refresh=True, priority=Priority.BULK, full=full)
+            except Exception as e:
+                logger.error(f"Background activity refresh failed for athlete {athlete_id}: {e}")
+        
+        task = asyncio.create_task(_refresh())
+        ACTIVITY_REFRESH_TASKS[key] = task
+    return task
+
+def activity_cache_headers(athlete_id: Optional[str]) -> Dict[str, str]:
+    """Freshness of the athlete's cached activity list, for X-Cache-* response headers."""
+    tasks = [ACTIVITY_REFRESH_TASKS.get(key) for key in (athlete_id, f"{athlete_id}:full")] if athlete_id else []
+    refreshing = any(task is not None and not task.done() for task in tasks)
+    headers = {"X-Cache-Refreshing": "true" if refreshing else "false"}
+    cache_entry = ACTIVITY_CACHE.get(athlete_id) if athlete_id else None
+    if cache_entry and cache_entry.get("fetched_at"):
+        headers["X-Cache-Age"] = str(int(time.time() - cache_entry["fetched_at"]))
+        headers["X-Cache-Fetched-At"] = datetime.fromtimestamp(cache_entry["fetched_at"]).isoformat()
+    return headers
+
+async def _fetch_activity_delta(x_strava_token: str, athlete_id: str, priority: Priority) -> List[Dict[str, Any]]:
+    """
+    Bring a complete cached list up to date with activities started since the newest
+    cached one (minus DELTA_OVERLAP_SECONDS, to catch late uploads and recent edits).
+    Must be called under the athlete's lock.
+    """
+    cache_entry = ACTIVITY_CACHE[athlete_id]
+    cached = cache_entry["activities"]
+    epochs = [e for e in (_activity_epoch(a) for a in cached[:50]) if e is not None]
+    after = int(max(epochs) - DELTA_OVERLAP_SECONDS) if epochs else 0
     
-    if not athlete_id:
-        try:
-            athlete = await make_strava_request(f"{STRAVA_API_BASE_URL}/athlete", access_token=x_strava_token)
-            athlete_id = str(athlete["id"])
-            TOKEN_TO_ID_CACHE[x_strava_token] = athlete_id
-        except HTTPException as e:
-            if e.status_code == 429:
-                logger.error("Rate limited getting athlete ID. Cannot check cache.")
-            raise e
+    fetched = []
+    page = 1
+    while True:
+        activities = await make_strava_request(
+            f"{STRAVA_API_BASE_URL}/athlete/activities",
+            params={"per_page": 200, "page": page, "after": after},
+            access_token=x_strava_token,
+            priority=priority
+        )
+        if not isinstance(activities, list) or not activities:
+            break
+        fetched.extend(activities)
+        if len(activities) < 200:
+            break
+        page += 1
+    
+    # Update known activities in place (keeps hydrated fields), prepend new ones newest-first
+    id_map = get_activity_map(athlete_id)
+    new_activities = []
+    for act in fetched:
+        existing = id_map.get(act.get("id"))
+        if existing is not None:
+            existing.update(act)
+            activity_changed(athlete_id, existing)
+        else:
+            new_activities.append(act)
+    new_activities.sort(key=lambda a: a.get("start_date", ""), reverse=True)
+    
+    # A new list object so the id map and yearly summary are rebuilt
+    activities = new_activities + cached
+    cache_entry["activities"] = activities
+    cache_entry["fetched_at"] = time.time()
+    for act in new_activities:
+        activity_changed(athlete_id, act)
+    save_cache_to_disk()
+    await publish_activity_cache(athlete_id)
+    logger.info(
+        f"Delta refresh for athlete {athlete_id}: {len(fetched)} recent from Strava, "
+        f"{len(new_activities)} new, {len(activities)} cached"
+    )
+    return activities
+
+def merge_full_listing(athlete_id: str, fetched: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Reconcile a full re-pagination with the cached list. Known records are updated in
+    place (keeping hydrated fields). Activities Strava no longer lists were deleted:
+    they are dropped along with everything derived from them.
+    """
+    id_map = get_activity_map(athlete_id)
+    merged = []
+    for act in fetched:
+        existing = id_map.get(act.get("id"))
+        if existing is not None:
+            existing.update(act)
+            act = existing
+        merged.append(act)
+    listed = {a.get("id") for a in merged}
+    for activity_id in set(id_map) - listed:
+        activity_removed(athlete_id, activity_id)
+        streams_store.invalidate("activity", activity_id)
+        segment_effort_store.remove_activity(athlete_id, activity_id)
+        drop_activity_caches(athlete_id, activity_id)
+    return merged
+
+async def _fetch_all_activities_logic(x_strava_token: str, refresh: bool, priority: Priority = Priority.INTERACTIVE,
+                                      full: bool = False) -> List[Dict[str, Any]]:
+    """
+    Core logic to fetch all activities, separated for background reuse.
+    
+    Reads (refresh=False) never block on Strava once a list is cached: a stale list is
+    returned as-is and one background delta refresh is started (stale-while-revalidate).
+    refresh=True brings the list up to date before returning; a complete cached list
+    only needs the recent pages, anything else is paginated in full. full=True, or a
+    last full listing older than FULL_RECONCILE_SECONDS, re-paginates everything so
+    deletions and edits to older activities are picked up.
+    """
+    global ACTIVITY_CACHE, TOKEN_TO_ID_CACHE
+    
+    athlete_id = await get_athlete_id(x_strava_token)
+    await sync_activity_cache(athlete_id)
     
     # Check cache
-    if athlete_id in ACTIVITY_CACHE:
+    if athlete_id in ACTIVITY_CACHE and "activities" in ACTIVITY_CACHE[athlete_id] and not refresh:
         cache_entry = ACTIVITY_CACHE[athlete_id]
         age = time.time() - cache_entry["fetched_at"]
-        
-        # If cache is valid, return immediately
-        if age < CACHE_TTL_SECONDS and not refresh:
+        if age >= CACHE_TTL_SECONDS:
+            logger.info(f"Cache stale ({int(age)}s old). Returning {len(cache_entry['activities'])} activities and refreshing in background.")
+            schedule_activity_refresh(x_strava_token, athlete_id)
+        else:
             logger.info(f"Returning {len(cache_entry['activities'])} cached activities for athlete {athlete_id}")
-            return cache_entry["activities"]
-            
-        # If cache is stale but exists, and we are NOT explicitly refreshing (just reading),
-        # return stale data but trigger background refresh if needed? 
-        # Actually, for async, we can just return stale data here if refresh=False.
-        if not refresh:
-            logger.info(f"Cache stale ({int(age)}s old). Returning {len(cache_entry['activities'])} activities immediately.")
-            return cache_entry["activities"]
+        if cache_entry.get("webhook_pending"):
+            schedule_webhook_fetches(athlete_id)
+        return cache_entry["activities"]
     
-    # Fetch all activities with pagination
-    # Use lock to prevent concurrent full-history fetches for the same athlete
-    async with ATHLETE_LOCKS[athlete_id]:
-        # Double-check cache after acquiring lock!
-        if athlete_id in ACTIVITY_CACHE:
-            cache_entry = ACTIVITY_CACHE[athlete_id]
-            age = time.time() - cache_entry["fetched_at"]
-            if age < CACHE_TTL_SECONDS and not refresh:
+    # Use lock to prevent concurrent fetches for the same athlete
+    async with athlete_lock(athlete_id):
+        # Double-check cache after acquiring lock (another worker may have fetched it)!
+        await sync_activity_cache(athlete_id)
+        cache_entry = ACTIVITY_CACHE.get(athlete_id)
+        if cache_entry and "activities" in cache_entry:
+            if not refresh:
                 logger.info(f"Returning {len(cache_entry['activities'])} cached activities for athlete {athlete_id} (acquired lock)")
                 return cache_entry["activities"]
-            
-            # If we just want to read but cache is stale, return it anyway to avoid blocking
-            if not refresh and "activities" in cache_entry:
-                 logger.info(f"Cache stale but available. Returning {len(cache_entry['activities'])} activities for athlete {athlete_id} (acquired lock)")
-                 return cache_entry["activities"]
+            # Lists cached before full_fetched_at was tracked are reconciled one period from now
+            last_full = cache_entry.setdefault("full_fetched_at", cache_entry["fetched_at"])
+            if time.time() - (last_full if full else cache_entry["fetched_at"]) < MIN_REFRESH_INTERVAL_SECONDS:
+                # Someone refreshed while we waited for the lock
+                return cache_entry["activities"]
+            reconcile_due = time.time() - last_full >= FULL_RECONCILE_SECONDS
+            if reconcile_due and not full:
+                logger.info(f"Last full listing for athlete {athlete_id} is {int(time.time() - last_full)}s old: re-paginating")
+            elif cache_entry.get("complete") and not full:
+                try:
+                    return await _fetch_activity_delta(x_strava_token, athlete_id, priority)
+                except HTTPException as e:
+                    logger.error(f"Delta refresh failed: {e.detail}. Keeping cached activities.")
+                    return cache_entry["activities"]
 
+        # Fetch all activities with pagination
         all_activities = []
         page = 1
+        complete = False  # True once the last page was reached without errors
         
         try:
             while True:
@@ -372,7 +1045,8 @@ async def _fetch_all_activities_logic(x_strava_token: str, refresh: bool) -> Lis
                     activities = await make_strava_request(
                         f"{STRAVA_API_BASE_URL}/athlete/activities",
                         params=params, 
-                        access_token=x_strava_token
+                        access_token=x_strava_token,
+                        priority=priority
                     )
                 except HTTPException as e:
                     # Check if it's a rate limit error (429)
@@ -384,7 +1058,8 @@ async def _fetch_all_activities_logic(x_strava_token: str, refresh: bool) -> Lis
                              activities = await make_strava_request(
                                 f"{STRAVA_API_BASE_URL}/athlete/activities",
                                 params=params,
-                                access_token=x_strava_token
+                                access_token=x_strava_token,
+                                priority=priority
                              )
                         except Exception as retry_e:
                             logger.error(f"Retry failed: {retry_e}. Returning partial activities.")
@@ -397,268 +1072,231 @@ async def _fetch_all_activities_logic(x_strava_token: str, refresh: bool) -> Lis
                     break
                 
                 if not isinstance(activities, list) or not activities:
+                    complete = isinstance(activities, list)
                     break
                     
                 all_activities.extend(activities)
                 logger.info(f"Fetched {len(activities)} activities (Total: {len(all_activities)})")
                 
                 if len(activities) < 200:
+                    complete = True
                     break
                     
                 page += 1
                 # Respect rate limits - pause slightly
-                await asyncio.sleep(1)
+                await asyncio.sleep(ACTIVITY_PAGE_PAUSE_SECONDS)
                 
         except Exception as outer_e:
             logger.error(f"Fatal error in pagination loop: {outer_e}")
             
         # Save to cache if we got results
+        if all_activities and cache_entry and "activities" in cache_entry:
+            if cache_entry.get("complete") and not complete:
+                logger.warning(f"Full refresh for athlete {athlete_id} stopped early. Keeping the cached list.")
+                return cache_entry["activities"]
+            all_activities = merge_full_listing(athlete_id, all_activities)
         if all_activities:
             ACTIVITY_CACHE[athlete_id] = {
                 "activities": all_activities,
-                "fetched_at": time.time()
+                "fetched_at": time.time(),
+                "full_fetched_at": time.time(),
+                "complete": complete  # Full history (vs. partial after an error)
             }
+            if cache_backend.shared:
+                pending_changes(athlete_id).replaced = True
+            ACTIVITY_TEXT_INDEXES[athlete_id] = ActivityTextIndex().build(all_activities)
             save_cache_to_disk()
+            # Before releasing the lock, so workers waiting on it find the list
+            await publish_activity_cache(athlete_id)
             dates = [a.get("start_date", "") for a in all_activities]
             dates.sort()
             if dates:
                 logger.info(f"Fetched {len(all_activities)} activities. Range: {dates[0]} to {dates[-1]}")
     
     logger.info(f"Fetched and cached {len(all_activities)} total activities for athlete {athlete_id}")
-    
-    # Background hydration DISABLED for multi-user quota fairness.
-    # Activity details are now fetched only on-demand when a user queries for them.
-    # try:
-    #     if not HYDRATION_LOCK.locked():
-    #          logger.info("Triggering automatic background hydration...")
-    #          asyncio.create_task(hydrate_activities_background(x_strava_token))
-    #     else:
-    #          logger.info("Hydration already in progress.")
-    # except Exception:
-    #     pass # Don't block
-        
     return all_activities
 
 @app.get("/activities/all")
-async def get_all_activities(x_strava_token: str = Header(..., alias="X-Strava-Token"), refresh: bool = False) -> List[Dict[str, Any]]:
-    """Get ALL activities from Strava by paginating through all pages. Results are cached for 5 minutes."""
-    return await _fetch_all_activities_logic(x_strava_token, refresh)
+async def get_all_activities(response: Response, x_strava_token: str = Header(..., alias="X-Strava-Token"), refresh: bool = False) -> List[Dict[str, Any]]:
+    """
+    Get ALL activities from Strava by paginating through all pages. Served from the cache,
+    refreshed in the background once older than CACHE_TTL_SECONDS (see X-Cache-* headers).
+    """
+    activities = await _fetch_all_activities_logic(x_strava_token, refresh)
+    response.headers.update(activity_cache_headers(TOKEN_TO_ID_CACHE.get(x_strava_token)))
+    return activities
 
 
     
 
-# Global lock for hydration to prevent concurrent runs
-HYDRATION_LOCK = asyncio.Lock()
+# Background hydration: persistent job queue + single worker
+hydration_queue = HydrationQueue(os.getenv("HYDRATION_QUEUE_DB", "hydration_queue.db"))
+hydration_worker = HydrationWorker(
+    hydration_queue, rate_limiter,
+    reserve_15m=scheduler.INTERACTIVE_RESERVE_15M,
+    reserve_daily=scheduler.INTERACTIVE_RESERVE_DAILY
+)
+
+async def _hydrate_job(token: str, activity_id: int):
+    """Worker job: fetch details unless something else hydrated the activity meanwhile."""
+    athlete_id = TOKEN_TO_ID_CACHE.get(token)
+    cached = get_activity_map(athlete_id).get(activity_id) if athlete_id else None
+    if cached is not None and is_hydrated(cached):
+        return cached
+    logger.info(f"Hydrating activity {activity_id}.")
+    return await fetch_activity_detail(token, activity_id, priority=Priority.HYDRATION)
 
-async def hydrate_activities_background(token: str):
-    """Background task to fetch full details for activities."""
-    
-    async with HYDRATION_LOCK:
-        logger.info("Starting background hydration of activity details...")
-        
-        # Re-read cache
-        athlete_id = TOKEN_TO_ID_CACHE.get(token)
-        if not athlete_id or athlete_id not in ACTIVITY_CACHE:
-             # Try to fetch athlete ID if missing (should be cached by now)
-             return
+hydration_worker.configure(fetch=_hydrate_job, on_progress=request_cache_save)
 
-        activities = ACTIVITY_CACHE[athlete_id].get("activities", [])
-        
-        # Identify candidates: activities matching "Jessica" should be prioritized if we could search them?
-        # But we can't search them. So we rely on the heuristic.
-        # Candidates: missing 'description'
-        # Smart Hydration: Filter for high-value activities
-        # We only want to auto-hydrate "high value" activities to save API calls
-        # High value = Run, Ride, Swim OR High Social Engagement
-        def is_high_value(act):
-            atype = act.get('type', 'Run') # Default to Run if missing
-            kudos = act.get('kudos_count', 0)
-            comments = act.get('comment_count', 0)
-            
-            # 1. Always hydrate primary sports
-            if atype in ['Run', 'Ride', 'Swim', 'VirtualRun', 'VirtualRide']:
-                return True
-                
-            # 2. Hydrate anything with social engagement (e.g. a Hike with friends)
-            if kudos > 5 or comments > 0:
-                return True
-                
-            # 3. Specific keywords
-            name = act.get('name', '').lower()
-            if any(w in name for w in ['race', 'marathon', 'ftp', 'test']):
-                return True
-            
-            # Default: Ignore Walks, Hikes, Yoga, Weights to save API
-            return False
+async def hydrate_activities_background(token: str):
+    """Queue the athlete's un-hydrated, high-value activities for the hydration worker."""
+    athlete_id = TOKEN_TO_ID_CACHE.get(token)
+    if not athlete_id or athlete_id not in ACTIVITY_CACHE:
+        return
 
-        candidates = [
-            a for a in activities 
-            if ("description" not in a or a["description"] is None) 
-            and is_high_value(a)
-        ]
-        
-        if not candidates:
-            return
+    activities = ACTIVITY_CACHE[athlete_id].get("activities", [])
+    jobs = hydration_jobs(a for a in activities if not is_hydrated(a))
+    queued = hydration_worker.submit(athlete_id, token, jobs)
+    logger.info(f"Hydration: {len(jobs)} high-value activities need details ({queued} queued/updated).")
 
-        logger.info(f"Found {len(candidates)} high-value activities needing hydration.")
-        
-        # Priority Scoring & Window Filtering
-        def priority_score(act):
-            score = 0
-            start_date_str = act.get('start_date', '')
-            if not start_date_str: return (0, "")
-            
-            # 12-MONTH WINDOW CHECK
-            try:
-                # Strava usually uses ISO format "2023-10-31T01:02:03Z"
-                act_date = datetime.fromisoformat(start_date_str.replace("Z", "+00:00"))
-                # If older than 12 months, give it a massive penalty so it drops out of the candidate list or is processed last
-                # Actually, according to plan, we should just SKIP these candidates entirely below.
-                if (datetime.now(act_date.tzinfo) - act_date).days > 365:
-                    return (-10000, start_date_str)
-            except Exception:
-                pass
-
-            atype = act.get('type', '')
-            kudos = act.get('kudos_count', 0)
-            name = act.get('name', '').lower()
-
-            # Tier 1: Recent (Last ~15 months)
-            current_year = datetime.now().year
-            if str(current_year) in start_date_str:
-                score += 1000
-            elif str(current_year - 1) in start_date_str:
-                score += 500
-                
-            # Tier 2: Social
-            if kudos > 10:
-                score += 50
-            if act.get('comment_count', 0) > 0:
-                score += 100
-            
-            # Tier 3: Important keywords
-            if any(w in name for w in ['race', 'marathon', '5k', '10k', 'pr', 'pb']):
-                score += 200
-            if 'angeles' in name:
-                score += 100
-                
-            # Tier 4: Type Preference
-            if atype == 'Run':
-                score += 20
-                
-            return (score, start_date_str)
-        
-        candidates.sort(key=priority_score, reverse=True)
-        # Filter out candidates outside the 12-month window (Score < 0)
-        candidates = [c for c in candidates if priority_score(c)[0] >= 0]
-        
-        # We process candidates in a loop, but we RELEASE the lock during the network call
-        # so that other requests (like specific hydration) can interleave.
-        # We need to copy the list of candidates to iterate (since they are just refs)
-        # but we need to re-check status before hydrating.
-        
-    logger.info(f"Starting hydration loop for {len(candidates)} candidates...")
+@app.post("/activities/refresh")
+async def refresh_activities(
+    response: Response,
+    wait_seconds: float = 0,
+    full: bool = False,
+    x_strava_token: str = Header(..., alias="X-Strava-Token")
+) -> Dict[str, Any]:
+    """
+    Delta-refresh the activity list in the background (at most one refresh per athlete
+    at a time), then queue hydration. With wait_seconds, wait up to that long for the
+    refresh to finish, e.g. before answering a question about today. full=true
+    re-paginates the whole list instead, picking up deleted and edited activities.
+    """
+    athlete_id = await get_athlete_id(x_strava_token)
+    task = schedule_activity_refresh(x_strava_token, athlete_id, full=full)
+    task.add_done_callback(lambda _: asyncio.ensure_future(hydrate_activities_background(x_strava_token)))
     
-    hydrated_count = 0
+    if wait_seconds > 0 and not task.done():
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout=wait_seconds)
+        except asyncio.TimeoutError:
+            logger.info(f"Activity refresh for athlete {athlete_id} still running after {wait_seconds}s")
     
-    for act in candidates:
-        # DYNAMIC THROTTLING
-        stats = rate_limiter.get_stats()
-        used_15m = stats.get("15m_used", 0)
-        limit_15m = stats.get("15m_limit", 80)
-        used_daily = stats.get("daily_used", 0)
-        limit_daily = stats.get("daily_limit", 800)
-        
-        # Priority check: If we are nearing the global or daily limit, slow down or stop
-        # background hydration to leave room for live user queries.
-        sleep_time = 2 
-        
-        # DAILY LIMIT PROTECTION
-        if used_daily > (limit_daily * 0.95): # > 900 calls (was 720)
-            logger.warning("Daily rate limit nearly reached. Stopping background hydration for the day.")
-            break
-            
-        # 15-MINUTE THROTTLING
-        if used_15m > (limit_15m * 0.9): # > 72 calls 
-            logger.warning("Critical 15m rate limit usage. Pausing background hydration.")
-            break
-        elif used_15m > (limit_15m * 0.75): # > 60 calls
-            logger.info("High 15m rate limit usage. Throttling background hydration (10s sleep).")
-            sleep_time = 10
-        elif used_15m > (limit_15m * 0.5): # > 40 calls
-            logger.info("Moderate 15m rate limit usage. Throttling background hydration (5s sleep).")
-            sleep_time = 5 
-
-
-        # Check if already hydrated (by another process)
-        if "description" in act and act["description"] is not None:
-            continue
+    headers = activity_cache_headers(athlete_id)
+    response.headers.update(headers)
+    refreshing = headers["X-Cache-Refreshing"] == "true"
+    return {
+        "message": "Refresh started in background" if refreshing else "Refresh complete",
+        "refreshing": refreshing,
+        "cache_age_seconds": int(headers["X-Cache-Age"]) if "X-Cache-Age" in headers else None
+    }
 
-        act_id = act['id']
-        try:
-            # Rate limit safety sleep
-            await asyncio.sleep(sleep_time)
-            
-            logger.info(f"Hydrating activity {act_id} ({act.get('name')}). Usage: {used_15m}/{limit_15m}")
-            
-            # NETWORK CALL - NO LOCK
+async def fetch_activity_detail(token: str, activity_id: int, priority: Priority = Priority.INTERACTIVE,
+                                semaphore: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
+    """Fetch one detailed activity from Strava and merge it into the cached record."""
+    if semaphore is not None:
+        async with semaphore:
             detail = await make_strava_request(
-                    f"{STRAVA_API_BASE_URL}/activities/{act_id}",
-                    access_token=token
+                f"{STRAVA_API_BASE_URL}/activities/{activity_id}", access_token=token, priority=priority
             )
-            
-            # UPDATE CACHE - ACQUIRE LOCK
-            async with HYDRATION_LOCK:
-                # Update in place (act is a reference to the dict in ACTIVITY_CACHE)
-                act['description'] = detail.get('description', '')
-                act['private_note'] = detail.get('private_note', '')
-                act['segment_efforts'] = detail.get('segment_efforts', [])
-                act['similar_activities'] = detail.get('similar_activities')
-                act['athlete_count'] = detail.get('athlete_count', 1)
-                act['hydrated_at'] = time.time()
-                
-                hydrated_count += 1
-                
-                if hydrated_count % 5 == 0:
-                    save_cache_to_disk()
-                
-        except HTTPException as he:
-            if he.status_code == 429:
-                logger.error("Rate limit 429 hit (server side). Stopping hydration.")
-                break
-            logger.error(f"Failed to hydrate {act_id}: {he}")
-        except Exception as e:
-            logger.error(f"Failed to hydrate {act_id}: {e}")
-            
-    async with HYDRATION_LOCK:
-        save_cache_to_disk()
-    logger.info(f"Hydration complete/paused. {hydrated_count} activities updated.")
+    else:
+        detail = await make_strava_request(
+            f"{STRAVA_API_BASE_URL}/activities/{activity_id}", access_token=token, priority=priority
+        )
+
+    athlete_id = TOKEN_TO_ID_CACHE.get(token)
+    if athlete_id and detail.get("segment_efforts"):
+        segment_effort_store.ingest(athlete_id, detail["segment_efforts"])
+    cached = get_activity_map(athlete_id).get(activity_id) if athlete_id else None
+    if cached is not None:
+        cached.update(detail)
+        cached["hydrated_at"] = time.time()
+        activity_changed(athlete_id, cached)
+        return cached
+    return detail
 
-@app.post("/activities/refresh")
-async def refresh_activities(x_strava_token: str = Header(..., alias="X-Strava-Token"), background_tasks: BackgroundTasks = None):
-    """Trigger a background refresh of the activity cache (list only, no hydration)."""
-    
-    async def _do_refresh(token):
-        logger.info("Starting background activity refresh...")
-        try:
-            # 1. Fetch latest summary list
-            await _fetch_all_activities_logic(token, refresh=True)
-            logger.info("Background refresh complete.")
-            
-            # 2. Hydration DISABLED for multi-user quota fairness
-            # Activity details are now fetched only on-demand when a user queries for them.
-            # asyncio.create_task(hydrate_activities_background(token))
+def start_detail_fetches(token: str, ids: List[int], priority: Priority = Priority.INTERACTIVE) -> Dict[asyncio.Task, int]:
+    """
+    Start concurrent detail fetches for ids. Returns {task: activity_id}.
+    The cache is saved once all of them have finished, even if the caller stops waiting.
+    """
+    semaphore = asyncio.Semaphore(DETAIL_FETCH_CONCURRENCY)
+    tasks = {
+        asyncio.create_task(fetch_activity_detail(token, activity_id, priority, semaphore)): activity_id
+        for activity_id in ids
+    }
 
-        except Exception as e:
-            logger.error(f"Background refresh failed: {e}")
+    async def _save_when_done():
+        await asyncio.gather(*tasks, return_exceptions=True)
+        save_cache_to_disk()
 
-    if background_tasks:
-        background_tasks.add_task(_do_refresh, x_strava_token)
-        return {"message": "Refresh started in background"}
-    else:
-        # Fallback (shouldn't happen)
-        await _do_refresh(x_strava_token)
-        return {"message": "Refresh completed (synchronous fallback)"}
+    if tasks:
+        asyncio.create_task(_save_when_done())
+    return tasks
+
+@app.post("/activities/details")
+async def get_activity_details_batch(
+    payload: DetailsRequest,
+    x_strava_token: str = Header(..., alias="X-Strava-Token")
+):
+    """
+    Detailed activities for a list of ids, streamed as NDJSON.
+    
+    Cached (hydrated) activities are returned immediately; the rest are fetched
+    concurrently under the quota scheduler and streamed as each completes. Lines:
+      {"id": ..., "source": "cache" | "api", "activity": {...}}
+      {"id": ..., "error": "...", "status": 404}
+      {"done": true, "cached": n, "fetched": n, "failed": n, "pending": [ids], "elapsed_ms": ...}
+    With deadline_seconds, "pending" lists ids still in flight when time ran out;
+    those fetches continue and are cached for the next request.
+    """
+    started = time.monotonic()
+    athlete_id = TOKEN_TO_ID_CACHE.get(x_strava_token)
+    id_map = get_activity_map(athlete_id) if athlete_id else {}
+    
+    ids = list(dict.fromkeys(payload.ids))  # De-duplicate, keep order
+    cached = [id_map[i] for i in ids if i in id_map and is_hydrated(id_map[i])]
+    missing = [i for i in ids if not (i in id_map and is_hydrated(id_map[i]))]
+    
+    async def _stream():
+        counts = {"cached": len(cached), "fetched": 0, "failed": 0}
+        for act in cached:
+            yield json.dumps({"id": act["id"], "source": "cache", "activity": act}) + "\n"
+        
+        tasks = start_detail_fetches(x_strava_token, missing)
+        pending = set(tasks)
+        while pending:
+            timeout = None
+            if payload.deadline_seconds is not None:
+                timeout = max(0.0, payload.deadline_seconds - (time.monotonic() - started))
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.info(f"Details batch deadline reached with {len(pending)} fetches in flight")
+                break
+            for task in done:
+                activity_id = tasks[task]
+                error = task.exception()
+                if error is None:
+                    counts["fetched"] += 1
+                    line = {"id": activity_id, "source": "api", "activity": task.result()}
+                else:
+                    counts["failed"] += 1
+                    line = {
+                        "id": activity_id,
+                        "error": error.detail if isinstance(error, HTTPException) else str(error),
+                        "status": error.status_code if isinstance(error, HTTPException) else 500
+                    }
+                yield json.dumps(line) + "\n"
+        
+        yield json.dumps({
+            "done": True,
+            **counts,
+            "pending": sorted(tasks[t] for t in pending),
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+        }) + "\n"
+    
+    logger.info(f"Details batch: {len(cached)} cached, {len(missing)} to fetch")
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
 
 @app.post("/activities/hydrate_ids")
 async def hydrate_specific_activities(
@@ -674,52 +1312,16 @@ async def hydrate_specific_activities(
              logger.warning("Cache miss during specific hydration.")
              return
              
-        activities = ACTIVITY_CACHE[athlete_id].get("activities", [])
-        # Map ID to Activity Object
-        act_map = {a['id']: a for a in activities}
-        
-        target_acts = []
-        for aid in ids:
-            if aid in act_map:
-                target_acts.append(act_map[aid])
-                
-        logger.info(f"Specific Hydration: Found {len(target_acts)} of {len(ids)} requested activities.")
+        act_map = get_activity_map(athlete_id)
+        target_ids = [aid for aid in ids if aid in act_map and not is_hydrated(act_map[aid])]
+        logger.info(f"Specific Hydration: {len(target_ids)} of {len(ids)} requested activities need details.")
         
-        for act in target_acts:
-            # Check if done?
-            if "description" in act and act["description"] is not None:
-                continue
-
-            # Check Rate Limit (safety first)
-            if not rate_limiter.can_request():
-                 logger.error("Rate limit hit during specific hydration.")
-                 break
-                 
-            try:
-                # Network Call (No Lock)
-                detail = await make_strava_request(
-                        f"{STRAVA_API_BASE_URL}/activities/{act['id']}",
-                        access_token=token
-                )
-                
-                # Update (Lock)
-                async with HYDRATION_LOCK:
-                     act['description'] = detail.get('description', '')
-                     act['private_note'] = detail.get('private_note', '')
-                     act['segment_efforts'] = detail.get('segment_efforts', [])
-                     act['similar_activities'] = detail.get('similar_activities')
-                     act['athlete_count'] = detail.get('athlete_count', 1)
-                     act['hydrated_at'] = time.time()
-                
-                # Sleep a tiny bit to be nice?
-                await asyncio.sleep(0.5)
-                
-            except Exception as e:
-                logger.error(f"Specific hydration failed for {act['id']}: {e}")
-                
-        # Save at end
-        async with HYDRATION_LOCK:
-             save_cache_to_disk()
+        # Concurrent fetches; the scheduler paces them against the quota
+        tasks = start_detail_fetches(token, target_ids)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for aid, result in zip(tasks.values(), results):
+            if isinstance(result, Exception):
+                logger.error(f"Specific hydration failed for {aid}: {result}")
              
     if background_tasks:
         background_tasks.add_task(_do_specific_hydration, x_strava_token, payload.ids)
@@ -728,227 +1330,244 @@ async def hydrate_specific_activities(
         await _do_specific_hydration(x_strava_token, payload.ids)
         return {"message": "Completed specific hydration."}
 
+# {athlete_id: (cache_key, by_year)} - yearly totals only change when the list is refetched
+SUMMARY_CACHE: Dict[str, Any] = {}
+
+async def get_yearly_summary(athlete_id: Optional[str], activities: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Yearly/monthly totals, memoized per athlete until the activity list changes."""
+    if not athlete_id or athlete_id not in ACTIVITY_CACHE:
+        return await executors.run_in_thread(summarize_by_year, activities)
+    cache_key = (ACTIVITY_CACHE[athlete_id].get("fetched_at"), len(activities))
+    cached = SUMMARY_CACHE.get(athlete_id)
+    if cached and cached[0] == cache_key:
+        return cached[1]
+    # Snapshot the fields in a thread, aggregate in a worker process for long histories
+    rows = await executors.run_in_thread(summary_rows, activities)
+    by_year = await executors.run_cpu_bound(summarize_rows, rows, size=len(rows))
+    SUMMARY_CACHE[athlete_id] = (cache_key, by_year)
+    return by_year
+
 @app.get("/activities/summary")
-async def get_activities_summary(x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
+async def get_activities_summary(response: Response, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
     """Get a summarized view of all activities for efficient AI queries. Returns aggregated data by year/month."""
     # Get all activities (will use cache if available)
-    all_activities = await get_all_activities(x_strava_token)
+    all_activities = await _fetch_all_activities_logic(x_strava_token, refresh=False)
+    response.headers.update(activity_cache_headers(TOKEN_TO_ID_CACHE.get(x_strava_token)))
+    return {
+        "total_activities": len(all_activities),
+        "by_year": await get_yearly_summary(TOKEN_TO_ID_CACHE.get(x_strava_token), all_activities),
+        "activities_by_date": await executors.run_in_thread(group_by_date, all_activities),  # Full list for date queries
+        "cache_info": f"Data cached at {datetime.now().isoformat()}"
+    }
+
+@app.post("/activities/query")
+async def query_activities(
+    payload: ActivityQuery,
+    response: Response,
+    x_strava_token: str = Header(..., alias="X-Strava-Token")
+) -> Dict[str, Any]:
+    """
+    Filtered version of /activities/summary: only matching rows are returned.
+    
+    - after_date/before_date: Inclusive local-date bounds (YYYY-MM-DD)
+    - activity_type: Matches sport_type or type (case-insensitive)
+    - min_distance_meters/max_distance_meters: Distance range
+    - keyword: Every keyword must match name/description/private_note (text index)
+    - ids: Restrict to these activity ids
+    - q + top_k: Keep only the top_k activities by query-word hits, then recency
+    - include_summary: Include the all-time by_year aggregates
     
-    # Background hydration DISABLED for multi-user quota fairness.
-    # try:
-    #      asyncio.create_task(hydrate_activities_background(x_strava_token))
-    # except Exception:
-    #      pass
+    Returns the /activities/summary shape plus `matched` (row count).
+    Cache freshness is reported in X-Cache-Age / X-Cache-Refreshing headers.
+    """
+    trace = metrics.current_trace()
+    trace.stage("load_activities")
+    all_activities = await _fetch_all_activities_logic(x_strava_token, refresh=False)
+    athlete_id = TOKEN_TO_ID_CACHE.get(x_strava_token)
+    response.headers.update(activity_cache_headers(athlete_id))
+    trace.stage("filter_activities")
+    index = get_text_index(athlete_id) if athlete_id else ActivityTextIndex().build(all_activities)
     
-    # Group activities by year and month
-    by_year: Dict[str, Dict[str, Any]] = {}
-    activities_by_date: Dict[str, List[Dict[str, Any]]] = {}
+    allowed_ids = set(payload.ids) if payload.ids is not None else None
+    for keyword in payload.keyword or []:
+        keyword_ids = index.search(keyword)
+        allowed_ids = keyword_ids if allowed_ids is None else allowed_ids & keyword_ids
     
-    for activity in all_activities:
-        # Parse date
-        start_date = activity.get("start_date_local", activity.get("start_date", ""))
-        if not start_date:
+    activity_type = payload.activity_type.lower() if payload.activity_type else None
+    candidates = all_activities
+    if allowed_ids is not None and athlete_id:
+        # Small id sets (e.g. backend lookups) go through the id map instead of a full scan
+        id_map = get_activity_map(athlete_id)
+        candidates = [id_map[i] for i in allowed_ids if i in id_map]
+        candidates.sort(key=lambda a: a.get("start_date", ""), reverse=True)  # Cache order
+    matches = []
+    for act in candidates:
+        if allowed_ids is not None and act.get("id") not in allowed_ids:
             continue
-            
-        date_obj = datetime.fromisoformat(start_date.replace("Z", "+00:00"))
-        year = str(date_obj.year)
-        month = f"{year}-{date_obj.month:02d}"
-        date_key = date_obj.strftime("%Y-%m-%d")
-        
-        # Initialize year if needed
-        if year not in by_year:
-            by_year[year] = {
-                "total_activities": 0,
-                "total_distance_miles": 0,
-                "total_elevation_feet": 0,
-                "total_moving_time_seconds": 0,
-                "by_type": {},
-                "by_month": {}
-            }
-        
-        # Initialize month if needed
-        if month not in by_year[year]["by_month"]:
-            by_year[year]["by_month"][month] = {
-                "activities": 0,
-                "distance_miles": 0,
-                "elevation_feet": 0,
-                "moving_time_seconds": 0,
-                "by_type": {}
-            }
-        
-        # Track activities by date (condensed format)
-        if date_key not in activities_by_date:
-            activities_by_date[date_key] = []
-        
-        activity_type = activity.get("sport_type", activity.get("type", "Unknown"))
-        distance_miles = activity.get("distance", 0) / 1609.344 # Official meters per mile for precision
-        elevation_feet = activity.get("total_elevation_gain", 0) * 3.28084
-        moving_time = activity.get("moving_time", 0)
-        
-        activities_by_date[date_key].append({
-            "id": activity.get("id"),
-            "name": activity.get("name", ""),
-            "type": activity_type,
-            "distance_miles": round(distance_miles, 3),
-            "elevation_feet": round(elevation_feet, 0),
-            "moving_time_seconds": moving_time,
-            "elapsed_time_seconds": activity.get("elapsed_time", 0),
-            "elapsed_time_str": format_seconds_to_str(activity.get("elapsed_time", 0)),
-            "start_time": start_date,
-            "private_note": activity.get("private_note", ""),
-            "description": activity.get("description", ""),
-            "athlete_count": activity.get("athlete_count", 1),
-            "route_match_count": activity.get("similar_activities", {}).get("effort_count", 0) if activity.get("similar_activities") else 0,
-            "hydrated": activity.get("hydrated_at") is not None
-        })
-        
-        # Update year totals
-        by_year[year]["total_activities"] += 1
-        by_year[year]["total_distance_miles"] += distance_miles
-        by_year[year]["total_elevation_feet"] += elevation_feet
-        by_year[year]["total_moving_time_seconds"] += moving_time
-        
-        # Update type counts (Yearly)
-        if activity_type not in by_year[year]["by_type"]:
-            by_year[year]["by_type"][activity_type] = {"count": 0, "distance_miles": 0}
-        by_year[year]["by_type"][activity_type]["count"] += 1
-        by_year[year]["by_type"][activity_type]["distance_miles"] += distance_miles
-        
-        # Update month totals
-        by_year[year]["by_month"][month]["activities"] += 1
-        by_year[year]["by_month"][month]["distance_miles"] += distance_miles
-        by_year[year]["by_month"][month]["elevation_feet"] += elevation_feet
-        by_year[year]["by_month"][month]["moving_time_seconds"] += moving_time
-        
-        # Update type counts (Monthly)
-        if activity_type not in by_year[year]["by_month"][month]["by_type"]:
-            by_year[year]["by_month"][month]["by_type"][activity_type] = {"count": 0, "distance_miles": 0}
-        by_year[year]["by_month"][month]["by_type"][activity_type]["count"] += 1
-        by_year[year]["by_month"][month]["by_type"][activity_type]["distance_miles"] += distance_miles
+        date_key = act.get("start_date_local", act.get("start_date", ""))[:10]
+        if not date_key:
+            continue
+        if payload.after_date and date_key < payload.after_date:
+            continue
+        if payload.before_date and date_key > payload.before_date:
+            continue
+        if activity_type and activity_type not in (
+            str(act.get("sport_type", "")).lower(), str(act.get("type", "")).lower()
+        ):
+            continue
+        dist = act.get("distance", 0) or 0
+        if payload.min_distance_meters is not None and dist < payload.min_distance_meters:
+            continue
+        if payload.max_distance_meters is not None and dist > payload.max_distance_meters:
+            continue
+        matches.append(act)
     
-    # Round the totals
-    for year_data in by_year.values():
-        year_data["total_distance_miles"] = round(year_data["total_distance_miles"], 2)
-        year_data["total_elevation_feet"] = round(year_data["total_elevation_feet"], 0)
-        for type_data in year_data["by_type"].values():
-            type_data["distance_miles"] = round(type_data["distance_miles"], 2)
-        
-        for month_data in year_data["by_month"].values():
-            month_data["distance_miles"] = round(month_data["distance_miles"], 2)
-            month_data["elevation_feet"] = round(month_data["elevation_feet"], 0)
-            # Round monthly type totals
-            for m_type_data in month_data["by_type"].values():
-                m_type_data["distance_miles"] = round(m_type_data["distance_miles"], 2)
+    if payload.top_k is not None:
+        scores = index.score(payload.q) if payload.q else {}
+        matches = heapq.nlargest(
+            payload.top_k, matches,
+            key=lambda a: (scores.get(a.get("id"), 0), a.get("start_date", ""))
+        )
     
-    return {
+    trace.stage("group_by_date")
+    result = {
         "total_activities": len(all_activities),
-        "by_year": by_year,
-        "activities_by_date": activities_by_date,  # Full list for date queries
+        "matched": len(matches),
+        "activities_by_date": await executors.run_in_thread(group_by_date, matches),
         "cache_info": f"Data cached at {datetime.now().isoformat()}"
     }
+    if payload.include_summary:
+        trace.stage("yearly_summary")
+        result["by_year"] = await get_yearly_summary(athlete_id, all_activities)
+    return result
+
+@app.get("/activities/text_search")
+async def text_search_activities(
+    q: List[str] = Query(...),
+    x_strava_token: str = Header(..., alias="X-Strava-Token")
+) -> Dict[str, Any]:
+    """
+    Keyword search over activity names, descriptions and private notes.
+    Each `q` is matched independently (all words of a q must match, partial words allowed).
+
+    Returns: {matches: {q: [activity ids]}, indexed_activities: int, elapsed_ms: float}
+    """
+    all_activities = await _fetch_all_activities_logic(x_strava_token, refresh=False)
+    athlete_id = TOKEN_TO_ID_CACHE.get(x_strava_token)
+    
+    started = time.perf_counter()
+    if athlete_id:
+        index = get_text_index(athlete_id)
+    else:
+        index = ActivityTextIndex().build(all_activities)
+    matches = {term: sorted(index.search(term)) for term in q}
+    
+    return {
+        "matches": matches,
+        "indexed_activities": len(index),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
 
 @app.get("/activities/{activity_id}")
 async def get_activity(activity_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
     """Get detailed activity data from Strava, checking cache first."""
     # 1. Try Cache
     athlete_id = TOKEN_TO_ID_CACHE.get(x_strava_token)
-    if athlete_id and athlete_id in ACTIVITY_CACHE:
-        acts = ACTIVITY_CACHE[athlete_id].get("activities", [])
-        # Find the activity in the cache
-        for act in acts:
-            if act.get('id') == activity_id:
-                # Check if it has 'description' (sign of hydration)
-                if 'description' in act and act['description'] is not None:
-                    logger.info(f"Cache Hit for detailed activity {activity_id}")
-                    return act
+    cached = get_activity_map(athlete_id).get(activity_id) if athlete_id else None
+    if cached is not None and is_hydrated(cached):
+        logger.info(f"Cache Hit for detailed activity {activity_id}")
+        return cached
     
-    # 2. Fetch from API
+    # 2. Fetch from API (and update the cached record if there is one)
     logger.info(f"Cache Miss for detailed activity {activity_id}. Fetching from API.")
-    detail = await make_strava_request(f"{STRAVA_API_BASE_URL}/activities/{activity_id}", access_token=x_strava_token)
-    
-    # 3. Update cache if possible
-    if athlete_id and athlete_id in ACTIVITY_CACHE:
-         acts = ACTIVITY_CACHE[athlete_id].get("activities", [])
-         for i, act in enumerate(acts):
-             if act.get('id') == activity_id:
-                 ACTIVITY_CACHE[athlete_id]["activities"][i].update(detail)
-                 ACTIVITY_CACHE[athlete_id]["activities"][i]["hydrated_at"] = time.time()
-                 save_cache_to_disk()
-                 break
-                 
+    detail = await fetch_activity_detail(x_strava_token, activity_id)
+    if cached is not None:
+        save_cache_to_disk()
     return detail
 
 @app.get("/segments/{segment_id}")
+@endpoint_cache.cached("segment", SEGMENT_TTL, stale_ttl=STALE_TTL)
 async def get_segment(segment_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
     """Get detailed segment data from Strava, with caching."""
-    cache_entry = SEGMENT_CACHE.get(segment_id)
-    now = time.time()
-    
-    if cache_entry and "details" in cache_entry and (now - cache_entry["fetched_at"]) < SEGMENT_TTL:
-        logger.info(f"Segment Cache Hit: {segment_id}")
-        return cache_entry["details"]
-        
-    logger.info(f"Segment Cache Miss: {segment_id}")
-    details = await make_strava_request(f"{STRAVA_API_BASE_URL}/segments/{segment_id}", access_token=x_strava_token)
-    
-    if segment_id not in SEGMENT_CACHE:
-        SEGMENT_CACHE[segment_id] = {"fetched_at": now}
-    SEGMENT_CACHE[segment_id]["details"] = details
-    SEGMENT_CACHE[segment_id]["fetched_at"] = now
+    # Scoped per athlete: the response includes the athlete's own PR stats and starred flag
+    return await make_strava_request(f"{STRAVA_API_BASE_URL}/segments/{segment_id}", access_token=x_strava_token)
+
+async def sync_segment_efforts(athlete_id: str, segment_id: int, access_token: str) -> None:
+    """
+    Bring the local effort history for (athlete, segment) up to date.
+    First time: page through the full history. Afterwards: only efforts that started
+    at or after the newest one a listing returned (efforts stored from hydrated
+    activities don't count), and at most once per SEGMENT_EFFORTS_TTL.
+    """
+    state = segment_effort_store.sync_state(athlete_id, segment_id)
+    if state["complete"] and time.time() - state["synced_at"] < SEGMENT_EFFORTS_TTL:
+        return
+
+    params: Dict[str, Any] = {"segment_id": segment_id, "per_page": EFFORTS_PAGE_SIZE}
+    latest = segment_effort_store.listed_until(athlete_id, segment_id) if state["complete"] else None
+    if latest:
+        params["start_date_local"] = latest
+
+    newest = latest
+    page = 1
+    fetched = 0
+    while True:
+        efforts = await make_strava_request(
+            f"{STRAVA_API_BASE_URL}/segment_efforts",
+            params={**params, "page": page},
+            access_token=access_token
+        )
+        if not isinstance(efforts, list):
+            break
+        fetched += segment_effort_store.ingest(athlete_id, efforts)
+        starts = [e["start_date_local"] for e in efforts if e.get("start_date_local")]
+        if starts and (newest is None or max(starts) > newest):
+            newest = max(starts)
+        if len(efforts) < EFFORTS_PAGE_SIZE:
+            break
+        page += 1
     
-    return details
+    segment_effort_store.mark_synced(athlete_id, segment_id, complete=True, listed_until=newest)
+    logger.info(
+        f"Segment {segment_id} efforts {'topped up' if latest else 'fully synced'}: "
+        f"{fetched} from Strava, {segment_effort_store.count(athlete_id, segment_id)} stored"
+    )
 
 @app.get("/segments/{segment_id}/efforts")
 async def get_segment_efforts(segment_id: int, page: int = 1, per_page: int = 50, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> List[Dict[str, Any]]:
     """Get all efforts for a segment for the authenticated athlete.
     
-    NOTE: Caching disabled for efforts to support full pagination.
-    The backend fetches ALL pages with per_page=200, so caching page 1 
-    with a smaller per_page was causing incomplete results.
+    Served from the local effort history, so any page size works and repeated
+    questions about the same segment cost at most one small top-up call.
     """
-    # CACHE DISABLED - was preventing full pagination
-    # The issue: Cache stored page 1 with per_page=50, then when backend
-    # requested per_page=200, it returned the cached 50-result subset,
-    # preventing pagination from fetching all 183 efforts.
-    
-    efforts = await make_strava_request(
-        f"{STRAVA_API_BASE_URL}/segment_efforts",
-        params={"segment_id": segment_id, "page": page, "per_page": per_page},
-        access_token=x_strava_token
-    )
+    athlete_id = TOKEN_TO_ID_CACHE.get(x_strava_token)
+    if not athlete_id:
+        # Unknown athlete: pass straight through to Strava
+        return await make_strava_request(
+            f"{STRAVA_API_BASE_URL}/segment_efforts",
+            params={"segment_id": segment_id, "page": page, "per_page": per_page},
+            access_token=x_strava_token
+        )
     
-    return efforts
+    if page == 1:
+        await sync_segment_efforts(athlete_id, segment_id, x_strava_token)
+    return segment_effort_store.page(athlete_id, segment_id, page=page, per_page=per_page)
 
 @app.get("/segments/{segment_id}/leaderboard")
+@endpoint_cache.cached("leaderboard", SEGMENT_EFFORTS_TTL, stale_ttl=SEGMENT_EFFORTS_TTL, per_athlete=False)
 async def get_segment_leaderboard(segment_id: int, gender: Optional[str] = None, weight_class: Optional[str] = None, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
     """Get the leaderboard for a segment, with caching."""
-    # Only cache default leaderboard (no filters)
-    if not gender and not weight_class:
-        cache_entry = SEGMENT_CACHE.get(segment_id)
-        now = time.time()
-        if cache_entry and "leaderboard" in cache_entry and (now - cache_entry.get("lb_fetched_at", 0)) < SEGMENT_EFFORTS_TTL:
-             logger.info(f"Segment Leaderboard Cache Hit: {segment_id}")
-             return cache_entry["leaderboard"]
-
     params = {"per_page": 5} # Top 5 is usually enough for CR
     if gender:
         params["gender"] = gender
     if weight_class:
         params["weight_class"] = weight_class
-        
-    lb = await make_strava_request(
+    
+    return await make_strava_request(
         f"{STRAVA_API_BASE_URL}/segments/{segment_id}/leaderboard",
         params=params,
         access_token=x_strava_token
     )
-    
-    if not gender and not weight_class:
-        if segment_id not in SEGMENT_CACHE:
-            SEGMENT_CACHE[segment_id] = {}
-        SEGMENT_CACHE[segment_id]["leaderboard"] = lb
-        SEGMENT_CACHE[segment_id]["lb_fetched_at"] = time.time()
-        
-    return lb
 
 @app.get("/segments/starred")
 async def get_starred_segments(page: int = 1, per_page: int = 50, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> List[Dict[str, Any]]:
@@ -983,12 +1602,7 @@ async def get_athlete_stats(x_strava_token: str = Header(..., alias="X-Strava-To
     global ACTIVITY_CACHE, TOKEN_TO_ID_CACHE, LAST_HYDRATION_TRIGGER
 
     # 1. Get Athlete ID (Cached)
-    athlete_id = TOKEN_TO_ID_CACHE.get(x_strava_token)
-    if not athlete_id:
-        # Fetch if not in memory cache
-        athlete = await make_strava_request(f"{STRAVA_API_BASE_URL}/athlete", access_token=x_strava_token)
-        athlete_id = str(athlete["id"])
-        TOKEN_TO_ID_CACHE[x_strava_token] = athlete_id
+    athlete_id = await get_athlete_id(x_strava_token)
     
     # 2. Check Cache for Stats
     current_time = time.time()
@@ -1003,22 +1617,24 @@ async def get_athlete_stats(x_strava_token: str = Header(..., alias="X-Strava-To
              stats_dict["app_status"] = {
                  "synced_activities": total,
                  "enriched_activities": hydrated,
-                 "percent": percent
+                 "percent": percent,
+                 "hydration": hydration_worker.get_stats(athlete_id),
+                 "quota_queue": scheduler.get_stats(),
+                 "streams_store": streams_store.get_stats()
              }
              
-             # AUTO-TRIGGER HYDRATION CHECK (DISABLED for multi-user quota fairness)
-             # Background hydration consumed the entire 15m quota, blocking interactive queries.
-             # Activity details are now fetched on-demand only when a user queries for them.
-             # To re-enable, uncomment the block below.
-             #
-             # global LAST_HYDRATION_TRIGGER
-             # if percent < 100 and (time.time() - LAST_HYDRATION_TRIGGER) > 300:
-             #     if background_tasks:
-             #         logger.info(f"Auto-triggering background hydration (Progress: {percent}%)")
-             #         background_tasks.add_task(hydrate_activities_background, x_strava_token)
-             #         LAST_HYDRATION_TRIGGER = time.time()
-             #     else:
-             #         logger.warning("Cannot auto-trigger hydration: BackgroundTasks not available")
+             # AUTO-TRIGGER HYDRATION CHECK
+             # Safe again now that hydration runs at HYDRATION priority: it queues behind
+             # interactive queries and never touches the reserved interactive headroom.
+             global LAST_HYDRATION_TRIGGER
+             hydration_worker.remember_token(athlete_id, x_strava_token)
+             if AUTO_HYDRATION and percent < 100 and (time.time() - LAST_HYDRATION_TRIGGER) > 300:
+                 if background_tasks:
+                     logger.info(f"Auto-triggering background hydration (Progress: {percent}%)")
+                     background_tasks.add_task(hydrate_activities_background, x_strava_token)
+                     LAST_HYDRATION_TRIGGER = time.time()
+                 else:
+                     logger.warning("Cannot auto-trigger hydration: BackgroundTasks not available")
 
         return stats_dict
 
@@ -1045,60 +1661,163 @@ async def get_athlete_stats(x_strava_token: str = Header(..., alias="X-Strava-To
     
     return inject_app_status(stats_data)
 
+@app.get("/runtime/stats")
+async def get_runtime_stats() -> Dict[str, Any]:
+    """Event-loop lag and worker pool usage."""
+    return {
+        "event_loop_lag": loop_lag_monitor.get_stats(),
+        "executors": executors.get_stats(),
+        "cache_backend": cache_backend.get_stats(),
+        "token_map": token_athletes.get_stats(),
+    }
+
+@app.get("/cache/stats")
+async def get_cache_stats() -> Dict[str, Any]:
+    """Size and per-namespace hit/miss counters of the response cache."""
+    return {
+        **response_cache.get_stats(),
+        "stale_while_revalidate": endpoint_cache.get_stats(),
+        "exports": export_cache.get_stats(),
+        "webhooks": dict(WEBHOOK_STATS),
+    }
+
+CACHE_LOOKUPS = metrics.Counter(
+    "strava_mcp_cache_lookups_total", "Cache lookups by cache, namespace and result.", ["cache", "namespace", "result"]
+)
+CACHE_BYTES = metrics.Gauge("strava_mcp_cache_bytes", "Bytes held by each cache.", ["cache"])
+QUOTA_QUEUED = metrics.Gauge("strava_mcp_quota_queued", "Requests waiting for a Strava quota slot.", ["priority"])
+QUOTA_WAIT = metrics.Counter("strava_mcp_quota_wait_seconds_total", "Time spent waiting for quota slots.", ["priority"])
+EVENT_LOOP_LAG = metrics.Gauge("strava_mcp_event_loop_lag_seconds", "Event-loop wake-up lag.", ["stat"])
+
+@metrics.registry.on_collect
+def collect_runtime_metrics():
+    """Mirror the counters the caches, scheduler and rate limiter already keep."""
+    for namespace, stats in response_cache.get_stats()["namespaces"].items():
+        CACHE_LOOKUPS.set(stats["hits"], cache="response", namespace=namespace, result="hit")
+        CACHE_LOOKUPS.set(stats["misses"], cache="response", namespace=namespace, result="miss")
+    for cache, stats in (("streams", streams_store.get_stats()), ("exports", export_cache.get_stats()),
+                         ("token_map", token_athletes.get_stats())):
+        CACHE_LOOKUPS.set(stats["hits"], cache=cache, namespace="", result="hit")
+        CACHE_LOOKUPS.set(stats["misses"], cache=cache, namespace="", result="miss")
+    CACHE_BYTES.set(response_cache.get_stats()["bytes"], cache="response")
+    CACHE_BYTES.set(export_cache.get_stats()["bytes"], cache="exports")
+
+    for priority, stats in scheduler.get_stats().items():
+        QUOTA_QUEUED.set(stats["queued"], priority=priority)
+        QUOTA_WAIT.set(stats["waited_seconds"], priority=priority)
+    local = rate_limiter.get_stats()
+    STRAVA_QUOTA_USED.set(local["15m_used"], window="15m", source="local")
+    STRAVA_QUOTA_USED.set(local["daily_used"], window="daily", source="local")
+    STRAVA_QUOTA_LIMIT.set(local["15m_limit"], window="15m", source="local")
+    STRAVA_QUOTA_LIMIT.set(local["daily_limit"], window="daily", source="local")
+
+    lag = loop_lag_monitor.get_stats()
+    EVENT_LOOP_LAG.set(lag["max_ms"] / 1000, stat="max")
+    if lag["p99_ms"] is not None:
+        EVENT_LOOP_LAG.set(lag["p99_ms"] / 1000, stat="p99")
+
+@app.get("/metrics")
+async def prometheus_metrics() -> Response:
+    """Prometheus scrape endpoint."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/gear/{gear_id}")
+@endpoint_cache.cached("gear", GEAR_TTL, stale_ttl=STALE_TTL)
 async def get_gear(gear_id: str, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
     """Get details for a piece of gear (shoe/bike)."""
     return await make_strava_request(f"{STRAVA_API_BASE_URL}/gear/{gear_id}", access_token=x_strava_token)
 
 @app.get("/activities/{activity_id}/zones")
+@endpoint_cache.cached("activity_zones", ACTIVITY_ZONES_TTL)
 async def get_activity_zones(activity_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> List[Dict[str, Any]]:
     """Get heart rate and power zones for an activity."""
     return await make_strava_request(f"{STRAVA_API_BASE_URL}/activities/{activity_id}/zones", access_token=x_strava_token)
 
 @app.get("/clubs")
+@endpoint_cache.cached("clubs", CLUBS_TTL, stale_ttl=STALE_TTL)
 async def get_clubs(x_strava_token: str = Header(..., alias="X-Strava-Token")) -> List[Dict[str, Any]]:
     """List the authenticated athlete's clubs."""
     return await make_strava_request(f"{STRAVA_API_BASE_URL}/athlete/clubs", access_token=x_strava_token)
 
 @app.get("/routes")
+@endpoint_cache.cached("routes", ROUTES_TTL, stale_ttl=STALE_TTL)
 async def get_routes(x_strava_token: str = Header(..., alias="X-Strava-Token"), limit: int = 50) -> List[Dict[str, Any]]:
     """List the authenticated athlete's created routes."""
     return await make_strava_request(f"{STRAVA_API_BASE_URL}/athlete/routes", params={"per_page": limit}, access_token=x_strava_token)
 
+async def export_route_file(route_id: int, ext: str, access_token: str) -> Response:
+    """
+    Serve a route GPX/TCX export from the export cache, or stream it from Strava
+    into the cache. The route details (cached per athlete) both check that the
+    athlete can see the route and supply updated_at, the version of the file.
+    """
+    route = await get_route(route_id, x_strava_token=access_token)
+    version = route.get("updated_at") or route.get("timestamp")
+    media_type = EXPORT_FORMATS[ext]
+    headers = {"Content-Disposition": f"attachment; filename=route_{route_id}.{ext}"}
+
+    # 1. CHECK EXPORT CACHE
+    if version:
+        path = export_cache.get("route", route_id, version, ext)
+        if path:
+            return FileResponse(path, media_type=media_type, headers=headers)
+
+    # 2. STREAM FROM STRAVA (AND INTO THE CACHE)
+    writer = export_cache.writer("route", route_id, version, ext) if version else None
+    return await stream_strava_download(
+        f"{STRAVA_API_BASE_URL}/routes/{route_id}/export_{ext}", access_token,
+        media_type, headers, writer=writer
+    )
+
 @app.get("/routes/{route_id}/export_gpx")
 async def get_route_gpx(route_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")):
     """Download the GPX file for a route."""
-    gpx_content = await make_strava_request(
-        f"{STRAVA_API_BASE_URL}/routes/{route_id}/export_gpx", 
-        access_token=x_strava_token,
-        response_type="content"
-    )
-    
-    return Response(
-        content=gpx_content,
-        media_type="application/gpx+xml",
-        headers={"Content-Disposition": f"attachment; filename=route_{route_id}.gpx"}
-    )
+    return await export_route_file(route_id, "gpx", x_strava_token)
+
+def render_activity_map(activity: Dict[str, Any], format: str) -> Dict[str, str]:
+    """Render a map view and its ETag (CPU bound: decode, simplify, template)."""
+    formatted_activity = format_activity_with_map(activity, format)
+    if format == 'html':
+        body, media_type = formatted_activity, "text/html"
+    else:
+        body = json.dumps({"formatted_activity": formatted_activity, "activity": activity})
+        media_type = "application/json"
+    etag = '"' + hashlib.sha1(body.encode()).hexdigest()[:20] + '"'
+    return {"body": body, "media_type": media_type, "etag": etag}
 
 @app.get("/activities/{activity_id}/map")
-async def get_activity_with_map(activity_id: int, format: str = 'html', x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Response:
-    """Get detailed activity data from Strava with map visualization."""
+async def get_activity_with_map(
+    activity_id: int,
+    format: str = 'html',
+    x_strava_token: str = Header(..., alias="X-Strava-Token"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+) -> Response:
+    """
+    Get detailed activity data from Strava with map visualization.
+    Rendered maps are cached per (activity, format) and served with an ETag (304 if unchanged).
+    """
     try:
-        activity_data = await make_strava_request(f"{STRAVA_API_BASE_URL}/activities/{activity_id}", access_token=x_strava_token)
-        logger.debug(f"Retrieved activity data for ID {activity_id}")
-        
-        # Note: formatting is CPU bound, could be offloaded to threadpool if needed
-        # but for text/html generation it's usually fast enough.
-        formatted_activity = format_activity_with_map(activity_data, format)
-        logger.debug(f"Formatted activity data with {format} format")
+        key = endpoint_cache.make_key(cache_scope(x_strava_token), activity_id, format)
+        rendered = response_cache.get("map", key)
+        if rendered is None:
+            # Reuse the cached detailed activity (and its full polyline) when we have it
+            athlete_id = TOKEN_TO_ID_CACHE.get(x_strava_token)
+            activity_data = get_activity_map(athlete_id).get(activity_id) if athlete_id else None
+            if activity_data is None or not (activity_data.get("map") or {}).get("polyline"):
+                activity_data = await fetch_activity_detail(x_strava_token, activity_id)
+                request_cache_save()
+            logger.debug(f"Retrieved activity data for ID {activity_id}")
+            
+            rendered = await executors.run_in_thread(render_activity_map, activity_data, format)
+            response_cache.set("map", key, rendered, MAP_CACHE_TTL)
+            logger.debug(f"Formatted activity data with {format} format")
         
-        if format == 'html':
-            return HTMLResponse(content=formatted_activity, media_type="text/html")
-        else:
-            return {
-                "formatted_activity": formatted_activity,
-                "activity": activity_data
-            }
+        headers = {"ETag": rendered["etag"], "Cache-Control": "private, no-cache"}
+        if if_none_match and rendered["etag"] in [t.strip() for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return Response(content=rendered["body"], media_type=rendered["media_type"], headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing activity {activity_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -1107,25 +1826,267 @@ async def get_activity_with_map(activity_id: int, format: str = 'html', x_strava
 # ADDITIONAL ENDPOINTS FOR FEATURE PARITY
 # ============================================================================
 
+async def get_cached_streams(
+    kind: str,
+    obj_id: int,
+    url: str,
+    keys: Optional[str],
+    access_token: str,
+    key_by_type: bool = True,
+    output_format: str = "json",
+    max_age: Optional[float] = None,
+    priority: Priority = Priority.INTERACTIVE,
+) -> Any:
+    """
+    Serve streams from the local streams store, fetching from Strava only on a miss.
+    keys=None means "whatever Strava returns" (route streams take no keys parameter).
+    output_format "binary" returns the store's compressed binary encoding.
+    """
+    key_list = [k.strip() for k in keys.split(",") if k.strip()] if keys else None
+
+    # 1. CHECK STORE
+    if output_format == "binary":
+        cached = streams_store.get_binary(kind, obj_id, key_list, max_age=max_age)
+    else:
+        cached = streams_store.get_json(kind, obj_id, key_list, key_by_type=key_by_type, max_age=max_age)
+
+    if cached is None:
+        # 2. FETCH FROM STRAVA AND STORE
+        params = {"keys": ",".join(key_list), "key_by_type": True} if key_list else None
+        streams = await make_strava_request(url, params=params, access_token=access_token, priority=priority)
+        try:
+            streams_store.put(kind, obj_id, streams, key_list or [])
+        except OSError as e:
+            logger.error(f"Failed to store streams for {kind} {obj_id}: {e}")
+            return streams
+        logger.info(f"Streams for {kind} {obj_id} fetched from Strava and stored.")
+        if output_format == "binary":
+            cached = streams_store.get_binary(kind, obj_id, key_list)
+        else:
+            cached = streams_store.get_json(kind, obj_id, key_list, key_by_type=key_by_type)
+    else:
+        logger.info(f"Streams cache hit for {kind} {obj_id}")
+
+    if output_format == "binary":
+        return Response(content=cached, media_type="application/octet-stream")
+    return cached
+
 @app.get("/activities/{activity_id}/streams")
 async def get_activity_streams(
     activity_id: int, 
     keys: str = "time,distance,latlng,altitude,velocity_smooth,heartrate,cadence,watts,temp,moving,grade_smooth",
+    format: str = "json",
     x_strava_token: str = Header(..., alias="X-Strava-Token")
-) -> Dict[str, Any]:
+) -> Any:
     """Get activity streams (time-series data like heart rate, GPS, etc)."""
-    return await make_strava_request(
-        f"{STRAVA_API_BASE_URL}/activities/{activity_id}/streams",
-        params={"keys": keys, "key_by_type": True},
-        access_token=x_strava_token
+    return await get_cached_streams(
+        "activity", activity_id, f"{STRAVA_API_BASE_URL}/activities/{activity_id}/streams",
+        keys, x_strava_token, output_format=format
+    )
+
+async def load_export_streams(activity_id: int, access_token: str,
+                              priority: Priority = Priority.INTERACTIVE) -> Dict[str, Any]:
+    """The activity's export streams as arrays, fetched into the streams store on a miss."""
+    key_list = EXPORT_STREAM_KEYS.split(",")
+    arrays = streams_store.get_arrays("activity", activity_id, key_list)
+    if arrays is None:
+        await get_cached_streams(
+            "activity", activity_id, f"{STRAVA_API_BASE_URL}/activities/{activity_id}/streams",
+            EXPORT_STREAM_KEYS, access_token, priority=priority
+        )
+        arrays = streams_store.get_arrays("activity", activity_id, key_list) or {}
+    return arrays
+
+async def export_activity_file(activity_id: int, ext: str, access_token: str) -> StreamingResponse:
+    """Stream a GPX/TCX file generated from the activity's cached streams."""
+    athlete_id = TOKEN_TO_ID_CACHE.get(access_token)
+    activity = get_activity_map(athlete_id).get(activity_id) if athlete_id else None
+    if activity is None:
+        activity = await fetch_activity_detail(access_token, activity_id)
+
+    arrays = await load_export_streams(activity_id, access_token)
+    if ext == "gpx" and not has_gps(arrays):
+        raise HTTPException(status_code=422, detail="Activity has no GPS data; export it as TCX instead")
+
+    # A sync iterator: Starlette runs the XML generation in its thread pool
+    return StreamingResponse(
+        iter_export(activity, arrays, ext),
+        media_type=EXPORT_FORMATS[ext],
+        headers={"Content-Disposition": f"attachment; filename={export_filename(activity, ext)}"}
+    )
+
+@app.get("/activities/{activity_id}/export_gpx")
+async def get_activity_gpx(activity_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")):
+    """Download a GPX file for an activity, generated from its streams."""
+    return await export_activity_file(activity_id, "gpx", x_strava_token)
+
+@app.get("/activities/{activity_id}/export_tcx")
+async def get_activity_tcx(activity_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")):
+    """Download a TCX file for an activity, generated from its streams."""
+    return await export_activity_file(activity_id, "tcx", x_strava_token)
+
+def write_zip_entry(archive: zipfile.ZipFile, name: str, chunks: Iterator[str]) -> None:
+    """Write one export into the archive chunk by chunk (runs in a worker thread)."""
+    with archive.open(name, "w") as entry:
+        for chunk in chunks:
+            entry.write(chunk.encode("utf-8"))
+
+async def run_year_export(job: Dict[str, Any], access_token: str, activities: List[Dict[str, Any]]) -> None:
+    """
+    Build the year's zip one activity at a time. Missing streams are fetched at BULK
+    priority; the archive is published only once complete.
+    """
+    ext = job["format"]
+    writer = export_cache.writer(f"{ext}{job['year']}", job["athlete_id"], job["job_id"], "zip")
+    try:
+        with zipfile.ZipFile(writer.file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for activity in activities:
+                if job["status"] != "running":
+                    break
+                if activity.get("manual"):
+                    job["skipped"] += 1
+                    continue
+                try:
+                    arrays = await load_export_streams(activity["id"], access_token, priority=Priority.BULK)
+                except HTTPException as e:
+                    logger.warning(f"Year export: no streams for activity {activity['id']}: {e.detail}")
+                    job["failed"] += 1
+                    continue
+                if not arrays or (ext == "gpx" and not has_gps(arrays)):
+                    job["skipped"] += 1
+                    continue
+                await executors.run_in_thread(
+                    write_zip_entry, archive, export_filename(activity, ext), iter_export(activity, arrays, ext)
+                )
+                job["exported"] += 1
+        if job["status"] != "running":
+            # Cancelled by purge_athlete (access revoked)
+            writer.discard()
+            return
+        writer.commit()
+        job["path"] = writer.final_path
+        job["status"] = "done"
+    except Exception as e:
+        writer.discard()
+        job["status"] = "failed"
+        job["error"] = str(e)
+        logger.error(f"Year export {job['job_id']} failed: {e}", exc_info=True)
+    finally:
+        if job["status"] == "running":
+            # Cancelled (server shutting down)
+            writer.discard()
+            job["status"] = "cancelled"
+        job["finished_at"] = time.time()
+
+def public_export_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in job.items() if k != "path"}
+
+def get_export_job(job_id: str, athlete_id: str) -> Dict[str, Any]:
+    job = EXPORT_JOBS.get(job_id)
+    if job is None or job["athlete_id"] != athlete_id:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+@app.post("/exports/year/{year}")
+async def start_year_export(
+    year: int,
+    format: str = "gpx",
+    x_strava_token: str = Header(..., alias="X-Strava-Token")
+) -> Dict[str, Any]:
+    """
+    Start (or join) a background job that zips every activity of the year as GPX or TCX.
+    Poll /exports/jobs/{job_id}; download from /exports/jobs/{job_id}/download when done.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    athlete_id = await get_athlete_id(x_strava_token)
+    for job in EXPORT_JOBS.values():
+        if (job["athlete_id"], job["year"], job["format"], job["status"]) == (athlete_id, year, format, "running"):
+            return public_export_job(job)
+
+    activities = await _fetch_all_activities_logic(x_strava_token, refresh=False)
+    in_year = [
+        a for a in activities
+        if (a.get("start_date_local") or a.get("start_date") or "")[:4] == str(year)
+    ]
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id, "athlete_id": athlete_id, "year": year, "format": format,
+        "status": "running", "total": len(in_year), "exported": 0, "skipped": 0, "failed": 0,
+        "error": None, "started_at": time.time(), "finished_at": None,
+    }
+    EXPORT_JOBS[job_id] = job
+    asyncio.create_task(run_year_export(job, x_strava_token, in_year))
+    return public_export_job(job)
+
+@app.get("/exports/jobs/{job_id}")
+async def get_year_export(job_id: str, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
+    """Progress of a year export job."""
+    return public_export_job(get_export_job(job_id, await get_athlete_id(x_strava_token)))
+
+@app.get("/exports/jobs/{job_id}/download")
+async def download_year_export(job_id: str, x_strava_token: str = Header(..., alias="X-Strava-Token")):
+    """The finished zip of a year export job."""
+    job = get_export_job(job_id, await get_athlete_id(x_strava_token))
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    if not os.path.exists(job["path"]):
+        raise HTTPException(status_code=410, detail="Export was replaced by a newer export of the same year")
+    return FileResponse(
+        job["path"], media_type="application/zip",
+        filename=f"activities_{job['year']}_{job['format']}.zip"
     )
 
+async def get_cached_athlete_zones(access_token: str) -> Dict[str, Any]:
+    """Athlete zones through the cached /athlete/zones handler, or {} if they can't be read."""
+    scope = cache_scope(access_token)
+    if response_cache.get("athlete_zones_unavailable", scope):
+        return {}
+    try:
+        return await get_athlete_zones(x_strava_token=access_token)
+    except HTTPException as e:
+        # Zones are optional for analytics (and need profile:read_all); don't ask again today
+        logger.warning(f"Could not fetch athlete zones: {e.detail}")
+        response_cache.set("athlete_zones_unavailable", scope, True, ATHLETE_ZONES_TTL)
+        return {}
+
+@app.get("/activities/{activity_id}/analytics")
+async def get_activity_analytics(activity_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
+    """
+    Best efforts, power/pace curves, time in zones, decoupling and elevation gain,
+    computed locally from the activity's streams.
+    """
+    zones = await get_cached_athlete_zones(x_strava_token)
+
+    # 1. CHECK CACHE (invalidated when the athlete's zones change)
+    cached = ANALYTICS_CACHE.get(activity_id)
+    if cached and cached["zones"] == zones:
+        return cached["analytics"]
+
+    # 2. LOAD STREAMS (from the local store when possible)
+    key_list = ANALYTICS_KEYS.split(",")
+    arrays = streams_store.get_arrays("activity", activity_id, key_list)
+    if arrays is None:
+        await get_cached_streams(
+            "activity", activity_id, f"{STRAVA_API_BASE_URL}/activities/{activity_id}/streams",
+            ANALYTICS_KEYS, x_strava_token
+        )
+        arrays = streams_store.get_arrays("activity", activity_id, key_list) or {}
+
+    # 3. ANALYZE
+    analytics = await executors.run_in_thread(analyze_streams, arrays, zones)
+    analytics["activity_id"] = activity_id
+    ANALYTICS_CACHE[activity_id] = {"zones": zones, "analytics": analytics}
+    return analytics
+
 @app.get("/activities/{activity_id}/laps")
+@endpoint_cache.cached("laps", LAPS_TTL)
 async def get_activity_laps(activity_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> List[Dict[str, Any]]:
     """Get laps for an activity."""
     return await make_strava_request(f"{STRAVA_API_BASE_URL}/activities/{activity_id}/laps", access_token=x_strava_token)
 
 @app.get("/activities/{activity_id}/comments")
+@endpoint_cache.cached("comments", SOCIAL_TTL, stale_ttl=SOCIAL_STALE_TTL)
 async def get_activity_comments(
     activity_id: int, page: int = 1, per_page: int = 30,
     x_strava_token: str = Header(..., alias="X-Strava-Token")
@@ -1138,6 +2099,7 @@ async def get_activity_comments(
     )
 
 @app.get("/activities/{activity_id}/kudos")
+@endpoint_cache.cached("kudos", SOCIAL_TTL, stale_ttl=SOCIAL_STALE_TTL)
 async def get_activity_kudoers(
     activity_id: int, page: int = 1, per_page: int = 30,
     x_strava_token: str = Header(..., alias="X-Strava-Token")
@@ -1150,16 +2112,19 @@ async def get_activity_kudoers(
     )
 
 @app.get("/athlete/zones")
+@endpoint_cache.cached("athlete_zones", ATHLETE_ZONES_TTL, stale_ttl=STALE_TTL)
 async def get_athlete_zones(x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
     """Get athlete heart rate and power zones."""
     return await make_strava_request(f"{STRAVA_API_BASE_URL}/athlete/zones", access_token=x_strava_token)
 
 @app.get("/clubs/{club_id}")
+@endpoint_cache.cached("club", CLUBS_TTL, stale_ttl=STALE_TTL)
 async def get_club(club_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
     """Get club details."""
     return await make_strava_request(f"{STRAVA_API_BASE_URL}/clubs/{club_id}", access_token=x_strava_token)
 
 @app.get("/clubs/{club_id}/activities")
+@endpoint_cache.cached("club_activities", CLUB_ACTIVITIES_TTL, stale_ttl=SOCIAL_STALE_TTL)
 async def get_club_activities(
     club_id: int, page: int = 1, per_page: int = 30,
     x_strava_token: str = Header(..., alias="X-Strava-Token")
@@ -1172,6 +2137,7 @@ async def get_club_activities(
     )
 
 @app.get("/clubs/{club_id}/members")
+@endpoint_cache.cached("club_members", CLUBS_TTL, stale_ttl=STALE_TTL)
 async def get_club_members(
     club_id: int, page: int = 1, per_page: int = 30,
     x_strava_token: str = Header(..., alias="X-Strava-Token")
@@ -1184,6 +2150,7 @@ async def get_club_members(
     )
 
 @app.get("/clubs/{club_id}/admins")
+@endpoint_cache.cached("club_admins", CLUBS_TTL, stale_ttl=STALE_TTL)
 async def get_club_admins(
     club_id: int, page: int = 1, per_page: int = 30,
     x_strava_token: str = Header(..., alias="X-Strava-Token")
@@ -1196,53 +2163,52 @@ async def get_club_admins(
     )
 
 @app.get("/routes/{route_id}")
+@endpoint_cache.cached("route", ROUTES_TTL, stale_ttl=STALE_TTL)
 async def get_route(route_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> Dict[str, Any]:
     """Get route details."""
     return await make_strava_request(f"{STRAVA_API_BASE_URL}/routes/{route_id}", access_token=x_strava_token)
 
 @app.get("/routes/{route_id}/streams")
-async def get_route_streams(route_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")) -> List[Dict[str, Any]]:
+async def get_route_streams(
+    route_id: int,
+    format: str = "json",
+    x_strava_token: str = Header(..., alias="X-Strava-Token")
+) -> Any:
     """Get route streams (GPS coordinates, elevation, etc)."""
-    return await make_strava_request(f"{STRAVA_API_BASE_URL}/routes/{route_id}/streams", access_token=x_strava_token)
+    return await get_cached_streams(
+        "route", route_id, f"{STRAVA_API_BASE_URL}/routes/{route_id}/streams",
+        None, x_strava_token, key_by_type=False, output_format=format, max_age=ROUTE_STREAMS_MAX_AGE
+    )
 
 @app.get("/routes/{route_id}/export_tcx")
 async def get_route_tcx(route_id: int, x_strava_token: str = Header(..., alias="X-Strava-Token")):
     """Export route as TCX file."""
-    tcx_content = await make_strava_request(
-        f"{STRAVA_API_BASE_URL}/routes/{route_id}/export_tcx",
-        access_token=x_strava_token,
-        response_type="content"
-    )
-    return Response(
-        content=tcx_content,
-        media_type="application/vnd.garmin.tcx+xml",
-        headers={"Content-Disposition": f"attachment; filename=route_{route_id}.tcx"}
-    )
+    return await export_route_file(route_id, "tcx", x_strava_token)
 
 @app.get("/segments/{segment_id}/streams")
 async def get_segment_streams(
     segment_id: int,
     keys: str = "distance,latlng,altitude",
+    format: str = "json",
     x_strava_token: str = Header(..., alias="X-Strava-Token")
-) -> List[Dict[str, Any]]:
+) -> Any:
     """Get segment streams."""
-    return await make_strava_request(
-        f"{STRAVA_API_BASE_URL}/segments/{segment_id}/streams",
-        params={"keys": keys, "key_by_type": True},
-        access_token=x_strava_token
+    return await get_cached_streams(
+        "segment", segment_id, f"{STRAVA_API_BASE_URL}/segments/{segment_id}/streams",
+        keys, x_strava_token, output_format=format
     )
 
 @app.get("/segment_efforts/{effort_id}/streams")
 async def get_segment_effort_streams(
     effort_id: int,
     keys: str = "distance,latlng,altitude,velocity_smooth,heartrate,cadence,watts,grade_smooth,moving",
+    format: str = "json",
     x_strava_token: str = Header(..., alias="X-Strava-Token")
-) -> List[Dict[str, Any]]:
+) -> Any:
     """Get segment effort streams."""
-    return await make_strava_request(
-        f"{STRAVA_API_BASE_URL}/segment_efforts/{effort_id}/streams",
-        params={"keys": keys, "key_by_type": True},
-        access_token=x_strava_token
+    return await get_cached_streams(
+        "segment_effort", effort_id, f"{STRAVA_API_BASE_URL}/segment_efforts/{effort_id}/streams",
+        keys, x_strava_token, output_format=format
     )
 
 @app.put("/segments/{segment_id}/starred")
@@ -1252,12 +2218,19 @@ async def star_segment(
     x_strava_token: str = Header(..., alias="X-Strava-Token")
 ) -> Dict[str, Any]:
     """Star or unstar a segment."""
-    return await make_strava_request(
+    result = await make_strava_request(
         f"{STRAVA_API_BASE_URL}/segments/{segment_id}/starred",
         method="PUT",
         params={"starred": starred},
         access_token=x_strava_token
     )
+    # Segment details carry the starred flag; the starred list changed too
+    endpoint_cache.invalidate("segment", x_strava_token, segment_id)
+    athlete_id = TOKEN_TO_ID_CACHE.get(x_strava_token)
+    if athlete_id and athlete_id in ACTIVITY_CACHE:
+        ACTIVITY_CACHE[athlete_id].pop("starred_segments", None)
+        ACTIVITY_CACHE[athlete_id].pop("starred_fetched_at", None)
+    return result
 
 @app.post("/activities")
 async def create_activity(
@@ -1303,12 +2276,24 @@ async def update_activity(
         "name": name, "sport_type": sport_type, "description": description,
         "trainer": trainer, "commute": commute
     }.items() if v is not None}
-    return await make_strava_request(
+    updated = await make_strava_request(
         f"{STRAVA_API_BASE_URL}/activities/{activity_id}",
         method="PUT",
         params=params,
         access_token=x_strava_token
     )
+    
+    # Keep the cached record in step (the response is the full detailed activity)
+    athlete_id = TOKEN_TO_ID_CACHE.get(x_strava_token)
+    cached = get_activity_map(athlete_id).get(activity_id) if athlete_id else None
+    if cached is not None and isinstance(updated, dict):
+        cached.update(updated)
+        activity_changed(athlete_id, cached)
+        SUMMARY_CACHE.pop(athlete_id, None)
+        request_cache_save()
+    for namespace in ("laps", "comments", "kudos", "activity_zones", "map"):
+        endpoint_cache.invalidate(namespace, x_strava_token, activity_id)
+    return updated
 
 @app.put("/athlete")
 async def update_athlete(
@@ -1319,21 +2304,207 @@ async def update_athlete(
     params = {}
     if weight is not None:
         params["weight"] = weight
-    return await make_strava_request(
+    athlete = await make_strava_request(
         f"{STRAVA_API_BASE_URL}/athlete",
         method="PUT",
         params=params,
         access_token=x_strava_token
     )
+    # Power zones are derived from the athlete profile
+    endpoint_cache.invalidate("athlete_zones", x_strava_token)
+    response_cache.invalidate("athlete_zones_unavailable", cache_scope(x_strava_token))
+    return athlete
 
 def main() -> None:
     """Main entry point for the server."""
     try:
         logger.info("Starting Strava HTTP Server...")
-        uvicorn.run(app, host="0.0.0.0", port=8001)
+        uvicorn.run(app, host=MCP_HOST, port=MCP_PORT)
     except Exception as e:
         logger.error(f"Server error: {str(e)}", exc_info=True)
         raise
 
+# ============================================================================
+# STRAVA WEBHOOKS (push subscription)
+# ============================================================================
+
+def latest_token_for(athlete_id: str) -> Optional[str]:
+    """The most recently seen token of an athlete (it may have expired since)."""
+    for token, known_id in reversed(list(TOKEN_TO_ID_CACHE.items())):
+        if known_id == athlete_id:
+            return token
+    return None
+
+def drop_activity_caches(athlete_id: str, activity_id: int) -> None:
+    """Forget responses derived from one activity after it was edited or deleted."""
+    for namespace in ("laps", "comments", "kudos", "activity_zones", "map"):
+        response_cache.invalidate_prefix(namespace, endpoint_cache.make_key(athlete_id, activity_id))
+    ANALYTICS_CACHE.pop(activity_id, None)
+    SUMMARY_CACHE.pop(athlete_id, None)
+
+async def purge_athlete(athlete_id: str) -> None:
+    """Forget everything held for an athlete who revoked access: caches, stores, jobs and files."""
+    # Activity ids key the streams and analytics; another worker may hold the only list
+    await sync_activity_cache(athlete_id)
+    activity_ids = [a["id"] for a in ACTIVITY_CACHE.get(athlete_id, {}).get("activities", []) if "id" in a]
+    for activity_id in activity_ids:
+        streams_store.invalidate("activity", activity_id)
+        ANALYTICS_CACHE.pop(activity_id, None)
+
+    for cache in (ACTIVITY_CACHE, ACTIVITY_TEXT_INDEXES, ACTIVITY_ID_MAPS, SUMMARY_CACHE, ACTIVITY_CACHE_DIGESTS,
+                  ACTIVITY_CHANGES):
+        cache.pop(athlete_id, None)
+    tokens = [t for t, known_id in TOKEN_TO_ID_CACHE.items() if known_id == athlete_id]
+    # The persistent map also knows tokens this process has not seen since a restart
+    fingerprints = {token_fingerprint(t) for t in tokens} | set(token_athletes.fingerprints(athlete_id))
+    # Per-athlete responses (map, laps, zones...), including any scoped by token before the id was known
+    for scope in [athlete_id, *(token_scope(fingerprint) for fingerprint in fingerprints)]:
+        response_cache.invalidate_prefix(None, scope)
+    for token in tokens:
+        del TOKEN_TO_ID_CACHE[token]
+    token_athletes.forget_athlete(athlete_id)
+
+    segment_effort_store.forget_athlete(athlete_id)
+    hydration_worker.forget_athlete(athlete_id)
+    for job_id, job in list(EXPORT_JOBS.items()):
+        if job["athlete_id"] == athlete_id:
+            # A running export sees this and discards its zip
+            job["status"] = "cancelled"
+            del EXPORT_JOBS[job_id]
+    export_cache.remove_object(athlete_id, kind_pattern=f"(?:{'|'.join(EXPORT_FORMATS)})\\d+")
+
+    if cache_backend.shared:
+        await cache_backend.delete("activities", athlete_id)
+        await cache_backend.delete("activities_meta", athlete_id)
+        for fingerprint in fingerprints:
+            await cache_backend.delete("token_athlete", fingerprint)
+    request_cache_save()
+
+async def fetch_webhook_activity(athlete_id: str, activity_id: int) -> bool:
+    """
+    Fetch one created or edited activity into the athlete's cached list. Without a
+    working token the id is queued and fetched on the athlete's next request.
+    """
+    token = latest_token_for(athlete_id)
+    if token is not None:
+        try:
+            detail = await fetch_activity_detail(token, activity_id, priority=Priority.HYDRATION)
+        except HTTPException as e:
+            if e.status_code not in (401, 429):
+                # Gone again, or not visible to us: nothing to cache
+                logger.warning(f"Webhook fetch of activity {activity_id} failed: {e.detail}")
+                return True
+        else:
+            cache_entry = ACTIVITY_CACHE.get(athlete_id)
+            if cache_entry and activity_id not in get_activity_map(athlete_id):
+                detail["hydrated_at"] = time.time()
+                cache_entry["activities"] = insert_activity(cache_entry["activities"], detail)
+                activity_changed(athlete_id, detail)
+            return True
+
+    pending = ACTIVITY_CACHE[athlete_id].setdefault("webhook_pending", [])
+    if activity_id not in pending:
+        pending.append(activity_id)
+    return False
+
+def schedule_webhook_fetches(athlete_id: str) -> None:
+    """Fetch activities queued by webhook events while no token was available."""
+    pending = ACTIVITY_CACHE[athlete_id].pop("webhook_pending", [])
+
+    async def _fetch():
+        for activity_id in pending:
+            await fetch_webhook_activity(athlete_id, activity_id)
+        request_cache_save()
+
+    asyncio.create_task(_fetch())
+
+async def apply_webhook_event(event: WebhookEvent) -> str:
+    """Apply one event to the caches with the smallest change possible. Returns the outcome."""
+    athlete_id = event.owner_id
+
+    if event.is_deauthorization:
+        # 1. ACCESS REVOKED: DROP EVERYTHING CACHED FOR THE ATHLETE
+        await purge_athlete(athlete_id)
+        return "deauthorized"
+    if event.object_type == "athlete":
+        response_cache.invalidate_prefix("athlete_zones", endpoint_cache.make_key(athlete_id))
+        return "athlete_updated"
+
+    await sync_activity_cache(athlete_id)
+    cache_entry = ACTIVITY_CACHE.get(athlete_id)
+    if not cache_entry or "activities" not in cache_entry:
+        # Nothing cached yet; the athlete's first request fetches the full list
+        return "ignored"
+    activity_id = event.object_id
+
+    # 2. DELETE: DROP THE RECORD AND EVERYTHING DERIVED FROM IT
+    if event.aspect_type == "delete":
+        cache_entry["activities"], removed = remove_activity(cache_entry["activities"], activity_id)
+        activity_removed(athlete_id, activity_id)
+        index = ACTIVITY_TEXT_INDEXES.get(athlete_id)
+        if index is not None:
+            index.remove(activity_id)
+        if activity_id in cache_entry.get("webhook_pending", []):
+            cache_entry["webhook_pending"].remove(activity_id)
+        streams_store.invalidate("activity", activity_id)
+        segment_effort_store.remove_activity(athlete_id, activity_id)
+        drop_activity_caches(athlete_id, activity_id)
+        request_cache_save()
+        return "deleted" if removed is not None else "ignored"
+
+    # 3. UPDATE: PATCH IN PLACE WHEN THE EVENT CARRIES THE NEW VALUES
+    if event.aspect_type == "update":
+        drop_activity_caches(athlete_id, activity_id)
+        record = get_activity_map(athlete_id).get(activity_id)
+        if record is not None and patch_activity(record, event.updates):
+            activity_changed(athlete_id, record)
+            request_cache_save()
+            return "patched"
+
+    # 4. CREATE (OR AN UPDATE WE CAN'T PATCH): FETCH THE ONE ACTIVITY
+    fetched = await fetch_webhook_activity(athlete_id, activity_id)
+    request_cache_save()
+    return "fetched" if fetched else "deferred"
+
+async def _apply_webhook_event_logged(event: WebhookEvent) -> None:
+    try:
+        outcome = await apply_webhook_event(event)
+    except Exception as e:
+        outcome = "failed"
+        logger.error(f"Applying webhook event {event} failed: {e}", exc_info=True)
+    WEBHOOK_STATS[outcome] += 1
+    logger.info(f"Webhook {event.object_type}/{event.aspect_type} {event.object_id} for athlete {event.owner_id}: {outcome}")
+
+@app.get("/webhook")
+async def verify_webhook(
+    hub_mode: str = Query(..., alias="hub.mode"),
+    hub_verify_token: str = Query(..., alias="hub.verify_token"),
+    hub_challenge: str = Query(..., alias="hub.challenge"),
+) -> Dict[str, str]:
+    """Subscription validation handshake: echo the challenge if the verify token matches."""
+    if not WEBHOOK_VERIFY_TOKEN or hub_mode != "subscribe" or hub_verify_token != WEBHOOK_VERIFY_TOKEN:
+        raise HTTPException(status_code=403, detail="Webhook verification failed")
+    return {"hub.challenge": hub_challenge}
+
+@app.post("/webhook")
+async def receive_webhook(background_tasks: BackgroundTasks, payload: Dict[str, Any] = Body(...)) -> Dict[str, str]:
+    """
+    Event receiver. Strava wants a 200 within two seconds, so the event is applied
+    after the response is sent.
+    """
+    try:
+        event = WebhookEvent.from_payload(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # The route is public: only events naming our subscription are accepted, so
+    # nothing is accepted until STRAVA_WEBHOOK_SUBSCRIPTION_ID is set
+    if not WEBHOOK_SUBSCRIPTION_ID:
+        raise HTTPException(status_code=403, detail="Webhooks are not configured")
+    if not hmac.compare_digest(str(event.subscription_id), WEBHOOK_SUBSCRIPTION_ID):
+        raise HTTPException(status_code=403, detail="Unknown subscription")
+    WEBHOOK_STATS["received"] += 1
+    background_tasks.add_task(_apply_webhook_event_logged, event)
+    return {"status": "accepted"}
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
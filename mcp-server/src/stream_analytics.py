@@ -0,0 +1,243 @@
+"""
+Local analytics over activity streams.
+Power/pace curves, best efforts, time in zones, aerobic decoupling and
+elevation gain, computed with NumPy from the cached streams so the LLM gets
+a handful of numbers instead of raw time series.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Streams needed by analyze_streams
+ANALYTICS_KEYS = "time,distance,altitude,velocity_smooth,heartrate,watts,moving"
+
+CURVE_DURATIONS = (5, 15, 30, 60, 300, 600, 1200, 1800, 3600)
+PACE_DURATIONS = (60, 300, 600, 1200, 3600)
+BEST_EFFORT_DISTANCES = {
+    "400m": 400.0,
+    "1k": 1000.0,
+    "1 mile": 1609.344,
+    "5k": 5000.0,
+    "10k": 10000.0,
+    "half marathon": 21097.5,
+    "marathon": 42195.0,
+}
+
+# Recording gaps longer than this (auto-pause, lost signal) count as zero output
+MAX_SAMPLE_GAP = 5
+# Decoupling needs a reasonably long steady effort to mean anything
+MIN_DECOUPLING_SECONDS = 1200
+ELEVATION_SMOOTHING = 5
+METERS_PER_MILE = 1609.344
+
+
+def format_duration(seconds: float) -> str:
+    """h:mm:ss if >= 1 hour, else m:ss."""
+    t = int(round(seconds))
+    if t >= 3600:
+        return f"{t // 3600}:{t % 3600 // 60:02d}:{t % 60:02d}"
+    return f"{t // 60}:{t % 60:02d}"
+
+
+def duration_label(seconds: int) -> str:
+    """5 -> '5s', 300 -> '5m', 3600 -> '1h'."""
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    if seconds % 60 == 0:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+
+def resample_1hz(time: np.ndarray, values: np.ndarray, fill_gaps: bool = False) -> np.ndarray:
+    """
+    Resample a stream onto a 1-second grid by linear interpolation.
+    With fill_gaps, seconds inside recording gaps longer than MAX_SAMPLE_GAP are zero
+    (used for power: a paused rider isn't producing watts).
+    """
+    grid = np.arange(time[0], time[-1] + 1)
+    out = np.interp(grid, time, values)
+    if fill_gaps:
+        left = np.clip(np.searchsorted(time, grid, side="right") - 1, 0, len(time) - 2)
+        gaps = time[left + 1] - time[left]
+        out[gaps > MAX_SAMPLE_GAP] = 0.0
+    return out
+
+
+def rolling_mean_max(series: np.ndarray, window: int) -> Optional[float]:
+    """Highest mean over any contiguous window of the given length, or None if too short."""
+    if window <= 0 or len(series) < window:
+        return None
+    cumulative = np.concatenate(([0.0], np.cumsum(series, dtype=float)))
+    return float(((cumulative[window:] - cumulative[:-window]) / window).max())
+
+
+def power_curve(time: np.ndarray, watts: np.ndarray,
+                durations: Sequence[int] = CURVE_DURATIONS) -> Dict[str, int]:
+    """Best average power for each duration."""
+    series = resample_1hz(time, watts, fill_gaps=True)
+    curve = {}
+    for duration in durations:
+        best = rolling_mean_max(series, duration)
+        if best is not None:
+            curve[duration_label(duration)] = int(round(best))
+    return curve
+
+
+def pace_curve(time: np.ndarray, distance: np.ndarray,
+               durations: Sequence[int] = PACE_DURATIONS) -> Dict[str, str]:
+    """Best average pace (min/mile) sustained for each duration."""
+    series = resample_1hz(time, distance)
+    curve = {}
+    for duration in durations:
+        if len(series) <= duration:
+            continue
+        best_meters = float((series[duration:] - series[:-duration]).max())
+        if best_meters > 0:
+            curve[duration_label(duration)] = f"{format_duration(duration * METERS_PER_MILE / best_meters)}/mi"
+    return curve
+
+
+def best_efforts(time: np.ndarray, distance: np.ndarray,
+                 targets: Optional[Dict[str, float]] = None) -> Dict[str, str]:
+    """
+    Fastest time to cover each target distance anywhere in the activity.
+    For every start sample, the first sample at least `target` further on is found
+    with a binary search, so the whole search is O(n log n) per distance.
+    """
+    targets = targets or BEST_EFFORT_DISTANCES
+    # Distance can dip by a rounding error; searchsorted needs it non-decreasing
+    distance = np.maximum.accumulate(distance)
+    efforts = {}
+    for label, target in targets.items():
+        if distance[-1] - distance[0] < target:
+            continue
+        ends = np.searchsorted(distance, distance + target, side="left")
+        valid = ends < len(distance)
+        if not valid.any():
+            continue
+        elapsed = time[ends[valid]] - time[valid]
+        efforts[label] = format_duration(float(elapsed.min()))
+    return efforts
+
+
+def time_in_zones(time: np.ndarray, values: np.ndarray, zones: List[Dict[str, Any]]) -> List[int]:
+    """
+    Seconds spent in each zone. zones is Strava's list of {"min", "max"} bands
+    (the last band has max -1). Gaps longer than MAX_SAMPLE_GAP are not counted.
+    """
+    if not zones:
+        return []
+    dt = np.diff(time, append=time[-1]).astype(float)
+    dt[dt > MAX_SAMPLE_GAP] = 0.0
+    edges = np.array([zone.get("min", 0) for zone in zones[1:]], dtype=float)
+    index = np.digitize(values, edges)
+    seconds = np.bincount(index, weights=dt, minlength=len(zones))
+    return [int(round(s)) for s in seconds[:len(zones)]]
+
+
+def decoupling(time: np.ndarray, heartrate: np.ndarray, output: np.ndarray,
+               moving: Optional[np.ndarray] = None) -> Optional[float]:
+    """
+    Aerobic decoupling (%): drop in output-per-heartbeat from the first to the second
+    half of moving time. output is power or speed. Positive means HR drifted up.
+    """
+    mask = (heartrate > 0) & np.isfinite(output) & np.isfinite(time)
+    if moving is not None and len(moving) == len(time):
+        mask &= np.asarray(moving).astype(bool)
+    if mask.sum() < 2:
+        return None
+    t, hr, out = time[mask], heartrate[mask], output[mask]
+    dt = np.diff(t, append=t[-1]).astype(float)
+    dt[dt > MAX_SAMPLE_GAP] = 0.0
+    elapsed = np.cumsum(dt)
+    if elapsed[-1] < MIN_DECOUPLING_SECONDS:
+        return None
+
+    first = elapsed <= elapsed[-1] / 2
+    ratios = []
+    for half in (first, ~first):
+        weights = dt[half]
+        if weights.sum() == 0:
+            return None
+        ratios.append(np.average(out[half], weights=weights) / np.average(hr[half], weights=weights))
+    if ratios[0] == 0:
+        return None
+    return round(float((ratios[0] - ratios[1]) / ratios[0] * 100), 1)
+
+
+def elevation_change(altitude: np.ndarray, window: int = ELEVATION_SMOOTHING) -> Dict[str, float]:
+    """Total ascent/descent after smoothing out barometer/GPS noise."""
+    if len(altitude) > window:
+        altitude = np.convolve(altitude, np.ones(window) / window, mode="valid")
+    steps = np.diff(altitude)
+    return {
+        "elevation_gain_m": round(float(steps[steps > 0].sum()), 1),
+        "elevation_loss_m": round(float(-steps[steps < 0].sum()), 1),
+    }
+
+
+def analyze_streams(streams: Dict[str, np.ndarray],
+                    zones: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Compact analytics for one activity.
+    streams: decoded arrays keyed by stream type (see ANALYTICS_KEYS).
+    zones: Strava /athlete/zones response, for time in HR/power zones.
+    """
+    time = streams.get("time")
+    if time is None or len(time) < 2:
+        return {}
+    time = np.asarray(time, dtype=float)
+    n = len(time)
+
+    def stream(key):
+        values = streams.get(key)
+        if values is None or len(values) != n:
+            return None
+        return np.asarray(values, dtype=float)
+
+    def samples(values):
+        """(time, values) where the sensor recorded something, or None if under 2 samples."""
+        if values is None:
+            return None
+        # Samples Strava sends as null decode to NaN
+        valid = np.isfinite(values) & np.isfinite(time)
+        if valid.sum() < 2:
+            return None
+        return time[valid], values[valid]
+
+    distance, watts, heartrate = stream("distance"), stream("watts"), stream("heartrate")
+    velocity, altitude = stream("velocity_smooth"), stream("altitude")
+    moving = streams.get("moving")
+    zones = zones or {}
+
+    result: Dict[str, Any] = {"elapsed_time": format_duration(np.nanmax(time) - np.nanmin(time))}
+
+    if (recorded := samples(distance)) is not None:
+        result["best_efforts"] = best_efforts(*recorded)
+        result["pace_curve"] = pace_curve(*recorded)
+
+    if (recorded := samples(watts)) is not None:
+        watts_time, watts_values = recorded
+        result["power_curve_w"] = power_curve(watts_time, watts_values)
+        result["avg_power_w"] = int(round(float(watts_values.mean())))
+        power_zones = zones.get("power", {}).get("zones", [])
+        if power_zones:
+            result["power_zone_seconds"] = time_in_zones(watts_time, watts_values, power_zones)
+
+    if (recorded := samples(heartrate)) is not None:
+        hr_time, hr_values = recorded
+        result["avg_hr"] = int(round(float(hr_values[hr_values > 0].mean()))) if (hr_values > 0).any() else None
+        result["max_hr"] = int(hr_values.max())
+        hr_zones = zones.get("heart_rate", {}).get("zones", [])
+        if hr_zones:
+            result["hr_zone_seconds"] = time_in_zones(hr_time, hr_values, hr_zones)
+        output = watts if watts is not None else velocity
+        if output is not None:
+            drift = decoupling(time, heartrate, output, moving)
+            if drift is not None:
+                result["decoupling_pct"] = drift
+
+    if (recorded := samples(altitude)) is not None:
+        result.update(elevation_change(recorded[1]))
+
+    return result
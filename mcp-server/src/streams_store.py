@@ -0,0 +1,319 @@
+"""
+Persistent on-disk cache for Strava streams.
+
+Each cached object (activity, segment, segment effort, route) is one file:
+
+    MAGIC | uint32 header length | JSON header | compressed stream blocks
+
+Every stream is stored as a typed array: values are scaled to integers at the
+stream's native resolution, delta-encoded along the samples, narrowed to the
+smallest integer type that fits and zlib-compressed. Reads memory-map the file
+and only decompress the streams that were asked for.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"STRMS1\n"
+HEADER_LEN = struct.Struct("<I")
+
+# Fixed-point scale per stream type (values are stored as round(value * scale)).
+# Anything that does not round-trip exactly at its scale is stored as float64.
+STREAM_SCALES: Dict[str, int] = {
+    "time": 1,
+    "distance": 10,
+    "latlng": 10 ** 6,
+    "altitude": 10,
+    "velocity_smooth": 1000,
+    "heartrate": 1,
+    "cadence": 1,
+    "watts": 1,
+    "temp": 1,
+    "moving": 1,
+    "grade_smooth": 10,
+}
+
+INT_DTYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def _encode_array(values: List[Any], scale: int) -> Optional[Dict[str, Any]]:
+    """
+    Encode one stream's data. Returns block metadata plus the compressed payload,
+    or None if the data is not numeric (e.g. contains nulls).
+    """
+    try:
+        raw = np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        return None
+    if raw.ndim == 0 or np.isnan(raw).any():
+        return None
+
+    is_bool = bool(values) and isinstance(np.ravel(np.asarray(values, dtype=object))[0], bool)
+    scaled = np.rint(raw * scale)
+    if np.array_equal(scaled / scale, raw) and np.abs(scaled).max(initial=0) < 2 ** 62:
+        ints = scaled.astype(np.int64)
+        deltas = np.diff(ints, axis=0, prepend=np.zeros_like(ints[:1]))
+        low, high = deltas.min(initial=0), deltas.max(initial=0)
+        dtype = next(d for d in INT_DTYPES if np.iinfo(d).min <= low and high <= np.iinfo(d).max)
+        payload = deltas.astype(dtype).tobytes()
+        encoding = "delta"
+    else:
+        dtype = np.float64
+        scale = 1
+        payload = raw.tobytes()
+        encoding = "raw"
+
+    return {
+        "encoding": encoding,
+        "dtype": np.dtype(dtype).name,
+        "scale": scale,
+        "shape": list(raw.shape),
+        "bool": is_bool,
+        "payload": zlib.compress(payload, 6),
+    }
+
+
+def _decode_array(meta: Dict[str, Any], block: bytes) -> np.ndarray:
+    """Inverse of _encode_array. Returns float64 (or bool) samples."""
+    data = np.frombuffer(zlib.decompress(block), dtype=meta["dtype"]).reshape(meta["shape"])
+    if meta["encoding"] == "delta":
+        data = np.cumsum(data, axis=0, dtype=np.int64)
+        if meta["bool"]:
+            return data.astype(bool)
+        if meta["scale"] == 1:
+            return data
+        return data / meta["scale"]
+    return data.astype(np.float64)
+
+
+def streams_by_type(streams: Any) -> Dict[str, Dict[str, Any]]:
+    """Normalize a Strava streams response (list or key_by_type dict) to a dict keyed by type."""
+    if isinstance(streams, dict):
+        return {k: v for k, v in streams.items() if isinstance(v, dict) and "data" in v}
+    if isinstance(streams, list):
+        return {s["type"]: s for s in streams if isinstance(s, dict) and "type" in s and "data" in s}
+    return {}
+
+
+class StreamsStore:
+    """
+    Disk-backed streams cache, one file per (kind, object id).
+    kind is one of "activity", "segment", "segment_effort", "route".
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        self.bytes_written = 0
+        self.bytes_raw = 0
+
+    def _path(self, kind: str, obj_id: int) -> str:
+        return os.path.join(self.root, kind, f"{obj_id}.strm")
+
+    # --- WRITE ---
+
+    def put(self, kind: str, obj_id: int, streams: Any, requested_keys: Iterable[str]) -> None:
+        """
+        Store a Strava streams response. requested_keys is what was asked for, so a
+        later request for a key Strava did not return (e.g. no HR strap) is still a hit.
+        Streams already on disk that this response does not carry are kept, so asking
+        for a different set of keys adds to the file instead of replacing it.
+        """
+        by_type = streams_by_type(streams)
+        header: Dict[str, Any] = {
+            "kind": kind,
+            "id": obj_id,
+            "fetched_at": time.time(),
+            "requested_keys": set(requested_keys) | set(by_type),
+            "streams": {},
+        }
+        blocks: List[bytes] = []
+        offset = 0
+
+        opened = self._open(kind, obj_id)
+        if opened is not None:
+            old_header, mm, data_start = opened
+            try:
+                header["requested_keys"] |= set(old_header.get("requested_keys", []))
+                for stream_type, meta in old_header["streams"].items():
+                    if stream_type in by_type:
+                        continue
+                    start = data_start + meta["offset"]
+                    blocks.append(mm[start:start + meta["length"]])
+                    header["streams"][stream_type] = dict(meta, offset=offset)
+                    offset += meta["length"]
+            finally:
+                mm.close()
+        header["requested_keys"] = sorted(header["requested_keys"])
+
+        for stream_type, stream in by_type.items():
+            data = stream.get("data", [])
+            meta = _encode_array(data, STREAM_SCALES.get(stream_type, 1))
+            if meta is None:
+                meta = {"encoding": "json", "payload": zlib.compress(json.dumps(data).encode())}
+            payload = meta.pop("payload")
+            meta.update({
+                "offset": offset,
+                "length": len(payload),
+                "series_type": stream.get("series_type"),
+                "original_size": stream.get("original_size", len(data)),
+                "resolution": stream.get("resolution"),
+            })
+            header["streams"][stream_type] = meta
+            blocks.append(payload)
+            offset += len(payload)
+            self.bytes_raw += len(json.dumps(data))
+
+        path = self._path(kind, obj_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        encoded_header = json.dumps(header).encode()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(HEADER_LEN.pack(len(encoded_header)))
+            f.write(encoded_header)
+            for block in blocks:
+                f.write(block)
+        os.replace(tmp_path, path)
+        self.bytes_written += os.path.getsize(path)
+
+    def invalidate(self, kind: str, obj_id: int) -> None:
+        try:
+            os.remove(self._path(kind, obj_id))
+        except FileNotFoundError:
+            pass
+
+    # --- READ ---
+
+    def _open(self, kind: str, obj_id: int):
+        """Memory-map a cached file. Returns (header, mmap, data_start) or None."""
+        path = self._path(kind, obj_id)
+        try:
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            if mm[:len(MAGIC)] != MAGIC:
+                raise ValueError("bad magic")
+            start = len(MAGIC) + HEADER_LEN.size
+            (header_len,) = HEADER_LEN.unpack(mm[len(MAGIC):start])
+            header = json.loads(mm[start:start + header_len])
+            return header, mm, start + header_len
+        except (ValueError, struct.error) as e:
+            mm.close()
+            logger.warning(f"Discarding corrupt streams file {path}: {e}")
+            self.invalidate(kind, obj_id)
+            return None
+
+    def _lookup(self, kind: str, obj_id: int, keys: Optional[Iterable[str]], max_age: Optional[float]):
+        opened = self._open(kind, obj_id)
+        if opened is None:
+            self.misses += 1
+            return None
+        header, mm, data_start = opened
+        fresh = max_age is None or time.time() - header.get("fetched_at", 0) <= max_age
+        covered = keys is None or set(keys) <= set(header.get("requested_keys", []))
+        if not (fresh and covered):
+            mm.close()
+            self.misses += 1
+            return None
+        self.hits += 1
+        wanted = [k for k in header["streams"] if keys is None or k in set(keys)]
+        return header, mm, data_start, wanted
+
+    def get_arrays(self, kind: str, obj_id: int, keys: Optional[Iterable[str]] = None,
+                   max_age: Optional[float] = None) -> Optional[Dict[str, np.ndarray]]:
+        """Decoded numpy arrays for the requested stream types, or None on a miss."""
+        found = self._lookup(kind, obj_id, keys, max_age)
+        if found is None:
+            return None
+        header, mm, data_start, wanted = found
+        try:
+            arrays = {}
+            for stream_type in wanted:
+                meta = header["streams"][stream_type]
+                block = mm[data_start + meta["offset"]:data_start + meta["offset"] + meta["length"]]
+                if meta["encoding"] == "json":
+                    arrays[stream_type] = np.asarray(json.loads(zlib.decompress(block)), dtype=object)
+                else:
+                    arrays[stream_type] = _decode_array(meta, block)
+            return arrays
+        finally:
+            mm.close()
+
+    def get_json(self, kind: str, obj_id: int, keys: Optional[Iterable[str]] = None,
+                 key_by_type: bool = True, max_age: Optional[float] = None) -> Optional[Any]:
+        """Streams in Strava's response shape (key_by_type dict or list), or None on a miss."""
+        found = self._lookup(kind, obj_id, keys, max_age)
+        if found is None:
+            return None
+        header, mm, data_start, wanted = found
+        try:
+            result: Dict[str, Dict[str, Any]] = {}
+            for stream_type in wanted:
+                meta = header["streams"][stream_type]
+                block = mm[data_start + meta["offset"]:data_start + meta["offset"] + meta["length"]]
+                if meta["encoding"] == "json":
+                    data = json.loads(zlib.decompress(block))
+                else:
+                    data = _decode_array(meta, block).tolist()
+                result[stream_type] = {
+                    "data": data,
+                    "series_type": meta.get("series_type"),
+                    "original_size": meta.get("original_size"),
+                    "resolution": meta.get("resolution"),
+                }
+        finally:
+            mm.close()
+        if key_by_type:
+            return result
+        return [{"type": stream_type, **stream} for stream_type, stream in result.items()]
+
+    def get_binary(self, kind: str, obj_id: int, keys: Optional[Iterable[str]] = None,
+                   max_age: Optional[float] = None) -> Optional[bytes]:
+        """
+        The requested streams in the on-disk binary format (compressed blocks are
+        copied, not decoded). Clients decode with the header's dtype/scale/encoding.
+        """
+        found = self._lookup(kind, obj_id, keys, max_age)
+        if found is None:
+            return None
+        header, mm, data_start, wanted = found
+        try:
+            subset = dict(header, streams={})
+            blocks = []
+            offset = 0
+            for stream_type in wanted:
+                meta = dict(header["streams"][stream_type])
+                start = data_start + meta["offset"]
+                blocks.append(mm[start:start + meta["length"]])
+                meta["offset"] = offset
+                offset += meta["length"]
+                subset["streams"][stream_type] = meta
+        finally:
+            mm.close()
+        encoded_header = json.dumps(subset).encode()
+        return MAGIC + HEADER_LEN.pack(len(encoded_header)) + encoded_header + b"".join(blocks)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_written": self.bytes_written,
+            "compression_ratio": round(self.bytes_raw / self.bytes_written, 1) if self.bytes_written else None,
+        }
+
+
+# Global Instance
+streams_store = StreamsStore(os.getenv("STREAMS_CACHE_DIR", "streams_cache"))
@@ -1,6 +1,8 @@
 """HTML templates for the Strava activity visualization."""
 
-MAP_TEMPLATE = """
+# The route coordinates go between head and tail. Only the head goes through
+# str.format, so the (large) coordinate array is never scanned for placeholders.
+MAP_TEMPLATE_HEAD = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -70,8 +72,10 @@ MAP_TEMPLATE = """
             attribution: '© OpenStreetMap contributors'
         }}).addTo(map);
         
-        const coordinates = {coordinates};
-        const polyline = L.polyline(coordinates, {{color: 'red', weight: 3}}).addTo(map);
+        const coordinates = """
+
+MAP_TEMPLATE_TAIL = """;
+        const polyline = L.polyline(coordinates, {color: 'red', weight: 3}).addTo(map);
         
         // Add start and end markers
         L.marker(coordinates[0]).addTo(map).bindPopup('Start');
@@ -0,0 +1,110 @@
+"""
+Persistent token -> athlete id map.
+
+Every cached object is keyed by athlete id, but requests carry only an access
+token, and Strava rotates tokens every six hours. Remembering which athlete a
+token belongs to (the backend tells us, or one /athlete call does) means cached
+data can be served without asking Strava again, across restarts too.
+
+Tokens are stored as SHA-256 fingerprints, never in the clear. The map is LRU
+bounded by max_entries, and entries unused for max_age are dropped (the token
+has long expired by then).
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def token_fingerprint(access_token: str) -> str:
+    """Stable id for a token that is safe to store (the token itself never is)."""
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+class TokenAthleteMap:
+    def __init__(self, max_entries: int = 10000, max_age: float = 3600 * 24 * 7,
+                 persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.persist_path = persist_path
+        # fingerprint -> (athlete_id, last_used)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._dirty = False
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, access_token: str) -> Optional[str]:
+        key = token_fingerprint(access_token)
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[1] > self.max_age:
+            del self._entries[key]
+            self._dirty = True
+            entry = None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self._entries[key] = (entry[0], time.time())
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, access_token: str, athlete_id: str) -> None:
+        key = token_fingerprint(access_token)
+        self._entries[key] = (str(athlete_id), time.time())
+        self._entries.move_to_end(key)
+        self._dirty = True
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def fingerprints(self, athlete_id: str) -> List[str]:
+        """Fingerprints of the tokens known to belong to an athlete."""
+        return [k for k, (known_id, _) in self._entries.items() if known_id == str(athlete_id)]
+
+    def forget_athlete(self, athlete_id: str) -> int:
+        """Drop every token of an athlete (e.g. after deauthorization)."""
+        doomed = self.fingerprints(athlete_id)
+        for key in doomed:
+            del self._entries[key]
+        if doomed:
+            self._dirty = True
+        return len(doomed)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, **self.stats}
+
+    def save(self) -> None:
+        """Write the map to persist_path (LRU order preserved). No-op if unchanged."""
+        if not self.persist_path or not self._dirty:
+            return
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump([[key, athlete_id, last_used] for key, (athlete_id, last_used) in self._entries.items()], f)
+            os.replace(tmp_path, self.persist_path)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Failed to save token map: {e}")
+
+    def load(self) -> None:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r") as f:
+                rows = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load token map: {e}")
+            return
+        now = time.time()
+        for key, athlete_id, last_used in rows[-self.max_entries:]:
+            if now - last_used <= self.max_age:
+                self._entries[key] = (athlete_id, last_used)
+        self._dirty = False
+        logger.info(f"Loaded {len(self._entries)} token -> athlete mappings from disk.")
@@ -0,0 +1,188 @@
+"""
+Bounded TTL + LRU cache for Strava responses.
+
+Entries live in namespaces ("segment", "leaderboard", "gear", ...) that share
+one size budget, counted in entries and in approximate bytes (the size of the
+JSON encoding). When either limit is exceeded the least recently used entries
+are evicted, whatever their namespace. Expired entries are dropped on read.
+
+The cache can be persisted to a JSON file so a restart does not re-spend API
+quota on data that is still fresh.
+"""
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str]
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    stored_at: float
+    expires_at: float
+    size: int
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+
+def _namespace_stats() -> Dict[str, int]:
+    return {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0}
+
+
+class TTLCache:
+    """
+    get/set keyed by (namespace, key). Keys are stored as strings so the cache
+    survives a JSON round trip; values must be JSON-serializable.
+    """
+
+    def __init__(self, max_entries: int = 5000, max_bytes: int = 64 * 1024 * 1024,
+                 persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._dirty = False
+
+    def _ns(self, namespace: str) -> Dict[str, int]:
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = _namespace_stats()
+        return stats
+
+    def _remove(self, cache_key: CacheKey) -> CacheEntry:
+        entry = self._entries.pop(cache_key)
+        self._bytes -= entry.size
+        stats = self._ns(cache_key[0])
+        stats["entries"] -= 1
+        stats["bytes"] -= entry.size
+        self._dirty = True
+        return entry
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            cache_key = next(iter(self._entries))
+            self._remove(cache_key)
+            self._ns(cache_key[0])["evictions"] += 1
+
+    def get_entry(self, namespace: str, key: Hashable) -> Optional[CacheEntry]:
+        """The live entry (value + timestamps), or None if missing or expired."""
+        cache_key = (namespace, str(key))
+        entry = self._entries.get(cache_key)
+        if entry is not None and entry.expires_at <= time.time():
+            self._remove(cache_key)
+            entry = None
+        stats = self._ns(namespace)
+        if entry is None:
+            stats["misses"] += 1
+            return None
+        stats["hits"] += 1
+        self._entries.move_to_end(cache_key)
+        return entry
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        entry = self.get_entry(namespace, key)
+        return entry.value if entry is not None else None
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float) -> CacheEntry:
+        cache_key = (namespace, str(key))
+        if cache_key in self._entries:
+            self._remove(cache_key)
+        now = time.time()
+        size = len(json.dumps(value, separators=(",", ":")))
+        entry = CacheEntry(value=value, stored_at=now, expires_at=now + ttl, size=size)
+        self._entries[cache_key] = entry
+        self._bytes += size
+        stats = self._ns(namespace)
+        stats["entries"] += 1
+        stats["bytes"] += size
+        self._dirty = True
+        self._evict()
+        return entry
+
+    def invalidate(self, namespace: str, key: Optional[Hashable] = None) -> int:
+        """Drop one entry, or the whole namespace if key is None. Returns how many were dropped."""
+        if key is not None:
+            cache_key = (namespace, str(key))
+            if cache_key not in self._entries:
+                return 0
+            self._remove(cache_key)
+            return 1
+        doomed = [k for k in self._entries if k[0] == namespace]
+        for cache_key in doomed:
+            self._remove(cache_key)
+        return len(doomed)
+
+    def invalidate_prefix(self, namespace: Optional[str], prefix: str) -> int:
+        """Drop entries whose key is prefix or starts with prefix + ':' (in every namespace if None)."""
+        doomed = [
+            k for k in self._entries
+            if (namespace is None or k[0] == namespace) and (k[1] == prefix or k[1].startswith(prefix + ":"))
+        ]
+        for cache_key in doomed:
+            self._remove(cache_key)
+        return len(doomed)
+
+    def get_stats(self) -> Dict[str, Any]:
+        namespaces = {}
+        for namespace, stats in self._stats.items():
+            lookups = stats["hits"] + stats["misses"]
+            namespaces[namespace] = {
+                **stats,
+                "hit_rate": round(stats["hits"] / lookups, 3) if lookups else None,
+            }
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "namespaces": namespaces,
+        }
+
+    def save(self) -> None:
+        """Write unexpired entries to persist_path (LRU order preserved). No-op if unchanged."""
+        if not self.persist_path or not self._dirty:
+            return
+        now = time.time()
+        rows = [
+            [namespace, key, entry.stored_at, entry.expires_at, entry.value]
+            for (namespace, key), entry in self._entries.items()
+            if entry.expires_at > now
+        ]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(rows, f)
+            os.replace(tmp_path, self.persist_path)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Failed to save response cache: {e}")
+
+    def load(self) -> None:
+        """Restore entries saved by save(), skipping any that expired in the meantime."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r") as f:
+                rows = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load response cache: {e}")
+            return
+        now = time.time()
+        for namespace, key, stored_at, expires_at, value in rows:
+            if expires_at <= now:
+                continue
+            entry = self.set(namespace, key, value, expires_at - now)
+            entry.stored_at = stored_at
+        self._dirty = False
+        logger.info(f"Loaded {len(self._entries)} response cache entries from disk.")
@@ -0,0 +1,101 @@
+"""
+Strava push subscription (webhook) events.
+
+Strava POSTs one small event per change instead of us polling the activity list:
+
+    {"object_type": "activity", "object_id": 123, "aspect_type": "update",
+     "owner_id": 7, "subscription_id": 1, "event_time": 1700000000,
+     "updates": {"title": "Evening Ride"}}
+
+These helpers parse events and apply them to a cached activity list. They never
+call Strava; the server decides when a change needs the full activity fetched.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+OBJECT_TYPES = ("activity", "athlete")
+ASPECT_TYPES = ("create", "update", "delete")
+
+
+@dataclass
+class WebhookEvent:
+    object_type: str
+    object_id: int
+    aspect_type: str
+    owner_id: str
+    event_time: int = 0
+    subscription_id: Optional[int] = None
+    updates: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "WebhookEvent":
+        """Parse a webhook POST body. Raises ValueError if it is not a Strava event."""
+        try:
+            event = cls(
+                object_type=payload["object_type"],
+                object_id=int(payload["object_id"]),
+                aspect_type=payload["aspect_type"],
+                owner_id=str(payload["owner_id"]),
+                event_time=int(payload.get("event_time") or 0),
+                subscription_id=payload.get("subscription_id"),
+                updates=payload.get("updates") or {},
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Malformed webhook event: {e}")
+        if event.object_type not in OBJECT_TYPES or event.aspect_type not in ASPECT_TYPES:
+            raise ValueError(f"Unknown webhook event {event.object_type}/{event.aspect_type}")
+        if not isinstance(event.updates, dict):
+            raise ValueError("Webhook updates must be an object")
+        return event
+
+    @property
+    def is_deauthorization(self) -> bool:
+        """The athlete revoked our access (their cached data must go)."""
+        return (
+            self.object_type == "athlete"
+            and str(self.updates.get("authorized", "")).lower() == "false"
+        )
+
+
+def _as_bool(value: Any) -> bool:
+    return str(value).lower() == "true"
+
+
+# Update fields Strava sends -> how to apply them to a cached summary record
+PATCHABLE_UPDATES = {
+    "title": lambda record, v: record.update(name=v),
+    "type": lambda record, v: record.update(type=v, sport_type=v),
+    "private": lambda record, v: record.update(private=_as_bool(v)),
+}
+
+
+def patch_activity(record: Dict[str, Any], updates: Dict[str, Any]) -> bool:
+    """
+    Apply an update event to the cached record in place. Returns False if the event
+    carries changes the record can't be patched with (the caller should fetch it).
+    """
+    if not updates or any(key not in PATCHABLE_UPDATES for key in updates):
+        return False
+    for key, value in updates.items():
+        PATCHABLE_UPDATES[key](record, value)
+    return True
+
+
+def insert_activity(activities: List[Dict[str, Any]], activity: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A new list with activity added (replacing any record with the same id), newest first."""
+    rest = [a for a in activities if a.get("id") != activity.get("id")]
+    start = activity.get("start_date", "")
+    position = next((i for i, a in enumerate(rest) if a.get("start_date", "") <= start), len(rest))
+    return rest[:position] + [activity] + rest[position:]
+
+
+def remove_activity(activities: List[Dict[str, Any]], activity_id: int) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """A new list without activity_id, and the removed record (None if it wasn't cached)."""
+    removed = None
+    kept = []
+    for activity in activities:
+        if activity.get("id") == activity_id:
+            removed = activity
+        else:
+            kept.append(activity)
+    return kept, removed
@@ -0,0 +1,21 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# MCP server modules are imported as top-level modules (see strava_http_server.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    # The server keeps its caches and stores in the working directory
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("server"))
+    try:
+        module = importlib.import_module("strava_http_server")
+        module.WEBHOOK_SUBSCRIPTION_ID = "99"
+        yield module
+    finally:
+        os.chdir(previous)
@@ -0,0 +1,72 @@
+import xml.etree.ElementTree as ET
+
+import activity_export
+import numpy as np
+from activity_export import export_filename, has_gps, iter_gpx, iter_tcx
+
+GPX = "{http://www.topografix.com/GPX/1/1}"
+TPX = "{http://www.garmin.com/xmlschemas/TrackPointExtension/v1}"
+TCX = "{http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2}"
+
+ACTIVITY = {
+    "id": 42, "name": "Morning <Run> & coffee", "type": "Run",
+    "start_date": "2024-05-04T06:00:00Z", "start_date_local": "2024-05-04T08:00:00Z",
+    "elapsed_time": 20, "distance": 50.0,
+}
+
+
+def make_arrays(n=5):
+    return {
+        "time": np.arange(n) * 5,
+        "latlng": np.column_stack([np.linspace(51.5, 51.6, n), np.linspace(-0.1, -0.2, n)]),
+        "altitude": np.full(n, 12.5),
+        "distance": np.arange(n) * 12.5,
+        "heartrate": np.arange(n) + 140,
+        "watts": np.full(n, 250),
+    }
+
+
+def test_gpx_is_valid_and_carries_sensor_data(monkeypatch):
+    # Several chunks, to check the document is stitched together correctly
+    monkeypatch.setattr(activity_export, "POINTS_PER_CHUNK", 2)
+    chunks = list(iter_gpx(ACTIVITY, make_arrays()))
+    assert len(chunks) > 3
+
+    root = ET.fromstring("".join(chunks))
+    assert root.find(f"{GPX}trk/{GPX}name").text == ACTIVITY["name"]
+    points = root.findall(f".//{GPX}trkpt")
+    assert len(points) == 5
+    assert float(points[0].get("lat")) == 51.5
+    assert points[1].find(f"{GPX}time").text == "2024-05-04T06:00:05Z"
+    assert points[2].find(f".//{TPX}hr").text == "142"
+    assert points[2].find(f".//{GPX}power").text == "250"
+
+
+def test_tcx_without_gps():
+    arrays = make_arrays(3)
+    del arrays["latlng"]
+    assert not has_gps(arrays)
+
+    root = ET.fromstring("".join(iter_tcx(ACTIVITY, arrays)))
+    assert root.find(f".//{TCX}Activity").get("Sport") == "Running"
+    points = root.findall(f".//{TCX}Trackpoint")
+    assert len(points) == 3
+    assert points[0].find(f"{TCX}Position") is None
+    assert points[2].find(f"{TCX}HeartRateBpm/{TCX}Value").text == "142"
+    assert points[2].find(f"{TCX}DistanceMeters").text == "25.0"
+
+
+def test_null_samples_are_skipped():
+    arrays = {
+        "time": np.array([0, 1, 2]),
+        "latlng": np.array([[1.0, 2.0], None, [1.1, 2.1]], dtype=object),
+        "heartrate": np.array([None, 120, 121], dtype=object),
+    }
+    root = ET.fromstring("".join(iter_gpx(ACTIVITY, arrays)))
+    points = root.findall(f".//{GPX}trkpt")
+    assert len(points) == 2
+    assert points[0].find(f".//{TPX}hr") is None
+
+
+def test_export_filename():
+    assert export_filename(ACTIVITY, "gpx") == "2024-05-04_42.gpx"
@@ -0,0 +1,38 @@
+from activity_index import ActivityTextIndex, tokenize
+
+
+def _index():
+    return ActivityTextIndex().build([
+        {"id": 1, "name": "Downskis loop", "description": "Legs felt heavy", "private_note": None},
+        {"id": 2, "name": "Easy run", "description": "", "private_note": "knee pain again"},
+        {"id": 3, "name": "Track 5k", "description": "Easy warmup, hard intervals"},
+    ])
+
+
+def test_tokenize_lowercases_words():
+    assert tokenize("Angeles Crest 100!") == ["angeles", "crest", "100"]
+
+
+def test_exact_partial_and_multiword_queries():
+    index = _index()
+    assert index.search("Downskis") == {1}
+    assert index.search("downski") == {1}
+    assert index.search("skis") == {1}
+    assert index.search("pain") == {2}
+    assert index.search("easy") == {2, 3}
+    assert index.search("easy run") == {2}
+    assert index.search("5k") == {3}
+    assert index.search("marathon") == set()
+
+
+def test_reindex_and_remove_keep_postings_consistent():
+    index = _index()
+    index.add({"id": 1, "name": "Downskis loop", "description": "Hydrated: calf pain"})
+    assert index.search("pain") == {1, 2}
+    assert index.search("heavy") == set()
+
+    index.remove(2)
+    assert index.search("pain") == {1}
+    assert "knee" not in index.postings
+    assert index.matching_tokens("kne") == set()
+    assert len(index) == 2
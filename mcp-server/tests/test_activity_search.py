@@ -0,0 +1,51 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+RECENT = {"id": 2, "name": "Tempo", "type": "Run", "distance": 8000, "start_date": "2024-03-02T08:00:00Z"}
+OLDER = {"id": 1, "name": "First tempo", "type": "Run", "distance": 5000, "start_date": "2015-06-01T08:00:00Z"}
+
+
+@pytest.fixture
+def strava_pages(server, monkeypatch):
+    """Strava's listing holds RECENT and OLDER; returns the params of each page asked for."""
+    pages = []
+
+    async def fake_request(url, params=None, access_token=None, **kwargs):
+        pages.append(params)
+        return [RECENT, OLDER] if params["page"] == 1 else []
+
+    monkeypatch.setattr(server, "make_strava_request", fake_request)
+    return pages
+
+
+def search(server, token):
+    response = TestClient(server.app).get(
+        "/activities/search", params={"search_name": "tempo"}, headers={"X-Strava-Token": token}
+    )
+    return response.json()
+
+
+def test_partial_list_without_flag_is_not_full_history(server, strava_pages):
+    server.remember_token("token-of-43", "43")
+    # Written before lists carried the "complete" flag
+    server.ACTIVITY_CACHE["43"] = {"activities": [RECENT], "fetched_at": time.time()}
+
+    body = search(server, "token-of-43")
+
+    assert [a["id"] for a in body["activities"]] == [2, 1]
+    assert body["source"]["cache_covered_until"] is None
+    # The whole history was paged, not just what is newer than the partial list
+    assert "after" not in strava_pages[0]
+
+
+def test_persistently_known_token_is_served_from_the_cache(server, strava_pages):
+    # Only the persistent map knows the token (e.g. right after a restart)
+    server.token_athletes.set("token-of-44", "44")
+    server.ACTIVITY_CACHE["44"] = {"activities": [RECENT, OLDER], "fetched_at": time.time(), "complete": True}
+
+    body = search(server, "token-of-44")
+
+    assert body["source"]["cache"] == 2
+    assert strava_pages[0]["after"] >= int(server.ACTIVITY_CACHE["44"]["fetched_at"])
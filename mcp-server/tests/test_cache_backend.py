@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+import pytest
+from cache_backend import (
+    LockTimeout,
+    MemoryBackend,
+    RedisBackend,
+    SQLiteBackend,
+    aioredis,
+    create_backend,
+)
+
+
+def backends(tmp_path):
+    yield MemoryBackend()
+    yield SQLiteBackend(str(tmp_path / "cache.db"))
+    # Point REDIS_URL at a local server (e.g. `redis-server --port 6390`) to cover Redis too
+    if os.getenv("REDIS_URL") and aioredis is not None:
+        yield RedisBackend(os.environ["REDIS_URL"], prefix="strava-mcp-test")
+
+
+async def test_get_set_delete_and_ttl(tmp_path):
+    for backend in backends(tmp_path):
+        await backend.set("activities", "7", {"activities": [{"id": 1}]})
+        assert await backend.get("activities", "7") == {"activities": [{"id": 1}]}
+        assert await backend.get("activities", "8") is None
+
+        await backend.set("token_athlete", "abc", "7", ttl=0.05)
+        assert await backend.get("token_athlete", "abc") == "7"
+        await asyncio.sleep(0.1)
+        assert await backend.get("token_athlete", "abc") is None
+
+        await backend.delete("activities", "7")
+        assert await backend.get("activities", "7") is None
+        await backend.close()
+
+
+async def test_lock_is_exclusive(tmp_path):
+    for backend in backends(tmp_path):
+        inside = 0
+        peak = 0
+
+        async def worker():
+            nonlocal inside, peak
+            async with backend.lock("activities:7"):
+                inside += 1
+                peak = max(peak, inside)
+                await asyncio.sleep(0.01)
+                inside -= 1
+
+        await asyncio.gather(*(worker() for _ in range(5)))
+        assert peak == 1
+
+        async with backend.lock("activities:7"):
+            with pytest.raises(LockTimeout):
+                async with backend.lock("activities:7", timeout=0.1):
+                    pass
+        await backend.close()
+
+
+async def test_sqlite_is_shared_between_workers(tmp_path):
+    # Two backends on one file stand in for two uvicorn workers
+    path = str(tmp_path / "cache.db")
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+
+    await first.set("activities_meta", "7", {"digest": "abc"})
+    assert await second.get("activities_meta", "7") == {"digest": "abc"}
+
+    async with first.lock("activities:7"):
+        with pytest.raises(LockTimeout):
+            async with second.lock("activities:7", timeout=0.1):
+                pass
+    async with second.lock("activities:7", timeout=0.1):
+        pass
+
+    # A holder that died is bypassed once its lease runs out
+    assert await first._try_acquire("activities:8", "dead-worker", lease=0.05)
+    await asyncio.sleep(0.1)
+    async with second.lock("activities:8", timeout=0.5):
+        pass
+
+
+def test_create_backend(tmp_path):
+    assert isinstance(create_backend(None), MemoryBackend)
+    assert isinstance(create_backend(f"sqlite:///{tmp_path}/cache.db"), SQLiteBackend)
+    with pytest.raises(ValueError):
+        create_backend("memcached://localhost")
@@ -0,0 +1,71 @@
+from cache_merge import ActivityChanges, merge_activities, merge_entries
+
+
+def test_updates_and_removals_replay_onto_their_list():
+    theirs = [
+        {"id": 3, "start_date": "2024-03-03", "name": "Tempo"},
+        {"id": 2, "start_date": "2024-03-02", "name": "Long run", "calories": 900},
+        {"id": 1, "start_date": "2024-03-01", "name": "Easy"},
+    ]
+    ours = [
+        {"id": 4, "start_date": "2024-03-04", "name": "Intervals"},
+        {"id": 2, "start_date": "2024-03-02", "name": "Long run with Sam"},
+        {"id": 1, "start_date": "2024-03-01", "name": "Easy"},
+    ]
+    changes = ActivityChanges()
+    changes.update(4)
+    changes.update(2)
+    changes.remove(1)
+
+    merged = merge_activities(theirs, ours, changes)
+
+    # Their new activity 3 survives, ours are replayed, 1 is gone
+    assert [a["id"] for a in merged] == [4, 3, 2]
+    # Fields only the other worker fetched survive our rename
+    assert merged[2] == {"id": 2, "start_date": "2024-03-02", "name": "Long run with Sam", "calories": 900}
+
+
+def test_full_listing_decides_membership():
+    theirs = [{"id": 2, "calories": 900}, {"id": 1}]
+    ours = [{"id": 3}, {"id": 2, "name": "Long run"}]
+    changes = ActivityChanges(replaced=True)
+
+    assert merge_activities(theirs, ours, changes) == [{"id": 3}, {"id": 2, "calories": 900, "name": "Long run"}]
+
+
+def test_remove_then_update_keeps_the_activity():
+    changes = ActivityChanges()
+    assert not changes
+    changes.remove(5)
+    changes.update(5)
+    assert changes.updated == {5} and changes.removed == set()
+    assert changes
+
+
+def test_merge_entries_keeps_newest_metadata():
+    theirs = {
+        "activities": [{"id": 1, "start_date": "2024-03-01"}],
+        "fetched_at": 200.0,
+        "full_fetched_at": 50.0,
+        "complete": True,
+        "stats": {"ytd": 2},
+        "stats_fetched_at": 300.0,
+    }
+    ours = {
+        "activities": [{"id": 2, "start_date": "2024-03-02"}, {"id": 1, "start_date": "2024-03-01"}],
+        "fetched_at": 100.0,
+        "full_fetched_at": 90.0,
+        "complete": False,
+        "stats": {"ytd": 1},
+        "stats_fetched_at": 10.0,
+    }
+    changes = ActivityChanges()
+    changes.update(2)
+
+    merged = merge_entries(theirs, ours, changes)
+
+    assert [a["id"] for a in merged["activities"]] == [2, 1]
+    assert merged["fetched_at"] == 200.0
+    assert merged["full_fetched_at"] == 90.0
+    assert merged["complete"] is True
+    assert merged["stats"] == {"ytd": 2}
@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+
+
+def deauthorize(athlete_id):
+    return {
+        "object_type": "athlete",
+        "aspect_type": "update",
+        "object_id": athlete_id,
+        "owner_id": athlete_id,
+        "subscription_id": 99,
+        "event_time": 1700000000,
+        "updates": {"authorized": "false"},
+    }
+
+
+def test_deauthorization_purges_token_scoped_responses(server):
+    token = "token-of-42"
+    # Cached before the athlete was known, so scoped by token
+    scope = server.cache_scope(token)
+    assert scope.startswith("token:")
+    server.response_cache.set("map", server.endpoint_cache.make_key(scope, 11), "map", 60)
+    server.response_cache.set("map", server.endpoint_cache.make_key("42", 12), "map", 60)
+    # Only the persistent map knows the token (e.g. after a restart)
+    server.token_athletes.set(token, "42")
+
+    response = TestClient(server.app).post("/webhook", json=deauthorize(42))
+
+    assert response.status_code == 200
+    assert server.response_cache.get("map", server.endpoint_cache.make_key(scope, 11)) is None
+    assert server.response_cache.get("map", server.endpoint_cache.make_key("42", 12)) is None
+    assert server.token_athletes.get(token) is None
+
+
+def test_webhook_from_another_subscription_is_rejected(server):
+    event = dict(deauthorize(42), subscription_id=7)
+    assert TestClient(server.app).post("/webhook", json=event).status_code == 403
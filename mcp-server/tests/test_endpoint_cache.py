@@ -0,0 +1,72 @@
+import asyncio
+
+from endpoint_cache import EndpointCache
+from ttl_cache import TTLCache
+
+SCOPES = {"tok-a": "1", "tok-b": "2"}
+
+
+def make_cache():
+    return EndpointCache(TTLCache(), lambda token: SCOPES[token])
+
+
+async def test_per_athlete_scoping_and_invalidation():
+    endpoint_cache = make_cache()
+    calls = []
+
+    @endpoint_cache.cached("laps", ttl=60)
+    async def get_laps(activity_id: int, x_strava_token: str = None):
+        calls.append((activity_id, x_strava_token))
+        return [{"lap": len(calls)}]
+
+    assert await get_laps(5, x_strava_token="tok-a") == [{"lap": 1}]
+    assert await get_laps(activity_id=5, x_strava_token="tok-a") == [{"lap": 1}]
+    assert await get_laps(5, x_strava_token="tok-b") == [{"lap": 2}]
+    assert len(calls) == 2
+
+    # Only athlete 1's entries for activity 5 go (not activity 55)
+    await get_laps(55, x_strava_token="tok-a")
+    assert endpoint_cache.invalidate("laps", "tok-a", 5) == 1
+    assert await get_laps(5, x_strava_token="tok-a") == [{"lap": 4}]
+    assert await get_laps(55, x_strava_token="tok-a") == [{"lap": 3}]
+
+
+async def test_shared_entries():
+    endpoint_cache = make_cache()
+    calls = []
+
+    @endpoint_cache.cached("leaderboard", ttl=60, per_athlete=False)
+    async def get_leaderboard(segment_id: int, gender: str = None, x_strava_token: str = None):
+        calls.append(segment_id)
+        return {"entries": []}
+
+    await get_leaderboard(9, x_strava_token="tok-a")
+    await get_leaderboard(9, x_strava_token="tok-b")
+    await get_leaderboard(9, gender="F", x_strava_token="tok-b")
+    assert calls == [9, 9]
+
+
+async def test_stale_while_revalidate():
+    endpoint_cache = make_cache()
+    calls = []
+    release = asyncio.Event()
+
+    @endpoint_cache.cached("kudos", ttl=0, stale_ttl=60)
+    async def get_kudos(activity_id: int, x_strava_token: str = None):
+        calls.append(activity_id)
+        if len(calls) > 1:
+            await release.wait()
+        return len(calls)
+
+    assert await get_kudos(1, x_strava_token="tok-a") == 1
+    # Stale: served immediately, one refresh started however many callers
+    assert await get_kudos(1, x_strava_token="tok-a") == 1
+    assert await get_kudos(1, x_strava_token="tok-a") == 1
+    await asyncio.sleep(0)
+    assert len(calls) == 2
+
+    release.set()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert endpoint_cache.get_stats()["revalidations"] == 1
+    assert await get_kudos(1, x_strava_token="tok-a") == 2
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import executors
+from activity_summary import summarize_by_year, summarize_rows, summary_rows
+
+ACTIVITIES = [
+    {"start_date_local": "2024-05-01T07:00:00Z", "sport_type": "Run", "distance": 10000.0,
+     "total_elevation_gain": 50.0, "moving_time": 3000},
+    {"start_date_local": "2024-05-03T07:00:00Z", "type": "Ride", "distance": 40000.0,
+     "total_elevation_gain": 300.0, "moving_time": 5400},
+    {"start_date_local": "2023-12-31T07:00:00Z", "sport_type": "Run", "distance": 5000.0,
+     "total_elevation_gain": 10.0, "moving_time": 1500},
+    {"name": "undated"},
+]
+
+
+async def test_run_cpu_bound_uses_process_pool_for_large_inputs(monkeypatch):
+    rows = summary_rows(ACTIVITIES)
+    expected = summarize_by_year(ACTIVITIES)
+    assert expected["2024"]["total_activities"] == 2
+    assert expected["2024"]["by_month"]["2024-05"]["by_type"]["Ride"]["distance_miles"] == 24.85
+
+    before = executors.get_stats()
+    assert await executors.run_cpu_bound(summarize_rows, rows, size=len(rows)) == expected
+    assert executors.get_stats()["thread_tasks"] == before["thread_tasks"] + 1
+
+    monkeypatch.setattr("backend.executors.PROCESS_POOL_MIN_ITEMS", 1)
+    try:
+        assert await executors.run_cpu_bound(summarize_rows, rows, size=len(rows)) == expected
+        assert executors.get_stats()["process_tasks"] == before["process_tasks"] + 1
+    finally:
+        executors.shutdown()
+
+
+async def test_loop_lag_monitor_sees_blocking_work():
+    monitor = executors.EventLoopLagMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.03)
+    time.sleep(0.1)  # Block the loop
+    await asyncio.sleep(0.03)
+    monitor.stop()
+    stats = monitor.get_stats()
+    assert stats["samples"] >= 2
+    assert stats["max_ms"] >= 80
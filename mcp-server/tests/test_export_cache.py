@@ -0,0 +1,50 @@
+import os
+
+from export_cache import ExportCache
+
+
+def test_commit_publishes_and_replaces_old_versions(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    assert cache.get("route", 7, "2024-01-01T00:00:00Z", "gpx") is None
+
+    writer = cache.writer("route", 7, "2024-01-01T00:00:00Z", "gpx")
+    writer.write(b"<gpx>")
+    writer.write(b"</gpx>")
+    # Nothing is visible until the whole body arrived
+    assert cache.get("route", 7, "2024-01-01T00:00:00Z", "gpx") is None
+    writer.commit()
+
+    path = cache.get("route", 7, "2024-01-01T00:00:00Z", "gpx")
+    assert open(path, "rb").read() == b"<gpx></gpx>"
+
+    # Same route as TCX is a separate file; a newer GPX replaces the old one
+    tcx = cache.writer("route", 7, "2024-01-01T00:00:00Z", "tcx")
+    tcx.write(b"tcx")
+    tcx.commit()
+    newer = cache.writer("route", 7, "2024-02-01T00:00:00Z", "gpx")
+    newer.write(b"new")
+    newer.commit()
+    assert not os.path.exists(path)
+    assert cache.get("route", 7, "2024-02-01T00:00:00Z", "gpx") is not None
+    assert cache.get("route", 7, "2024-01-01T00:00:00Z", "tcx") is not None
+    assert cache.get_stats()["files"] == 2
+
+
+def test_discard_leaves_nothing_behind(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    writer = cache.writer("route", 7, "v1", "gpx")
+    writer.write(b"partial")
+    writer.discard()
+    assert os.listdir(tmp_path) == []
+    assert cache.get("route", 7, "v1", "gpx") is None
+
+
+def test_remove_object_only_touches_matching_kinds(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    for kind, obj_id in (("gpx2023", 42), ("tcx2024", 42), ("gpx2024", 421), ("route", 42)):
+        writer = cache.writer(kind, obj_id, "job", "zip")
+        writer.write(b"zip")
+        writer.commit()
+
+    assert cache.remove_object(42, kind_pattern=r"(?:gpx|tcx)\d+") == 2
+    assert sorted(os.listdir(tmp_path)) == ["gpx2024_421_job.zip", "route_42_job.zip"]
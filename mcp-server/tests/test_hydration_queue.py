@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from hydration_queue import HydrationQueue, HydrationWorker, hydration_jobs
+
+
+class IdleLimiter:
+    def has_headroom(self, reserve_15m=0, reserve_daily=0):
+        return True
+
+    def seconds_until_available(self, reserve_15m=0, reserve_daily=0):
+        return 0.0
+
+    def get_stats(self):
+        return {"15m_used": 0, "15m_limit": 100, "daily_used": 0, "daily_limit": 800}
+
+
+def _recent(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def test_jobs_skip_low_value_and_old_activities():
+    jobs = hydration_jobs([
+        {"id": 1, "type": "Run", "name": "Morning Run", "start_date": _recent(3)},
+        {"id": 2, "type": "Walk", "name": "Dog walk", "start_date": _recent(3)},
+        {"id": 3, "type": "Ride", "name": "Old ride", "start_date": _recent(800)},
+        {"id": 4, "type": "Run", "name": "Race day", "start_date": _recent(5)},
+    ])
+    by_id = {activity_id: priority for activity_id, priority, _ in jobs}
+    assert set(by_id) == {1, 4}
+    assert by_id[4] > by_id[1]
+
+
+def test_queue_survives_reopen_and_retries_failures(tmp_path):
+    db = str(tmp_path / "jobs.db")
+    queue = HydrationQueue(db)
+    queue.enqueue("a", [(1, 10, "2024-01-01"), (2, 50, "2024-01-02")])
+    assert queue.next_job("a") == 2
+    queue.mark_done("a", 2)
+    queue.mark_failed("a", 1, "boom")
+
+    reopened = HydrationQueue(db)
+    assert reopened.counts("a") == {"pending": 1, "done": 1, "failed": 0}
+    reopened.mark_failed("a", 1, "boom")
+    reopened.mark_failed("a", 1, "boom")
+    assert reopened.counts("a") == {"pending": 0, "done": 1, "failed": 1}
+    # Queued again without details (its record was replaced): a done job is reopened,
+    # a failed one is not
+    reopened.enqueue("a", [(1, 10, "2024-01-01"), (2, 99, "2024-01-02")])
+    assert reopened.counts("a") == {"pending": 1, "done": 0, "failed": 1}
+    assert reopened.next_job("a") == 2
+
+
+async def test_worker_round_robins_athletes(tmp_path):
+    worker = HydrationWorker(HydrationQueue(str(tmp_path / "jobs.db")), IdleLimiter(), 20, 100)
+    worker.IDLE_SLEEP = 0.01
+    order = []
+
+    async def fetch(token, activity_id):
+        order.append((token, activity_id))
+        if activity_id == 99:
+            raise HTTPException(status_code=404, detail="gone")
+
+    worker.configure(fetch=fetch, on_progress=lambda: None)
+    worker.submit("big", "tok-big", [(i, 100 - i, "") for i in range(1, 4)])
+    worker.submit("small", "tok-small", [(99, 1, "")])
+    await asyncio.wait_for(worker._task, timeout=2)
+
+    assert order[:2] in ([("tok-big", 1), ("tok-small", 99)], [("tok-small", 99), ("tok-big", 1)])
+    assert worker.get_stats("big")["done"] == 3
+    assert worker.get_stats("small")["failed"] == 1
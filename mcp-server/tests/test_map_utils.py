@@ -0,0 +1,59 @@
+import math
+
+import polyline
+from map_utils import create_ascii_map, create_html_map, simplify_route
+
+
+def test_simplify_keeps_shape_and_endpoints():
+    # Straight line with noise-free midpoints collapses to its endpoints
+    line = [(45.0 + i * 1e-4, 7.0) for i in range(1000)]
+    assert simplify_route(line) == [line[0], line[-1]]
+
+    # A corner survives
+    corner = [(45.0, 7.0 + i * 1e-4) for i in range(100)] + [(45.0 + i * 1e-4, 7.0099) for i in range(1, 100)]
+    simplified = simplify_route(corner)
+    assert simplified[0] == corner[0] and simplified[-1] == corner[-1]
+    assert (45.0, 7.0099) in [(round(a, 6), round(b, 6)) for a, b in simplified]
+
+
+def test_simplify_long_loop():
+    # ~30k-point closed loop (start == end) with GPS-like jitter
+    n = 30000
+    loop = [
+        (45.0 + 0.2 * math.sin(2 * math.pi * i / n) + 1e-6 * (i % 7),
+         7.0 + 0.2 * math.cos(2 * math.pi * i / n))
+        for i in range(n)
+    ]
+    loop.append(loop[0])
+    simplified = simplify_route(loop)
+    assert 50 < len(simplified) < 3000
+    assert simplified[0] == loop[0] and simplified[-1] == loop[-1]
+
+
+def test_html_map_splices_coordinates():
+    coords = [(45.0, 7.0), (45.001, 7.002), (45.003, 7.001)]
+    html = create_html_map({
+        "name": "Loop {weird}", "distance": 1000, "moving_time": 300,
+        "map": {"polyline": polyline.encode(coords)},
+    })
+    assert "const coordinates = [[45.00000,7.00000]," in html
+    assert "L.polyline(coordinates, {color: 'red', weight: 3})" in html
+
+
+def test_ascii_map_degenerate_bounds():
+    # Single point and a due north-south route used to divide by zero
+    single = create_ascii_map([(45.0, 7.0)], width=10, height=5)
+    assert "E" in single
+    north_south = create_ascii_map([(45.0, 7.0), (45.01, 7.0), (45.02, 7.0)], width=11, height=3)
+    rows = [r for r in north_south.splitlines() if r.startswith("│")]
+    assert [r.index(c) for r, c in zip(rows, "E•S")] == [6, 6, 6]
+
+
+def test_ascii_map_density_shading():
+    # Many points in one corner, one point elsewhere
+    route = [(45.0, 7.0)] * 500 + [(45.0, 7.01), (45.01, 7.01)] + [(45.0, 7.0)]
+    plain = create_ascii_map(route, width=5, height=2)
+    shaded = create_ascii_map(route, width=5, height=2, shading=True)
+    assert "█" not in plain
+    assert "·" in shaded or "•" in shaded
+    assert "sparse to dense" in shaded
@@ -0,0 +1,24 @@
+from metrics import Histogram, Registry, span, trace
+
+
+def test_histogram_render():
+    registry = Registry()
+    latency = Histogram("test_seconds", "Latency.", ["stage"], buckets=(0.1, 1.0), registry=registry)
+    latency.observe(0.5, stage="fetch")
+    latency.observe(2, stage="fetch")
+    text = registry.render()
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{stage="fetch",le="0.1"} 0' in text
+    assert 'test_seconds_bucket{stage="fetch",le="1"} 1' in text
+    assert 'test_seconds_bucket{stage="fetch",le="+Inf"} 2' in text
+    assert 'test_seconds_count{stage="fetch"} 2' in text
+
+
+def test_spans_record_into_the_request_trace():
+    with trace("GET /test") as request_trace:
+        with span("strava_api"):
+            pass
+        with span("strava_api"):
+            pass
+    assert list(request_trace.stages) == ["strava_api"]
+
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from request_scheduler import Priority, QuotaWaitTimeout, StravaRequestScheduler
+
+
+class FakeLimiter:
+    """In-memory stand-in for StravaRateLimiter with a tiny window."""
+
+    LIMIT_15_MIN = 4
+    LIMIT_DAILY = 1000
+
+    def __init__(self):
+        self.used = 0
+        self.free_after = 0.05
+
+    def has_headroom(self, reserve_15m=0, reserve_daily=0):
+        return self.used < self.LIMIT_15_MIN - reserve_15m
+
+    def seconds_until_available(self, reserve_15m=0, reserve_daily=0):
+        return 0.0 if self.has_headroom(reserve_15m, reserve_daily) else self.free_after
+
+    def record_attempt(self):
+        self.used += 1
+
+
+def _scheduler(limiter):
+    sched = StravaRequestScheduler(limiter)
+    sched.INTERACTIVE_RESERVE_15M = 2
+    return sched
+
+
+async def test_background_work_leaves_interactive_headroom():
+    limiter = FakeLimiter()
+    sched = _scheduler(limiter)
+
+    await sched.acquire(Priority.HYDRATION, "a")
+    await sched.acquire(Priority.HYDRATION, "a")
+    blocked = asyncio.create_task(sched.acquire(Priority.HYDRATION, "a"))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    # Interactive requests can still use the reserved slots
+    await sched.acquire(Priority.INTERACTIVE, "b")
+    await sched.acquire(Priority.INTERACTIVE, "b")
+    assert limiter.used == 4
+
+    # Once the window frees up, the queued background request proceeds instead of failing
+    limiter.used = 0
+    await asyncio.wait_for(blocked, timeout=1)
+    assert sched.get_stats()["hydration"]["granted"] == 3
+
+
+async def test_athletes_are_served_round_robin_within_a_priority():
+    limiter = FakeLimiter()
+    limiter.used = limiter.LIMIT_15_MIN
+    sched = _scheduler(limiter)
+    order = []
+
+    async def request(athlete, n):
+        await sched.acquire(Priority.BULK, athlete)
+        order.append((athlete, n))
+
+    tasks = [asyncio.create_task(request("big", n)) for n in range(3)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(request("small", 0)))
+    await asyncio.sleep(0.01)
+    assert order == []
+
+    limiter.used = 0
+    limiter.LIMIT_15_MIN = 100
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+    assert order[:2] == [("big", 0), ("small", 0)]
+
+
+async def test_interactive_wait_is_bounded():
+    limiter = FakeLimiter()
+    limiter.used = limiter.LIMIT_15_MIN
+    limiter.free_after = 10
+    sched = _scheduler(limiter)
+
+    with pytest.raises(QuotaWaitTimeout):
+        await sched.acquire(Priority.INTERACTIVE, "a", max_wait=0.05)
+    assert sched.get_stats()["interactive"]["queued"] == 0
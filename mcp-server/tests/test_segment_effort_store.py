@@ -0,0 +1,48 @@
+from segment_effort_store import SegmentEffortStore
+
+
+def _effort(effort_id, day, segment_id=5, elapsed=300):
+    return {
+        "id": effort_id,
+        "segment": {"id": segment_id, "name": "Commute Hill"},
+        "activity": {"id": 1000 + effort_id},
+        "start_date_local": f"2024-03-{day:02d}T08:00:00Z",
+        "elapsed_time": elapsed,
+    }
+
+
+def test_history_is_deduplicated_and_paged_oldest_first(tmp_path):
+    store = SegmentEffortStore(str(tmp_path / "efforts.db"))
+    # From an activity detail, then the same effort again from a listing
+    store.ingest("a", [_effort(2, 10), _effort(9, 10, segment_id=6)])
+    store.ingest("a", [_effort(1, 3), _effort(2, 10, elapsed=290), _effort(3, 20)])
+
+    assert store.count("a", 5) == 3
+    assert [e["id"] for e in store.page("a", 5, page=1, per_page=2)] == [1, 2]
+    assert [e["id"] for e in store.page("a", 5, page=2, per_page=2)] == [3]
+    assert store.page("a", 5, per_page=10)[1]["elapsed_time"] == 290
+    assert store.latest_start("a", 5) == "2024-03-20T08:00:00Z"
+    assert store.count("b", 5) == 0
+
+
+def test_sync_state_stays_complete(tmp_path):
+    store = SegmentEffortStore(str(tmp_path / "efforts.db"))
+    assert store.sync_state("a", 5) == {"complete": False, "synced_at": None}
+    store.mark_synced("a", 5, complete=True)
+    store.mark_synced("a", 5, complete=False)
+    assert store.sync_state("a", 5)["complete"] is True
+
+
+def test_listing_watermark_ignores_hydrated_efforts(tmp_path):
+    store = SegmentEffortStore(str(tmp_path / "efforts.db"))
+    store.ingest("a", [_effort(1, 3)])
+    store.mark_synced("a", 5, complete=True, listed_until="2024-03-03T08:00:00Z")
+    # A newer activity is hydrated: its effort is stored, but the next top-up
+    # must still start from the last listing
+    store.ingest("a", [_effort(2, 20)])
+    assert store.listed_until("a", 5) == "2024-03-03T08:00:00Z"
+
+    store.mark_synced("a", 5, complete=True, listed_until="2024-03-20T08:00:00Z")
+    store.mark_synced("a", 5, complete=True)  # An empty top-up keeps the watermark
+    assert store.listed_until("a", 5) == "2024-03-20T08:00:00Z"
+    assert store.listed_until("a", 6) is None
@@ -0,0 +1,69 @@
+import numpy as np
+from stream_analytics import (
+    analyze_streams,
+    best_efforts,
+    decoupling,
+    power_curve,
+    time_in_zones,
+)
+from streams_store import StreamsStore
+
+
+def test_power_curve_finds_best_window_and_zeroes_pauses():
+    time = np.arange(0, 600, dtype=float)
+    watts = np.full(600, 150.0)
+    watts[100:160] = 400.0  # One hard minute
+    curve = power_curve(time, watts, durations=(60, 300))
+    assert curve["1m"] == 400
+    assert curve["5m"] == 200  # (60 * 400 + 240 * 150) / 300
+
+    # A 10 minute recording gap counts as zero watts, not interpolated effort
+    paused = np.concatenate([np.arange(0, 60), np.arange(660, 720)]).astype(float)
+    assert power_curve(paused, np.full(120, 300.0), durations=(300,))["5m"] < 100
+
+
+def test_best_efforts_uses_fastest_stretch():
+    # 1 km at 5 m/s, then 1 km at 4 m/s
+    time = np.arange(0, 451, dtype=float)
+    distance = np.where(time <= 200, time * 5, 1000 + (time - 200) * 4)
+    efforts = best_efforts(time, distance, {"1k": 1000.0, "2k": 2000.0, "5k": 5000.0})
+    assert efforts == {"1k": "3:20", "2k": "7:30"}
+
+
+def test_zones_and_decoupling():
+    time = np.arange(0, 3600, dtype=float)
+    heartrate = np.where(time < 1800, 140.0, 154.0)
+    watts = np.full(3600, 200.0)
+
+    zones = [{"min": 0, "max": 150}, {"min": 150, "max": -1}]
+    assert time_in_zones(time, heartrate, zones) == [1800, 1799]
+    # Same output for ~10% more heartbeats: ~9% decoupling
+    assert decoupling(time, heartrate, watts) == 9.1
+
+    result = analyze_streams({"time": time, "heartrate": heartrate, "watts": watts, "altitude": np.zeros(3600)})
+    assert result["power_curve_w"]["1h"] == 200
+    assert result["max_hr"] == 154
+    assert result["elevation_gain_m"] == 0.0
+    assert analyze_streams({"time": np.array([0.0])}) == {}
+
+
+def test_null_samples_are_skipped(tmp_path):
+    # Strava sends null for samples a sensor missed; the store hands them back as object arrays
+    n = 1200
+    watts = [None] + [200] * (n - 1)
+    heartrate = [150] * (n - 2) + [None, None]
+    store = StreamsStore(str(tmp_path))
+    store.put("activity", 1, {
+        "time": {"data": list(range(n))},
+        "watts": {"data": watts},
+        "heartrate": {"data": heartrate},
+        "velocity_smooth": {"data": [3.0] * n},
+        "altitude": {"data": [None] * n},
+    }, ["time", "watts", "heartrate", "velocity_smooth", "altitude"])
+
+    result = analyze_streams(store.get_arrays("activity", 1))
+    assert result["power_curve_w"]["5m"] == 200
+    assert result["avg_power_w"] == 200
+    assert result["avg_hr"] == 150
+    assert result["max_hr"] == 150
+    assert "elevation_gain_m" not in result
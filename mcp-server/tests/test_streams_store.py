@@ -0,0 +1,57 @@
+import numpy as np
+from streams_store import StreamsStore
+
+STREAMS = {
+    "time": {"data": [0, 1, 2, 5, 6], "series_type": "distance", "original_size": 5, "resolution": "high"},
+    "distance": {"data": [0.0, 2.3, 5.1, 9.9, 14.2], "series_type": "distance", "original_size": 5, "resolution": "high"},
+    "latlng": {"data": [[37.771, -122.41], [37.7711, -122.4101], [37.7712, -122.4102], [37.7713, -122.41], [37.7714, -122.41]]},
+    "moving": {"data": [False, True, True, True, True]},
+    "watts": {"data": [None, 100, 120, 130, 90]},
+}
+
+
+def test_round_trip_is_lossless(tmp_path):
+    store = StreamsStore(str(tmp_path))
+    store.put("activity", 1, STREAMS, ["time", "distance", "latlng", "moving", "watts", "heartrate"])
+
+    result = store.get_json("activity", 1, ["time", "distance", "latlng", "moving", "watts"])
+    for stream_type, stream in STREAMS.items():
+        assert result[stream_type]["data"] == stream["data"]
+    assert result["time"]["series_type"] == "distance"
+
+    as_list = store.get_json("activity", 1, ["time"], key_by_type=False)
+    assert as_list == [{"type": "time", **STREAMS["time"]}]
+
+
+def test_requested_but_missing_keys_are_still_a_hit(tmp_path):
+    store = StreamsStore(str(tmp_path))
+    store.put("activity", 1, STREAMS, ["time", "heartrate"])
+
+    # Strava returned no heartrate stream: don't go back and ask again
+    assert "heartrate" not in store.get_json("activity", 1, ["time", "heartrate"])
+    # A key that was never requested is a miss
+    assert store.get_json("activity", 1, ["cadence"]) is None
+    assert store.get_json("activity", 2) is None
+
+
+def test_arrays_and_max_age(tmp_path):
+    store = StreamsStore(str(tmp_path))
+    store.put("route", 9, [{"type": "altitude", "data": [10.5, 11.0, 12.4]}], [])
+
+    arrays = store.get_arrays("route", 9)
+    np.testing.assert_allclose(arrays["altitude"], [10.5, 11.0, 12.4])
+    assert store.get_binary("route", 9).startswith(b"STRMS1")
+    assert store.get_json("route", 9, max_age=-1) is None
+
+
+def test_put_adds_to_existing_streams(tmp_path):
+    store = StreamsStore(str(tmp_path))
+    store.put("activity", 1, {"time": STREAMS["time"], "watts": STREAMS["watts"]}, ["time", "watts", "heartrate"])
+    store.put("activity", 1, {"time": STREAMS["time"], "distance": STREAMS["distance"]}, ["time", "distance"])
+
+    # Keys from both requests are hits, including heartrate (requested, not returned)
+    result = store.get_json("activity", 1, ["time", "distance", "watts", "heartrate"])
+    assert set(result) == {"time", "distance", "watts"}
+    assert result["watts"]["data"] == STREAMS["watts"]["data"]
+    assert result["distance"]["data"] == STREAMS["distance"]["data"]
+    np.testing.assert_allclose(store.get_arrays("activity", 1, ["time"])["time"], STREAMS["time"]["data"])
@@ -0,0 +1,39 @@
+import time
+
+from token_map import TokenAthleteMap, token_fingerprint
+
+
+def test_lru_eviction_and_expiry():
+    tokens = TokenAthleteMap(max_entries=2, max_age=60)
+    tokens.set("a", "1")
+    tokens.set("b", "2")
+    assert tokens.get("a") == "1"  # "b" is now least recently used
+    tokens.set("c", "3")
+    assert tokens.get("b") is None
+    assert (tokens.get("a"), tokens.get("c")) == ("1", "3")
+    assert tokens.get_stats()["evictions"] == 1
+
+    stale = TokenAthleteMap(max_age=0.01)
+    stale.set("a", "1")
+    time.sleep(0.02)
+    assert stale.get("a") is None
+    assert len(stale) == 0
+
+
+def test_persistence_and_forget(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    tokens = TokenAthleteMap(persist_path=path)
+    tokens.set("a", "1")
+    tokens.set("b", "1")
+    tokens.set("c", "2")
+    tokens.save()
+
+    # Only fingerprints reach the disk
+    contents = open(path).read()
+    assert token_fingerprint("a") in contents and '"a"' not in contents
+
+    restored = TokenAthleteMap(persist_path=path)
+    restored.load()
+    assert restored.get("b") == "1"
+    assert restored.forget_athlete("1") == 2
+    assert (restored.get("a"), restored.get("c")) == (None, "2")
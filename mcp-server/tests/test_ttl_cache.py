@@ -0,0 +1,73 @@
+import time
+
+from ttl_cache import TTLCache
+
+
+def test_hit_miss_and_expiry():
+    cache = TTLCache()
+    assert cache.get("segment", 1) is None
+    cache.set("segment", 1, {"name": "Hill"}, ttl=60)
+    assert cache.get("segment", 1) == {"name": "Hill"}
+    # Keys are normalized to strings
+    assert cache.get("segment", "1") == {"name": "Hill"}
+
+    cache.set("gear", "b1", {"name": "Bike"}, ttl=-1)
+    assert cache.get("gear", "b1") is None
+
+    stats = cache.get_stats()["namespaces"]
+    assert stats["segment"]["hits"] == 2
+    assert stats["segment"]["misses"] == 1
+    assert stats["gear"]["misses"] == 1
+    assert stats["gear"]["entries"] == 0
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1, 1, ttl=60)
+    cache.set("a", 2, 2, ttl=60)
+    cache.get("a", 1)  # 2 is now least recently used
+    cache.set("b", 3, 3, ttl=60)
+    assert cache.get("a", 2) is None
+    assert cache.get("a", 1) == 1
+    assert cache.get_stats()["namespaces"]["a"]["evictions"] == 1
+
+    cache = TTLCache(max_bytes=30)
+    cache.set("a", 1, "x" * 10, ttl=60)
+    cache.set("a", 2, "y" * 10, ttl=60)
+    cache.set("a", 3, "z" * 10, ttl=60)
+    assert cache.get("a", 1) is None
+    assert cache.get_stats()["bytes"] <= 30
+
+
+def test_invalidate():
+    cache = TTLCache()
+    cache.set("routes", "7:50", [1], ttl=60)
+    cache.set("routes", "8:50", [2], ttl=60)
+    cache.set("clubs", "7", [3], ttl=60)
+    assert cache.invalidate("routes", "7:50") == 1
+    assert cache.invalidate("routes") == 1
+    assert cache.get("clubs", "7") == [3]
+
+    # A scope prefix across every namespace (e.g. all of one athlete's responses)
+    cache.set("map", "7:1", "m", ttl=60)
+    cache.set("laps", "70:1", [4], ttl=60)
+    assert cache.invalidate_prefix(None, "7") == 2
+    assert cache.get("laps", "70:1") == [4]
+
+
+def test_persistence_round_trip(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = TTLCache(persist_path=path)
+    cache.set("segment", 1, {"name": "Hill"}, ttl=60)
+    entry = cache.set("leaderboard", 1, {"entries": []}, ttl=60)
+    cache.set("gear", "old", {}, ttl=0.01)
+    time.sleep(0.02)
+    cache.save()
+
+    restored = TTLCache(persist_path=path)
+    restored.load()
+    assert restored.get("segment", 1) == {"name": "Hill"}
+    restored_entry = restored.get_entry("leaderboard", 1)
+    assert restored_entry.stored_at == entry.stored_at
+    assert abs(restored_entry.expires_at - entry.expires_at) < 1
+    assert restored.get("gear", "old") is None
@@ -0,0 +1,59 @@
+import pytest
+from webhooks import WebhookEvent, insert_activity, patch_activity, remove_activity
+
+
+def event_payload(**overrides):
+    payload = {
+        "object_type": "activity", "object_id": 3, "aspect_type": "update",
+        "owner_id": 7, "subscription_id": 1, "event_time": 1700000000,
+        "updates": {"title": "Evening Ride"},
+    }
+    payload.update(overrides)
+    return payload
+
+
+def test_parse_event():
+    event = WebhookEvent.from_payload(event_payload())
+    assert (event.object_type, event.object_id, event.owner_id) == ("activity", 3, "7")
+    assert not event.is_deauthorization
+
+    revoked = WebhookEvent.from_payload(event_payload(
+        object_type="athlete", object_id=7, updates={"authorized": "false"}
+    ))
+    assert revoked.is_deauthorization
+
+    with pytest.raises(ValueError):
+        WebhookEvent.from_payload({"object_type": "activity"})
+    with pytest.raises(ValueError):
+        WebhookEvent.from_payload(event_payload(aspect_type="archive"))
+
+
+def test_patch_activity():
+    record = {"id": 3, "name": "Morning Ride", "type": "Ride", "private": False}
+    assert patch_activity(record, {"title": "Evening Ride", "type": "Run", "private": "true"})
+    assert record == {"id": 3, "name": "Evening Ride", "type": "Run", "sport_type": "Run", "private": True}
+
+    # Anything else needs the full activity
+    assert not patch_activity(record, {})
+    assert not patch_activity(record, {"title": "x", "gear": "b1"})
+    assert record["name"] == "Evening Ride"
+
+
+def test_insert_and_remove_keep_newest_first():
+    activities = [
+        {"id": 3, "start_date": "2024-03-01T00:00:00Z"},
+        {"id": 1, "start_date": "2024-01-01T00:00:00Z"},
+    ]
+    updated = insert_activity(activities, {"id": 2, "start_date": "2024-02-01T00:00:00Z"})
+    assert [a["id"] for a in updated] == [3, 2, 1]
+    # A new list, so id maps built from the old one are rebuilt
+    assert updated is not activities
+
+    replaced = insert_activity(updated, {"id": 3, "start_date": "2024-03-01T00:00:00Z", "name": "new"})
+    assert [a["id"] for a in replaced] == [3, 2, 1]
+    assert replaced[0]["name"] == "new"
+
+    kept, removed = remove_activity(replaced, 2)
+    assert [a["id"] for a in kept] == [3, 1]
+    assert removed["id"] == 2
+    assert remove_activity(kept, 99) == (kept, None)
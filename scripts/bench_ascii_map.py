@@ -0,0 +1,67 @@
+"""
+Benchmark the ASCII map rasterizer over synthetic routes of increasing length.
+
+    python scripts/bench_ascii_map.py
+
+Compares map_utils.create_ascii_map against the previous per-point loop.
+"""
+import math
+import os
+import sys
+import time
+from math import floor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mcp-server", "src"))
+
+from map_utils import create_ascii_map  # noqa: E402
+
+LENGTHS = (1_000, 10_000, 50_000, 200_000)
+REPEATS = 5
+
+
+def synthetic_route(n):
+    """A wandering loop, roughly what a long ride looks like."""
+    return [
+        (45.0 + 0.3 * math.sin(2 * math.pi * i / n) + 0.02 * math.sin(i / 150),
+         7.0 + 0.4 * math.cos(2 * math.pi * i / n) + 0.02 * math.cos(i / 90))
+        for i in range(n)
+    ]
+
+
+def legacy_ascii_map(coordinates, width=60, height=20):
+    lats = [lat for lat, _ in coordinates]
+    lngs = [lng for _, lng in coordinates]
+    min_lat, max_lat = min(lats), max(lats)
+    min_lng, max_lng = min(lngs), max(lngs)
+    map_array = [[' ' for _ in range(width)] for _ in range(height)]
+    for lat, lng in coordinates:
+        x = floor((lng - min_lng) / (max_lng - min_lng) * (width - 1))
+        y = floor((max_lat - lat) / (max_lat - min_lat) * (height - 1))
+        map_array[min(max(y, 0), height - 1)][min(max(x, 0), width - 1)] = '•'
+    map_str = ''
+    for row in map_array:
+        map_str += '│' + ''.join(row) + '│\n'
+    return map_str
+
+
+def best_of(fn, *args, **kwargs):
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    print(f"{'points':>8} {'legacy ms':>10} {'numpy ms':>10} {'shaded ms':>10} {'speedup':>8}")
+    for n in LENGTHS:
+        route = synthetic_route(n)
+        legacy = best_of(legacy_ascii_map, route)
+        fast = best_of(create_ascii_map, route)
+        shaded = best_of(create_ascii_map, route, shading=True)
+        print(f"{n:>8} {legacy:>10.2f} {fast:>10.2f} {shaded:>10.2f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Local stand-in for Strava's push subscription service.
+
+Runs the validation handshake against the MCP server's /webhook endpoint and
+then posts synthetic events, so webhook handling can be exercised without a
+public URL or a real subscription:
+
+    STRAVA_WEBHOOK_VERIFY_TOKEN=dev python mcp-server/src/strava_http_server.py
+    python scripts/strava_webhook_standin.py --verify-token dev --owner 7 create 123
+    python scripts/strava_webhook_standin.py --verify-token dev --owner 7 update 123 --title "Evening Ride"
+    python scripts/strava_webhook_standin.py --verify-token dev --owner 7 delete 123
+    python scripts/strava_webhook_standin.py --verify-token dev --owner 7 deauthorize
+
+Afterwards, /cache/stats on the server shows the outcome counters under "webhooks".
+"""
+import argparse
+import secrets
+import sys
+import time
+
+import httpx
+
+
+def handshake(client: httpx.Client, url: str, verify_token: str) -> bool:
+    challenge = secrets.token_hex(8)
+    resp = client.get(url, params={
+        "hub.mode": "subscribe", "hub.verify_token": verify_token, "hub.challenge": challenge,
+    })
+    ok = resp.status_code == 200 and resp.json().get("hub.challenge") == challenge
+    print(f"Handshake: {resp.status_code} {'ok' if ok else resp.text}")
+    return ok
+
+
+def build_event(args) -> dict:
+    if args.event == "deauthorize":
+        object_type, aspect_type, object_id = "athlete", "update", args.owner
+        updates = {"authorized": "false"}
+    else:
+        object_type, aspect_type, object_id = "activity", args.event, args.activity_id
+        updates = {}
+        if args.title is not None:
+            updates["title"] = args.title
+        if args.type is not None:
+            updates["type"] = args.type
+        if args.private is not None:
+            updates["private"] = args.private
+    return {
+        "object_type": object_type,
+        "object_id": object_id,
+        "aspect_type": aspect_type,
+        "owner_id": args.owner,
+        "subscription_id": args.subscription_id,
+        "event_time": int(time.time()),
+        "updates": updates,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("event", choices=["create", "update", "delete", "deauthorize"])
+    parser.add_argument("activity_id", type=int, nargs="?", default=0)
+    parser.add_argument("--url", default="http://localhost:8001/webhook")
+    parser.add_argument("--verify-token", required=True)
+    parser.add_argument("--owner", type=int, required=True, help="athlete id (owner_id)")
+    parser.add_argument("--subscription-id", type=int, default=1)
+    parser.add_argument("--title")
+    parser.add_argument("--type")
+    parser.add_argument("--private", choices=["true", "false"])
+    args = parser.parse_args()
+    if args.event != "deauthorize" and not args.activity_id:
+        parser.error("activity_id is required for activity events")
+
+    with httpx.Client(timeout=10.0) as client:
+        if not handshake(client, args.url, args.verify_token):
+            return 1
+        event = build_event(args)
+        started = time.perf_counter()
+        resp = client.post(args.url, json=event)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # Strava gives up on a delivery after two seconds
+        print(f"Event {event['object_type']}/{event['aspect_type']}: {resp.status_code} in {elapsed_ms:.0f} ms {resp.text}")
+        return 0 if resp.status_code == 200 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())